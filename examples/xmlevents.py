@@ -0,0 +1,69 @@
+"""Throughput of simpleparse.xmlparser.events on a generated corpus
+
+Writes a synthetic XML document of the given size (in MB, default
+20) to a temporary file, then streams it through iterevents,
+reporting the events counted, the throughput and the peak memory
+of the process, alongside xml.etree's iterparse for reference.
+
+    python examples/xmlevents.py [megabytes]
+"""
+from __future__ import print_function
+import sys, os, time, tempfile, resource
+from xml.etree import ElementTree
+from simpleparse.xmlparser.events import iterevents
+
+record = u"""  <entry id="%d" kind='log &amp; trace'>
+    <when>2002-02-03T04:15:%02d</when><!-- generated -->
+    <message>Value &lt; %d for café <b>now</b></message>
+    <raw><![CDATA[<not markup> & more]]></raw><flag/>
+  </entry>
+"""
+
+def writeCorpus( stream, size ):
+    """Write about size bytes of XML to stream"""
+    stream.write( b'<?xml version="1.0" encoding="utf-8"?>\n<log>\n' )
+    written = index = 0
+    while written < size:
+        data = (record%( index, index%60, index )).encode( 'utf-8' )
+        stream.write( data )
+        written += len(data)
+        index += 1
+    stream.write( b'</log>\n' )
+
+def peakMemory( ):
+    """Peak resident set size of the process in MB"""
+    return resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss / 1024.0
+
+def main( megabytes=20 ):
+    with tempfile.NamedTemporaryFile( suffix='.xml', delete=False ) as stream:
+        writeCorpus( stream, int( megabytes * 2**20 ))
+        name = stream.name
+    try:
+        size = os.path.getsize( name ) / float( 2**20 )
+        print( 'corpus: %.1f MB'%( size ))
+        counts = {}
+        t = time.time()
+        with open( name, 'rb' ) as source:
+            for production, text, children in iterevents( source ):
+                counts[production] = counts.get( production, 0 ) + 1
+        elapsed = time.time() - t
+        print( 'iterevents: %d events in %.2fs, %.2f MB/s, peak memory %.1f MB'%(
+            sum( counts.values() ), elapsed, size/elapsed, peakMemory(),
+        ))
+        for production in sorted( counts ):
+            print( '    %-14s %d'%( production, counts[production] ))
+        t = time.time()
+        events = 0
+        for event, element in ElementTree.iterparse( name, ('start','end') ):
+            events += 1
+            if event == 'end':
+                element.clear()
+        elapsed = time.time() - t
+        print( 'ElementTree.iterparse: %d events in %.2fs, %.2f MB/s'%(
+            events, elapsed, size/elapsed,
+        ))
+    finally:
+        os.remove( name )
+
+if __name__ == "__main__":
+    main( *[float( arg ) for arg in sys.argv[1:]] )
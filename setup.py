@@ -7,8 +7,10 @@ to install the packages from the source archive.
 """
 try:
     from setuptools import setup, Extension
+    from setuptools.command.build_py import build_py
 except ImportError as err:
     from distutils.core import setup, Extension
+    from distutils.command.build_py import build_py
 import os, sys
 
 def findVersion( ):
@@ -36,6 +38,22 @@ def packagesFor( filename, basePackage="" ):
             set.update( packagesFor( dir, moduleName))
     return set
 
+# (package, module) pairs using syntax older Pythons can't compile
+PY36_MODULES = [
+    ('simpleparse', 'streaming'),
+]
+class BuildPy( build_py ):
+    """Leave out the modules the building Python can't compile"""
+    def find_package_modules( self, package, package_dir ):
+        modules = build_py.find_package_modules( self, package, package_dir )
+        if sys.version_info < (3,6):
+            modules = [
+                (pkg, module, filename)
+                for (pkg, module, filename) in modules
+                if (pkg, module) not in PY36_MODULES
+            ]
+        return modules
+
 packages = packagesFor( "simpleparse", 'simpleparse' )
 packages.update( {'simpleparse':'simpleparse'} )
 
@@ -85,6 +103,7 @@ largely deterministic grammars.""",
 
         package_dir = packages,
         options = options,
+        cmdclass = {'build_py': BuildPy},
 
         packages = list(packages.keys()),
         ext_modules=[
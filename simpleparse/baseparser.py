@@ -1,6 +1,7 @@
 """Base class for real-world parsers (such as parser.Parser)"""
 from simpleparse.stt.TextTools.TextTools import *
 from simpleparse.generator import Generator
+from simpleparse.columns import Columns
 
 class BaseParser:
     """Class on which real-world parsers build
@@ -10,7 +11,11 @@ class BaseParser:
     """
     _rootProduction = ""
     # primary API...
-    def parse( self, data, production=None, processor=None, start=0, stop=None):
+    def parse(
+        self, data, production=None, processor=None, start=0, stop=None,
+        max_results=0, max_depth=0, max_result_bytes=0,
+        max_steps=0, deadline=None, consume=None, intern_matches=0,
+    ):
         """Parse data with production "production" of this parser
 
         data -- data to be parsed, a Python string, for now
@@ -21,17 +26,102 @@ class BaseParser:
             of the parsing pass.  Can be None if neither is desired (default)
         start -- starting index for the parsing, default 0
         stop -- stoping index for the parsing, default len(data)
+        max_results -- maximum number of result tuples the engine may
+            create (counting those discarded on backtracking), 0 for
+            no limit
+        max_depth -- maximum nesting depth of tag tables (each
+            production and group is at least one level), 0 for no limit
+        max_result_bytes -- maximum (approximate) memory of the results
+            created, 0 for no limit
+        max_steps -- maximum number of tag table entries executed,
+            0 for no limit
+        deadline -- time.monotonic() value (time.time() on Python 2)
+            at which to give up, None for no deadline
+        consume -- dictionary mapping production names (tag objects)
+            to handlers for results which are to be processed as
+            soon as they are complete and then dropped, see below
+        intern_matches -- AppendMatch results of up to this many
+            characters share one string with identical matches,
+            0 for none
+
+        Exceeding a limit aborts the parse with a
+        simpleparse.stt.TextTools.LimitError reporting the limit,
+        position and production reached.  The step budget and the
+        deadline are checked every few thousand table entries, which
+        is also when signal handlers get to run during a long parse
+        (so that e.g. KeyboardInterrupt isn't delayed until it ends).
+
+        Results of the productions in consume are passed to
+        handler( (tag, start, stop, children), buffer ) (the
+        signature of DispatchProcessor methods) and removed from
+        the results as soon as they are top-level results and the
+        root production has moved on to its next item, when they
+        can't be undone by backtracking any more (a failing root
+        production still fails the parse).  With e.g.
+
+            root := record*
+
+        memory use is bounded by a single record, rather than
+        the whole document.  Matches nested deeper than the
+        root production's own items are left alone.
         """
         self.resetBeforeParse()
         if processor is None:
             processor = self.buildProcessor()
         if stop is None:
             stop = len(data)
-        value = tag( data, self.buildTagger( production, processor), start, stop )
+        value = tag(
+            data, self.buildTagger( production, processor), start, stop,
+            max_results=max_results, max_depth=max_depth,
+            max_result_bytes=max_result_bytes,
+            max_steps=max_steps, deadline=deadline, consume=consume,
+            intern_matches=intern_matches,
+        )
         if processor and callable(processor):
             return processor( value, data )
         else:
             return value
+    def parse_columns( self, data, production=None, start=0, stop=None ):
+        """Parse data, reporting results as parallel arrays
+
+        data -- data to be parsed, a Python string, for now
+        production -- optional string specifying a non-default production to use
+            for parsing data
+        start -- starting index for the parsing, default 0
+        stop -- stoping index for the parsing, default len(data)
+
+        The engine records each result as a row of native
+        integers (tag index, left, right, depth, parent) instead
+        of building result tuples, no processor is run over
+        the results.  Productions called via a method source
+        (CallTag and the like) are passed None for their
+        children and their children are not recorded.
+
+        returns (success, columns, next) where columns is a
+        simpleparse.columns.Columns instance
+        """
+        self.resetBeforeParse()
+        processor = self.buildProcessor()
+        if stop is None:
+            stop = len(data)
+        success, columns, next = tagcolumns(
+            data, self.buildTagger( production, processor), start, stop
+        )
+        return success, Columns( *columns ), next
+    def parse_stream( self, reader, production=None, processor=None, **named ):
+        """Asynchronously parse records read from an asyncio.StreamReader
+
+        Requires Python 3.6+, returns an asynchronous iterator
+        yielding (record, result) for each complete record:
+
+            async for record, result in parser.parse_stream( reader, 'record' ):
+                ...
+
+        See simpleparse.streaming.parse_stream for the other
+        arguments.
+        """
+        from simpleparse.streaming import parse_stream
+        return parse_stream( self, reader, production, processor, **named )
     # abstract methods
     def buildProcessor( self ):
         """Build default processor object for this parser class
@@ -0,0 +1,67 @@
+"""Columnar parse results as parallel arrays
+
+BaseParser.parse_columns has the tagging engine record each
+result node as a row in a set of native arrays, rather than
+building the usual nested (tag, left, right, children) tuples.
+That makes multi-million-node results cheap to produce and
+lets you filter them with vectorised operations, for instance:
+
+    success, columns, next = parser.parse_columns( data )
+    import numpy
+    left = numpy.asarray( columns.left )
+    wanted = numpy.asarray( columns.tag ) == columns.tags.index( 'word' )
+    starts = left[ wanted ]
+
+Rows are in post-order, that is, a node's children come
+before the node itself (which is the order the engine
+finishes them).
+"""
+import array, struct
+
+def _ssizeTypecode( ):
+    """Find the array typecode matching the engine's Py_ssize_t"""
+    size = struct.calcsize( 'P' )
+    for code in 'ilq':
+        try:
+            if array.array( code ).itemsize == size:
+                return code
+        except ValueError:
+            # 'q' isn't available on older Pythons
+            pass
+    raise ImportError( """No array typecode with itemsize %s for columnar results"""%(size,))
+SSIZE_TYPECODE = _ssizeTypecode()
+
+class Columns:
+    """Parallel arrays describing the result nodes of a parse
+
+    tags -- list of the distinct tag objects (production names),
+        indexed by the values in tag
+    tag -- index into tags for each row
+    left -- start of each row's match
+    right -- end of each row's match
+    depth -- nesting depth of each row, 0 for top-level results
+    parent -- index of each row's parent row, -1 for top-level
+        results
+
+    All of the arrays are array.array instances of equal length
+    and support the buffer protocol (e.g. numpy.asarray).
+    """
+    def __init__( self, tags, tag, left, right, depth, parent ):
+        """Initialise from the raw values returned by tagcolumns()"""
+        self.tags = tags
+        self.tag = self._array( tag )
+        self.left = self._array( left )
+        self.right = self._array( right )
+        self.depth = self._array( depth )
+        self.parent = self._array( parent )
+    def _array( self, data ):
+        """Convert native Py_ssize_t data to an array"""
+        result = array.array( SSIZE_TYPECODE )
+        if hasattr( result, 'frombytes' ):
+            result.frombytes( data )
+        else:
+            result.fromstring( data )
+        return result
+    def __len__( self ):
+        """Number of result rows"""
+        return len(self.tag)
@@ -13,7 +13,14 @@ as allowing the integer values to use non-0-padded integers.
     ISO_date_time -- YYYY-MM-DD HH:mm:SS+HH:mm format,
         with time optional and TimeZone offset optional
 
-Interpreter:
+Interpreters:
+    DateTimeInterpreter
+        Interprets ISO_date and ISO_date_time as timezone-aware
+        datetime.datetime values, each in a single C call
+    TimestampCollector
+        Stores ISO_date_time values as epoch microseconds in an
+        array('q') (or a writable int64 buffer) without building
+        a result tree for them
     MxInterpreter
         Interprets the parse tree as mx.DateTime values
         ISO_date and ISO_time
@@ -32,6 +39,7 @@ from simpleparse.parser import Parser
 from simpleparse import common, objectgenerator
 from simpleparse.common import chartypes, numbers
 from simpleparse.dispatchprocessor import *
+from simpleparse.stt.TextTools import TextTools
 
 c = {}
 
@@ -65,6 +73,33 @@ for name in ["ISO_time","ISO_date", "ISO_date_time"]:
     )
 common.share( c )
 
+class DateTimeInterpreter(DispatchProcessor):
+    """Interpret a parsed ISO_date_time or ISO_date as a datetime
+
+    The whole match is converted by TextTools.isodatetime, without
+    dispatching on its fields.  The values are timezone-aware, those
+    without an offset are taken to be in tzinfo (UTC if None).
+    Requires datetime.timezone (Python 3).
+    """
+    def __init__( self, tzinfo=None ):
+        self.tzinfo = tzinfo
+    def ISO_date_time( self, info, buffer):
+        """Interpret the ISO date + time format"""
+        (tag, left, right, sublist) = info
+        return TextTools.isodatetime( buffer, left, right, self.tzinfo )
+    ISO_date = ISO_date_time
+
+class TimestampCollector( numbers.NumberCollector ):
+    """Method source storing ISO_date_time values as epoch microseconds
+
+    Works like numbers.NumberCollector, target must be an array('q')
+    or a writable int64 buffer.  Values without an offset are taken
+    to be UTC.
+    """
+    timestamps = 1
+    def __init__( self, target, productions=("ISO_date_time",) ):
+        super( TimestampCollector, self ).__init__( target, productions )
+
 if haveMX:
     class MxInterpreter(DispatchProcessor):
         """Interpret a parsed ISO_date_time_loose in GMT/UTC time or localtime
@@ -8,7 +8,13 @@
         with time optional and TimeZone offset optional,
         same format for date and time as above
 
-Interpreter:
+Interpreters:
+    DateTimeInterpreter
+        Date and DateTime -> timezone-aware datetime.datetime
+        values, each in a single C call
+    TimestampCollector
+        Stores ISO_date_time_loose values as epoch microseconds
+        in an array('q') (or a writable int64 buffer)
     MxInterpreter
         Interprets the parse tree as mx.DateTime values
         Date and DateTime -> DateTime objects
@@ -21,7 +27,7 @@ except ImportError:
     haveMX = 0
 from simpleparse.parser import Parser
 from simpleparse import common, objectgenerator
-from simpleparse.common import chartypes, numbers
+from simpleparse.common import chartypes, numbers, iso_date
 from simpleparse.dispatchprocessor import *
 
 c = {}
@@ -53,6 +59,15 @@ for name in ["ISO_time_loose","ISO_date_time_loose", "ISO_date_loose"]:
     )
 common.share( c )
 
+class DateTimeInterpreter(iso_date.DateTimeInterpreter):
+    """Interpret a parsed ISO_date_time_loose or ISO_date_loose as a datetime"""
+    ISO_date_time_loose = ISO_date_loose = iso_date.DateTimeInterpreter.ISO_date_time
+
+class TimestampCollector( iso_date.TimestampCollector ):
+    """Method source storing ISO_date_time_loose values as epoch microseconds"""
+    def __init__( self, target, productions=("ISO_date_time_loose",) ):
+        super( TimestampCollector, self ).__init__( target, productions )
+
 if haveMX:
     class MxInterpreter(DispatchProcessor):
         """Interpret a parsed ISO_date_time_loose in GMT/UTC time or localtime
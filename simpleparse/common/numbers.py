@@ -42,12 +42,21 @@ Interpreters:
         binary_number
     ImaginaryInterpreter
         imaginary_number
+
+Bulk conversion:
+
+    NumberCollector
+        int, int_unsigned, hex, float, number, binary_number (base=2),
+        stored in an array.array or NumPy array without creating
+        result tuples or Python number objects
     
 """
 from simpleparse.parser import Parser
 from simpleparse import common, objectgenerator
 from simpleparse.common import chartypes
 from simpleparse.dispatchprocessor import *
+from simpleparse.processor import MethodSource
+from simpleparse.stt.TextTools import TextTools
 
 c = {}
 
@@ -188,3 +197,36 @@ class ImaginaryInterpreter( DispatchProcessor ):
         base = self.mapSet[base[0]](base, buffer)
         return base * 1j
     
+
+class NumberCollector( MethodSource ):
+    """Method source storing the values of number productions in an array
+
+    The productions are reported with TextTools.AppendNumber, so the
+    tagging engine converts each match in C and stores it in target,
+    either an array.array (e.g. array('d') or array('q')) which gets
+    the values appended, or a writable buffer (e.g. a NumPy array)
+    which is filled from the start.  The productions leave nothing in
+    the result tree.
+
+    Literals with a 0x prefix are read as hexadecimal and others in
+    base, use base=2 for binary_number.  Float literals can only be
+    stored in float arrays, integers out of range for the array's
+    typecode raise OverflowError.
+
+    Values stored for a production which matched before the enclosing
+    production failed are removed again, and productions nested in
+    another collected production don't store values of their own.
+    """
+    timestamps = 0
+    def __init__( self, target, productions=("number",), base=10 ):
+        self.sink = TextTools.NumberSink( target, base, self.timestamps )
+        for name in productions:
+            setattr( self, '_m_'+name, TextTools.AppendNumber )
+            setattr( self, '_o_'+name, self.sink )
+    @property
+    def target( self ):
+        """The array or buffer the values are stored in"""
+        return self.sink.target
+    def __len__( self ):
+        """Number of values stored so far"""
+        return self.sink.count
@@ -40,6 +40,7 @@ from simpleparse import common, objectgenerator
 from simpleparse.common import chartypes
 assert chartypes
 from simpleparse.dispatchprocessor import *
+from simpleparse.stt.TextTools import TextTools
 
 c = {}
 
@@ -123,8 +124,20 @@ class StringInterpreter(DispatchProcessor):
         return dispatch( self, sublist[0], buffer )
 
     def string_single_quote( self, info, buffer):
+        """Decode the escapes of any of the string types in one call"""
         (tag, left, right, sublist) = info
-        return "".join(dispatchList(self, sublist, buffer))
+        if isinstance( buffer, bytes ) and bytes is not str:
+            # the per-node methods build str values with chr(), so
+            # read the bytes as the code points those would produce
+            buffer, left, right = buffer[left:right].decode( 'latin-1' ), 0, right-left
+        quote = buffer[left:left+1]
+        if right - left >= 6 and buffer[left:left+3] == buffer[right-3:right] == quote*3:
+            width = 3
+        else:
+            width = 1
+        return TextTools.unescape(
+            buffer, self.escapeRules( quote ), left+width, right-width,
+        )
     string_double_quote = string_single_quote
     string_triple_single = string_single_quote
     string_triple_double = string_single_quote
@@ -148,6 +161,26 @@ class StringInterpreter(DispatchProcessor):
     def backslash_char( self, info, buffer):
         return "\\"
 
+    def escapeRules( self, quote ):
+        """Get the specialescapedmap entries the grammar allows with quote
+
+        The string_special_escapes production of each string type
+        only accepts the characters in specialescapes and its own
+        quote character after a backslash.  The rules are built in
+        the text type of quote, as unescape() requires.
+        """
+        cache = self.__dict__.setdefault( '_escapeRules', {} )
+        textType = type( quote )
+        try:
+            return cache[textType, quote]
+        except KeyError:
+            rules = cache[textType, quote] = dict([
+                (textType(char), textType(self.specialescapedmap[char]))
+                for char in self.specialescapes + quote
+            ])
+            return rules
+    specialescapes = '\\abfnrtv'
+
     def string_special_escapes( self, info, buffer):
         """Maps "special" escapes to the corresponding characters"""
         (tag, left, right, sublist) = info
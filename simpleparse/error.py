@@ -7,6 +7,9 @@ class ParserSyntaxError( SyntaxError ):
     Every instance will have the following attributes:
         buffer -- pointer to the source buffer
         position -- integer position in buffer where error occured or -1
+        bufferOffset -- position in the source of buffer's first character,
+            non-zero when buffer only holds the end of the source
+            (e.g. for streams), position includes the offset
         production -- the production which failed
         expected -- string (currently taken from grammar) describing
             what production/element token failed to match
@@ -18,6 +21,7 @@ class ParserSyntaxError( SyntaxError ):
     """
     buffer = ""
     position = -1
+    bufferOffset = 0
     line = -1
     production = ""
     expected = ""
@@ -40,16 +44,17 @@ class ParserSyntaxError( SyntaxError ):
             "line": line,
             "lineChar": lineChar,
             "expected": self.expected or "UNKNOWN",
-            "text": repr(self.buffer[ self.position:self.position+50 ]),
+            "text": repr(self.buffer[ self.position-self.bufferOffset:self.position-self.bufferOffset+50 ]),
         }
         return template % variables
     def getLineCoordinate( self ):
         """Get (line number, line character) for the error"""
-        lineChar = self.buffer.rfind('\n', 0, self.position)
+        position = self.position - self.bufferOffset
+        lineChar = self.buffer.rfind('\n', 0, position)
         if lineChar == -1: # was no \n before the current position
-            lineChar = self.position
+            lineChar = position
             line = 1
         else:
             line = countlines( self.buffer[:lineChar] )
-            lineChar = self.position-lineChar
+            lineChar = position-lineChar
         return line, lineChar
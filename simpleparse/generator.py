@@ -2,6 +2,9 @@
 from simpleparse.stt.TextTools import TextTools
 import traceback
 
+# native strings are parsed with Unicode tag tables on Python 3
+UNICODE_TABLES = not isinstance( '', bytes )
+
 class Generator:
     '''Abstract representation of an in-memory grammar that generates parsers
     
@@ -18,6 +21,12 @@ class Generator:
         self.rootObjects = []
         self.methodSource = None
         self.definitionSources = []
+        self.nullableCache = {}
+        self.nullableActive = {}
+        self.parserListCache = {}
+        self.validatorList = None
+        self.analysisCache = {}
+        self.analysisActive = {}
     def getNameIndex( self, name ):
         '''Return the index into the main list for the given name'''
         try:
@@ -49,11 +58,106 @@ class Generator:
             self.names.append( name )
             self.rootObjects.append( rootElement )
             return self.getNameIndex( name )
-    def buildParser( self, name, methodSource=None ):
-        '''Build the given parser definition, returning a TextTools parsing tuple'''
-        self.parserList = []
-        self.terminalParserCache = {}
-        self.methodSource = methodSource
+    def isNullable( self, name, atEOF=0 ):
+        '''Determine whether the given production can match without consuming input
+
+        atEOF -- if true, also count productions which may
+            succeed at the end of the buffer without moving
+            forward (or which we can't analyse), that is, those
+            whose repetitions need to check for EOF
+
+        The analysis is a fixpoint over all definitions, cached
+        until a name which hasn't been analysed is requested.
+        '''
+        key = bool( atEOF )
+        results = self.nullableCache.get( key )
+        if results is not None and name in results:
+            return results[ name ]
+        if key in self.nullableActive:
+            # mid-analysis, not yet known to match empty
+            self.getNameIndex( name )
+            return 0
+        self.getNameIndex( name )
+        results = self.nullableCache[ key ] = {}
+        self.nullableActive[ key ] = 1
+        try:
+            changed = 1
+            while changed:
+                changed = 0
+                i = 0
+                while i < len(self.rootObjects):
+                    # rootObjects grows if the analysis loads definitions
+                    current = self.names[i]
+                    if not results.get( current ):
+                        results[ current ] = 0
+                        if self.rootObjects[i].nullable( self, atEOF ):
+                            results[ current ] = changed = 1
+                    i = i + 1
+        except:
+            del self.nullableCache[ key ]
+            raise
+        finally:
+            del self.nullableActive[ key ]
+        return results[ name ]
+    def alwaysMatches( self, name ):
+        '''Determine whether the given production matches wherever it is tried'''
+        return self.analyseName( name, 'alwaysMatches', 0 )
+    def firstCharacters( self, name ):
+        '''Determine the characters with which a non-empty match of name can start
+
+        returns a string of characters or None if any character may start a match
+        '''
+        return self.analyseName( name, 'firstCharacters', None )
+    def literalPrefix( self, name ):
+        '''Determine a literal string with which every match of name starts'''
+        return self.analyseName( name, 'literalPrefix', '' )
+    def analyseName( self, name, method, default ):
+        '''Run the given element token analysis method for a definition
+
+        Results are cached, a definition which refers back to
+        itself while being analysed gets the default (unknown)
+        result for the inner reference.
+        '''
+        key = (method, name)
+        if key in self.analysisCache:
+            return self.analysisCache[ key ]
+        if key in self.analysisActive:
+            return default
+        rootObject = self.getRootObject( name )
+        self.analysisActive[ key ] = 1
+        try:
+            result = getattr( rootObject, method )( self )
+        finally:
+            del self.analysisActive[ key ]
+        self.analysisCache[ key ] = result
+        return result
+    def buildParser( self, name, methodSource=None, unicode=UNICODE_TABLES ):
+        '''Build the given parser definition, returning a TextTools parsing tuple
+
+        getParserList afterwards returns the list with the
+        compiled tables, linked for Unicode or 8-bit text
+        according to unicode.  The linked list is kept for the
+        last methodSource (compared by identity) of each text
+        type, so repeated parses don't rebuild and relink it.
+        '''
+        index = self.getNameIndex( name )
+        key = bool( unicode )
+        cached = self.parserListCache.get( key )
+        if cached is not None and cached[0] is methodSource and cached[1] == len(self.rootObjects):
+            (self.methodSource, count, self.parserList, self.terminalParserCache) = cached
+        else:
+            self.parserList = []
+            self.terminalParserCache = {}
+            self.methodSource = methodSource
+            self.buildParserList()
+            self.linkParsers( unicode )
+            self.parserListCache[ key ] = (
+                methodSource, len(self.rootObjects),
+                self.parserList, self.terminalParserCache,
+            )
+        return self.getTerminalParser( index )
+    def buildParserList( self, noReport=0 ):
+        '''Build the tables for every definition into the parser list'''
         i = 0
         while i < len(self.rootObjects):
             # XXX Note: rootObjects will grow in certain cases where
@@ -61,7 +165,7 @@ class Generator:
             rootObject = self.rootObjects[i]
             try:
                 if len(self.parserList) <= i or self.parserList[i] is None:
-                    parser = tuple(rootObject.toParser( self ))
+                    parser = tuple(rootObject.toParser( self, noReport ))
                     self.setTerminalParser( i, parser )
             except NameError as err:
                 currentRuleName = self.names[i]
@@ -69,7 +173,45 @@ class Generator:
                 raise
             i = i + 1
         assert None not in self.parserList, str( self.parserList)
-        return self.parserList [self.getNameIndex (name)]
+    def buildValidator( self, name, unicode=UNICODE_TABLES ):
+        '''Build a non-reporting parser for the given definition
+
+        The validation tables report nothing (so no methodSource
+        is consulted), which lets them be built once and kept in
+        their own (linked) parser list, separate from the list
+        used by buildParser.  Returns the compiled table, or the
+        parsing tuple if the table type doesn't match unicode.
+        '''
+        index = self.getNameIndex( name )
+        if self.validatorList is None or len(self.validatorList) < len(self.rootObjects):
+            saved = (
+                getattr( self, 'parserList', None ),
+                getattr( self, 'terminalParserCache', None ),
+                self.methodSource,
+            )
+            self.parserList = []
+            self.terminalParserCache = {}
+            self.methodSource = None
+            try:
+                self.buildParserList( noReport=1 )
+                self.validatorTables = list( self.parserList )
+                self.validatorList = self.parserList
+                self.linkParsers()
+            finally:
+                self.parserList, self.terminalParserCache, self.methodSource = saved
+        if unicode == UNICODE_TABLES:
+            return self.validatorList[ index ]
+        return self.validatorTables[ index ]
+    def linkParsers( self, unicode=UNICODE_TABLES ):
+        """Compile the parser list and link the references between its tables
+
+        Name references are TableInList entries, linking
+        replaces the lookup (and compilation) of the target
+        table in the parser list with a direct reference
+        to the compiled table.  Text of the other type (bytes
+        vs. Unicode) is still parsed, just without the links.
+        """
+        TextTools.linktables( self.parserList, unicode )
     def setTerminalParser( self, index, parser ):
         """Explicitly set the parser value for given name"""
         while index >= len(self.parserList):
@@ -78,9 +220,11 @@ class Generator:
     def getTerminalParser( self, index ):
         """Try to retrieve a parser from the parser-list"""
         try:
-            return self.parserList[ index ]
+            parser = self.parserList[ index ]
         except IndexError:
             return None
+        # once linked, the list holds compiled tables
+        return getattr( parser, 'definition', parser )
     def cacheCustomTerminalParser( self, index, flags, parser ):
         """Optimization to reuse customized terminal parsers"""
         self.terminalParserCache[ (index,flags) ] = parser
@@ -110,6 +254,11 @@ class Generator:
                     if not ( hasattr( object, 'append') and callable(object.append)):
                         raise ValueError( """Method source %s declares production %s to use AppendToTagobj method, but doesn't given an object with an append method in _o_%s (gave %s)"""%(repr(self.methodSource), name,name, repr(object)))
                 return method, object
+            elif method == TextTools.AppendNumber:
+                object = self.getTagObjectForName( name )
+                if not isinstance( object, TextTools.NumberSinkType ):
+                    raise ValueError( """Method source %s declares production %s to use AppendNumber method, but doesn't give a NumberSink in _o_%s (gave %s)"""%(repr(self.methodSource), name,name, repr(object)))
+                return method, object
             else:
                 raise ValueError( """Unrecognised command value %s (not callable, not one of the Append* constants) found in methodSource %s, name=%s"""%( repr(method),repr(methodSource),name))
         return 0, name
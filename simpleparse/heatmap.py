@@ -0,0 +1,95 @@
+"""Backtracking heatmaps for finding slow spots in grammars
+
+Parser.parse_heatmap runs the tagging engine in a diagnostic
+mode which records, for each bucket of text positions and
+each production, how much work was thrown away: the
+characters matched by attempts which then failed, and how
+often the production was tried again at a position it had
+already been tried at.  Regions where those numbers are
+large are where a grammar backtracks, for instance:
+
+    success, children, next, heatmap = parser.parse_heatmap( data )
+    print( heatmap.render() )
+
+Productions are reported by name, work done outside of any
+named production (e.g. in the root table) as <root>.
+"""
+import array
+from simpleparse.columns import SSIZE_TYPECODE
+
+ROOT = '<root>'
+
+class Heatmap:
+    """Parallel arrays describing where a parse backtracked
+
+    bucketsize -- number of text positions per bucket
+    names -- list of production names, indexed by the values
+        in production, or None to report the indexes
+    bucket -- bucket of each cell, covering text positions
+        bucket*bucketsize up to (bucket+1)*bucketsize
+    production -- production of each cell, -1 for work done
+        outside of the productions
+    failed -- characters matched by attempts of the production
+        starting in the bucket which then failed
+    reentries -- number of times the production was entered
+        again at a position in the bucket it had been tried at
+
+    The arrays are array.array instances of equal length, cells
+    are in no particular order.
+    """
+    def __init__( self, bucketsize, bucket, production, failed, reentries, names=None ):
+        """Initialise from the raw values returned by tagheatmap()"""
+        self.bucketsize = bucketsize
+        self.names = names
+        self.bucket = self._array( bucket )
+        self.production = self._array( production )
+        self.failed = self._array( failed )
+        self.reentries = self._array( reentries )
+    def _array( self, data ):
+        """Convert native Py_ssize_t data to an array"""
+        result = array.array( SSIZE_TYPECODE )
+        if hasattr( result, 'frombytes' ):
+            result.frombytes( data )
+        else:
+            result.fromstring( data )
+        return result
+    def __len__( self ):
+        """Number of cells"""
+        return len(self.bucket)
+    def name( self, production ):
+        """Get the name to report for a production index"""
+        if production < 0:
+            return ROOT
+        if self.names is None:
+            return str( production )
+        return self.names[ production ]
+    def hottest( self, count=10 ):
+        """Get the count cells with the most wasted work
+
+        Cells are ranked by failed characters, then re-entries.
+
+        returns list of (start, stop, name, failed, reentries)
+        where start:stop is the bucket's range of positions
+        """
+        order = sorted(
+            range(len(self)),
+            key = lambda cell: (self.failed[cell], self.reentries[cell]),
+            reverse = True,
+        )
+        result = []
+        for cell in order[:count]:
+            start = self.bucket[cell] * self.bucketsize
+            result.append( (
+                start, start + self.bucketsize,
+                self.name( self.production[cell] ),
+                self.failed[cell], self.reentries[cell],
+            ))
+        return result
+    def render( self, count=10 ):
+        """Render the count hottest cells as a text table"""
+        lines = ['%-21s %10s %10s  %s'%('positions', 'failed', 'reentries', 'production')]
+        for start, stop, name, failed, reentries in self.hottest( count ):
+            lines.append( '%-21s %10d %10d  %s'%(
+                '%d-%d'%(start, stop), failed, reentries, name,
+            ))
+        return '\n'.join( lines )
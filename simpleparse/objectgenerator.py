@@ -46,6 +46,11 @@ class ElementToken:
             matching object iff the element token fails
             to match.  This is used to signal
             SyntaxErrors.
+        minimum, maximum -- if minimum is not None, the
+            element token must match at least minimum and
+            at most maximum (None for no limit) times, this
+            is the "{m,n}" bounded repetition and takes the
+            place of the optional and repeating flags.
             
     Attributes only used for top-level Productions:
     
@@ -67,6 +72,8 @@ class ElementToken:
     # as if the name wasn't present...
     expanded = 0
     lookahead = 0
+    minimum = None
+    maximum = None
     
     
     def __init__( self, **namedarguments ):
@@ -90,20 +97,26 @@ class ElementToken:
         another element-token's toParser method.
         """
         raise NotImplementedError( '''Element token generator abstract function called''' )
-    def permute( self, basetable ):
+    def permute( self, basetable, generator=None ):
         '''Given a positive, required, non-repeating table, convert to appropriately configured table
 
         This method applies generic logic for applying the
         operational flags to a basic recipe for an element.
         
         It is normally called from the elements-token's own
-        toParser method.
+        toParser method.  If the generator is passed,
+        repetitions of elements which can't match without
+        consuming input don't need the EOF guard.
         '''
         flags = 0
         if self.lookahead:
             flags = flags + LookAhead
             
         assert len(basetable) == 3, '''Attempt to permute a base table that already has fail flag set, can only permute unadorned tables'''
+        repeatFlags = 0
+        if self.minimum is not None:
+            # lookahead applies to the whole repetition, not each iteration
+            flags, repeatFlags = 0, flags
         if self.negative:
             # negative "matches" if it fails
             # we add in the flags while we're at it...
@@ -116,9 +129,41 @@ class ElementToken:
         elif flags:
             # unpack, add the flags, and repack
             tag, command, arg = basetable
-            basetable = ( tag, command+flags, arg)
+            basetable = ( tag, command|flags, arg)
             
-        if self.repeating:
+        if self.minimum is not None:
+            # bounded repetition loops natively in the engine
+            basetable = (None, Repeat+repeatFlags, ((basetable,), self.minimum, self.maximum))
+            if self.errorOnFail:
+                return [
+                    basetable+(1,2),
+                    (None, Call, self.errorOnFail),
+                ]
+            else:
+                return [
+                    basetable
+                ]
+        elif self.repeating and generator is not None and not (
+            self.lookahead or (not self.negative and self.baseNullable( generator, 1 ))
+        ):
+            # every match consumes input, so the table entry can
+            # simply loop on itself until it fails
+            if self.optional:
+                return [
+                    basetable +(1,0),
+                ]
+            elif self.errorOnFail:
+                return [
+                    basetable+(1,2),
+                    (None, Call, self.errorOnFail),
+                    basetable +(1,0),
+                ]
+            else:
+                return [
+                    basetable,
+                    basetable +(1,0),
+                ]
+        elif self.repeating:
             ### There are a number of problems with repetition that we'd like to solve
             ### via recursive table calls, but those are very expensive in the current
             ### implementation, so we need to use something a little more hacky...
@@ -172,6 +217,81 @@ class ElementToken:
     def terminal (self, generator):
         """Determine if this element is terminal for the generator"""
         return 0
+    def nullable( self, generator, atEOF=0 ):
+        """Determine if this element can match without consuming input
+
+        atEOF -- if true, also count matches at the end of
+            the buffer which don't move forward (see
+            Generator.isNullable)
+        """
+        if self.optional or self.lookahead or self.minimum == 0:
+            return 1
+        if self.negative:
+            # permuted negatives fail at EOF, otherwise they
+            # always consume a character
+            return 0
+        return self.baseNullable( generator, atEOF )
+    def baseNullable( self, generator, atEOF=0 ):
+        """Determine if the base element (ignoring flags) can match without consuming input
+
+        We don't know what the tables of arbitrary element
+        tokens do, so we only claim they are nullable
+        when asked for the safe (atEOF) answer.
+        """
+        return atEOF
+    def alwaysMatches( self, generator ):
+        """Determine if this element matches wherever it is tried
+
+        Unlike nullable, a lookahead only counts if what it
+        looks for always matches.
+        """
+        if self.optional or self.minimum == 0:
+            return 1
+        if self.negative:
+            return 0
+        return self.baseAlwaysMatches( generator )
+    def baseAlwaysMatches( self, generator ):
+        """Determine if the base element (ignoring flags) matches wherever it is tried
+
+        Unknown tables are assumed to be able to fail.
+        """
+        return 0
+    def firstCharacters( self, generator ):
+        """Determine the characters with which a non-empty match can start
+
+        returns a string of characters, or None if the element
+        could start with any character (or we can't tell)
+        """
+        if self.negative or self.lookahead:
+            return None
+        return self.baseFirstCharacters( generator )
+    def baseFirstCharacters( self, generator ):
+        """Determine the starting characters of the base element (ignoring flags)"""
+        return None
+    def literalPrefix( self, generator ):
+        """Determine a literal string with which every match must start
+
+        returns the (possibly empty) string
+        """
+        if self.negative or self.lookahead or self.optional or self.minimum == 0:
+            return ''
+        return self.baseLiteralPrefix( generator )
+    def baseLiteralPrefix( self, generator ):
+        """Determine the literal prefix of the base element (ignoring flags)"""
+        return ''
+    def boundedToParser( self, generator=None ):
+        """Parser generation for a "{m,n}" bounded repetition of a terminal
+
+        Used by the element tokens which don't go through permute,
+        the single-match table for the base element is wrapped
+        in a Repeat command.
+        """
+        single = copy.copy( self )
+        single.minimum = single.maximum = None
+        single.optional = single.repeating = 0
+        return [
+            (None, Repeat, (tuple(single.baseToParser( generator )), self.minimum, self.maximum))
+        ]
         
 
 class Literal( ElementToken ):
@@ -203,7 +323,10 @@ class Literal( ElementToken ):
         flags = 0
         if self.lookahead:
             flags = flags + LookAhead
-        base = self.baseToParser( generator )
+        if self.minimum is not None:
+            base = self.boundedToParser( generator )
+        else:
+            base = self.baseToParser( generator )
         if flags or self.errorOnFail:
             if self.errorOnFail:
                 return [(None, SubTable+flags, tuple(base),1,2),(None, Call, self.errorOnFail)]
@@ -271,6 +394,24 @@ class Literal( ElementToken ):
     def terminal (self, generator):
         """Determine if this element is terminal for the generator"""
         return 1
+    def nullable( self, generator, atEOF=0 ):
+        """Determine if this element can match without consuming input"""
+        if self.negative and atEOF:
+            # the Skip past a non-matching character succeeds at EOF
+            return 1
+        return ElementToken.nullable( self, generator, atEOF )
+    def baseNullable( self, generator, atEOF=0 ):
+        """Determine if the base element (ignoring flags) can match without consuming input"""
+        return not self.value
+    def baseAlwaysMatches( self, generator ):
+        """Determine if the base element (ignoring flags) matches wherever it is tried"""
+        return not self.value
+    def baseFirstCharacters( self, generator ):
+        """Determine the starting characters of the base element (ignoring flags)"""
+        return self.value[:1]
+    def baseLiteralPrefix( self, generator ):
+        """Determine the literal prefix of the base element (ignoring flags)"""
+        return self.value
 
 class _Range( ElementToken ):
     """Range of character values where any one of the characters may match
@@ -307,7 +448,10 @@ class _Range( ElementToken ):
         flags = 0
         if self.lookahead:
             flags = flags + LookAhead
-        base = self.baseToParser( generator )
+        if self.minimum is not None:
+            base = self.boundedToParser( generator )
+        else:
+            base = self.baseToParser( generator )
         if flags or self.errorOnFail:
             if self.errorOnFail:
                 return [(None, SubTable+flags, tuple(base),1,2),(None, Call, self.errorOnFail)]
@@ -401,6 +545,18 @@ class Range( _Range ):
     def terminal (self, generator):
         """Determine if this element is terminal for the generator"""
         return 1
+    def nullable( self, generator, atEOF=0 ):
+        """Determine if this element can match without consuming input"""
+        if self.negative and atEOF:
+            # IsNotIn succeeds at EOF, moving past the end of the buffer
+            return 1
+        return ElementToken.nullable( self, generator, atEOF )
+    def baseNullable( self, generator, atEOF=0 ):
+        """Determine if the base element (ignoring flags) can match without consuming input"""
+        return 0
+    def baseFirstCharacters( self, generator ):
+        """Determine the starting characters of the base element (ignoring flags)"""
+        return self.value
 
 class Group( ElementToken ):
     """Abstract base class for all group element tokens
@@ -437,23 +593,54 @@ class SequentialGroup( Group ):
         elset = []
         for child in self.children:
             elset.extend( child.toParser( generator, noReport ) )
-        basic = self.permute( (None, SubTable, tuple( elset)) )
+        basic = self.permute( (None, SubTable, tuple( elset)), generator )
         if len(basic) == 1:
             first = basic[0]
             if len(first) == 3 and first[0] is None and first[1] == SubTable:
                 return tuple(first[2])
         return basic
+    def baseNullable( self, generator, atEOF=0 ):
+        """Determine if the base element (ignoring flags) can match without consuming input"""
+        for child in self.children:
+            if not child.nullable( generator, atEOF ):
+                return 0
+        return 1
+    def baseAlwaysMatches( self, generator ):
+        """Determine if the base element (ignoring flags) matches wherever it is tried"""
+        for child in self.children:
+            if not child.alwaysMatches( generator ):
+                return 0
+        return 1
+    def baseFirstCharacters( self, generator ):
+        """Determine the starting characters of the base element (ignoring flags)
+
+        Children which may match empty let the following
+        child supply the first character as well.
+        """
+        result = ''
+        for child in self.children:
+            first = child.firstCharacters( generator )
+            if first is None:
+                return None
+            result = result + first
+            if not child.nullable( generator, 1 ):
+                break
+        return result
+    def baseLiteralPrefix( self, generator ):
+        """Determine the literal prefix of the base element (ignoring flags)"""
+        if self.children:
+            return self.children[0].literalPrefix( generator )
+        return ''
             
 class CILiteral( SequentialGroup ):
     """Case-insensitive Literal values
 
-    The CILiteral is a sequence of literal and
-    character-range values, where each element is
-    positive and required.  Literal values are
-    composed of those characters which are not
-    upper-case/lower-case pairs, while the ranges
-    are all two-character ranges with the upper
-    and lower forms.
+    The CILiteral matches its value with the CIWord
+    command, which compares the characters after
+    folding their case (with the to_lower table for
+    8-bit text, simple Unicode case folding for
+    Unicode text, so e.g. c"k" also matches the
+    Kelvin sign).
 
     CILiterals in the SimpleParse EBNF grammar are defined like so:
         c"test", c"test"?, c"test"*, c"test"+
@@ -463,47 +650,63 @@ class CILiteral( SequentialGroup ):
         value -- a string storing the literal's value
 
     Notes:
-        Currently we don't support Unicode literals
-
-        A CILiteral will be *much* slower than a
-        regular literal or character range
+        Characters whose full case folding is longer
+        than one character aren't expanded, e.g. the
+        German sharp s matches its capital form but
+        not "ss"
     """
     value = ""
     def toParser( self, generator=None, noReport=0 ):
-        elset = self.ciParse( self.value )
-        if len(elset) == 1:
-            # XXX should be compressing these out during optimisation...
-            # pointless declaration of case-insensitivity,
-            # or a single-character value
-            pass
-        basic = self.permute( (None, SubTable, tuple( elset)) )
+        if not self.value:
+            return self.permute( (None, SubTable, ()), generator )
+        if self.negative and self.repeating and not (
+            self.lookahead or self.minimum is not None or self.errorOnFail
+        ):
+            # a repeating negative value, a "search" in effect
+            if self.optional: # if not found, go to end of file
+                return [
+                    (None, CIWordStart, self.value, 1, 3),
+                    # WordStart doesn't move if the word is right here
+                    (None, CIWord+LookAhead, self.value, 1, 2),
+                    (None, Move, ToEOF ),
+                ]
+            else: # must match at least one character before the word
+                return [
+                    (None, EOF, Here, 1, 2),
+                    (None, CIWord+LookAhead, self.value, 2, 1),
+                    (None, Fail, Here),
+                    (None, CIWordStart, self.value, 1, 2),
+                    (None, Move, ToEOF ),
+                ]
+        basic = self.permute( (None, CIWord, self.value), generator )
         if len(basic) == 1:
+            # unwrap as SequentialGroup does, so that e.g. negatives
+            # report and fail the way they did as a group of items
             first = basic[0]
             if len(first) == 3 and first[0] is None and first[1] == SubTable:
                 return tuple(first[2])
         return basic
-    def ciParse( self, value ):
-        """Break value into set of case-dependent groups..."""
-        def equalPrefix( a,b ):
-            for x in range(len(a)-1):
-                if a[x] != b[x]:
-                    return x
-        result = []
-        a,b = value.upper(), value.lower()
-        while a and b:
-            # is there an equal literal run at the start?
-            stringPrefix = equalPrefix( a,b )
-            if stringPrefix:
-                result.append( (None, Word, a[:stringPrefix]) )
-                a,b = a[stringPrefix:],b[stringPrefix:]
-            # if we hit the end of the string, that's fine, just return
-            if not a and b:
-                break
-            # otherwise, the next character must be a case-differing pair
-            result.append( (None, IsIn, a[0]+b[0]) )
-            a,b = a[1:], b[1:]
-        return result
-        
+    def baseNullable( self, generator, atEOF=0 ):
+        """Determine if the base element (ignoring flags) can match without consuming input"""
+        return not self.value
+    def baseAlwaysMatches( self, generator ):
+        """Determine if the base element (ignoring flags) matches wherever it is tried"""
+        return not self.value
+    def baseFirstCharacters( self, generator ):
+        """Determine the starting characters of the base element (ignoring flags)
+
+        Case folding maps more characters than the upper and
+        lower case forms onto a letter (e.g. the Kelvin sign
+        onto k), so we can't tell for letters.
+        """
+        first = self.value[:1]
+        if first.upper() == first.lower():
+            return first
+        return None
+    def baseLiteralPrefix( self, generator ):
+        """Determine the literal prefix of the base element (ignoring flags)"""
+        return ''
+
 
 class ErrorOnFail(ElementToken):
     """When called as a matching function, raises a SyntaxError
@@ -556,12 +759,23 @@ class FirstOfGroup( Group ):
     """
     def toParser( self, generator=None, noReport=0 ):
         elset = []
-        # should catch condition where a child is optional
-        # and we are repeating (which causes a crash during
-        # parsing), but doing so is rather complex and
-        # requires analysis of the whole grammar.
-        for el in self.children:
+        # a child which matches wherever it is tried hides
+        # any following children, and makes a repeating
+        # group loop forever in the engine; as the last child
+        # of a non-repeating group it is just a default
+        repeats = self.repeating or (
+            self.minimum is not None and self.maximum != 1
+        )
+        for index, el in enumerate( self.children ):
             assert not el.optional, """Optional child of a FirstOf group created, this would cause an infinite recursion in the engine, child was %s"""%el
+            if generator is None:
+                always = el.minimum == 0
+            else:
+                always = el.alwaysMatches( generator )
+            if repeats:
+                assert not always, """Child of a repeating FirstOf group which always matches created, this would cause an infinite recursion in the engine, child was %s"""%el
+            elif index < len( self.children ) - 1:
+                assert not always, """Child of a FirstOf group which always matches created before other children, they could never match, child was %s"""%el
             dataset = el.toParser( generator, noReport )
             if len( dataset) == 1:# and len(dataset[0]) == 3: # we can alter the jump states with impunity
                 elset.append( dataset[0] )
@@ -575,7 +789,38 @@ class FirstOfGroup( Group ):
         procset = tuple(procset)
 
         basetable = (None, SubTable, procset )
-        return self.permute( basetable )
+        return self.permute( basetable, generator )
+    def baseNullable( self, generator, atEOF=0 ):
+        """Determine if the base element (ignoring flags) can match without consuming input"""
+        for child in self.children:
+            if child.nullable( generator, atEOF ):
+                return 1
+        return 0
+    def baseAlwaysMatches( self, generator ):
+        """Determine if the base element (ignoring flags) matches wherever it is tried"""
+        for child in self.children:
+            if child.alwaysMatches( generator ):
+                return 1
+        return 0
+    def baseFirstCharacters( self, generator ):
+        """Determine the starting characters of the base element (ignoring flags)"""
+        result = ''
+        for child in self.children:
+            first = child.firstCharacters( generator )
+            if first is None:
+                return None
+            result = result + first
+        return result
+    def baseLiteralPrefix( self, generator ):
+        """Determine the literal prefix of the base element (ignoring flags)"""
+        prefixes = [child.literalPrefix( generator ) for child in self.children]
+        if not prefixes:
+            return ''
+        result = prefixes[0]
+        for prefix in prefixes[1:]:
+            while not prefix.startswith( result ):
+                result = result[:-1]
+        return result
 
 class Prebuilt( ElementToken ):
     """Holder for pre-built TextTools tag tables
@@ -606,10 +851,22 @@ class LibraryElement( ElementToken ):
                 else:
                     # this is a table that got returned!
                     basetable = (None, SubTable, basetable)
-            return self.permute( basetable )
+            return self.permute( basetable, generator )
         except:
             print(basetable)
             raise
+    def baseNullable( self, generator, atEOF=0 ):
+        """Determine if the base element (ignoring flags) can match without consuming input"""
+        return self.generator.isNullable( self.production, atEOF )
+    def baseAlwaysMatches( self, generator ):
+        """Determine if the base element (ignoring flags) matches wherever it is tried"""
+        return self.generator.alwaysMatches( self.production )
+    def baseFirstCharacters( self, generator ):
+        """Determine the starting characters of the base element (ignoring flags)"""
+        return self.generator.firstCharacters( self.production )
+    def baseLiteralPrefix( self, generator ):
+        """Determine the literal prefix of the base element (ignoring flags)"""
+        return self.generator.literalPrefix( self.production )
 
 class Name( ElementToken ):
     """Reference to another rule in the grammar
@@ -693,7 +950,19 @@ class Name( ElementToken ):
                 command = command | flags
         if tagobject is None and not flags:
             if self.terminal(generator):
-                if extractFlags(self,reportChildren) != extractFlags(target):
+                if self.minimum is not None or target.minimum is not None:
+                    # bounded repetitions can't be folded into a single
+                    # flag-set, so wrap the target's table in our own flags
+                    partial = tuple(target.toParser(
+                        generator,
+                        not reportChildren
+                    ))
+                    if len(partial) == 1 and len(partial[0]) == 3:
+                        partial = partial[0]
+                    else:
+                        partial = (None, SubTable, partial)
+                    return self.permute( partial, generator )
+                elif extractFlags(self,reportChildren) != extractFlags(target):
                     composite = compositeFlags(self,target, reportChildren)
                     partial = generator.getCustomTerminalParser( sindex,composite)
                     if partial is not None:
@@ -729,13 +998,18 @@ class Name( ElementToken ):
                 generator.setTerminalParser( sindex, partial)
             if len(partial) == 1 and len(partial[0]) == 3 and (
                 partial[0][0] is None or tagobject is None
+            ) and not (
+                # multi-character CILiterals used to match a character
+                # at a time, so they report an (empty) children list
+                tagobject is not None and
+                isinstance(target, CILiteral) and len(target.value) > 1
             ):
                 # there is a single child
                 # it doesn't report anything, or we don't
                 partial = (partial[0][0] or tagobject,)+ partial[0][1:]
             else:
                 partial = (tagobject, Table, tuple(partial))
-            return self.permute( partial )
+            return self.permute( partial, generator )
         basetable = (
             tagobject,
             command, (
@@ -743,7 +1017,7 @@ class Name( ElementToken ):
                 sindex,
             )
         )
-        return self.permute( basetable )
+        return self.permute( basetable, generator )
     terminalValue = None
     def terminal (self, generator):
         """Determine if this element is terminal for the generator"""
@@ -754,6 +1028,25 @@ class Name( ElementToken ):
         if target.terminal( generator):
             self.terminalValue = 1
         return self.terminalValue
+    def nullable( self, generator, atEOF=0 ):
+        """Determine if this element can match without consuming input"""
+        if self.negative and atEOF:
+            # a negated terminal is compiled as the target's own
+            # negative table (e.g. IsNotIn), which succeeds at EOF
+            return 1
+        return ElementToken.nullable( self, generator, atEOF )
+    def baseNullable( self, generator, atEOF=0 ):
+        """Determine if the base element (ignoring flags) can match without consuming input"""
+        return generator.isNullable( self.value, atEOF )
+    def baseAlwaysMatches( self, generator ):
+        """Determine if the base element (ignoring flags) matches wherever it is tried"""
+        return generator.alwaysMatches( self.value )
+    def baseFirstCharacters( self, generator ):
+        """Determine the starting characters of the base element (ignoring flags)"""
+        return generator.firstCharacters( self.value )
+    def baseLiteralPrefix( self, generator ):
+        """Determine the literal prefix of the base element (ignoring flags)"""
+        return generator.literalPrefix( self.value )
 
 
 def extractFlags( item, report=1 ):
@@ -1,5 +1,8 @@
 """Real-world parsers using the SimpleParse EBNF"""
 from simpleparse import baseparser, simpleparsegrammar, common
+from simpleparse.stt.TextTools.TextTools import tag, shifttaglist, TextSearch, CharSet
+from simpleparse.stt.TextTools import TextTools
+import bisect, copy
 
 class Parser( baseparser.BaseParser ):
     """EBNF-generated Parsers with results-handling
@@ -46,4 +49,356 @@ class Parser( baseparser.BaseParser ):
             production,
             methodSource=processor,
         )
-    
\ No newline at end of file
+    def compile( self, production=None, processor=None ):
+        """Get an immutable CompiledParser for production
+
+        production -- optional string specifying a non-default production
+        processor -- optional processor as for parse, by default
+            the result of buildProcessor
+
+        The tables for 8-bit and Unicode text are built and
+        linked here, once, the CompiledParser doesn't refer
+        back to this parser or its generator.
+        """
+        if production is None:
+            production = self._rootProduction
+        if processor is None:
+            processor = self.buildProcessor()
+        index = self._generator.getNameIndex( production )
+        lists = []
+        for unicode in (0, 1):
+            self._generator.buildParser(
+                production, methodSource=processor, unicode=unicode,
+            )
+            lists.append( self._generator.getParserList() )
+        return CompiledParser( production, processor, lists[0], lists[1], index )
+    def validate( self, data, production=None, start=0, stop=None ):
+        """Check whether data conforms to production, without building results
+
+        data -- data to be checked, a Python string
+        production -- optional string specifying a non-default production
+        start -- starting index for the parsing, default 0
+        stop -- stoping index for the parsing, default len(data)
+
+        Uses a separately compiled set of tables which report
+        nothing, so no result tuples or lists are created and
+        no processor methods are called.
+
+        returns (success, next)
+        """
+        if production is None:
+            production = self._rootProduction
+        if stop is None:
+            stop = len(data)
+        table = self._generator.buildValidator(
+            production, not isinstance( data, bytes ),
+        )
+        success, children, next = tag( data, table, start, stop, None )
+        return success, next
+    def parse_heatmap(
+        self, data, production=None, processor=None, start=0, stop=None,
+        bucketsize=1024,
+    ):
+        """Parse data, recording where the parse backtracks
+
+        data -- data to be parsed, a Python string
+        production -- optional string specifying a non-default production
+        processor -- as for parse, the processor is only used as a
+            method source, no post-processing is done
+        start -- starting index for the parsing, default 0
+        stop -- stoping index for the parsing, default len(data)
+        bucketsize -- number of text positions per heatmap bucket
+
+        This is a diagnostic for finding the slow spots of a
+        grammar, the engine's bookkeeping makes parsing a good
+        deal slower than parse.
+
+        returns (success, children, next, heatmap) where heatmap
+        is a simpleparse.heatmap.Heatmap instance
+        """
+        from simpleparse.heatmap import Heatmap
+        if processor is None:
+            processor = self.buildProcessor()
+        if stop is None:
+            stop = len(data)
+        self.resetBeforeParse()
+        tagger = self.buildTagger( production, processor )
+        names = list( self._generator.getNames() )
+        # productions inlined by the generator are found by their tagobj
+        productions = dict([(name, index) for index, name in enumerate( names )])
+        success, children, next, raw = TextTools.tagheatmap(
+            data, tagger, start, stop,
+            self._generator.getParserList(), productions, bucketsize,
+        )
+        return success, children, next, Heatmap( *raw, names=names )
+    def finditer( self, data, production=None, processor=None, start=0, stop=None ):
+        """Iterate over the matches of production anywhere in data
+
+        data -- data to be searched, a Python string
+        production -- optional string specifying a non-default production
+        processor -- as for parse, the processor is only used as a
+            method source, no post-processing is done
+        start -- starting index for the search, default 0
+        stop -- stoping index for the search, default len(data)
+
+        Like re.finditer, matches are found left to right and
+        don't overlap.  Rather than trying the production at each
+        offset, candidate positions are found with a TextSearch
+        for a literal every match must start with, or a CharSet
+        search for the characters a match can start with.  The
+        production is tried at every offset if it can match
+        without consuming input.
+
+        yields (production, start, stop, children) result tuples
+        """
+        if production is None:
+            production = self._rootProduction
+        if processor is None:
+            processor = self.buildProcessor()
+        if stop is None:
+            stop = len(data)
+        self.resetBeforeParse()
+        tagger = self.buildTagger( production, processor )
+        search = self.buildCandidateSearch( production, isinstance( data, bytes ) )
+        position = start
+        while position <= stop:
+            if search is not None:
+                position = search( data, position, stop )
+                if position is None:
+                    return
+            success, children, next = tag( data, tagger, position, stop )
+            if success:
+                yield (production, position, next, children)
+                if next > position:
+                    position = next
+                    continue
+            position += 1
+    def buildCandidateSearch( self, production, binary=False ):
+        """Get a function finding the next position where production may match
+
+        binary -- whether the text is bytes, literals and
+            characters from the grammar are matched as UTF-8
+
+        returns search( text, start, stop ) -> position or None,
+        or None if production has to be tried at every position
+        """
+        generator = self._generator
+        if generator.isNullable( production, 1 ):
+            return None
+        prefix = generator.literalPrefix( production )
+        if binary and not isinstance( prefix, bytes ):
+            prefix = prefix.encode( 'utf-8' )
+        if len( prefix ) > 1:
+            searcher = TextSearch( prefix )
+            def search( text, start, stop ):
+                left, right = searcher.search( text, start, stop )
+                if left == right:
+                    return None
+                return left
+            return search
+        first = generator.firstCharacters( production )
+        if first is None:
+            return None
+        characters = {}
+        for character in first:
+            if binary and not isinstance( character, bytes ):
+                # only the lead byte of the UTF-8 encoding is tested
+                character = character.encode( 'utf-8' )[:1].decode( 'latin-1' )
+            if character in '\\-^':
+                character = '\\' + character
+            characters[ character ] = 1
+        charset = CharSet( ''.join( sorted( characters ) ))
+        def search( text, start, stop ):
+            if start >= stop:
+                return None
+            return charset.search( text, 1, start, stop )
+        return search
+    def buildItemTagger( self, production=None ):
+        """Get a parsing table for one repetition of a repeating production
+
+        Call buildTagger for the production first, the item table
+        refers to the same parser list.  Returns None if the
+        production isn't a plain repetition (e.g. root := item*).
+        """
+        if production is None:
+            production = self._rootProduction
+        rootObject = self._generator.getRootObject( production )
+        if not getattr( rootObject, 'repeating', 0 ):
+            return None
+        for attribute in ('negative','lookahead','errorOnFail','minimum'):
+            if getattr( rootObject, attribute, None ):
+                return None
+        single = copy.copy( rootObject )
+        single.repeating = single.optional = 0
+        return tuple( single.toParser( self._generator ) )
+    def reparse(
+        self, old_result, old_text, new_text, edit_range,
+        production=None, processor=None,
+    ):
+        """Reparse new_text, reusing the unaffected parts of old_result
+
+        old_result -- (success, children, next) as returned by tag-level
+            parsing of old_text from position 0 (i.e. parse without a
+            result-processing processor)
+        old_text -- the text old_result describes
+        new_text -- old_text with edit_range replaced
+        edit_range -- (start, end) of the replaced slice of old_text
+        production, processor -- as for parse, the processor is only
+            used as a method source, no post-processing is done
+
+        For productions which are a plain repetition of items
+        (e.g. root := (declaration/comment/ts)*) the top-level
+        children before the edit are kept, parsing restarts at
+        the item boundary just before the edit and stops as soon
+        as an item after the edit matches the old tree again, the
+        remaining old children are reused with their offsets
+        shifted.  Any other production is simply parsed again.
+
+        returns (success, children, next) for new_text
+        """
+        if processor is None:
+            processor = self.buildProcessor()
+        tagger = self.buildTagger( production, processor )
+        item = self.buildItemTagger( production )
+        success, oldChildren, oldNext = old_result
+        if item is None or not success or oldChildren is None:
+            return tag( new_text, tagger, 0, len(new_text) )
+        start, end = edit_range
+        delta = len(new_text) - len(old_text)
+        stop = len(new_text)
+
+        # restart one child before the first child touching the edit,
+        # as that child's end may depend on what followed it, then
+        # back up further until we are at the start of an item
+        index = 0
+        while index < len(oldChildren) and oldChildren[index][2] < start:
+            index += 1
+        index -= 1
+        while index > 0:
+            found, itemChildren, next = tag( new_text, item, oldChildren[index][1], stop )
+            if found and itemChildren and itemChildren[0][:2] == oldChildren[index][:2]:
+                break
+            index -= 1
+        if index > 0:
+            restart = oldChildren[index][1]
+        else:
+            index, restart = 0, 0
+
+        children = list( oldChildren[:index] )
+        lefts = [child[1] for child in oldChildren]
+        matched = restart > 0
+        position = restart
+        while position < stop:
+            found, itemChildren, next = tag( new_text, item, position, stop )
+            if not found or next == position:
+                break
+            matched = True
+            if itemChildren and position - delta >= end:
+                # past the edit, an item starting on an old child's
+                # start which reproduces the old children means the
+                # rest of the old tree still applies
+                old = bisect.bisect_left( lefts, position - delta )
+                if old < len(lefts) and lefts[old] == position - delta:
+                    following = old + len(itemChildren)
+                    if shifttaglist( oldChildren[old:following], delta ) == itemChildren:
+                        children.extend( itemChildren )
+                        children.extend( shifttaglist( oldChildren[following:], delta ))
+                        return success, children, oldNext + delta
+            children.extend( itemChildren or () )
+            position = next
+        if not matched and not self._generator.getRootObject(
+            production or self._rootProduction
+        ).optional:
+            return tag( new_text, tagger, 0, len(new_text) )
+        return 1, children, position
+
+class CompiledParser( object ):
+    """Immutable parser for a single production
+
+    Produced by Parser.compile, holds the linked tag tables
+    for 8-bit and Unicode text and nothing else, parse only
+    reads them, so one CompiledParser can be shared between
+    threads.  Note that the processor (if any) is shared as
+    well, it has to be safe to use from several threads.
+
+    Compiled parsers pickle as their two parser lists, the
+    tag tables in them are restored from their compiled
+    entries and linked again, without going through the
+    grammar or the tag table compiler.  Callouts (processor
+    methods, Call arguments) are pickled by reference, so
+    they have to be importable in the loading process.
+    """
+    __slots__ = (
+        'production', 'processor', 'index',
+        'stringList', 'unicodeList', 'stringTable', 'unicodeTable',
+    )
+    def __init__( self, production, processor, stringList, unicodeList, index ):
+        """Initialise the compiled parser
+
+        production -- name of the production parsed
+        processor -- processor applied to the results, or None
+        stringList, unicodeList -- the generator's parser lists
+            built for bytes and Unicode text
+        index -- index of production in the parser lists
+
+        Links the tables in the lists (a no-op for lists
+        linked by the generator).
+        """
+        TextTools.linktables( stringList, 0 )
+        TextTools.linktables( unicodeList, 1 )
+        for name, value in (
+            ('production', production),
+            ('processor', processor),
+            ('index', index),
+            ('stringList', stringList),
+            ('unicodeList', unicodeList),
+            ('stringTable', stringList[ index ]),
+            ('unicodeTable', unicodeList[ index ]),
+        ):
+            object.__setattr__( self, name, value )
+    def __reduce__( self ):
+        return self.__class__, (
+            self.production, self.processor,
+            self.stringList, self.unicodeList, self.index,
+        )
+    def __setattr__( self, name, value ):
+        raise AttributeError( """CompiledParser objects are immutable""" )
+    def __delattr__( self, name ):
+        raise AttributeError( """CompiledParser objects are immutable""" )
+    def __repr__( self ):
+        return '<%s for %r>'%( self.__class__.__name__, self.production )
+    def parse(
+        self, data, start=0, stop=None,
+        max_results=0, max_depth=0, max_result_bytes=0,
+        max_steps=0, deadline=None, consume=None, intern_matches=0,
+    ):
+        """Parse data with the compiled production
+
+        data -- data to be parsed, a Python string
+        start -- starting index for the parsing, default 0
+        stop -- stoping index for the parsing, default len(data)
+        max_results, max_depth, max_result_bytes, max_steps,
+            deadline -- limits as for BaseParser.parse
+        consume -- handlers for results to be processed and
+            dropped early, as for BaseParser.parse
+        intern_matches -- as for BaseParser.parse
+
+        returns as BaseParser.parse
+        """
+        if stop is None:
+            stop = len(data)
+        if isinstance( data, bytes ):
+            table = self.stringTable
+        else:
+            table = self.unicodeTable
+        value = tag(
+            data, table, start, stop,
+            max_results=max_results, max_depth=max_depth,
+            max_result_bytes=max_result_bytes,
+            max_steps=max_steps, deadline=deadline, consume=consume,
+            intern_matches=intern_matches,
+        )
+        processor = self.processor
+        if processor and callable(processor):
+            return processor( value, data )
+        return value
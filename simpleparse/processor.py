@@ -24,11 +24,17 @@ class MethodSource(object):
             
             If it is TextTools.AppendTagobj, then append the associated
             tagobject itself to the results tree.
+
+            If it is TextTools.AppendNumber, then convert the matched
+            text to a number and store it in the TextTools.NumberSink
+            given as _o_productionname (see
+            simpleparse.common.numbers.NumberCollector).
             
-        _o_productionname -- with AppendToTagobj, AppendTagobj and
-            cases where there is no _m_productionname defined, this
-            allows you to provide an explicit tagobject for reporting
-            in the results tree/getting called with results.
+        _o_productionname -- with AppendToTagobj, AppendTagobj,
+            AppendNumber and cases where there is no _m_productionname
+            defined, this allows you to provide an explicit tagobject
+            for reporting in the results tree/getting called with
+            results.
     """
 
 
@@ -139,7 +139,13 @@ SPGenerator.addDefinition (
                 ]
             ),
             whitespace,
-            Name (value = "occurence_indicator", optional = 1),
+            FirstOfGroup (
+                children = [
+                    Name (value = "occurence_indicator"),
+                    Name (value = "repetition_bounds"),
+                ],
+                optional = 1,
+            ),
             whitespace,
             Name (value = "error_on_fail", optional = 1),
         ]
@@ -159,6 +165,31 @@ SPGenerator.addDefinition (
     "occurence_indicator",
     Range (value = "+*?" ),
 )	
+SPGenerator.addDefinition (
+    "repetition_bounds",
+    SequentialGroup (
+        children = [
+            Literal (value = "{"),
+            Name (value = "repetition_min", optional = 1),
+            SequentialGroup (
+                children = [
+                    Literal (value = ","),
+                    Name (value = "repetition_max", optional = 1),
+                ],
+                optional = 1,
+            ),
+            Literal (value = "}"),
+        ],
+    ),
+)
+SPGenerator.addDefinition (
+    "repetition_min",
+    Range (value = "0123456789", repeating = 1),
+)
+SPGenerator.addDefinition (
+    "repetition_max",
+    Range (value = "0123456789", repeating = 1),
+)
 SPGenerator.addDefinition (
     "error_on_fail",
     SequentialGroup (
@@ -413,11 +444,14 @@ SPGenerator.addDefinition (
 declaration = r"""declarationset      :=  declaration+
 declaration         :=  ts, (unreportedname/expandedname/name) ,ts,':',':'?,'=',seq_group
 
-element_token       :=  lookahead_indicator?, ts, negpos_indicator?,ts, (literal/range/group/name),ts, occurence_indicator?, ts, error_on_fail?
+element_token       :=  lookahead_indicator?, ts, negpos_indicator?,ts, (literal/range/group/name),ts, (occurence_indicator/repetition_bounds)?, ts, error_on_fail?
 
 negpos_indicator    :=  [-+]
 lookahead_indicator :=  "?"
 occurence_indicator :=  [+*?]
+repetition_bounds   :=  '{', repetition_min?, (',', repetition_max?)?, '}'
+repetition_min      :=  [0-9]+
+repetition_max      :=  [0-9]+
 error_on_fail       :=  "!", (ts,literal)?
 
 >group<             :=  '(',seq_group, ')'
@@ -537,12 +571,15 @@ class SPGrammarProcessor( DispatchProcessor ):
         repeating = 0
         lookahead = 0
         errorOnFail = None
+        minimum = maximum = None
         for tup in sublist:
             result = dispatch( self, tup, buffer )
             if tup[0] == 'negpos_indicator':
                 negative = result
             elif tup[0] == 'occurence_indicator':
                 optional, repeating = result
+            elif tup[0] == 'repetition_bounds':
+                minimum, maximum = result
             elif tup[0] == 'lookahead_indicator':
                 lookahead = result
             elif tup[0] == 'error_on_fail':
@@ -555,6 +592,9 @@ class SPGrammarProcessor( DispatchProcessor ):
         base.negative = negative
         base.repeating = repeating
         base.lookahead = lookahead
+        if minimum is not None:
+            base.minimum = minimum
+            base.maximum = maximum
         if errorOnFail:
             base.errorOnFail = errorOnFail
         return base
@@ -639,6 +679,22 @@ class SPGrammarProcessor( DispatchProcessor ):
         '''Return optional, repeating as a tuple of true/false values'''
         value = getString(tup, buffer)
         return self.occurenceIndicatorMap[value]
+    def repetition_bounds( self, info, buffer ):
+        '''Return minimum, maximum (None for no limit) for a "{m,n}" range'''
+        (tag, left, right, sublist) = info
+        minimum, maximum = 0, None
+        for tup in sublist:
+            if tup[0] == 'repetition_min':
+                minimum = int( getString(tup, buffer) )
+            elif tup[0] == 'repetition_max':
+                maximum = int( getString(tup, buffer) )
+        if ',' not in buffer[left:right]:
+            if not sublist:
+                raise ValueError( "Repetition bounds %s don't specify a count"%(buffer[left:right]) )
+            maximum = minimum
+        if maximum is not None and (maximum < minimum or maximum == 0):
+            raise ValueError( "Repetition bounds %s can never match"%(buffer[left:right]) )
+        return minimum, maximum
     def lookahead_indicator( self, tup, buffer ):
         """If present, the lookahead indictor just says "yes", so just return 1"""
         return 1
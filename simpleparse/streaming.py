@@ -0,0 +1,158 @@
+"""Asynchronous parsing of record streams (requires Python 3.6+)
+
+BaseParser.parse_stream reads data from an asyncio.StreamReader,
+buffering it until complete records are available, and matches
+(and post-processes) the records in an executor so that neither
+the tagging engine nor the processor runs on the event loop's
+thread:
+
+    async for record, result in parser.parse_stream( reader, 'record' ):
+        ...
+
+A record is complete once the record production has matched and
+stopped before the end of the buffered data (or the stream has
+ended), as more data could otherwise extend the match.  The
+generator only reads more data when the consumer asks for the
+next result, so a slow consumer slows down the reading.
+
+Note that the tagging engine holds the interpreter lock while
+matching, use a concurrent.futures.ProcessPoolExecutor as the
+executor to match in parallel with the event loop (the processor
+then has to be picklable as well).
+"""
+import asyncio, codecs, concurrent.futures
+from simpleparse.stt.TextTools.TextTools import tag, shifttaglist
+from simpleparse.error import ParserSyntaxError
+
+_executor = None
+def defaultExecutor( ):
+    """Get the shared single-worker executor used for matching"""
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor( max_workers=1 )
+    return _executor
+
+def matchRecords(
+    tagger, buffer, final, production=None, offset=0, processor=None,
+):
+    """Match as many complete records as possible from the start of buffer
+
+    tagger -- tag table for the record production
+    buffer -- text buffered so far
+    final -- whether the stream has ended, if so, buffer
+        must be consumed completely
+    production -- name of the record production, for error reports
+    offset -- number of characters of the stream consumed before
+        buffer, error positions are offsets in the whole stream
+    processor -- as for BaseParser.parse, called for each record
+
+    returns ( [(record, result), ...], consumed ) where result is
+    what parse would return for the record text
+    """
+    results = []
+    position = 0
+    length = len(buffer)
+    while position < length:
+        success, children, next = tag( buffer, tagger, position, length )
+        if not success or next == position:
+            if final:
+                error = ParserSyntaxError( )
+                error.production = production or ""
+                error.buffer = buffer
+                error.bufferOffset = offset
+                error.position = offset + position
+                raise error
+            break
+        if next == length and not final:
+            # the record may continue in data not yet read
+            break
+        if position:
+            children = shifttaglist( children, -position )
+        record = buffer[position:next]
+        value = (1, children, len(record))
+        if processor and callable(processor):
+            value = processor( value, record )
+        results.append( (record, value) )
+        position = next
+    return results, position
+
+async def parse_stream(
+    parser, reader, production=None, processor=None,
+    encoding='utf-8', chunkSize=65536, limit=2**24,
+    executor=None,
+):
+    """Asynchronously iterate over the records read from reader
+
+    parser -- the BaseParser whose production is used
+    reader -- asyncio.StreamReader (or anything with a coroutine
+        read(n) method returning bytes, empty at the end)
+    production -- name of the record production, the parser's
+        default production if not specified
+    processor -- as for BaseParser.parse
+    encoding -- encoding of the stream's data, None to parse
+        the bytes as they are
+    chunkSize -- number of bytes to read at a time
+    limit -- maximum number of characters buffered for a
+        single record, ValueError is raised beyond that
+    executor -- concurrent.futures executor in which to run the
+        tagging engine, by default a shared single thread
+
+    yields (record, result) where result is what parse would
+    return for the record text
+    """
+    loop = asyncio.get_event_loop()
+    if processor is None:
+        processor = parser.buildProcessor()
+    if executor is None:
+        executor = defaultExecutor()
+    # compiling the grammar can take a while as well; it runs in the
+    # loop's default executor as the tagger has to be built in this
+    # process (where the parser caches it)
+    tagger = await loop.run_in_executor(
+        None, parser.buildTagger, production, processor,
+    )
+    if encoding:
+        decoder = codecs.getincrementaldecoder( encoding )()
+        buffer = ''
+    else:
+        decoder = None
+        buffer = b''
+    # data read since the buffer was last matched
+    chunks = []
+    buffered = 0
+    # an incomplete record is only matched again from its start once
+    # the buffered data has doubled, so large records stay linear
+    threshold = 0
+    # characters matched (and dropped from the buffer) so far
+    offset = 0
+    final = False
+    while not final:
+        data = await reader.read( chunkSize )
+        final = not data
+        if decoder is not None:
+            data = decoder.decode( data, final )
+        if data:
+            chunks.append( data )
+            buffered += len(data)
+        if not buffered or not (
+            final or buffered >= threshold or buffered > limit
+        ):
+            continue
+        buffer = buffer + buffer[:0].join( chunks )
+        chunks = []
+        results, consumed = await loop.run_in_executor(
+            executor, matchRecords,
+            tagger, buffer, final, production, offset, processor,
+        )
+        buffer = buffer[consumed:]
+        offset += consumed
+        buffered = len(buffer)
+        threshold = 2 * buffered
+        if buffered > limit:
+            raise ValueError(
+                """Record buffer exceeded %s characters without a complete %s record"""%(
+                    limit, production or parser._rootProduction,
+                )
+            )
+        for record, value in results:
+            yield record, value
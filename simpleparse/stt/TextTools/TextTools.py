@@ -289,6 +289,40 @@ def multireplace(text,replacements,start=0,stop=None,
     else:
         return join(joinlist(text,replacements,start))
 
+def replaceall(text,replacements,start=0,stop=None,file=None,translate=None,
+
+               SearchSet=TextSearchSet):
+
+    """ Replace several strings in text in a single pass.
+
+        replacements maps match strings to their replacements (a
+        dictionary or a sequence of (what, with_what) pairs). At each
+        position the longest match string wins, replacements are
+        not searched again.
+
+        Returns text[start:stop] with the replacements applied. If
+        file is given, the output is written to it in chunks instead
+        and the number of replacements made is returned. translate
+        is passed to the search object as translation string.
+
+    """
+    if hasattr(replacements,'items'):
+        replacements = replacements.items()
+    what = []
+    with_what = []
+    for w,r in replacements:
+        what.append(w)
+        with_what.append(r)
+    if stop is None:
+        stop = len(text)
+    if not what:
+        if file is None:
+            return text[start:stop]
+        file.write(text[start:stop])
+        return 0
+    so = SearchSet(what,translate)
+    return so.replace(text,with_what,start,stop,file)
+
 def find(text,what,start=0,stop=None,
 
          SearchObject=TextSearch):
@@ -353,6 +387,28 @@ def split(text,sep,start=0,stop=None,translate=None,
     append(text[l:])
     return list
 
+def itersplit(text,sep,start=0,stop=None,translate=None,offsets=0,
+
+              SearchObject=TextSearch):
+
+    """ Iterator version of split().
+
+        Yields the parts of text[start:stop] between the occurances
+        of sep without building a list, or their slices (l,r) if
+        offsets is true. sep may also be a TextSearch or
+        TextSearchSet object. text may be an mmap or memoryview.
+
+    """
+    if isinstance(sep,(TextSearchType,TextSearchSetType)):
+        so = sep
+    elif translate:
+        so = SearchObject(sep,translate)
+    else:
+        so = SearchObject(sep)
+    if stop is None:
+        return so.itersplit(text,start,offsets=offsets)
+    return so.itersplit(text,start,stop,offsets)
+
 # helper for tagdict
 def _tagdict(text,dict,prefix,taglist):
 
@@ -423,7 +479,7 @@ def collapse(text,separator=' ',
 _linesplit_table = (
     (None,Is,'\r',+1),
     (None,Is,'\n',+1),
-    ('line',AllInCharSet+AppendMatch,CharSet('^\r\n'),+1,-2),
+    ('line',AllInCharSet+AppendMatch,CharSet(u'^\r\n'),+1,-2),
     (None,EOF,Here,+1,MatchOk),
     ('empty line',Skip+AppendMatch,0,0,-4),
     )
@@ -486,6 +542,20 @@ def splitwords(text,
     """
     return charset.split(text)
 
+def itersplitwords(text,start=0,stop=None,offsets=0,
+
+                   charset=whitespace_charset):
+
+    """ Iterator version of splitwords().
+
+        Yields the words of text[start:stop], or their slices (l,r)
+        if offsets is true. text may be an mmap or memoryview.
+        
+    """
+    if stop is None:
+        return charset.itersplit(text,start,offsets=offsets)
+    return charset.itersplit(text,start,stop,offsets)
+
 #
 # Testing and benchmarking
 #
@@ -22,8 +22,12 @@ def _CS(definition):
     return CharSet(definition)
 def _TT(definition):
     return TagTable(definition)
+def _TTE(entries,tabletype,definition=None):
+    return restoretagtable(entries,tabletype,definition)
 def _TS(match,translate,algorithm):
     return TextSearch(match,translate,algorithm)
+def _TSS(patterns,translate):
+    return TextSearchSet(patterns,translate)
 # Needed for backward compatibility:
 def _BMS(match,translate):
     return BMS(match,translate)
@@ -38,9 +42,15 @@ class modinit:
     def pickle_CharSet(cs):
         return _CS,(cs.definition,)
     def pickle_TagTable(tt):
-        return _TT,(tt.compiled(),)
+        # the definition is still needed to compile the table
+        # for the other text type, compiled() entries are restored
+        # as they are, see restoretagtable()
+        return (_TTE,(tt.compiled(), tt.tabletype, getattr(tt,'definition',None)),
+                tt.__getstate__())
     def pickle_TextSearch(ts):
         return _TS,(ts.match, ts.translate, ts.algorithm)
+    def pickle_TextSearchSet(tss):
+        return _TSS,(tss.patterns, tss.translate)
     copyreg.pickle(CharSetType,
                     pickle_CharSet,
                     _CS)
@@ -50,6 +60,9 @@ class modinit:
     copyreg.pickle(TextSearchType,
                     pickle_TextSearch,
                     _TS)
+    copyreg.pickle(TextSearchSetType,
+                    pickle_TextSearchSet,
+                    _TSS)
     if 0:
         def pickle_BMS(so):
             return _BMS,(so.match,so.translate)
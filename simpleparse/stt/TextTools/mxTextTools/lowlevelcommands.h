@@ -13,8 +13,10 @@
 	only childPosition should be updated otherwise
 
 */
-TE_CHAR *m = TE_STRING_AS_STRING(match);
-if (m == NULL) {
+/* the set and CharSet commands (>= MATCH_ALLINSET) don't get a string
+   of the text's type as match, so don't read one from it */
+TE_CHAR *m = command < MATCH_ALLINSET ? TE_STRING_AS_STRING(match) : NULL;
+if (m == NULL && command < MATCH_ALLINSET) {
 	childReturnCode = ERROR_CODE;
 	errorType = PyExc_TypeError;
 	errorMessage = PyString_FromFormat(
@@ -204,6 +206,75 @@ switch (command) {
 		break;
 	}
 
+	case MATCH_CIWORD:
+
+	{
+		Py_ssize_t ml1 = TE_STRING_GET_SIZE(match) - 1;
+		register TE_CHAR *tx = &text[childPosition + ml1];
+		register Py_ssize_t j = ml1;
+		register TE_CHAR *mj = &m[j];
+
+		DPRINTF("\nCIWord :\n"
+			" looking for   = '%.40s'\n"
+			" in string     = '%.40s'\n",m,&text[childPosition]);
+
+		if (childPosition+ml1 >= sliceright) break;
+		
+		/* compare from right to left */
+		for (; j >= 0 && (*tx == *mj || 
+				  TE_CHAR_FOLD(*tx) == TE_CHAR_FOLD(*mj));
+		 tx--, mj--, j--) ;
+
+		if (j >= 0) /* not matched */
+		childPosition = startPosition; /* reset */
+		else
+		childPosition += ml1 + 1;
+		break;
+	}
+
+	case MATCH_CIWORDSTART:
+	case MATCH_CIWORDEND:
+
+	{
+		Py_ssize_t ml1 = TE_STRING_GET_SIZE(match) - 1;
+
+		if (ml1 >= 0) {
+		register TE_CHAR *tx = &text[childPosition];
+			
+		DPRINTF("\nCIWordStart/End :\n"
+			" looking for   = '%.40s'\n"
+			" in string     = '%.40s'\n",m,tx);
+
+		/* Brute-force method; from right to left */
+		for (;;) {
+			register Py_ssize_t j = ml1;
+			register TE_CHAR *mj = &m[j];
+
+			if (childPosition+j >= sliceright) {
+			/* reached eof: no match, rewind */
+			childPosition = startPosition;
+			break;
+			}
+
+			/* scan from right to left */
+			for (tx += j; j >= 0 && (*tx == *mj || 
+						 TE_CHAR_FOLD(*tx) == TE_CHAR_FOLD(*mj));
+			 tx--, mj--, j--) ;
+
+			if (j < 0) {
+			/* found */
+			if (command == MATCH_CIWORDEND) childPosition += ml1 + 1;
+			break;
+			}
+			/* not found: rewind and advance one char */
+			tx -= j - 1;
+			childPosition++;
+		}
+		}
+
+		break;
+	}
+
 #if (TE_TABLETYPE == MXTAGTABLE_STRINGTYPE)
 
 	/* Note: These two only work for 8-bit set strings. */
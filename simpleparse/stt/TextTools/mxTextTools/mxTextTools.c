@@ -18,6 +18,7 @@
 #include "mx.h"
 #include "mxTextTools.h"
 #include "structmember.h"
+#include "datetime.h"
 #include <ctype.h>
 
 #define VERSION "2.1.0"
@@ -59,8 +60,10 @@ PyDoc_STRVAR(Module_docstring,
 /* Translation strings for the 8-bit versions of lower() and upper() */
 static PyObject *mx_ToUpper;
 static PyObject *mx_ToLower;
+unsigned char *mxTextTools_ToLowerTable;	/* mx_ToLower's contents */
 
 static PyObject *mxTextTools_Error;	/* mxTextTools specific error */
+PyObject *mxTextTools_LimitError;	/* tag() limit exceeded */
 
 static PyObject *mxTextTools_TagTables;	/* TagTable cache dictionary */
 
@@ -69,6 +72,14 @@ static int mxTextTools_Initialized = 0;
 
 /* --- forward declarations ----------------------------------------------- */
 
+static
+PyObject *mxSplitIterator_New(PyObject *text,
+			      Py_ssize_t start,
+			      Py_ssize_t stop,
+			      int kind,
+			      PyObject *separator,
+			      int offsets);
+
 /* --- module helper ------------------------------------------------------ */
 
 static
@@ -103,6 +114,12 @@ PyObject *mxTextTools_ToLower(void)
 
 /* --- Text Search Object ----------------------------------------------*/
 
+#ifdef HAVE_UNICODE
+static
+mxhorspool_data *horspool_init(const Py_UNICODE *match,
+			       Py_ssize_t match_len);
+#endif
+
 /* allocation */
 
 static
@@ -159,6 +176,19 @@ PyObject *mxTextSearch_New(PyObject *match,
 		  "trivial search algorithm does not support translate");
 	break;
 
+#ifdef HAVE_UNICODE
+    case MXTEXTSEARCH_HORSPOOL:
+	Py_Assert(PyUnicode_Check(match),
+		  PyExc_TypeError,
+		  "match must be unicode for Horspool");
+	so->data = horspool_init(PyUnicode_AS_UNICODE(match),
+				 PyUnicode_GET_SIZE(match));
+	Py_Assert(so->data != NULL,
+		  PyExc_MemoryError,
+		  "error initializing the search object");
+	break;
+#endif
+
     default:
 	Py_Error(PyExc_ValueError,
 		 "unknown or unsupported algorithm");
@@ -187,7 +217,7 @@ Py_C_Function_WithKeywords(
 
     if (algorithm == -424242) {
 	if (PyUnicode_Check(match))
-	    algorithm = MXTEXTSEARCH_TRIVIAL;
+	    algorithm = MXTEXTSEARCH_HORSPOOL;
 	else
 	    algorithm = MXTEXTSEARCH_BOYERMOORE;
     }
@@ -209,6 +239,10 @@ void mxTextSearch_Free(mxTextSearchObject *so)
 
 	case MXTEXTSEARCH_TRIVIAL:
 	    break;
+
+	case MXTEXTSEARCH_HORSPOOL:
+	    PyMem_Free(so->data);
+	    break;
 	    
 	}
     }
@@ -245,6 +279,9 @@ Py_ssize_t mxTextSearch_MatchLength(PyObject *self)
 #endif
 	break;
 
+    case MXTEXTSEARCH_HORSPOOL:
+	return ((mxhorspool_data *)so->data)->match_len;
+
     }
 
     Py_Error(mxTextTools_Error,
@@ -332,6 +369,91 @@ Py_ssize_t trivial_unicode_search(const Py_UNICODE *text,
     }
     return start;
 }
+
+/* Boyer-Moore-Horspool search for Unicode text. The bad character
+   shift table is indexed by the low byte of the character, the
+   shift for a bucket is the smallest one of the characters sharing
+   it, which keeps the shifts safe for the full Unicode range. */
+
+static
+mxhorspool_data *horspool_init(const Py_UNICODE *match,
+			       Py_ssize_t match_len)
+{
+    mxhorspool_data *c;
+    Py_ssize_t i;
+
+    c = (mxhorspool_data *)PyMem_Malloc(sizeof(mxhorspool_data));
+    if (c == NULL)
+	return NULL;
+    c->match_len = match_len;
+    for (i = 0; i < 256; i++)
+	c->shift[i] = match_len;
+    for (i = 0; i < match_len - 1; i++)
+	c->shift[match[i] & 0xFF] = match_len - 1 - i;
+    return c;
+}
+
+/* Below this match length the shifts are too short to make up for
+   the shift table lookups, a plain scan is faster */
+#define HORSPOOL_MIN_LEN 5
+
+/* Translate a text character, the translate string maps the first
+   256 ordinals, all other characters are left as they are */
+#define HORSPOOL_TR(ch) \
+    ((ch) < 256 ? (Py_UNICODE)(unsigned char)tr[(ch)] : (ch))
+
+static
+Py_ssize_t horspool_unicode_search(mxhorspool_data *c,
+				   const Py_UNICODE *text,
+				   Py_ssize_t start,
+				   Py_ssize_t stop,
+				   const Py_UNICODE *match,
+				   const char *tr)
+{
+    Py_ssize_t ml1 = c->match_len - 1;
+    register const Py_UNICODE *pt;
+    const Py_UNICODE *eot = text + stop;
+    Py_UNICODE last;
+
+    if (ml1 < 0)
+	return start;
+    if (tr == NULL && c->match_len < HORSPOOL_MIN_LEN)
+	return trivial_unicode_search(text, start, stop,
+				      match, c->match_len);
+    last = match[ml1];
+
+    /* pt points to the last character of the current window */
+    pt = text + start + ml1;
+    if (tr == NULL) {
+	while (pt < eot) {
+	    register Py_UNICODE ch = *pt;
+
+	    if (ch == last &&
+		memcmp(pt - ml1, match, ml1 * sizeof(Py_UNICODE)) == 0)
+		/* found */
+		return pt - text + 1;
+	    pt += c->shift[ch & 0xFF];
+	}
+    }
+    else {
+	while (pt < eot) {
+	    register Py_UNICODE ch = HORSPOOL_TR(*pt);
+
+	    if (ch == last) {
+		register Py_ssize_t j = ml1 - 1;
+
+		while (j >= 0 && HORSPOOL_TR(pt[j - ml1]) == match[j])
+		    j--;
+		if (j < 0)
+		    /* found */
+		    return pt - text + 1;
+	    }
+	    pt += c->shift[ch & 0xFF];
+	}
+    }
+    return start;
+}
+#undef HORSPOOL_TR
 #endif
 
 /* Search for the match in text[start:stop]. 
@@ -353,6 +475,9 @@ Py_ssize_t mxTextSearch_SearchBuffer(PyObject *self,
     Py_ssize_t nextpos;
     Py_ssize_t match_len;
 
+    if (mxTextSearchSet_Check(self))
+	return mxTextSearchSet_Search(self, text, 0, start, stop,
+				      sliceleft, sliceright, NULL);
     Py_Assert(mxTextSearch_Check(self),
 	      PyExc_TypeError,
 	      "expected a TextSearch object");
@@ -379,6 +504,7 @@ Py_ssize_t mxTextSearch_SearchBuffer(PyObject *self,
 	break;
 
     case MXTEXTSEARCH_TRIVIAL:
+    case MXTEXTSEARCH_HORSPOOL:
 	{
 	    const char *match;
 
@@ -427,6 +553,9 @@ Py_ssize_t mxTextSearch_SearchUnicode(PyObject *self,
     Py_ssize_t nextpos;
     Py_ssize_t match_len;
 
+    if (mxTextSearchSet_Check(self))
+	return mxTextSearchSet_Search(self, text, 1, start, stop,
+				      sliceleft, sliceright, NULL);
     Py_Assert(mxTextSearch_Check(self),
 	      PyExc_TypeError,
 	      "expected a TextSearch object");
@@ -464,6 +593,17 @@ Py_ssize_t mxTextSearch_SearchUnicode(PyObject *self,
 	}
 	break;
 
+    case MXTEXTSEARCH_HORSPOOL:
+	match_len = ((mxhorspool_data *)so->data)->match_len;
+	nextpos = horspool_unicode_search((mxhorspool_data *)so->data,
+					  text,
+					  start,
+					  stop,
+					  PyUnicode_AS_UNICODE(so->match),
+					  so->translate ?
+					  PyString_AS_STRING(so->translate) : NULL);
+	break;
+
     default:
 	Py_Error(mxTextTools_Error,
 		 "unknown algorithm type in mxTextSearch_SearchUnicode");
@@ -691,6 +831,28 @@ Py_C_Function( mxTextSearch_findall,
     return NULL;
 }
 
+Py_C_Function_WithKeywords( mxTextSearch_itersplit,
+	       "itersplit(text,start=0,stop=len(text),offsets=0)\n\n"
+	       "Return an iterator over the parts of text[start:stop]\n"
+	       "between the matches, like split() but without building\n"
+	       "a list; text may also be an mmap or memoryview. With\n"
+	       "offsets true, (l,r) slices are returned instead.")
+{
+    PyObject *text;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = INT_MAX;
+    int offsets = 0;
+
+    Py_KeywordsGet4Args("O|nni:itersplit",
+			text,start,stop,offsets);
+
+    return mxSplitIterator_New(text, start, stop,
+			       MXSPLIT_SEARCH, self, offsets);
+
+ onError:
+    return NULL;
+}
+
 #ifdef COPY_PROTOCOL
 Py_C_Function( mxTextSearch_copy,
 	       "copy([memo])\n\n"
@@ -751,6 +913,7 @@ PyMethodDef mxTextSearch_Methods[] =
     Py_MethodListEntry("search",mxTextSearch_search),
     Py_MethodListEntry("find",mxTextSearch_find),
     Py_MethodListEntry("findall",mxTextSearch_findall),
+    Py_MethodWithKeywordsListEntry("itersplit",mxTextSearch_itersplit),
 #ifdef COPY_PROTOCOL
     Py_MethodListEntry("__deepcopy__",mxTextSearch_copy),
     Py_MethodListEntry("__copy__",mxTextSearch_copy),
@@ -800,2411 +963,6137 @@ PyTypeObject mxTextSearch_Type = {
     mxTextSearch_members,               /*tp_members*/
 };
 
-/* --- Character Set Object --------------------------------------------*/
+/* --- Text Search Set Object ------------------------------------------*/
 
 /* internal */
 
-/* 8-bit character sets are implemented using a simple 32-byte
-   long bitmap with one bit per character.
+/* Get the ordinal of character i in a match string or the text */
+#define SEARCHSET_CHAR(text, unicode, i) \
+    ((unicode) ? (Py_UCS4)((Py_UNICODE *)(text))[(i)] \
+               : (Py_UCS4)((unsigned char *)(text))[(i)])
 
-   Addressing is done as follows:
+static
+int mxTextSearchSet_CompareEdges(const void *a,
+				 const void *b)
+{
+    Py_UCS4 x = ((mxsearchset_edge *)a)->ch;
+    Py_UCS4 y = ((mxsearchset_edge *)b)->ch;
 
-      def char_is_set(ordinal):
-          return bitmap[ordinal >> 3]  & (1 << (ordinal & 7))
+    return (x > y) - (x < y);
+}
 
-*/
+/* Return the child of node for character ch or -1 */
 
-#define STRING_CHARSET_SIZE 		256
-#define STRING_CHARSET_BITMAP_SIZE 	(STRING_CHARSET_SIZE / 8)
+static
+Py_ssize_t mxTextSearchSet_Child(mxTextSearchSetObject *so,
+				 Py_ssize_t node,
+				 Py_UCS4 ch)
+{
+    mxsearchset_edge *edge = so->edge + so->node[node].edges;
+    Py_ssize_t left = 0;
+    Py_ssize_t right = so->node[node].edgecount;
 
-typedef struct {
-    unsigned char bitmap[STRING_CHARSET_BITMAP_SIZE];
-    						/* character bitmap */
-} string_charset;
+    while (left < right) {
+	Py_ssize_t middle = (left + right) / 2;
+
+	if (edge[middle].ch < ch)
+	    left = middle + 1;
+	else if (edge[middle].ch > ch)
+	    right = middle;
+	else
+	    return edge[middle].target;
+    }
+    return -1;
+}
+
+/* Build the automaton for the match strings in so->patterns */
 
 static
-int init_string_charset(mxCharSetObject *cs,
-			PyObject *definition)
+int mxTextSearchSet_Build(mxTextSearchSetObject *so)
 {
-    register Py_ssize_t i, j;
-    char *def = PyString_AS_STRING(definition);
-    const Py_ssize_t len = PyString_GET_SIZE(definition);
-    string_charset *lookup = 0;
-    register unsigned char *bitmap;
-    int logic = 1;
-
-    /* Handle logic change (first char is '^' for negative matching) */
-    if (len > 0 && def[0] == '^') {
-	logic = 0;
-	i = 1;
+    Py_ssize_t npatterns = PyTuple_GET_SIZE(so->patterns);
+    Py_ssize_t total = 1;
+    Py_ssize_t i, j, n;
+    Py_ssize_t *firstchild = NULL;
+    Py_ssize_t *sibling = NULL;
+    Py_ssize_t *queue = NULL;
+    mxsearchset_edge *unsorted = NULL;
+
+    for (i = 0; i < npatterns; i++) {
+	PyObject *pattern = PyTuple_GET_ITEM(so->patterns, i);
+
+	if (PyString_Check(pattern))
+	    total += PyString_GET_SIZE(pattern);
+#ifdef HAVE_UNICODE
+	else if (PyUnicode_Check(pattern))
+	    total += PyUnicode_GET_SIZE(pattern);
+#endif
+	else
+	    Py_Error(PyExc_TypeError,
+		     "match strings must be strings or unicode");
     }
-    else
-	i = 0;
-    
-    /* Build 32-byte lookup bitmap (one bit per character) */
-    lookup = (string_charset *)PyMem_Malloc(sizeof(string_charset));
-    if (lookup == NULL) {
+
+    /* every character adds at most one node and the edge leading to it */
+    so->node = (mxsearchset_node *)PyMem_Malloc(total * sizeof(mxsearchset_node));
+    so->edge = (mxsearchset_edge *)PyMem_Malloc(total * sizeof(mxsearchset_edge));
+    unsorted = (mxsearchset_edge *)PyMem_Malloc(total * sizeof(mxsearchset_edge));
+    firstchild = (Py_ssize_t *)PyMem_Malloc(total * sizeof(Py_ssize_t));
+    sibling = (Py_ssize_t *)PyMem_Malloc(total * sizeof(Py_ssize_t));
+    queue = (Py_ssize_t *)PyMem_Malloc(total * sizeof(Py_ssize_t));
+    if (so->node == NULL || so->edge == NULL || unsorted == NULL ||
+	firstchild == NULL || sibling == NULL || queue == NULL) {
 	PyErr_NoMemory();
 	goto onError;
     }
-    memset(lookup, 0, sizeof(string_charset));
-    cs->mode = MXCHARSET_8BITMODE;
-    cs->lookup = (void *)lookup;
-    bitmap = lookup->bitmap;
 
-    for (; i < len; i++) {
+    /* Insert the match strings into a trie, the children of a node
+       are kept as a linked list of edges for now */
+    memset(so->node, 0, sizeof(mxsearchset_node));
+    firstchild[0] = -1;
+    so->nodecount = 1;
+    for (i = 0; i < npatterns; i++) {
+	PyObject *pattern = PyTuple_GET_ITEM(so->patterns, i);
+	int unicode = !PyString_Check(pattern);
+	void *match;
+	Py_ssize_t match_len;
+	Py_ssize_t current = 0;
+
+	if (unicode) {
+	    match = PyUnicode_AS_UNICODE(pattern);
+	    match_len = PyUnicode_GET_SIZE(pattern);
+	}
+	else {
+	    match = PyString_AS_STRING(pattern);
+	    match_len = PyString_GET_SIZE(pattern);
+	}
+	Py_Assert(match_len > 0,
+		  PyExc_ValueError,
+		  "match strings must not be empty");
 
-	/* Handle escapes: "b\-d", "\\" */
-	if (def[i] == '\\') {
-	    if (i < len - 1 && def[i+1] == '\\') {
-		j = (unsigned char)'\\';
-		bitmap[j >> 3] |= 1 << (j & 7);
-		i++;
+	for (j = 0; j < match_len; j++) {
+	    Py_UCS4 ch = SEARCHSET_CHAR(match, unicode, j);
+	    Py_ssize_t e;
+
+	    for (e = firstchild[current]; e >= 0; e = sibling[e])
+		if (unsorted[e].ch == ch)
+		    break;
+	    if (e < 0) {
+		n = so->nodecount++;
+		so->node[n].depth = j + 1;
+		so->node[n].matchlen = 0;
+		so->node[n].pattern = -1;
+		firstchild[n] = -1;
+		/* the edge leading to node n is edge n */
+		e = n;
+		unsorted[e].ch = ch;
+		unsorted[e].target = n;
+		sibling[e] = firstchild[current];
+		firstchild[current] = e;
 	    }
-	    continue;
+	    current = unsorted[e].target;
 	}
-
-	/* Handle ranges: "b-d", "\\-z", "\--z" */
-	if (i < len - 2 && def[i+1] == '-') {
-	    unsigned char range_left = def[i];
-	    unsigned char range_right = def[i+2];
-	    for (j = range_left; j <= range_right; j++)
-		bitmap[j >> 3] |= 1 << (j & 7);
-	    i++;
-	    continue;
+	if (so->node[current].matchlen == 0) {
+	    so->node[current].matchlen = match_len;
+	    so->node[current].pattern = i;
 	}
+    }
 
-	/* Normal processing */
-	j = (unsigned char)def[i];
-	bitmap[j >> 3] |= 1 << (j & 7);
+    /* Store the children of each node as a sorted run of edges */
+    j = 0;
+    for (n = 0; n < so->nodecount; n++) {
+	Py_ssize_t e;
+
+	so->node[n].edges = j;
+	for (e = firstchild[n]; e >= 0; e = sibling[e])
+	    so->edge[j++] = unsorted[e];
+	so->node[n].edgecount = j - so->node[n].edges;
+	qsort(so->edge + so->node[n].edges,
+	      so->node[n].edgecount,
+	      sizeof(mxsearchset_edge),
+	      mxTextSearchSet_CompareEdges);
     }
 
-    /* Invert bitmap if negative matching is requested */
-    if (!logic) {
-	DPRINTF("init_string_charset: inverting bitmap\n");
-	for (i = 0; i < STRING_CHARSET_BITMAP_SIZE; i++)
-	    bitmap[i] ^= 0xFF;
+    /* Breadth first: the failure link of a node points to the node
+       of its longest proper suffix, matches ending there end here too */
+    so->node[0].fail = 0;
+    queue[0] = 0;
+    for (i = 0, n = 1; i < n; i++) {
+	Py_ssize_t parent = queue[i];
+	mxsearchset_edge *edge = so->edge + so->node[parent].edges;
+
+	for (j = 0; j < so->node[parent].edgecount; j++) {
+	    Py_ssize_t child = edge[j].target;
+	    Py_ssize_t fail = 0;
+
+	    if (parent != 0) {
+		Py_ssize_t f = so->node[parent].fail;
+
+		for (;;) {
+		    fail = mxTextSearchSet_Child(so, f, edge[j].ch);
+		    if (fail >= 0 || f == 0)
+			break;
+		    f = so->node[f].fail;
+		}
+		if (fail < 0)
+		    fail = 0;
+	    }
+	    so->node[child].fail = fail;
+	    if (so->node[child].matchlen == 0) {
+		so->node[child].matchlen = so->node[fail].matchlen;
+		so->node[child].pattern = so->node[fail].pattern;
+	    }
+	    queue[n++] = child;
+	}
+    }
+
+    for (i = 0; i < 256; i++) {
+	n = mxTextSearchSet_Child(so, 0, (Py_UCS4)i);
+	so->root[i] = n < 0 ? 0 : n;
     }
 
+    PyMem_Free(unsorted);
+    PyMem_Free(firstchild);
+    PyMem_Free(sibling);
+    PyMem_Free(queue);
     return 0;
 
  onError:
-    if (lookup)
-	PyMem_Free((void *)lookup);
-    cs->lookup = 0;
+    if (unsorted)
+	PyMem_Free(unsorted);
+    if (firstchild)
+	PyMem_Free(firstchild);
+    if (sibling)
+	PyMem_Free(sibling);
+    if (queue)
+	PyMem_Free(queue);
     return -1;
 }
 
-#ifdef HAVE_UNICODE
-
-/* Unicode character sets are implemented using two step indexing
-   which is a good compromise between lookup speed and memory usage.
+/* allocation */
 
-   Lookup is done using a variable length array of 32-byte bitmap
-   blocks. There can be 256 such blocks. Identical blocks are
-   collapsed into a single copy.
-   
-   Addressing is done as follows:
+static
+PyObject *mxTextSearchSet_New(PyObject *patterns,
+			      PyObject *translate)
+{
+    mxTextSearchSetObject *so;
 
-      def char_is_set(ordinal):
-          index = bitmapindex[ordinal >> 8]
-	  bitmap = bitmaps[index]
-          return bitmap[(ordinal >> 3) & 31]  & (1 << (ordinal & 7))
+    so = PyObject_NEW(mxTextSearchSetObject, &mxTextSearchSet_Type);
+    if (so == NULL) 
+	return NULL;
+    so->patterns = NULL;
+    so->translate = NULL;
+    so->node = NULL;
+    so->edge = NULL;
+    so->nodecount = 0;
 
-   The technique used here is very similar to what is done in Python's
-   SRE (see the BIGCHARSET patch by Martin von Loewis). Compression
-   should be reasonably good since character sets in practice usually
-   only contains a few single characters or longer ranges of Unicode
-   characters.
+    so->patterns = PySequence_Tuple(patterns);
+    if (so->patterns == NULL)
+	goto onError;
+    Py_Assert(PyTuple_GET_SIZE(so->patterns) > 0,
+	      PyExc_ValueError,
+	      "need at least one match string");
 
-*/
+    if (translate == Py_None)
+	translate = NULL;
+    else if (translate) {
+	Py_Assert(PyString_Check(translate),
+		  PyExc_TypeError,
+		  "translate table must be a string");
+	Py_Assert(PyString_GET_SIZE(translate) == 256,
+		  PyExc_TypeError,
+		  "translate string must have exactly 256 chars");
+	Py_INCREF(translate);
+    }
+    so->translate = translate;
 
-#define UNICODE_CHARSET_SIZE 		65536
-#define UNICODE_CHARSET_BITMAP_SIZE 	32
-#define UNICODE_CHARSET_BITMAPS 	(UNICODE_CHARSET_SIZE / (UNICODE_CHARSET_BITMAP_SIZE * 8))
-#define UNICODE_CHARSET_BIGMAP_SIZE	(UNICODE_CHARSET_SIZE / 8)
+    if (mxTextSearchSet_Build(so))
+	goto onError;
+    return (PyObject *)so;
 
-typedef struct {
-    unsigned char bitmapindex[UNICODE_CHARSET_BITMAPS];	
-    					/* Index to char bitmaps */
-    unsigned char bitmaps[UNICODE_CHARSET_BITMAPS][UNICODE_CHARSET_BITMAP_SIZE];
-    					/* Variable length bitmap array */
-} unicode_charset;
+ onError:
+    Py_DECREF(so);
+    return NULL;
+}
 
-static
-int init_unicode_charset(mxCharSetObject *cs,
-			 PyObject *definition)
+Py_C_Function_WithKeywords(
+                mxTextSearchSet_TextSearchSet,
+	       "TextSearchSet(patterns[,translate=None])\n\n"
+	       "Create a search object finding the leftmost (and longest)\n"
+	       "match of any of the strings in patterns in one pass;\n"
+	       "translate is an optional translate-string like the one used\n"
+	       "in the module re."
+		)
 {
-    register Py_ssize_t i, j;
-    Py_UNICODE *def = PyUnicode_AS_UNICODE(definition);
-    const Py_ssize_t len = PyUnicode_GET_SIZE(definition);
-    unicode_charset *lookup = 0;
-    unsigned char bigmap[UNICODE_CHARSET_BIGMAP_SIZE];
-    Py_ssize_t blocks;
-    int logic = 1;
+    PyObject *patterns = 0;
+    PyObject *translate = 0;
 
-    /* Handle logic change (first char is '^' for negative matching) */
-    if (len > 0 && def[0] == '^') {
-	logic = 0;
-	i = 1;
-    }
-    else
-	i = 0;
-    
-    /* Build bigmap */
-    memset(bigmap, 0, sizeof(bigmap));
-    for (; i < len; i++) {
+    Py_KeywordsGet2Args("O|O:TextSearchSet",patterns,translate);
 
-	/* Handle escapes: "b\-d", "\\" */
-	if (def[i] == '\\') {
-	    if (i < len - 1 && def[i+1] == '\\') {
-		j = (int)'\\';
-		bigmap[j >> 3] |= 1 << (j & 7);
-		i++;
-	    }
-	    continue;
-	}
+    return mxTextSearchSet_New(patterns, translate);
 
-	/* Handle ranges: "b-d", "\\-z", "\--z" */
-	if (i < len - 2 && def[i+1] == '-') {
-	    Py_UNICODE range_left = def[i];
-	    Py_UNICODE range_right = def[i+2];
-	    if (range_right >= UNICODE_CHARSET_SIZE) {
-		Py_Error(PyExc_ValueError,
-			 "unicode ordinal out of supported range");
-	    }
-	    for (j = range_left; j <= range_right; j++)
-		bigmap[j >> 3] |= 1 << (j & 7);
-	    i++;
-	    continue;
-	}
+ onError:
+    return NULL;
+}
 
-	/* Normal processing */
-	j = def[i];
-	if (j >= UNICODE_CHARSET_SIZE) {
-	    Py_Error(PyExc_ValueError,
-		     "unicode ordinal out of supported range");
-	}
-	bigmap[j >> 3] |= 1 << (j & 7);
-    }
+static 
+void mxTextSearchSet_Free(mxTextSearchSetObject *so)
+{
+    if (so->node)
+	PyMem_Free(so->node);
+    if (so->edge)
+	PyMem_Free(so->edge);
+    Py_XDECREF(so->patterns);
+    Py_XDECREF(so->translate);
+    PyObject_Del(so);
+}
 
-    /* Build lookup table
+/* C APIs */
 
-       XXX Could add dynamic resizing here... probably not worth it
-           though, since sizeof(unicode_charset) isn't all that large.
+Py_ssize_t mxTextSearchSet_Search(PyObject *self,
+				  void *text,
+				  int unicode,
+				  Py_ssize_t start,
+				  Py_ssize_t stop,
+				  Py_ssize_t *sliceleft,
+				  Py_ssize_t *sliceright,
+				  Py_ssize_t *pattern)
+{
+    mxTextSearchSetObject *so = (mxTextSearchSetObject *)self;
+    mxsearchset_node *node = so->node;
+    const unsigned char *tr = NULL;
+    Py_ssize_t state = 0;
+    Py_ssize_t left = -1, right = -1, index = -1;
+    Py_ssize_t i;
 
-    */
-    lookup = (unicode_charset *)PyMem_Malloc(sizeof(unicode_charset));
-    if (lookup == NULL) {
-	PyErr_NoMemory();
-	goto onError;
-    }
-    blocks = 0;
-    for (i = UNICODE_CHARSET_BITMAPS - 1; i >= 0; i--) {
-	unsigned char *block = &bigmap[i << 5];
-	for (j = blocks - 1; j >= 0; j--)
-	    if (memcmp(lookup->bitmaps[j], block, 
-		       UNICODE_CHARSET_BITMAP_SIZE) == 0)
+    Py_Assert(mxTextSearchSet_Check(self),
+	      PyExc_TypeError,
+	      "expected a TextSearchSet object");
+    if (so->translate)
+	tr = (const unsigned char *)PyString_AS_STRING(so->translate);
+
+    for (i = start; i < stop; i++) {
+	Py_UCS4 ch = SEARCHSET_CHAR(text, unicode, i);
+
+	if (tr != NULL && ch < 256)
+	    ch = tr[ch];
+
+	/* follow failure links until the character can be added */
+	for (;;) {
+	    if (state == 0) {
+		if (ch < 256)
+		    state = so->root[ch];
+		else {
+		    state = mxTextSearchSet_Child(so, 0, ch);
+		    if (state < 0)
+			state = 0;
+		}
 		break;
-	if (j < 0) {
-	    j = blocks;
-	    DPRINTF("init_unicode_charset: Creating new block %i for %i\n", 
-		    j, i);
-	    memcpy(lookup->bitmaps[j], block, UNICODE_CHARSET_BITMAP_SIZE);
-	    blocks++;
+	    }
+	    else {
+		Py_ssize_t next = mxTextSearchSet_Child(so, state, ch);
+
+		if (next >= 0) {
+		    state = next;
+		    break;
+		}
+		state = node[state].fail;
+	    }
 	}
-	else
-	    DPRINTF("init_unicode_charset: Reusing block %i for %i\n", j, i);
-	lookup->bitmapindex[i] = j;
-    }
-    DPRINTF("init_unicode_charset: Map size: %i block(s) = %i bytes\n", 
-	    blocks, UNICODE_CHARSET_BITMAPS + 
-	    blocks * UNICODE_CHARSET_BITMAP_SIZE);
-    lookup = (unicode_charset *)PyMem_Realloc(lookup, 
-				 UNICODE_CHARSET_BITMAPS 
-				 + blocks * UNICODE_CHARSET_BITMAP_SIZE);
-    if (lookup == NULL) {
-	PyErr_NoMemory();
-	goto onError;
-    }
 
-    /* Invert bitmaps if negative matching is requested */
-    if (!logic) {
-	register unsigned char *bitmap = &lookup->bitmaps[0][0];
-	DPRINTF("init_unicode_charset: inverting bitmaps\n");
-	for (i = 0; i < blocks * UNICODE_CHARSET_BITMAP_SIZE; i++)
-	    bitmap[i] ^= 0xFF;
+	if (left >= 0 && i + 1 - node[state].depth > left)
+	    /* later matches can't start at or before the one found */
+	    break;
+	if (node[state].matchlen) {
+	    Py_ssize_t l = i + 1 - node[state].matchlen;
+
+	    /* at the same start, a later end is a longer match */
+	    if (left < 0 || l <= left) {
+		left = l;
+		right = i + 1;
+		index = node[state].pattern;
+	    }
+	}
     }
-
-    cs->mode = MXCHARSET_UCS2MODE;
-    cs->lookup = (void *)lookup;
-    return 0;
+    if (left < 0)
+	return 0;
+    if (sliceleft)
+	*sliceleft = left;
+    if (sliceright)
+	*sliceright = right;
+    if (pattern)
+	*pattern = index;
+    return 1;
 
  onError:
-    if (lookup)
-	PyMem_Free((void *)lookup);
-    cs->lookup = 0;
     return -1;
 }
 
-#endif
+#undef SEARCHSET_CHAR
 
-/* allocation */
+/* Search text (a string or unicode object) from start to stop, the
+   slice is checked and adjusted. Returns as mxTextSearchSet_Search */
 
 static
-PyObject *mxCharSet_New(PyObject *definition)
+Py_ssize_t mxTextSearchSet_SearchObject(PyObject *self,
+					PyObject *text,
+					Py_ssize_t *start,
+					Py_ssize_t *stop,
+					Py_ssize_t *sliceleft,
+					Py_ssize_t *sliceright,
+					Py_ssize_t *pattern)
 {
-    mxCharSetObject *cs;
-
-    cs = PyObject_NEW(mxCharSetObject, &mxCharSet_Type);
-    if (cs == NULL) 
-	return NULL;
-    Py_INCREF(definition);
-    cs->definition = definition;
-    cs->lookup = NULL;
-    cs->mode = -1;
-
-    if (PyString_Check(definition)) {
-	if (init_string_charset(cs, definition))
-	    goto onError;
+    if (PyString_Check(text)) {
+	Py_CheckStringSlice(text, *start, *stop);
+	return mxTextSearchSet_Search(self,
+				      PyString_AS_STRING(text), 0,
+				      *start, *stop,
+				      sliceleft, sliceright, pattern);
     }
 #ifdef HAVE_UNICODE
-    else if (PyUnicode_Check(definition)) {
-	if (init_unicode_charset(cs, definition))
-	    goto onError;
+    else if (PyUnicode_Check(text)) {
+	Py_CheckUnicodeSlice(text, *start, *stop);
+	return mxTextSearchSet_Search(self,
+				      PyUnicode_AS_UNICODE(text), 1,
+				      *start, *stop,
+				      sliceleft, sliceright, pattern);
     }
 #endif
-    else
-	Py_Error(PyExc_TypeError,
-		 "character set definition must be string or unicode");
+    Py_Error(PyExc_TypeError,
+	     "expected string or unicode");
+ onError:
+    return -1;
+}
 
-    return (PyObject *)cs;
+/* methods */
+
+Py_C_Function( mxTextSearchSet_search,
+	       "TextSearchSet.search(text,start=0,stop=len(text))\n\n"
+	       "Search for the leftmost (and longest) match string in text,\n"
+	       "looking only at the slice [start:stop] and return the slice\n"
+	       "(l,r) where it was found, (start,start) otherwise.")
+{
+    PyObject *text;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = INT_MAX;
+    Py_ssize_t sliceleft, sliceright;
+    Py_ssize_t rc;
+
+    Py_Get3Args("O|nn:TextSearchSet.search",
+		text,start,stop);
+
+    rc = mxTextSearchSet_SearchObject(self, text, &start, &stop,
+				      &sliceleft, &sliceright, NULL);
+    if (rc < 0)
+	goto onError;
+    if (rc == 0) {
+	sliceleft = start;
+	sliceright = start;
+    }
+    Py_Return2("nn", sliceleft, sliceright);
 
  onError:
-    Py_DECREF(cs);
     return NULL;
 }
 
-Py_C_Function( mxCharSet_CharSet,
-	       "CharSet(definition)\n\n"
-	       "Create a character set matching object from the string"
-	       )
+Py_C_Function( mxTextSearchSet_searchindex,
+	       "TextSearchSet.searchindex(text,start=0,stop=len(text))\n\n"
+	       "Same as search(), but return (l,r,index) where index is the\n"
+	       "position of the found match string in patterns,\n"
+	       "(start,start,-1) if none was found.")
 {
-    PyObject *definition;
+    PyObject *text;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = INT_MAX;
+    Py_ssize_t sliceleft, sliceright, index;
+    Py_ssize_t rc;
 
-    Py_GetArg("O:CharSet", definition);
-    return mxCharSet_New(definition);
+    Py_Get3Args("O|nn:TextSearchSet.searchindex",
+		text,start,stop);
+
+    rc = mxTextSearchSet_SearchObject(self, text, &start, &stop,
+				      &sliceleft, &sliceright, &index);
+    if (rc < 0)
+	goto onError;
+    if (rc == 0) {
+	sliceleft = start;
+	sliceright = start;
+	index = -1;
+    }
+    return Py_BuildValue("nnn", sliceleft, sliceright, index);
 
  onError:
     return NULL;
 }
 
-static 
-void mxCharSet_Free(mxCharSetObject *cs)
+Py_C_Function( mxTextSearchSet_find,
+	       "TextSearchSet.find(text,start=0,stop=len(text))\n\n"
+	       "Search for the leftmost (and longest) match string in text,\n"
+	       "looking only at the slice [start:stop] and return the index\n"
+	       "where it was found, -1 otherwise.")
 {
-    Py_XDECREF(cs->definition);
-    if (cs->lookup)
-	PyMem_Free(cs->lookup);
-    PyObject_Del(cs);
-}
-
-/* C APIs */
+    PyObject *text;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = INT_MAX;
+    Py_ssize_t sliceleft, sliceright;
+    Py_ssize_t rc;
 
-#define cs ((mxCharSetObject *)self)
+    Py_Get3Args("O|nn:TextSearchSet.find",
+		text,start,stop);
 
-int mxCharSet_ContainsChar(PyObject *self,
-			   register unsigned char ch)
-{
-    if (!mxCharSet_Check(self)) {
-	PyErr_BadInternalCall();
+    rc = mxTextSearchSet_SearchObject(self, text, &start, &stop,
+				      &sliceleft, &sliceright, NULL);
+    if (rc < 0)
 	goto onError;
-    }
-    
-    if (cs->mode == MXCHARSET_8BITMODE) {
-	unsigned char *bitmap = ((string_charset *)cs->lookup)->bitmap;
-	return ((bitmap[ch >> 3] & (1 << (ch & 7))) != 0);
-    }
-#ifdef HAVE_UNICODE
-    else if (cs->mode == MXCHARSET_UCS2MODE) {
-	unicode_charset *lookup = (unicode_charset *)cs->lookup;
-	unsigned char *bitmap = lookup->bitmaps[lookup->bitmapindex[0]];
-	return ((bitmap[ch >> 3] & (1 << (ch & 7))) != 0);
-    }
-#endif
-    else {
-	Py_Error(mxTextTools_Error,
-		 "unsupported character set mode");
-    }
+    if (rc == 0)
+	sliceleft = -1;
+    return PyInt_FromSsize_t(sliceleft);
 
  onError:
-    return -1;
+    return NULL;
 }
 
-#ifdef HAVE_UNICODE
-
-int mxCharSet_ContainsUnicodeChar(PyObject *self,
-				  register Py_UNICODE ch)
+Py_C_Function( mxTextSearchSet_findall,
+	       "TextSearchSet.findall(text,start=0,stop=len(text))\n\n"
+	       "Search for the match strings in text, looking only at the\n"
+	       "slice [start:stop] and return a list of all non\n"
+	       "overlapping slices (l,r) in text where one of them can\n"
+	       "be found, leftmost (and longest) first.")
 {
-    if (!mxCharSet_Check(self)) {
-	PyErr_BadInternalCall();
+    PyObject *text;
+    PyObject *list = 0;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = INT_MAX;
+
+    Py_Get3Args("O|nn:TextSearchSet.findall",
+		text,start,stop);
+
+    list = PyList_New(0);
+    if (!list)
 	goto onError;
+
+    for (;;) {
+	PyObject *t;
+	Py_ssize_t sliceleft, sliceright;
+	Py_ssize_t rc;
+
+	rc = mxTextSearchSet_SearchObject(self, text, &start, &stop,
+					  &sliceleft, &sliceright, NULL);
+	if (rc < 0)
+	    goto onError;
+	if (rc == 0)
+	    break;
+	t = Py_BuildValue("nn", sliceleft, sliceright);
+	if (t == NULL)
+	    goto onError;
+	if (PyList_Append(list, t)) {
+	    Py_DECREF(t);
+	    goto onError;
+	}
+	Py_DECREF(t);
+	start = sliceright;
     }
-    
-    if (cs->mode == MXCHARSET_8BITMODE) {
-	unsigned char *bitmap = ((string_charset *)cs->lookup)->bitmap;
-	if (ch >= 256)
-	    return 0;
-	return ((bitmap[ch >> 3] & (1 << (ch & 7))) != 0);
-    }
-    else if (cs->mode == MXCHARSET_UCS2MODE) {
-	unicode_charset *lookup = (unicode_charset *)cs->lookup;
-	unsigned char *bitmap = lookup->bitmaps[lookup->bitmapindex[ch >> 8]];
-	return ((bitmap[(ch >> 3) & 31] & (1 << (ch & 7))) != 0);
-    }
-    else {
-	Py_Error(mxTextTools_Error,
-		 "unsupported character set mode");
-    }
+    return list;
 
  onError:
-    return -1;
+    Py_XDECREF(list);
+    return NULL;
 }
 
-#endif
+/* Output of TextSearchSet.replace(): characters are copied to buffer,
+   which is either the pre-sized result object or, when writing to a
+   file, a chunk passed to write() whenever it fills up */
+
+typedef struct {
+    char *buffer;
+    Py_ssize_t len;		/* characters in the buffer */
+    Py_ssize_t size;		/* capacity of the buffer */
+    Py_ssize_t itemsize;	/* bytes per character */
+    int unicode;
+    PyObject *write;		/* bound write method or NULL */
+} mxsearchset_output;
+
+#define SEARCHSET_CHUNKSIZE 65536
 
 static
-int mxCharSet_Contains(PyObject *self,
-		       PyObject *other)
+int mxTextSearchSet_Write(mxsearchset_output *out,
+			  char *data,
+			  Py_ssize_t len)
 {
-    if (PyString_Check(other)) {
-	Py_Assert(PyString_GET_SIZE(other) == 1,
-		  PyExc_TypeError,
-		  "expected a single character");
-	return mxCharSet_ContainsChar(self, PyString_AS_STRING(other)[0]);
-    }
+    PyObject *chunk, *rc;
+
+    if (len == 0)
+	return 0;
 #ifdef HAVE_UNICODE
-    else if (PyUnicode_Check(other)) {
-	Py_Assert(PyUnicode_GET_SIZE(other) == 1,
-		  PyExc_TypeError,
-		  "expected a single unicode character");
-	return mxCharSet_ContainsUnicodeChar(self, 
-					     PyUnicode_AS_UNICODE(other)[0]);
-    }
-#endif
+    if (out->unicode)
+	chunk = PyUnicode_FromUnicode((Py_UNICODE *)data, len);
     else
-	Py_Error(PyExc_TypeError,
-		 "expected string or unicode character");
-
- onError:
-    return -1;
+#endif
+	chunk = PyString_FromStringAndSize(data, len);
+    if (chunk == NULL)
+	return -1;
+    rc = PyObject_CallFunctionObjArgs(out->write, chunk, NULL);
+    Py_DECREF(chunk);
+    if (rc == NULL)
+	return -1;
+    Py_DECREF(rc);
+    return 0;
 }
 
-/* In mode 1, find the position of the first character in text
-   belonging to set. This may also be stop or start-1 in case no such
-   character is found during the search (depending on the direction).
-
-   In mode 0, find the first character not in set. This may also be
-   stop or start-1 in case no such character is found during the
-   search (depending on the direction).
-
-   The search is done in the slice start:stop.
-
-   -2 is returned in case of an error.
-
-*/
-
 static
-int mxCharSet_FindChar(PyObject *self,
-		       unsigned char *text,
-		       Py_ssize_t start,
-		       Py_ssize_t stop,
-		       const int mode,
-		       const int direction)
+int mxTextSearchSet_Output(mxsearchset_output *out,
+			   char *data,
+			   Py_ssize_t len)
 {
-    register Py_ssize_t i;
-    register unsigned int c;
-    register unsigned int block;
-    unsigned char *bitmap;
-
-    if (!mxCharSet_Check(self)) {
-	PyErr_BadInternalCall();
-	goto onError;
-    }
-    
-    if (cs->mode == MXCHARSET_8BITMODE)
-	bitmap = ((string_charset *)cs->lookup)->bitmap;
-#ifdef HAVE_UNICODE
-    else if (cs->mode == MXCHARSET_UCS2MODE) {
-	unicode_charset *lookup = (unicode_charset *)cs->lookup;
-	bitmap = lookup->bitmaps[lookup->bitmapindex[0]];
-    }
-#endif
-    else {
-	Py_Error(mxTextTools_Error,
-		 "unsupported character set mode");
-    }
-
-    if (direction > 0) {
-	if (mode)
-	    /* Find first char in set */
-	    for (i = start; i < stop; i++) {
-		c = text[i];
-		block = bitmap[c >> 3];
-		if (block && ((block & (1 << (c & 7))) != 0))
-		    break;
-	    }
-	else
-	    /* Find first char not in set */
-	    for (i = start; i < stop; i++) {
-		c = text[i];
-		block = bitmap[c >> 3];
-		if (!block || ((block & (1 << (c & 7))) == 0))
-		    break;
-	    }
-    }
-    else {
-	if (mode)
-	    /* Find first char in set, searching from the end */
-	    for (i = stop - 1; i >= start; i--) {
-		c = text[i];
-		block = bitmap[c >> 3];
-		if (block && ((block & (1 << (c & 7))) != 0))
-		    break;
-	    }
-	else
-	    /* Find first char not in set, searching from the end */
-	    for (i = stop - 1; i >= start; i--) {
-		c = text[i];
-		block = bitmap[c >> 3];
-		if (!block || ((block & (1 << (c & 7))) == 0))
-		    break;
-	    }
+    if (out->len + len > out->size) {
+	/* only happens when writing to a file */
+	if (mxTextSearchSet_Write(out, out->buffer, out->len))
+	    return -1;
+	out->len = 0;
+	if (len > out->size)
+	    return mxTextSearchSet_Write(out, data, len);
     }
-    return i;
-
- onError:
-    return -2;
+    memcpy(out->buffer + out->len * out->itemsize,
+	   data,
+	   len * out->itemsize);
+    out->len += len;
+    return 0;
 }
 
-#ifdef HAVE_UNICODE
-
 static
-int mxCharSet_FindUnicodeChar(PyObject *self,
-			      Py_UNICODE *text,
-			      Py_ssize_t start,
-			      Py_ssize_t stop,
-			      const int mode,
-			      const int direction)
+int mxTextSearchSet_OutputReplacement(mxsearchset_output *out,
+				      PyObject *replacement)
 {
-    register int i;
-    register unsigned int c;
-    register unsigned int block;
-    unsigned char *bitmap;
-
-    if (!mxCharSet_Check(self)) {
-	PyErr_BadInternalCall();
-	goto onError;
-    }
-    
-    if (cs->mode == MXCHARSET_8BITMODE) {
-	bitmap = ((string_charset *)cs->lookup)->bitmap;
-	if (direction > 0) {
-	    if (mode)
-		/* Find first char in set */
-		for (i = start; i < stop; i++) {
-		    c = text[i];
-		    if (c > 256)
-			continue;
-		    block = bitmap[c >> 3];
-		    if (block && ((block & (1 << (c & 7))) != 0))
-			break;
-		}
-	    else
-		/* Find first char not in set */
-		for (i = start; i < stop; i++) {
-		    c = text[i];
-		    if (c > 256)
-			break;
-		    block = bitmap[c >> 3];
-		    if (!block || ((block & (1 << (c & 7))) == 0))
-			break;
-		}
-        }
-	else {
-	    if (mode)
-		/* Find first char in set, searching from the end */
-		for (i = stop - 1; i >= start; i--) {
-		    c = text[i];
-		    if (c > 256)
-			continue;
-		    block = bitmap[c >> 3];
-		    if (block && ((block & (1 << (c & 7))) != 0))
-			break;
-		}
-	    else
-		/* Find first char not in set, searching from the end */
-		for (i = stop - 1; i >= start; i--) {
-		    c = text[i];
-		    if (c > 256)
-			break;
-		    block = bitmap[c >> 3];
-		    if (!block || ((block & (1 << (c & 7))) == 0))
-			break;
-		}
-	}
-	return i;
-    }
-
 #ifdef HAVE_UNICODE
-    else if (cs->mode == MXCHARSET_UCS2MODE) {
-	unicode_charset *lookup = (unicode_charset *)cs->lookup;
-	if (direction > 0) {
-	    if (mode)
-		/* Find first char in set */
-		for (i = start; i < stop; i++) {
-		    c = text[i];
-		    bitmap = lookup->bitmaps[lookup->bitmapindex[c >> 8]];
-		    block = bitmap[(c >> 3) & 31];
-		    if (block && ((block & (1 << (c & 7))) != 0))
-			break;
-		}
-	    else
-		/* Find first char not in set */
-		for (i = start; i < stop; i++) {
-		    c = text[i];
-		    bitmap = lookup->bitmaps[lookup->bitmapindex[c >> 8]];
-		    block = bitmap[(c >> 3) & 31];
-		    if (!block || ((block & (1 << (c & 7))) == 0))
-			break;
-		}
-	}
-	else {
-	    if (mode)
-		/* Find first char in set, searching from the end */
-		for (i = stop - 1; i >= start; i--) {
-		    c = text[i];
-		    bitmap = lookup->bitmaps[lookup->bitmapindex[c >> 8]];
-		    block = bitmap[(c >> 3) & 31];
-		    if (block && ((block & (1 << (c & 7))) != 0))
-			break;
-		}
-	    else
-		/* Find first char not in set, searching from the end */
-		for (i = stop - 1; i >= start; i--) {
-		    c = text[i];
-		    bitmap = lookup->bitmaps[lookup->bitmapindex[c >> 8]];
-		    block = bitmap[(c >> 3) & 31];
-		    if (!block || ((block & (1 << (c & 7))) == 0))
-			break;
-		}
-	}
-	return i;
-    }
+    if (out->unicode)
+	return mxTextSearchSet_Output(out,
+				      (char *)PyUnicode_AS_UNICODE(replacement),
+				      PyUnicode_GET_SIZE(replacement));
 #endif
-    else {
-	Py_Error(mxTextTools_Error,
-		 "unsupported character set mode");
-    }
-
- onError:
-    return -2;
+    return mxTextSearchSet_Output(out,
+				  PyString_AS_STRING(replacement),
+				  PyString_GET_SIZE(replacement));
 }
 
-#endif
+Py_C_Function_WithKeywords( mxTextSearchSet_replace,
+	       "TextSearchSet.replace(text,replacements,start=0,stop=len(text),file=None)\n\n"
+	       "Replace all non overlapping matches in text[start:stop]\n"
+	       "with the string at the same index in replacements, scanning\n"
+	       "the text only once, and return the new string. If file is\n"
+	       "given, the output is passed to file.write() in chunks and\n"
+	       "the number of replacements made is returned.")
+{
+    mxTextSearchSetObject *so = (mxTextSearchSetObject *)self;
+    PyObject *text;
+    PyObject *replacements;
+    PyObject *file = NULL;
+    PyObject *repl = NULL;
+    PyObject *result = NULL;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = INT_MAX;
+    mxsearchset_output out;
+    Py_ssize_t *found = NULL;
+    Py_ssize_t foundcount = 0, foundsize = 0;
+    Py_ssize_t sliceleft, sliceright, index;
+    Py_ssize_t position, length, i;
+    char *tx;
 
-/* Return the position of the first character in text[start:stop]
-   occurring in set or -1 in case no such character exists.
+    out.buffer = NULL;
+    out.write = NULL;
 
-*/
+    Py_KeywordsGet5Args("OO|nnO:TextSearchSet.replace",
+			text,replacements,start,stop,file);
 
-static
-int mxCharSet_Search(PyObject *self,
-		     PyObject *text,
-		     Py_ssize_t start,
-		     Py_ssize_t stop,
-		     int direction)
-{
-    Py_ssize_t position;
-    
     if (PyString_Check(text)) {
 	Py_CheckStringSlice(text, start, stop);
-	position = mxCharSet_FindChar(self, 
-				      (unsigned char *)PyString_AS_STRING(text),
-				      start,
-				      stop,
-				      1,
-				      direction);
+	tx = PyString_AS_STRING(text);
+	out.unicode = 0;
+	out.itemsize = 1;
     }
 #ifdef HAVE_UNICODE
     else if (PyUnicode_Check(text)) {
 	Py_CheckUnicodeSlice(text, start, stop);
-	position = mxCharSet_FindUnicodeChar(self,
-					     PyUnicode_AS_UNICODE(text),
-					     start,
-					     stop,
-					     1,
-					     direction);
+	tx = (char *)PyUnicode_AS_UNICODE(text);
+	out.unicode = 1;
+	out.itemsize = sizeof(Py_UNICODE);
     }
 #endif
     else
 	Py_Error(PyExc_TypeError,
 		 "expected string or unicode");
 
-    if ((direction > 0 && position >= stop) ||
-	(direction <= 0 && position < start))
-	position = -1;
-    return position;
-
- onError:
-    return -2;
-}
+    repl = PySequence_Tuple(replacements);
+    if (repl == NULL)
+	goto onError;
+    Py_Assert(PyTuple_GET_SIZE(repl) == PyTuple_GET_SIZE(so->patterns),
+	      PyExc_ValueError,
+	      "need one replacement for each match string");
+    for (i = 0; i < PyTuple_GET_SIZE(repl); i++) {
+	PyObject *item = PyTuple_GET_ITEM(repl, i);
 
-/* Return the longest match of characters from set in
-   text[start:stop]. 
-
-   If direction is positive, the search is done from the left (longest
-   prefix), otherwise it is started from the right (longest suffix).
-
-   -1 is returned in case of an error.
-
-*/
-
-Py_ssize_t mxCharSet_Match(PyObject *self,
-		    PyObject *text,
-		    Py_ssize_t start,
-		    Py_ssize_t stop,
-		    int direction)
-{
-    Py_ssize_t position;
-    
-    if (PyString_Check(text)) {
-	Py_CheckStringSlice(text, start, stop);
-	position = mxCharSet_FindChar(self, 
-				      (unsigned char *)PyString_AS_STRING(text),
-				      start,
-				      stop,
-				      0,
-				      direction);
-    }
 #ifdef HAVE_UNICODE
-    else if (PyUnicode_Check(text)) {
-	Py_CheckUnicodeSlice(text, start, stop);
-	position = mxCharSet_FindUnicodeChar(self,
-					     PyUnicode_AS_UNICODE(text),
-					     start,
-					     stop,
-					     0,
-					     direction);
-    }
+	if (out.unicode) {
+	    Py_Assert(PyUnicode_Check(item),
+		      PyExc_TypeError,
+		      "replacements must be unicode for unicode text");
+	    if (PyUnicode_AS_UNICODE(item) == NULL)
+		goto onError;
+	    continue;
+	}
 #endif
-    else
-	Py_Error(PyExc_TypeError,
-		 "expected string or unicode");
-
-    if (position < -1)
-	goto onError;
-    if (direction > 0)
-	return position - start;
-    else
-	return stop-1 - position;
-
- onError:
-    return -1;
-}
-
-/* Stips off characters appearing in the character set from text[start:stop]
-   and returns the result as Python string object.
-
-   where indicates the mode:
-   where < 0: strip left only
-   where = 0: strip left and right
-   where > 0: strip right only
-
-*/
-static
-PyObject *mxCharSet_Strip(PyObject *self,
-			  PyObject *text,
-			  Py_ssize_t start,
-			  Py_ssize_t stop,
-			  Py_ssize_t where)
-{
-    Py_ssize_t left,right;
-    
-    if (!mxCharSet_Check(self)) {
-	PyErr_BadInternalCall();
-	goto onError;
+	Py_Assert(PyString_Check(item),
+		  PyExc_TypeError,
+		  "replacements must be strings for string text");
     }
 
-    if (PyString_Check(text)) {
-	Py_CheckStringSlice(text, start, stop);
+    if (file != NULL && file != Py_None) {
+	/* Write the output in chunks while scanning */
+	Py_ssize_t replaced = 0;
 
-	/* Strip left */
-	if (where <= 0) {
-	    left = mxCharSet_FindChar(self, 
-				      (unsigned char *)PyString_AS_STRING(text),
-				      start,
-				      stop,
-				      0,
-				      1);
-	    if (left < 0)
-		goto onError;
+	out.write = PyObject_GetAttrString(file, "write");
+	if (out.write == NULL)
+	    goto onError;
+	out.len = 0;
+	out.size = SEARCHSET_CHUNKSIZE;
+	out.buffer = (char *)PyMem_Malloc(out.size * out.itemsize);
+	if (out.buffer == NULL) {
+	    PyErr_NoMemory();
+	    goto onError;
 	}
-	else
-	    left = start;
+	for (position = start;; position = sliceright) {
+	    Py_ssize_t rc;
 
-	/* Strip right */
-	if (where >= 0) {
-	    right = mxCharSet_FindChar(self, 
-				       (unsigned char *)PyString_AS_STRING(text),
-				       left,
-				       stop,
-				       0,
-				       -1) + 1;
-	    if (right < 0)
+	    rc = mxTextSearchSet_Search(self, tx, out.unicode,
+					position, stop,
+					&sliceleft, &sliceright, &index);
+	    if (rc < 0)
 		goto onError;
+	    if (rc == 0)
+		break;
+	    if (mxTextSearchSet_Output(&out,
+				       tx + position * out.itemsize,
+				       sliceleft - position))
+		goto onError;
+	    if (mxTextSearchSet_OutputReplacement(&out,
+						  PyTuple_GET_ITEM(repl, index)))
+		goto onError;
+	    replaced++;
 	}
-	else
-	    right = stop;
-
-	return PyString_FromStringAndSize(PyString_AS_STRING(text) + left, 
-					  max(right - left, 0));
+	if (mxTextSearchSet_Output(&out,
+				   tx + position * out.itemsize,
+				   stop - position))
+	    goto onError;
+	if (mxTextSearchSet_Write(&out, out.buffer, out.len))
+	    goto onError;
+	PyMem_Free(out.buffer);
+	Py_DECREF(out.write);
+	Py_DECREF(repl);
+	return PyInt_FromSsize_t(replaced);
     }
-#ifdef HAVE_UNICODE
-    else if (PyUnicode_Check(text)) {
-        Py_CheckUnicodeSlice(text, start, stop);
 
-	/* Strip left */
-	if (where <= 0) {
-	    left = mxCharSet_FindUnicodeChar(self, 
-					     PyUnicode_AS_UNICODE(text),
-					     start,
-					     stop,
-					     0,
-					     1);
-	    if (left < 0)
-		goto onError;
-	}
-	else
-	    left = start;
+    /* Find all matches first, so that the result can be allocated
+       with its final size */
+    length = stop - start;
+    for (position = start;; position = sliceright) {
+	Py_ssize_t rc;
 
-	/* Strip right */
-	if (where >= 0) {
-	    right = mxCharSet_FindUnicodeChar(self, 
-					     PyUnicode_AS_UNICODE(text),
-					     start,
-					     stop,
-					     0,
-					     -1) + 1;
-	    if (right < 0)
+	rc = mxTextSearchSet_Search(self, tx, out.unicode,
+				    position, stop,
+				    &sliceleft, &sliceright, &index);
+	if (rc < 0)
+	    goto onError;
+	if (rc == 0)
+	    break;
+	if (foundcount + 3 > foundsize) {
+	    Py_ssize_t *resized;
+
+	    foundsize = foundsize ? 2 * foundsize : 3 * 64;
+	    resized = (Py_ssize_t *)PyMem_Realloc(found,
+						  foundsize * sizeof(Py_ssize_t));
+	    if (resized == NULL) {
+		PyErr_NoMemory();
 		goto onError;
+	    }
+	    found = resized;
 	}
+	found[foundcount++] = sliceleft;
+	found[foundcount++] = sliceright;
+	found[foundcount++] = index;
+#ifdef HAVE_UNICODE
+	if (out.unicode)
+	    length += PyUnicode_GET_SIZE(PyTuple_GET_ITEM(repl, index));
 	else
-	    right = stop;
-	
-	return PyUnicode_FromUnicode(PyUnicode_AS_UNICODE(text) + left, 
-				     max(right - left, 0));
-    }
 #endif
+	    length += PyString_GET_SIZE(PyTuple_GET_ITEM(repl, index));
+	length -= sliceright - sliceleft;
+    }
+
+#ifdef HAVE_UNICODE
+    if (out.unicode) {
+	result = PyUnicode_FromUnicode(NULL, length);
+	if (result == NULL)
+	    goto onError;
+	out.buffer = (char *)PyUnicode_AS_UNICODE(result);
+    }
     else
-	Py_Error(PyExc_TypeError,
-		 "expected string or unicode");
+#endif
+    {
+	result = PyString_FromStringAndSize(NULL, length);
+	if (result == NULL)
+	    goto onError;
+	out.buffer = PyString_AS_STRING(result);
+    }
+    out.len = 0;
+    out.size = length;
+
+    position = start;
+    for (i = 0; i < foundcount; i += 3) {
+	mxTextSearchSet_Output(&out,
+			       tx + position * out.itemsize,
+			       found[i] - position);
+	mxTextSearchSet_OutputReplacement(&out,
+					  PyTuple_GET_ITEM(repl, found[i + 2]));
+	position = found[i + 1];
+    }
+    mxTextSearchSet_Output(&out,
+			   tx + position * out.itemsize,
+			   stop - position);
+
+    if (found)
+	PyMem_Free(found);
+    Py_DECREF(repl);
+    return result;
 
  onError:
+    if (out.write) {
+	PyMem_Free(out.buffer);
+	Py_DECREF(out.write);
+    }
+    if (found)
+	PyMem_Free(found);
+    Py_XDECREF(repl);
+    Py_XDECREF(result);
     return NULL;
 }
 
-static 
-PyObject *mxCharSet_Split(PyObject *self,
-			  PyObject *text,
-			  Py_ssize_t start,
-			  Py_ssize_t text_len,
-			  int include_splits)
-{
-    PyObject *list = NULL;
-    PyObject *s;
-    register Py_ssize_t x;
-    Py_ssize_t listitem = 0;
-    Py_ssize_t listsize = INITIAL_LIST_SIZE;
+#undef SEARCHSET_CHUNKSIZE
 
-    if (!mxCharSet_Check(self)) {
-	PyErr_BadInternalCall();
-	goto onError;
-    }
+#ifdef COPY_PROTOCOL
+Py_C_Function( mxTextSearchSet_copy,
+	       "copy([memo])\n\n"
+	       "Return a new reference for the instance. This function\n"
+	       "is used for the copy-protocol. Real copying doesn't take\n"
+	       "place, since the instances are immutable.")
+{
+    PyObject *memo;
     
-    list = PyList_New(listsize);
-    if (!list)
-	goto onError;
+    Py_GetArg("|O",memo);
+    Py_INCREF(self);
+    return self;
+ onError:
+    return NULL;
+}
+#endif
 
-    if (PyString_Check(text)) {
-	unsigned char *tx = (unsigned char *)PyString_AS_STRING(text);
+/* --- slots --- */
 
-	Py_CheckStringSlice(text, start, text_len);
+static 
+PyObject *mxTextSearchSet_Repr(mxTextSearchSetObject *self)
+{
+#if PY_MAJOR_VERSION >= 3
+    return PyUnicode_FromFormat("<TextSearchSet object for %zd match strings at %p>",
+				PyTuple_GET_SIZE(self->patterns), self);
+#else
+    return PyString_FromFormat("<TextSearchSet object for %zd match strings at %p>",
+			       PyTuple_GET_SIZE(self->patterns), self);
+#endif
+}
 
-	x = start;
-	while (x < text_len) {
-	    Py_ssize_t z;
+/* Python Method Table */
 
-	    /* Skip all text in set (include_splits == 0), not in set
-    	       (include_splits == 1) */
-	    z = x;
-	    x = mxCharSet_FindChar(self, tx, x, text_len, include_splits, 1);
+static
+PyMethodDef mxTextSearchSet_Methods[] =
+{
+    Py_MethodListEntry("search",mxTextSearchSet_search),
+    Py_MethodListEntry("searchindex",mxTextSearchSet_searchindex),
+    Py_MethodListEntry("find",mxTextSearchSet_find),
+    Py_MethodListEntry("findall",mxTextSearchSet_findall),
+    Py_MethodWithKeywordsListEntry("replace",mxTextSearchSet_replace),
+    Py_MethodWithKeywordsListEntry("itersplit",mxTextSearch_itersplit),
+#ifdef COPY_PROTOCOL
+    Py_MethodListEntry("__deepcopy__",mxTextSearchSet_copy),
+    Py_MethodListEntry("__copy__",mxTextSearchSet_copy),
+#endif
+    {NULL,NULL} /* end of list */
+};
 
-	    /* Append the slice to list */
-	    if (include_splits) {
-		s = PyString_FromStringAndSize((char *)&tx[z], x - z);
-		if (!s)
-		    goto onError;
-		if (listitem < listsize)
-		    PyList_SET_ITEM(list,listitem,s);
-		else {
-		    PyList_Append(list,s);
-		    Py_DECREF(s);
-		}
-		listitem++;
+static PyMemberDef mxTextSearchSet_members[] = {
+    {"patterns",T_OBJECT_EX,offsetof(mxTextSearchSetObject,patterns),READONLY,"Tuple of the match strings"},
+    {"translate",T_OBJECT,offsetof(mxTextSearchSetObject,translate),READONLY,"Translate string or None"},
+    {NULL}
+};
 
-		if (x >= text_len)
-		    break;
-	    }
-	    
-	    /* Skip all text in set (include_splits == 1), not in set
-    	       (include_splits == 0) */
-	    z = x;
-	    x = mxCharSet_FindChar(self, tx, x, text_len, !include_splits, 1);
+/* Python Type Table */
 
-	    /* Append the slice to list if it is not empty */
-	    if (x > z) {
-		s = PyString_FromStringAndSize((char *)&tx[z], x - z);
-		if (!s)
-		    goto onError;
-		if (listitem < listsize)
-		    PyList_SET_ITEM(list,listitem,s);
-		else {
-		    PyList_Append(list,s);
-		    Py_DECREF(s);
-		}
-		listitem++;
-	    }
-	}
-	
-    }
-#ifdef HAVE_UNICODE
-    else if (PyUnicode_Check(text)) {
-	Py_UNICODE *tx = PyUnicode_AS_UNICODE(text);
+PyTypeObject mxTextSearchSet_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)      /* init at startup ! */
+    "TextSearchSet",                    /*tp_name*/
+    sizeof(mxTextSearchSetObject),      /*tp_basicsize*/
+    0,                                  /*tp_itemsize*/
+    /* methods */
+    (destructor)mxTextSearchSet_Free,   /*tp_dealloc*/
+    (printfunc)0,                       /*tp_print*/
+    (getattrfunc)0,                     /*tp_getattr*/
+    (setattrfunc)0,                     /*tp_setattr*/
+    0,                                  /*tp_compare*/
+    (reprfunc)mxTextSearchSet_Repr,     /*tp_repr*/
+    0,                                  /*tp_as_number*/
+    0,                                  /*tp_as_number*/
+    0,                                  /*tp_as_mapping*/
+    (hashfunc)0,                        /*tp_hash*/
+    (ternaryfunc)0,                     /*tp_call*/
+    (reprfunc)0,                        /*tp_str*/
+    (getattrofunc)0,                    /*tp_getattro*/
+    (setattrofunc)0,                    /*tp_setattro*/
+    0,                                  /*tp_asbuffer*/
+    Py_TPFLAGS_DEFAULT,                 /*tp_flags*/
+    "mxTextTools multi-string search object", /*tp_doc*/
+    0,                                  /*tp_traverse*/
+    0,                                  /*tp_clear*/
+    0,                                  /*tp_richcompare*/
+    0,                                  /*tp_weaklistoffset*/
+    0,                                  /*tp_iter*/
+    0,                                  /*tp_iternext*/
+    mxTextSearchSet_Methods,            /*tp_methods*/
+    mxTextSearchSet_members,            /*tp_members*/
+};
 
-	Py_CheckUnicodeSlice(text, start, text_len);
+/* --- Character Set Object --------------------------------------------*/
 
-	x = start;
-	while (x < text_len) {
-	    Py_ssize_t z;
+/* internal */
 
-	    /* Skip all text in set (include_splits == 0), not in set
-    	       (include_splits == 1) */
-	    z = x;
-	    x = mxCharSet_FindUnicodeChar(self, tx, x, text_len, include_splits, 1);
+/* 8-bit character sets are implemented using a simple 32-byte
+   long bitmap with one bit per character.
 
-	    /* Append the slice to list */
-	    if (include_splits) {
-		s = PyUnicode_FromUnicode(&tx[z], x - z);
-		if (!s)
-		    goto onError;
-		if (listitem < listsize)
-		    PyList_SET_ITEM(list,listitem,s);
-		else {
-		    PyList_Append(list,s);
-		    Py_DECREF(s);
-		}
-		listitem++;
+   Addressing is done as follows:
 
-		if (x >= text_len)
-		    break;
-	    }
-	    
-	    /* Skip all text in set (include_splits == 1), not in set
-    	       (include_splits == 0) */
-	    z = x;
-	    x = mxCharSet_FindUnicodeChar(self, tx, x, text_len, !include_splits, 1);
+      def char_is_set(ordinal):
+          return bitmap[ordinal >> 3]  & (1 << (ordinal & 7))
 
-	    /* Append the slice to list if it is not empty */
-	    if (x > z) {
-		s = PyUnicode_FromUnicode(&tx[z], x - z);
-		if (!s)
-		    goto onError;
-		if (listitem < listsize)
-		    PyList_SET_ITEM(list,listitem,s);
-		else {
-		    PyList_Append(list,s);
-		    Py_DECREF(s);
-		}
-		listitem++;
-	    }
-	}
-    }
-#endif    
-    else
-	Py_Error(PyExc_TypeError,
-		 "expected string or unicode");
-    
-    /* Resize list if necessary */
-    if (listitem < listsize)
-	PyList_SetSlice(list, listitem, listsize, (PyObject*)NULL);
+*/
 
-    return list;
-    
- onError:
-    Py_XDECREF(list);
-    return NULL;
-}
+#define STRING_CHARSET_SIZE 		256
+#define STRING_CHARSET_BITMAP_SIZE 	(STRING_CHARSET_SIZE / 8)
 
-/* methods */
+typedef struct {
+    unsigned char bitmap[STRING_CHARSET_BITMAP_SIZE];
+    						/* character bitmap */
+} string_charset;
 
-Py_C_Function( mxCharSet_contains,
-	       ".contains(char)\n\n"
-	       )
+static
+int init_string_charset(mxCharSetObject *cs,
+			PyObject *definition)
 {
-    PyObject *chr;
-    int rc;
+    register Py_ssize_t i, j;
+    char *def = PyString_AS_STRING(definition);
+    const Py_ssize_t len = PyString_GET_SIZE(definition);
+    string_charset *lookup = 0;
+    register unsigned char *bitmap;
+    int logic = 1;
 
-    Py_GetArg("O:CharSet.contains", chr);
+    /* Handle logic change (first char is '^' for negative matching) */
+    if (len > 0 && def[0] == '^') {
+	logic = 0;
+	i = 1;
+    }
+    else
+	i = 0;
     
-    rc = mxCharSet_Contains(self, chr);
-    if (rc < 0)
+    /* Build 32-byte lookup bitmap (one bit per character) */
+    lookup = (string_charset *)PyMem_Malloc(sizeof(string_charset));
+    if (lookup == NULL) {
+	PyErr_NoMemory();
 	goto onError;
-    return PyInt_FromLong(rc);
+    }
+    memset(lookup, 0, sizeof(string_charset));
+    cs->mode = MXCHARSET_8BITMODE;
+    cs->lookup = (void *)lookup;
+    bitmap = lookup->bitmap;
 
- onError:
-    return NULL;
-}
+    for (; i < len; i++) {
 
-Py_C_Function( mxCharSet_search,
-	       ".search(text[, direction=1, start=0, stop=len(text)])\n\n"
-	       )
-{
-    PyObject *text;
-    int direction = 1;
-    Py_ssize_t start = 0, stop = INT_MAX;
-    int rc;
+	/* Handle escapes: "b\-d", "\\" */
+	if (def[i] == '\\') {
+	    if (i < len - 1 && def[i+1] == '\\') {
+		j = (unsigned char)'\\';
+		bitmap[j >> 3] |= 1 << (j & 7);
+		i++;
+	    }
+	    continue;
+	}
 
-    Py_Get4Args("O|iii:CharSet.search", text, direction, start, stop);
-    
-    rc = mxCharSet_Search(self, text, start, stop, direction);
-    if (rc == -1)
-	Py_ReturnNone();
-    if (rc < -1)
-	goto onError;
-    return PyInt_FromLong(rc);
+	/* Handle ranges: "b-d", "\\-z", "\--z" */
+	if (i < len - 2 && def[i+1] == '-') {
+	    unsigned char range_left = def[i];
+	    unsigned char range_right = def[i+2];
+	    for (j = range_left; j <= range_right; j++)
+		bitmap[j >> 3] |= 1 << (j & 7);
+	    i++;
+	    continue;
+	}
 
- onError:
-    return NULL;
-}
+	/* Normal processing */
+	j = (unsigned char)def[i];
+	bitmap[j >> 3] |= 1 << (j & 7);
+    }
 
-Py_C_Function( mxCharSet_match,
-	       ".match(text[, direction=1, start=0, stop=len(text)])\n\n"
-	       )
-{
-    PyObject *text;
-    int direction = 1;
-    Py_ssize_t start = 0, stop = INT_MAX;
-    int rc;
+    /* Invert bitmap if negative matching is requested */
+    if (!logic) {
+	DPRINTF("init_string_charset: inverting bitmap\n");
+	for (i = 0; i < STRING_CHARSET_BITMAP_SIZE; i++)
+	    bitmap[i] ^= 0xFF;
+    }
 
-    Py_Get4Args("O|iii:CharSet.match", text, direction, start, stop);
-    
-    rc = mxCharSet_Match(self, text, start, stop, direction);
-    if (rc < 0)
-	goto onError;
-    return PyInt_FromLong(rc);
+    return 0;
 
  onError:
-    return NULL;
+    if (lookup)
+	PyMem_Free((void *)lookup);
+    cs->lookup = 0;
+    return -1;
 }
 
-Py_C_Function( mxCharSet_split,
-	       ".split(text[, start=0, stop=len(text)])\n\n"
-	       )
-{
-    PyObject *text;
-    Py_ssize_t start = 0, stop = INT_MAX;
+#ifdef HAVE_UNICODE
 
-    Py_Get3Args("O|ii:CharSet.split", text, start, stop);
-    
-    return mxCharSet_Split(self, text, start, stop, 0);
+/* Unicode character sets are implemented using two step indexing
+   which is a good compromise between lookup speed and memory usage.
 
- onError:
-    return NULL;
-}
+   Lookup is done using a variable length array of 32-byte bitmap
+   blocks. There can be 256 such blocks. Identical blocks are
+   collapsed into a single copy.
+   
+   Addressing is done as follows:
 
-Py_C_Function( mxCharSet_splitx,
-	       ".splitx(text[, start=0, stop=len(text)])\n\n"
-	       )
-{
-    PyObject *text;
-    Py_ssize_t start = 0, stop = INT_MAX;
+      def char_is_set(ordinal):
+          index = bitmapindex[ordinal >> 8]
+	  bitmap = bitmaps[index]
+          return bitmap[(ordinal >> 3) & 31]  & (1 << (ordinal & 7))
 
-    Py_Get3Args("O|ii:CharSet.splitx", text, start, stop);
-    
-    return mxCharSet_Split(self, text, start, stop, 1);
+   The technique used here is very similar to what is done in Python's
+   SRE (see the BIGCHARSET patch by Martin von Loewis). Compression
+   should be reasonably good since character sets in practice usually
+   only contains a few single characters or longer ranges of Unicode
+   characters.
 
- onError:
-    return NULL;
-}
+*/
 
-Py_C_Function( mxCharSet_strip,
-	       ".strip(text[, where=0, start=0, stop=len(text)])\n\n"
-	       )
-{
-    PyObject *text;
-    Py_ssize_t where = 0;
-    Py_ssize_t start = 0, stop = INT_MAX;
+#define UNICODE_CHARSET_SIZE 		65536
+#define UNICODE_CHARSET_BITMAP_SIZE 	32
+#define UNICODE_CHARSET_BITMAPS 	(UNICODE_CHARSET_SIZE / (UNICODE_CHARSET_BITMAP_SIZE * 8))
+#define UNICODE_CHARSET_BIGMAP_SIZE	(UNICODE_CHARSET_SIZE / 8)
 
-    Py_Get4Args("O|iii:CharSet.strip", text, where, start, stop);
-    
-    return mxCharSet_Strip(self, text, start, stop, where);
-
- onError:
-    return NULL;
-}
+typedef struct {
+    unsigned char bitmapindex[UNICODE_CHARSET_BITMAPS];	
+    					/* Index to char bitmaps */
+    unsigned char bitmaps[UNICODE_CHARSET_BITMAPS][UNICODE_CHARSET_BITMAP_SIZE];
+    					/* Variable length bitmap array */
+} unicode_charset;
 
-#ifdef COPY_PROTOCOL
-Py_C_Function( mxCharSet_copy,
-	       "copy([memo])\n\n"
-	       "Return a new reference for the instance. This function\n"
-	       "is used for the copy-protocol. Real copying doesn't take\n"
-	       "place, since the instances are immutable.")
+static
+int init_unicode_charset(mxCharSetObject *cs,
+			 PyObject *definition)
 {
-    PyObject *memo;
-    
-    Py_GetArg("|O",memo);
-    Py_INCREF(cs);
-    return (PyObject *)cs;
- onError:
-    return NULL;
-}
-#endif
+    register Py_ssize_t i, j;
+    Py_UNICODE *def = PyUnicode_AS_UNICODE(definition);
+    const Py_ssize_t len = PyUnicode_GET_SIZE(definition);
+    unicode_charset *lookup = 0;
+    unsigned char bigmap[UNICODE_CHARSET_BIGMAP_SIZE];
+    Py_ssize_t blocks;
+    int logic = 1;
 
-#undef cs
+    /* Handle logic change (first char is '^' for negative matching) */
+    if (len > 0 && def[0] == '^') {
+	logic = 0;
+	i = 1;
+    }
+    else
+	i = 0;
+    
+    /* Build bigmap */
+    memset(bigmap, 0, sizeof(bigmap));
+    for (; i < len; i++) {
 
-/* --- slots --- */
+	/* Handle escapes: "b\-d", "\\" */
+	if (def[i] == '\\') {
+	    if (i < len - 1 && def[i+1] == '\\') {
+		j = (int)'\\';
+		bigmap[j >> 3] |= 1 << (j & 7);
+		i++;
+	    }
+	    continue;
+	}
 
-static
-PyObject *mxCharSet_Repr(mxCharSetObject *self)
-{
-    PyObject *v;
-    char t[500], *reprstr;
+	/* Handle ranges: "b-d", "\\-z", "\--z" */
+	if (i < len - 2 && def[i+1] == '-') {
+	    Py_UNICODE range_left = def[i];
+	    Py_UNICODE range_right = def[i+2];
+	    if (range_right >= UNICODE_CHARSET_SIZE) {
+		Py_Error(PyExc_ValueError,
+			 "unicode ordinal out of supported range");
+	    }
+	    for (j = range_left; j <= range_right; j++)
+		bigmap[j >> 3] |= 1 << (j & 7);
+	    i++;
+	    continue;
+	}
 
-    v = PyObject_Repr(self->definition);
-    if (v == NULL)
-	return NULL;
-    reprstr = PyString_AsString(v);
-    if (reprstr == NULL)
-	return NULL;
-    sprintf(t, "<Character Set object for %.400s at 0x%lx>",
-	    reprstr, (long)self);
-    Py_DECREF(v);
-    return PyString_FromString(t);
-}
+	/* Normal processing */
+	j = def[i];
+	if (j >= UNICODE_CHARSET_SIZE) {
+	    Py_Error(PyExc_ValueError,
+		     "unicode ordinal out of supported range");
+	}
+	bigmap[j >> 3] |= 1 << (j & 7);
+    }
 
-/* Python Type Tables */
+    /* Build lookup table
 
-static
-PySequenceMethods mxCharSet_TypeAsSequence = {
-    (lenfunc)0,                         /*sq_length*/
-    (binaryfunc)0,                      /*sq_concat*/
-    (ssizeargfunc)0,                    /*sq_repeat*/
-    (ssizeargfunc)0,                    /*sq_item*/
-    (ssizessizeargfunc)0,               /*sq_slice*/
-    (ssizeobjargproc)0,                 /*sq_ass_item*/
-    (ssizessizeobjargproc)0,            /*sq_ass_slice*/
-    (objobjproc)mxCharSet_Contains,     /*sq_contains*/
-};
+       XXX Could add dynamic resizing here... probably not worth it
+           though, since sizeof(unicode_charset) isn't all that large.
 
-static
-PyMemberDef mxCharSet_Members[] = {
-    {"definition",T_OBJECT_EX,offsetof(mxCharSetObject,definition),READONLY,"Definition"},
-    {NULL}
-};
+    */
+    lookup = (unicode_charset *)PyMem_Malloc(sizeof(unicode_charset));
+    if (lookup == NULL) {
+	PyErr_NoMemory();
+	goto onError;
+    }
+    blocks = 0;
+    for (i = UNICODE_CHARSET_BITMAPS - 1; i >= 0; i--) {
+	unsigned char *block = &bigmap[i << 5];
+	for (j = blocks - 1; j >= 0; j--)
+	    if (memcmp(lookup->bitmaps[j], block, 
+		       UNICODE_CHARSET_BITMAP_SIZE) == 0)
+		break;
+	if (j < 0) {
+	    j = blocks;
+	    DPRINTF("init_unicode_charset: Creating new block %i for %i\n", 
+		    j, i);
+	    memcpy(lookup->bitmaps[j], block, UNICODE_CHARSET_BITMAP_SIZE);
+	    blocks++;
+	}
+	else
+	    DPRINTF("init_unicode_charset: Reusing block %i for %i\n", j, i);
+	lookup->bitmapindex[i] = j;
+    }
+    DPRINTF("init_unicode_charset: Map size: %i block(s) = %i bytes\n", 
+	    blocks, UNICODE_CHARSET_BITMAPS + 
+	    blocks * UNICODE_CHARSET_BITMAP_SIZE);
+    lookup = (unicode_charset *)PyMem_Realloc(lookup, 
+				 UNICODE_CHARSET_BITMAPS 
+				 + blocks * UNICODE_CHARSET_BITMAP_SIZE);
+    if (lookup == NULL) {
+	PyErr_NoMemory();
+	goto onError;
+    }
 
-static
-PyMethodDef mxCharSet_Methods[] =
-{   
-    Py_MethodListEntry("contains",mxCharSet_contains),
-    Py_MethodListEntry("search",mxCharSet_search),
-    Py_MethodListEntry("match",mxCharSet_match),
-    Py_MethodListEntry("strip",mxCharSet_strip),
-    Py_MethodListEntry("split",mxCharSet_split),
-    Py_MethodListEntry("splitx",mxCharSet_splitx),
-#ifdef COPY_PROTOCOL
-    Py_MethodListEntry("__deepcopy__",mxCharSet_copy),
-    Py_MethodListEntry("__copy__",mxCharSet_copy),
-#endif
-    {NULL,NULL} /* end of list */
-};
+    /* Invert bitmaps if negative matching is requested */
+    if (!logic) {
+	register unsigned char *bitmap = &lookup->bitmaps[0][0];
+	DPRINTF("init_unicode_charset: inverting bitmaps\n");
+	for (i = 0; i < blocks * UNICODE_CHARSET_BITMAP_SIZE; i++)
+	    bitmap[i] ^= 0xFF;
+    }
 
-PyTypeObject mxCharSet_Type = {
-    PyVarObject_HEAD_INIT(NULL, 0)      /* init at startup ! */
-    "Character Set",                    /* tp_name */
-    sizeof(mxCharSetObject),            /* tp_basicsize */
-    0,                                  /* tp_itemsize */
-    /* methods */
-    (destructor)mxCharSet_Free,         /* tp_dealloc */
-    (printfunc)0,                       /* tp_print */
-    (getattrfunc)0,                     /* tp_getattr */
-    (setattrfunc)0,                     /* tp_setattr */
-    0,                                  /* tp_compare */
-    (reprfunc)mxCharSet_Repr,           /* tp_repr */
-    0,                                  /* tp_as_number */
-    &mxCharSet_TypeAsSequence,          /* tp_as_sequence */
-    0,                                  /* tp_as_mapping */
-    (hashfunc)0,                        /* tp_hash */
-    (ternaryfunc)0,                     /* tp_call */
-    (reprfunc)0,                        /* tp_str */
-    (getattrofunc)0,                    /* tp_getattro */
-    (setattrofunc)0,                    /* tp_setattro */
-    0,                                  /* tp_as_buffer */
-    Py_TPFLAGS_DEFAULT,                 /* tp_flags */
-    (char*) 0,                          /* tp_doc */
-    0,                                  /* tp_traverse */
-    0,                                  /* tp_clear */
-    0,                                  /* tp_richcompare */
-    0,                                  /* tp_weaklistoffset */
-    0,                                  /* tp_iter */
-    0,                                  /* tp_iternext */
-    mxCharSet_Methods,                  /* tp_methods */
-    mxCharSet_Members,                  /* tp_members */
-};
+    cs->mode = MXCHARSET_UCS2MODE;
+    cs->lookup = (void *)lookup;
+    return 0;
 
-/* --- Tag Table Object ------------------------------------------------*/
+ onError:
+    if (lookup)
+	PyMem_Free((void *)lookup);
+    cs->lookup = 0;
+    return -1;
+}
 
-PyObject *mxTagTable_New(PyObject *definition,
-			 int tabletype,
-			 int cacheable);
+#endif
 
-/* internal APIs */
+/* allocation */
 
 static
-PyObject *tc_get_item(register PyObject *obj,
-		      register Py_ssize_t i)
+PyObject *mxCharSet_New(PyObject *definition)
 {
-    if (PyTuple_Check(obj)) {
-	if (i > PyTuple_GET_SIZE(obj))
-	    return NULL;
-	return PyTuple_GET_ITEM(obj, i);
+    mxCharSetObject *cs;
+
+    cs = PyObject_NEW(mxCharSetObject, &mxCharSet_Type);
+    if (cs == NULL) 
+	return NULL;
+    Py_INCREF(definition);
+    cs->definition = definition;
+    cs->lookup = NULL;
+    cs->mode = -1;
+
+    if (PyString_Check(definition)) {
+	if (init_string_charset(cs, definition))
+	    goto onError;
     }
-    else if (PyList_Check(obj)) {
-	if (i > PyList_GET_SIZE(obj))
-	    return NULL;
-	return PyList_GET_ITEM(obj, i);
+#ifdef HAVE_UNICODE
+    else if (PyUnicode_Check(definition)) {
+	if (init_unicode_charset(cs, definition))
+	    goto onError;
     }
-    else 
-	return NULL;
-}
+#endif
+    else
+	Py_Error(PyExc_TypeError,
+		 "character set definition must be string or unicode");
 
-static
-Py_ssize_t tc_length(register PyObject *obj)
+    return (PyObject *)cs;
+
+ onError:
+    Py_DECREF(cs);
+    return NULL;
+}
+
+Py_C_Function( mxCharSet_CharSet,
+	       "CharSet(definition)\n\n"
+	       "Create a character set matching object from the string"
+	       )
 {
-    if (obj == NULL)
-	return -1;
-    else if (PyTuple_Check(obj))
-	return PyTuple_GET_SIZE(obj);
-    else if (PyList_Check(obj))
-	return PyList_GET_SIZE(obj);
-    else 
-	return -1;
+    PyObject *definition;
+
+    Py_GetArg("O:CharSet", definition);
+    return mxCharSet_New(definition);
+
+ onError:
+    return NULL;
 }
 
-/* Add a jump target to the jump dictionary */
+static 
+void mxCharSet_Free(mxCharSetObject *cs)
+{
+    Py_XDECREF(cs->definition);
+    if (cs->lookup)
+	PyMem_Free(cs->lookup);
+    PyObject_Del(cs);
+}
 
-static
-Py_ssize_t tc_add_jumptarget(PyObject *jumpdict,
-		      PyObject *targetname,
-		      Py_ssize_t index)
+/* C APIs */
+
+#define cs ((mxCharSetObject *)self)
+
+int mxCharSet_ContainsChar(PyObject *self,
+			   register unsigned char ch)
 {
-    PyObject *v;
-    
-    v = PyDict_GetItem(jumpdict, targetname);
-    if (v != NULL)
-	Py_ErrorWithArg(PyExc_TypeError,
-			"tag table entry %d: "
-			"jump target already defined", (unsigned int) index);
-    v = PyInt_FromLong(index);
-    if (v == NULL)
+    if (!mxCharSet_Check(self)) {
+	PyErr_BadInternalCall();
 	goto onError;
-    if (PyDict_SetItem(jumpdict, targetname, v))
+    }
+    
+    if (cs->mode == MXCHARSET_8BITMODE) {
+	unsigned char *bitmap = ((string_charset *)cs->lookup)->bitmap;
+	return ((bitmap[ch >> 3] & (1 << (ch & 7))) != 0);
+    }
+#ifdef HAVE_UNICODE
+    else if (cs->mode == MXCHARSET_UCS2MODE) {
+	unicode_charset *lookup = (unicode_charset *)cs->lookup;
+	unsigned char *bitmap = lookup->bitmaps[lookup->bitmapindex[0]];
+	return ((bitmap[ch >> 3] & (1 << (ch & 7))) != 0);
+    }
+#endif
+    else {
+	Py_Error(mxTextTools_Error,
+		 "unsupported character set mode");
+    }
+
+ onError:
+    return -1;
+}
+
+#ifdef HAVE_UNICODE
+
+int mxCharSet_ContainsUnicodeChar(PyObject *self,
+				  register Py_UNICODE ch)
+{
+    if (!mxCharSet_Check(self)) {
+	PyErr_BadInternalCall();
 	goto onError;
-    Py_DECREF(v);
-    return 0;
+    }
     
+    if (cs->mode == MXCHARSET_8BITMODE) {
+	unsigned char *bitmap = ((string_charset *)cs->lookup)->bitmap;
+	if (ch >= 256)
+	    return 0;
+	return ((bitmap[ch >> 3] & (1 << (ch & 7))) != 0);
+    }
+    else if (cs->mode == MXCHARSET_UCS2MODE) {
+	unicode_charset *lookup = (unicode_charset *)cs->lookup;
+	unsigned char *bitmap = lookup->bitmaps[lookup->bitmapindex[ch >> 8]];
+	return ((bitmap[(ch >> 3) & 31] & (1 << (ch & 7))) != 0);
+    }
+    else {
+	Py_Error(mxTextTools_Error,
+		 "unsupported character set mode");
+    }
+
  onError:
     return -1;
 }
 
-/* Convert a string command argument to either an 8-bit string or
-   Unicode depending on the tabletype. */
+#endif
 
 static
-PyObject *tc_convert_string_arg(PyObject *arg,
-				Py_ssize_t tableposition,
-				int tabletype)
+int mxCharSet_Contains(PyObject *self,
+		       PyObject *other)
 {
-    /* Convert to strings */
-    if (tabletype == MXTAGTABLE_STRINGTYPE) {
-	if (PyString_Check(arg))
-	    return arg;
-#ifdef HAVE_UNICODE
-	else if (PyUnicode_Check(arg)) {
-	    Py_DECREF(arg);
-	    arg = PyUnicode_AsEncodedString(arg,
-					    NULL,
-					    NULL);
-	    if (arg == NULL)
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"conversion from Unicode to "
-				"string failed", (unsigned int)tableposition);
-	}
-#endif
-	else
-	    Py_ErrorWithArg(PyExc_TypeError,
-			    "tag table entry %d: "
-			    "command argument must be a "
-			    "string or unicode", (unsigned int)tableposition);
+    if (PyString_Check(other)) {
+	Py_Assert(PyString_GET_SIZE(other) == 1,
+		  PyExc_TypeError,
+		  "expected a single character");
+	return mxCharSet_ContainsChar(self, PyString_AS_STRING(other)[0]);
     }
-
 #ifdef HAVE_UNICODE
-    /* Convert to Unicode */
-    else if (tabletype == MXTAGTABLE_UNICODETYPE) {
-	if (PyUnicode_Check(arg))
-	    return arg;
-	else if (PyString_Check(arg)) {
-	    Py_DECREF(arg);
-	    arg = PyUnicode_Decode(PyString_AS_STRING(arg),
-				    PyString_GET_SIZE(arg),
-				    NULL,
-				    NULL);
-	    if (arg == NULL)
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"conversion from string to "
-				"Unicode failed", (unsigned int)tableposition);
-	}
-	else
-	    Py_ErrorWithArg(PyExc_TypeError,
-			    "tag table entry %d: "
-			    "command argument must be a "
-			    "string or unicode", (unsigned int)tableposition);
+    else if (PyUnicode_Check(other)) {
+	Py_Assert(PyUnicode_GET_SIZE(other) == 1,
+		  PyExc_TypeError,
+		  "expected a single unicode character");
+	return mxCharSet_ContainsUnicodeChar(self, 
+					     PyUnicode_AS_UNICODE(other)[0]);
     }
 #endif
-
     else
-	Py_Error(mxTextTools_Error,
-		 "unsupported table type");
+	Py_Error(PyExc_TypeError,
+		 "expected string or unicode character");
 
-    return arg;
-    
  onError:
-    return NULL;
+    return -1;
 }
 
-/* Cleanup any references in the tag table. */
+/* In mode 1, find the position of the first character in text
+   belonging to set. This may also be stop or start-1 in case no such
+   character is found during the search (depending on the direction).
 
-static
-int tc_cleanup(mxTagTableObject *tagtable)
-{
-    Py_ssize_t i;
-    for (i = 0; i < tagtable->numentries; i++) {
-	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+   In mode 0, find the first character not in set. This may also be
+   stop or start-1 in case no such character is found during the
+   search (depending on the direction).
 
-	Py_XDECREF(tagtableentry->tagobj);
-	tagtableentry->tagobj = NULL;
-	Py_XDECREF(tagtableentry->args);
-	tagtableentry->args = NULL;
-    }
-    return 0;
-}
+   The search is done in the slice start:stop.
 
-/* Initialize the tag table (this is the actual Tag Table compiler) */
+   -2 is returned in case of an error.
+
+*/
 
 static
-int init_tag_table(mxTagTableObject *tagtable,
-		   PyObject *table,
-		   Py_ssize_t size,
-		   int tabletype,
-		   int cacheable)
+int mxCharSet_FindChar(PyObject *self,
+		       unsigned char *text,
+		       Py_ssize_t start,
+		       Py_ssize_t stop,
+		       const int mode,
+		       const int direction)
 {
-    Py_ssize_t i;
-    PyObject *entry;
-    Py_ssize_t entry_len;
-    PyObject *tagobj, *command, *args = 0, *je, *jne;
-    PyObject *jumpdict, *v;
-    int secondpass, own_args = 0;
-
-    jumpdict = PyDict_New();
-    if (jumpdict == NULL)
-	return -1;
+    register Py_ssize_t i;
+    register unsigned int c;
+    register unsigned int block;
+    unsigned char *bitmap;
 
-    /* Reset to all fields to 0 */
-    memset(&tagtable->entry[0], 0, size * sizeof(mxTagTableEntry));
+    if (!mxCharSet_Check(self)) {
+	PyErr_BadInternalCall();
+	goto onError;
+    }
     
-    /* First pass */
-    secondpass = 0;
-    tagtable->numentries = size;
-    for (i = 0; i < size; i++) {
-	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+    if (cs->mode == MXCHARSET_8BITMODE)
+	bitmap = ((string_charset *)cs->lookup)->bitmap;
+#ifdef HAVE_UNICODE
+    else if (cs->mode == MXCHARSET_UCS2MODE) {
+	unicode_charset *lookup = (unicode_charset *)cs->lookup;
+	bitmap = lookup->bitmaps[lookup->bitmapindex[0]];
+    }
+#endif
+    else {
+	Py_Error(mxTextTools_Error,
+		 "unsupported character set mode");
+    }
 
-	/* Get table entry i and parse it */
-	entry = tc_get_item(table, i);
-	if (entry == NULL) {
-	    Py_ErrorWithArg(PyExc_TypeError,
-			    "tag table entry %d: "
-			    "not found or not a supported entry type", (unsigned int)i);
+    if (direction > 0) {
+	if (mode)
+	    /* Find first char in set */
+	    for (i = start; i < stop; i++) {
+		c = text[i];
+		block = bitmap[c >> 3];
+		if (block && ((block & (1 << (c & 7))) != 0))
+		    break;
+	    }
+	else
+	    /* Find first char not in set */
+	    for (i = start; i < stop; i++) {
+		c = text[i];
+		block = bitmap[c >> 3];
+		if (!block || ((block & (1 << (c & 7))) == 0))
+		    break;
+	    }
+    }
+    else {
+	if (mode)
+	    /* Find first char in set, searching from the end */
+	    for (i = stop - 1; i >= start; i--) {
+		c = text[i];
+		block = bitmap[c >> 3];
+		if (block && ((block & (1 << (c & 7))) != 0))
+		    break;
+	    }
+	else
+	    /* Find first char not in set, searching from the end */
+	    for (i = stop - 1; i >= start; i--) {
+		c = text[i];
+		block = bitmap[c >> 3];
+		if (!block || ((block & (1 << (c & 7))) == 0))
+		    break;
+	    }
+    }
+    return i;
+
+ onError:
+    return -2;
+}
+
+#ifdef HAVE_UNICODE
+
+static
+int mxCharSet_FindUnicodeChar(PyObject *self,
+			      Py_UNICODE *text,
+			      Py_ssize_t start,
+			      Py_ssize_t stop,
+			      const int mode,
+			      const int direction)
+{
+    register int i;
+    register unsigned int c;
+    register unsigned int block;
+    unsigned char *bitmap;
+
+    if (!mxCharSet_Check(self)) {
+	PyErr_BadInternalCall();
+	goto onError;
+    }
+    
+    if (cs->mode == MXCHARSET_8BITMODE) {
+	bitmap = ((string_charset *)cs->lookup)->bitmap;
+	if (direction > 0) {
+	    if (mode)
+		/* Find first char in set */
+		for (i = start; i < stop; i++) {
+		    c = text[i];
+		    if (c > 256)
+			continue;
+		    block = bitmap[c >> 3];
+		    if (block && ((block & (1 << (c & 7))) != 0))
+			break;
+		}
+	    else
+		/* Find first char not in set */
+		for (i = start; i < stop; i++) {
+		    c = text[i];
+		    if (c > 256)
+			break;
+		    block = bitmap[c >> 3];
+		    if (!block || ((block & (1 << (c & 7))) == 0))
+			break;
+		}
+        }
+	else {
+	    if (mode)
+		/* Find first char in set, searching from the end */
+		for (i = stop - 1; i >= start; i--) {
+		    c = text[i];
+		    if (c > 256)
+			continue;
+		    block = bitmap[c >> 3];
+		    if (block && ((block & (1 << (c & 7))) != 0))
+			break;
+		}
+	    else
+		/* Find first char not in set, searching from the end */
+		for (i = stop - 1; i >= start; i--) {
+		    c = text[i];
+		    if (c > 256)
+			break;
+		    block = bitmap[c >> 3];
+		    if (!block || ((block & (1 << (c & 7))) == 0))
+			break;
+		}
+	}
+	return i;
+    }
+
+#ifdef HAVE_UNICODE
+    else if (cs->mode == MXCHARSET_UCS2MODE) {
+	unicode_charset *lookup = (unicode_charset *)cs->lookup;
+	if (direction > 0) {
+	    if (mode)
+		/* Find first char in set */
+		for (i = start; i < stop; i++) {
+		    c = text[i];
+		    bitmap = lookup->bitmaps[lookup->bitmapindex[c >> 8]];
+		    block = bitmap[(c >> 3) & 31];
+		    if (block && ((block & (1 << (c & 7))) != 0))
+			break;
+		}
+	    else
+		/* Find first char not in set */
+		for (i = start; i < stop; i++) {
+		    c = text[i];
+		    bitmap = lookup->bitmaps[lookup->bitmapindex[c >> 8]];
+		    block = bitmap[(c >> 3) & 31];
+		    if (!block || ((block & (1 << (c & 7))) == 0))
+			break;
+		}
+	}
+	else {
+	    if (mode)
+		/* Find first char in set, searching from the end */
+		for (i = stop - 1; i >= start; i--) {
+		    c = text[i];
+		    bitmap = lookup->bitmaps[lookup->bitmapindex[c >> 8]];
+		    block = bitmap[(c >> 3) & 31];
+		    if (block && ((block & (1 << (c & 7))) != 0))
+			break;
+		}
+	    else
+		/* Find first char not in set, searching from the end */
+		for (i = stop - 1; i >= start; i--) {
+		    c = text[i];
+		    bitmap = lookup->bitmaps[lookup->bitmapindex[c >> 8]];
+		    block = bitmap[(c >> 3) & 31];
+		    if (!block || ((block & (1 << (c & 7))) == 0))
+			break;
+		}
+	}
+	return i;
+    }
+#endif
+    else {
+	Py_Error(mxTextTools_Error,
+		 "unsupported character set mode");
+    }
+
+ onError:
+    return -2;
+}
+
+#endif
+
+/* Return the position of the first character in text[start:stop]
+   occurring in set or -1 in case no such character exists.
+
+*/
+
+static
+int mxCharSet_Search(PyObject *self,
+		     PyObject *text,
+		     Py_ssize_t start,
+		     Py_ssize_t stop,
+		     int direction)
+{
+    Py_ssize_t position;
+    
+    if (PyString_Check(text)) {
+	Py_CheckStringSlice(text, start, stop);
+	position = mxCharSet_FindChar(self, 
+				      (unsigned char *)PyString_AS_STRING(text),
+				      start,
+				      stop,
+				      1,
+				      direction);
+    }
+#ifdef HAVE_UNICODE
+    else if (PyUnicode_Check(text)) {
+	Py_CheckUnicodeSlice(text, start, stop);
+	position = mxCharSet_FindUnicodeChar(self,
+					     PyUnicode_AS_UNICODE(text),
+					     start,
+					     stop,
+					     1,
+					     direction);
+    }
+#endif
+    else
+	Py_Error(PyExc_TypeError,
+		 "expected string or unicode");
+
+    if ((direction > 0 && position >= stop) ||
+	(direction <= 0 && position < start))
+	position = -1;
+    return position;
+
+ onError:
+    return -2;
+}
+
+/* Return the longest match of characters from set in
+   text[start:stop]. 
+
+   If direction is positive, the search is done from the left (longest
+   prefix), otherwise it is started from the right (longest suffix).
+
+   -1 is returned in case of an error.
+
+*/
+
+Py_ssize_t mxCharSet_Match(PyObject *self,
+		    PyObject *text,
+		    Py_ssize_t start,
+		    Py_ssize_t stop,
+		    int direction)
+{
+    Py_ssize_t position;
+    
+    if (PyString_Check(text)) {
+	Py_CheckStringSlice(text, start, stop);
+	position = mxCharSet_FindChar(self, 
+				      (unsigned char *)PyString_AS_STRING(text),
+				      start,
+				      stop,
+				      0,
+				      direction);
+    }
+#ifdef HAVE_UNICODE
+    else if (PyUnicode_Check(text)) {
+	Py_CheckUnicodeSlice(text, start, stop);
+	position = mxCharSet_FindUnicodeChar(self,
+					     PyUnicode_AS_UNICODE(text),
+					     start,
+					     stop,
+					     0,
+					     direction);
+    }
+#endif
+    else
+	Py_Error(PyExc_TypeError,
+		 "expected string or unicode");
+
+    if (position < -1)
+	goto onError;
+    if (direction > 0)
+	return position - start;
+    else
+	return stop-1 - position;
+
+ onError:
+    return -1;
+}
+
+/* Stips off characters appearing in the character set from text[start:stop]
+   and returns the result as Python string object.
+
+   where indicates the mode:
+   where < 0: strip left only
+   where = 0: strip left and right
+   where > 0: strip right only
+
+*/
+static
+PyObject *mxCharSet_Strip(PyObject *self,
+			  PyObject *text,
+			  Py_ssize_t start,
+			  Py_ssize_t stop,
+			  Py_ssize_t where)
+{
+    Py_ssize_t left,right;
+    
+    if (!mxCharSet_Check(self)) {
+	PyErr_BadInternalCall();
+	goto onError;
+    }
+
+    if (PyString_Check(text)) {
+	Py_CheckStringSlice(text, start, stop);
+
+	/* Strip left */
+	if (where <= 0) {
+	    left = mxCharSet_FindChar(self, 
+				      (unsigned char *)PyString_AS_STRING(text),
+				      start,
+				      stop,
+				      0,
+				      1);
+	    if (left < 0)
+		goto onError;
+	}
+	else
+	    left = start;
+
+	/* Strip right */
+	if (where >= 0) {
+	    right = mxCharSet_FindChar(self, 
+				       (unsigned char *)PyString_AS_STRING(text),
+				       left,
+				       stop,
+				       0,
+				       -1) + 1;
+	    if (right < 0)
+		goto onError;
+	}
+	else
+	    right = stop;
+
+	return PyString_FromStringAndSize(PyString_AS_STRING(text) + left, 
+					  max(right - left, 0));
+    }
+#ifdef HAVE_UNICODE
+    else if (PyUnicode_Check(text)) {
+        Py_CheckUnicodeSlice(text, start, stop);
+
+	/* Strip left */
+	if (where <= 0) {
+	    left = mxCharSet_FindUnicodeChar(self, 
+					     PyUnicode_AS_UNICODE(text),
+					     start,
+					     stop,
+					     0,
+					     1);
+	    if (left < 0)
+		goto onError;
+	}
+	else
+	    left = start;
+
+	/* Strip right */
+	if (where >= 0) {
+	    right = mxCharSet_FindUnicodeChar(self, 
+					     PyUnicode_AS_UNICODE(text),
+					     start,
+					     stop,
+					     0,
+					     -1) + 1;
+	    if (right < 0)
+		goto onError;
+	}
+	else
+	    right = stop;
+	
+	return PyUnicode_FromUnicode(PyUnicode_AS_UNICODE(text) + left, 
+				     max(right - left, 0));
+    }
+#endif
+    else
+	Py_Error(PyExc_TypeError,
+		 "expected string or unicode");
+
+ onError:
+    return NULL;
+}
+
+static 
+PyObject *mxCharSet_Split(PyObject *self,
+			  PyObject *text,
+			  Py_ssize_t start,
+			  Py_ssize_t text_len,
+			  int include_splits)
+{
+    PyObject *list = NULL;
+    PyObject *s;
+    register Py_ssize_t x;
+    Py_ssize_t listitem = 0;
+    Py_ssize_t listsize = INITIAL_LIST_SIZE;
+
+    if (!mxCharSet_Check(self)) {
+	PyErr_BadInternalCall();
+	goto onError;
+    }
+    
+    list = PyList_New(listsize);
+    if (!list)
+	goto onError;
+
+    if (PyString_Check(text)) {
+	unsigned char *tx = (unsigned char *)PyString_AS_STRING(text);
+
+	Py_CheckStringSlice(text, start, text_len);
+
+	x = start;
+	while (x < text_len) {
+	    Py_ssize_t z;
+
+	    /* Skip all text in set (include_splits == 0), not in set
+    	       (include_splits == 1) */
+	    z = x;
+	    x = mxCharSet_FindChar(self, tx, x, text_len, include_splits, 1);
+
+	    /* Append the slice to list */
+	    if (include_splits) {
+		s = PyString_FromStringAndSize((char *)&tx[z], x - z);
+		if (!s)
+		    goto onError;
+		if (listitem < listsize)
+		    PyList_SET_ITEM(list,listitem,s);
+		else {
+		    PyList_Append(list,s);
+		    Py_DECREF(s);
+		}
+		listitem++;
+
+		if (x >= text_len)
+		    break;
+	    }
+	    
+	    /* Skip all text in set (include_splits == 1), not in set
+    	       (include_splits == 0) */
+	    z = x;
+	    x = mxCharSet_FindChar(self, tx, x, text_len, !include_splits, 1);
+
+	    /* Append the slice to list if it is not empty */
+	    if (x > z) {
+		s = PyString_FromStringAndSize((char *)&tx[z], x - z);
+		if (!s)
+		    goto onError;
+		if (listitem < listsize)
+		    PyList_SET_ITEM(list,listitem,s);
+		else {
+		    PyList_Append(list,s);
+		    Py_DECREF(s);
+		}
+		listitem++;
+	    }
+	}
+	
+    }
+#ifdef HAVE_UNICODE
+    else if (PyUnicode_Check(text)) {
+	Py_UNICODE *tx = PyUnicode_AS_UNICODE(text);
+
+	Py_CheckUnicodeSlice(text, start, text_len);
+
+	x = start;
+	while (x < text_len) {
+	    Py_ssize_t z;
+
+	    /* Skip all text in set (include_splits == 0), not in set
+    	       (include_splits == 1) */
+	    z = x;
+	    x = mxCharSet_FindUnicodeChar(self, tx, x, text_len, include_splits, 1);
+
+	    /* Append the slice to list */
+	    if (include_splits) {
+		s = PyUnicode_FromUnicode(&tx[z], x - z);
+		if (!s)
+		    goto onError;
+		if (listitem < listsize)
+		    PyList_SET_ITEM(list,listitem,s);
+		else {
+		    PyList_Append(list,s);
+		    Py_DECREF(s);
+		}
+		listitem++;
+
+		if (x >= text_len)
+		    break;
+	    }
+	    
+	    /* Skip all text in set (include_splits == 1), not in set
+    	       (include_splits == 0) */
+	    z = x;
+	    x = mxCharSet_FindUnicodeChar(self, tx, x, text_len, !include_splits, 1);
+
+	    /* Append the slice to list if it is not empty */
+	    if (x > z) {
+		s = PyUnicode_FromUnicode(&tx[z], x - z);
+		if (!s)
+		    goto onError;
+		if (listitem < listsize)
+		    PyList_SET_ITEM(list,listitem,s);
+		else {
+		    PyList_Append(list,s);
+		    Py_DECREF(s);
+		}
+		listitem++;
+	    }
+	}
+    }
+#endif    
+    else
+	Py_Error(PyExc_TypeError,
+		 "expected string or unicode");
+    
+    /* Resize list if necessary */
+    if (listitem < listsize)
+	PyList_SetSlice(list, listitem, listsize, (PyObject*)NULL);
+
+    return list;
+    
+ onError:
+    Py_XDECREF(list);
+    return NULL;
+}
+
+/* methods */
+
+Py_C_Function( mxCharSet_contains,
+	       ".contains(char)\n\n"
+	       )
+{
+    PyObject *chr;
+    int rc;
+
+    Py_GetArg("O:CharSet.contains", chr);
+    
+    rc = mxCharSet_Contains(self, chr);
+    if (rc < 0)
+	goto onError;
+    return PyInt_FromLong(rc);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxCharSet_search,
+	       ".search(text[, direction=1, start=0, stop=len(text)])\n\n"
+	       )
+{
+    PyObject *text;
+    int direction = 1;
+    Py_ssize_t start = 0, stop = INT_MAX;
+    int rc;
+
+    Py_Get4Args("O|iii:CharSet.search", text, direction, start, stop);
+    
+    rc = mxCharSet_Search(self, text, start, stop, direction);
+    if (rc == -1)
+	Py_ReturnNone();
+    if (rc < -1)
+	goto onError;
+    return PyInt_FromLong(rc);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxCharSet_match,
+	       ".match(text[, direction=1, start=0, stop=len(text)])\n\n"
+	       )
+{
+    PyObject *text;
+    int direction = 1;
+    Py_ssize_t start = 0, stop = INT_MAX;
+    int rc;
+
+    Py_Get4Args("O|iii:CharSet.match", text, direction, start, stop);
+    
+    rc = mxCharSet_Match(self, text, start, stop, direction);
+    if (rc < 0)
+	goto onError;
+    return PyInt_FromLong(rc);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxCharSet_split,
+	       ".split(text[, start=0, stop=len(text)])\n\n"
+	       )
+{
+    PyObject *text;
+    Py_ssize_t start = 0, stop = INT_MAX;
+
+    Py_Get3Args("O|ii:CharSet.split", text, start, stop);
+    
+    return mxCharSet_Split(self, text, start, stop, 0);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxCharSet_splitx,
+	       ".splitx(text[, start=0, stop=len(text)])\n\n"
+	       )
+{
+    PyObject *text;
+    Py_ssize_t start = 0, stop = INT_MAX;
+
+    Py_Get3Args("O|ii:CharSet.splitx", text, start, stop);
+    
+    return mxCharSet_Split(self, text, start, stop, 1);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function_WithKeywords( mxCharSet_itersplit,
+	       ".itersplit(text[, start=0, stop=len(text), offsets=0])\n\n"
+	       "Iterator version of split(); text may also be an mmap\n"
+	       "or memoryview. With offsets true, (l,r) slices are\n"
+	       "returned instead of the parts."
+	       )
+{
+    PyObject *text;
+    Py_ssize_t start = 0, stop = INT_MAX;
+    int offsets = 0;
+
+    Py_KeywordsGet4Args("O|nni:CharSet.itersplit",
+			text,start,stop,offsets);
+    
+    return mxSplitIterator_New(text, start, stop,
+			       MXSPLIT_CHARSET, self, offsets);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxCharSet_strip,
+	       ".strip(text[, where=0, start=0, stop=len(text)])\n\n"
+	       )
+{
+    PyObject *text;
+    Py_ssize_t where = 0;
+    Py_ssize_t start = 0, stop = INT_MAX;
+
+    Py_Get4Args("O|iii:CharSet.strip", text, where, start, stop);
+    
+    return mxCharSet_Strip(self, text, start, stop, where);
+
+ onError:
+    return NULL;
+}
+
+#ifdef COPY_PROTOCOL
+Py_C_Function( mxCharSet_copy,
+	       "copy([memo])\n\n"
+	       "Return a new reference for the instance. This function\n"
+	       "is used for the copy-protocol. Real copying doesn't take\n"
+	       "place, since the instances are immutable.")
+{
+    PyObject *memo;
+    
+    Py_GetArg("|O",memo);
+    Py_INCREF(cs);
+    return (PyObject *)cs;
+ onError:
+    return NULL;
+}
+#endif
+
+#undef cs
+
+/* --- slots --- */
+
+static
+PyObject *mxCharSet_Repr(mxCharSetObject *self)
+{
+    PyObject *v;
+    char t[500], *reprstr;
+
+    v = PyObject_Repr(self->definition);
+    if (v == NULL)
+	return NULL;
+    reprstr = PyString_AsString(v);
+    if (reprstr == NULL)
+	return NULL;
+    sprintf(t, "<Character Set object for %.400s at 0x%lx>",
+	    reprstr, (long)self);
+    Py_DECREF(v);
+    return PyString_FromString(t);
+}
+
+/* Python Type Tables */
+
+static
+PySequenceMethods mxCharSet_TypeAsSequence = {
+    (lenfunc)0,                         /*sq_length*/
+    (binaryfunc)0,                      /*sq_concat*/
+    (ssizeargfunc)0,                    /*sq_repeat*/
+    (ssizeargfunc)0,                    /*sq_item*/
+    (ssizessizeargfunc)0,               /*sq_slice*/
+    (ssizeobjargproc)0,                 /*sq_ass_item*/
+    (ssizessizeobjargproc)0,            /*sq_ass_slice*/
+    (objobjproc)mxCharSet_Contains,     /*sq_contains*/
+};
+
+static
+PyMemberDef mxCharSet_Members[] = {
+    {"definition",T_OBJECT_EX,offsetof(mxCharSetObject,definition),READONLY,"Definition"},
+    {NULL}
+};
+
+static
+PyMethodDef mxCharSet_Methods[] =
+{   
+    Py_MethodListEntry("contains",mxCharSet_contains),
+    Py_MethodListEntry("search",mxCharSet_search),
+    Py_MethodListEntry("match",mxCharSet_match),
+    Py_MethodListEntry("strip",mxCharSet_strip),
+    Py_MethodListEntry("split",mxCharSet_split),
+    Py_MethodListEntry("splitx",mxCharSet_splitx),
+    Py_MethodWithKeywordsListEntry("itersplit",mxCharSet_itersplit),
+#ifdef COPY_PROTOCOL
+    Py_MethodListEntry("__deepcopy__",mxCharSet_copy),
+    Py_MethodListEntry("__copy__",mxCharSet_copy),
+#endif
+    {NULL,NULL} /* end of list */
+};
+
+PyTypeObject mxCharSet_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)      /* init at startup ! */
+    "Character Set",                    /* tp_name */
+    sizeof(mxCharSetObject),            /* tp_basicsize */
+    0,                                  /* tp_itemsize */
+    /* methods */
+    (destructor)mxCharSet_Free,         /* tp_dealloc */
+    (printfunc)0,                       /* tp_print */
+    (getattrfunc)0,                     /* tp_getattr */
+    (setattrfunc)0,                     /* tp_setattr */
+    0,                                  /* tp_compare */
+    (reprfunc)mxCharSet_Repr,           /* tp_repr */
+    0,                                  /* tp_as_number */
+    &mxCharSet_TypeAsSequence,          /* tp_as_sequence */
+    0,                                  /* tp_as_mapping */
+    (hashfunc)0,                        /* tp_hash */
+    (ternaryfunc)0,                     /* tp_call */
+    (reprfunc)0,                        /* tp_str */
+    (getattrofunc)0,                    /* tp_getattro */
+    (setattrofunc)0,                    /* tp_setattro */
+    0,                                  /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                 /* tp_flags */
+    (char*) 0,                          /* tp_doc */
+    0,                                  /* tp_traverse */
+    0,                                  /* tp_clear */
+    0,                                  /* tp_richcompare */
+    0,                                  /* tp_weaklistoffset */
+    0,                                  /* tp_iter */
+    0,                                  /* tp_iternext */
+    mxCharSet_Methods,                  /* tp_methods */
+    mxCharSet_Members,                  /* tp_members */
+};
+
+/* --- Tag Table Object ------------------------------------------------*/
+
+PyObject *mxTagTable_New(PyObject *definition,
+			 int tabletype,
+			 int cacheable);
+
+/* internal APIs */
+
+static
+PyObject *tc_get_item(register PyObject *obj,
+		      register Py_ssize_t i)
+{
+    if (PyTuple_Check(obj)) {
+	if (i > PyTuple_GET_SIZE(obj))
+	    return NULL;
+	return PyTuple_GET_ITEM(obj, i);
+    }
+    else if (PyList_Check(obj)) {
+	if (i > PyList_GET_SIZE(obj))
+	    return NULL;
+	return PyList_GET_ITEM(obj, i);
+    }
+    else 
+	return NULL;
+}
+
+static
+Py_ssize_t tc_length(register PyObject *obj)
+{
+    if (obj == NULL)
+	return -1;
+    else if (PyTuple_Check(obj))
+	return PyTuple_GET_SIZE(obj);
+    else if (PyList_Check(obj))
+	return PyList_GET_SIZE(obj);
+    else 
+	return -1;
+}
+
+/* Add a jump target to the jump dictionary */
+
+static
+Py_ssize_t tc_add_jumptarget(PyObject *jumpdict,
+		      PyObject *targetname,
+		      Py_ssize_t index)
+{
+    PyObject *v;
+    
+    v = PyDict_GetItem(jumpdict, targetname);
+    if (v != NULL)
+	Py_ErrorWithArg(PyExc_TypeError,
+			"tag table entry %d: "
+			"jump target already defined", (unsigned int) index);
+    v = PyInt_FromLong(index);
+    if (v == NULL)
+	goto onError;
+    if (PyDict_SetItem(jumpdict, targetname, v))
+	goto onError;
+    Py_DECREF(v);
+    return 0;
+    
+ onError:
+    return -1;
+}
+
+/* Convert a string command argument to either an 8-bit string or
+   Unicode depending on the tabletype. */
+
+static
+PyObject *tc_convert_string_arg(PyObject *arg,
+				Py_ssize_t tableposition,
+				int tabletype)
+{
+    /* Convert to strings */
+    if (tabletype == MXTAGTABLE_STRINGTYPE) {
+	if (PyString_Check(arg))
+	    return arg;
+#ifdef HAVE_UNICODE
+	else if (PyUnicode_Check(arg)) {
+	    Py_DECREF(arg);
+	    arg = PyUnicode_AsEncodedString(arg,
+					    NULL,
+					    NULL);
+	    if (arg == NULL)
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"conversion from Unicode to "
+				"string failed", (unsigned int)tableposition);
+	}
+#endif
+	else
+	    Py_ErrorWithArg(PyExc_TypeError,
+			    "tag table entry %d: "
+			    "command argument must be a "
+			    "string or unicode", (unsigned int)tableposition);
+    }
+
+#ifdef HAVE_UNICODE
+    /* Convert to Unicode */
+    else if (tabletype == MXTAGTABLE_UNICODETYPE) {
+	if (PyUnicode_Check(arg))
+	    return arg;
+	else if (PyString_Check(arg)) {
+	    Py_DECREF(arg);
+	    arg = PyUnicode_Decode(PyString_AS_STRING(arg),
+				    PyString_GET_SIZE(arg),
+				    NULL,
+				    NULL);
+	    if (arg == NULL)
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"conversion from string to "
+				"Unicode failed", (unsigned int)tableposition);
+	}
+	else
+	    Py_ErrorWithArg(PyExc_TypeError,
+			    "tag table entry %d: "
+			    "command argument must be a "
+			    "string or unicode", (unsigned int)tableposition);
+    }
+#endif
+
+    else
+	Py_Error(mxTextTools_Error,
+		 "unsupported table type");
+
+    return arg;
+    
+ onError:
+    return NULL;
+}
+
+/* Convert a TextSearch command argument whose algorithm can't
+   search the tabletype's text (Boyer-Moore only searches 8-bit
+   strings, Horspool only Unicode) to one which can; like
+   tc_convert_string_arg(), the reference to arg is consumed. */
+
+static
+PyObject *tc_convert_search_arg(PyObject *arg,
+				Py_ssize_t tableposition,
+				int tabletype)
+{
+#ifdef HAVE_UNICODE
+    mxTextSearchObject *search = (mxTextSearchObject *)arg;
+    PyObject *match, *converted;
+    int algorithm;
+
+    if (!mxTextSearch_Check(arg))
+	return arg;
+    if (tabletype == MXTAGTABLE_UNICODETYPE &&
+	search->algorithm == MXTEXTSEARCH_BOYERMOORE)
+	algorithm = MXTEXTSEARCH_HORSPOOL;
+    else if (tabletype == MXTAGTABLE_STRINGTYPE &&
+	     search->algorithm == MXTEXTSEARCH_HORSPOOL)
+	algorithm = MXTEXTSEARCH_BOYERMOORE;
+    else
+	return arg;
+    Py_INCREF(search->match);
+    match = tc_convert_string_arg(search->match, tableposition, tabletype);
+    if (match == NULL) {
+	Py_DECREF(arg);
+	return NULL;
+    }
+    converted = mxTextSearch_New(match, search->translate, algorithm);
+    Py_DECREF(match);
+    Py_DECREF(arg);
+    return converted;
+#else
+    return arg;
+#endif
+}
+
+/* Cleanup any references in the tag table. */
+
+static
+int tc_cleanup(mxTagTableObject *tagtable)
+{
+    Py_ssize_t i;
+    for (i = 0; i < tagtable->numentries; i++) {
+	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+
+	Py_XDECREF(tagtableentry->tagobj);
+	tagtableentry->tagobj = NULL;
+	Py_XDECREF(tagtableentry->args);
+	tagtableentry->args = NULL;
+	Py_XDECREF(tagtableentry->linked);
+	tagtableentry->linked = NULL;
+    }
+    return 0;
+}
+
+/* Link a TableInList|SubTableInList entry to its target table if
+   the list already holds a TagTable compiled for tabletype */
+
+static
+void tc_link_entry(mxTagTableEntry *tagtableentry,
+		   PyObject *args,
+		   int tabletype)
+{
+    PyObject *tablelist, *target;
+    Py_ssize_t index;
+
+    if (tagtableentry->linked != NULL)
+	return;
+    tablelist = PyTuple_GET_ITEM(args, 0);
+    index = PyInt_AS_LONG(PyTuple_GET_ITEM(args, 1));
+    if (index < 0 || index >= PyList_GET_SIZE(tablelist))
+	return;
+    target = PyList_GET_ITEM(tablelist, index);
+    if (mxTagTable_Check(target) && 
+	mxTagTable_Type(target) == tabletype) {
+	Py_INCREF(target);
+	tagtableentry->linked = target;
+    }
+}
+
+/* Link the TableInList|SubTableInList entries of the tag table and
+   of its compiled sub-tables */
+
+static
+void tc_link_table(mxTagTableObject *tagtable)
+{
+    Py_ssize_t i;
+    for (i = 0; i < tagtable->numentries; i++) {
+	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+
+	switch (tagtableentry->cmd) {
+
+	case MATCH_TABLE:
+	case MATCH_SUBTABLE:
+	    if (mxTagTable_Check(tagtableentry->args))
+		tc_link_table((mxTagTableObject *)tagtableentry->args);
+	    break;
+
+	case MATCH_REPEAT:
+	    tc_link_table((mxTagTableObject *)
+			  PyTuple_GET_ITEM(tagtableentry->args, 0));
+	    break;
+
+	case MATCH_TABLEINLIST:
+	case MATCH_SUBTABLEINLIST:
+	    tc_link_entry(tagtableentry, tagtableentry->args,
+			  tagtable->tabletype);
+	    break;
+	}
+    }
+}
+
+/* Initialize the tag table (this is the actual Tag Table compiler) */
+
+static
+int init_tag_table(mxTagTableObject *tagtable,
+		   PyObject *table,
+		   Py_ssize_t size,
+		   int tabletype,
+		   int cacheable)
+{
+    Py_ssize_t i;
+    PyObject *entry;
+    Py_ssize_t entry_len;
+    PyObject *tagobj, *command, *args = 0, *je, *jne;
+    PyObject *jumpdict, *v;
+    int secondpass, own_args = 0;
+
+    jumpdict = PyDict_New();
+    if (jumpdict == NULL)
+	return -1;
+
+    /* Reset to all fields to 0 */
+    memset(&tagtable->entry[0], 0, size * sizeof(mxTagTableEntry));
+    
+    /* First pass */
+    secondpass = 0;
+    tagtable->numentries = size;
+    for (i = 0; i < size; i++) {
+	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+
+	/* Get table entry i and parse it */
+	entry = tc_get_item(table, i);
+	if (entry == NULL) {
+	    Py_ErrorWithArg(PyExc_TypeError,
+			    "tag table entry %d: "
+			    "not found or not a supported entry type", (unsigned int)i);
+	}
+
+	/* Special handling for jump marks (args is set to the jump
+	   mark string, jump target index is the next table entry) */
+	if (PyString_Check(entry)) {
+	    if (tc_add_jumptarget(jumpdict, entry, i + 1))
+		goto onError;
+	    tagtableentry->tagobj = NULL;
+	    tagtableentry->cmd = MATCH_JUMPTARGET;
+	    tagtableentry->flags = 0;
+	    Py_INCREF(entry);
+	    tagtableentry->args = entry;
+	    tagtableentry->jne = 0;
+	    tagtableentry->je = 1;
+	    continue;
+	}
+
+	/* Get entry length */
+	entry_len = tc_length(entry);
+	if (entry_len < 3) {
+	    Py_ErrorWithArg(PyExc_TypeError,
+			    "tag table entry %d: "
+			    "expected an entry of the form "
+			    "(tagobj,command,arg[,jne[,je]])", (unsigned int)i);
+	}
+
+	/* Decode entry parts: (tagobj, command, args[, jne[, je]]) */
+	tagobj = tc_get_item(entry, 0);
+	command = tc_get_item(entry, 1);
+	args = tc_get_item(entry, 2);
+	if (entry_len >= 4)
+	    jne = tc_get_item(entry, 3);
+	else
+	    jne = NULL;
+	if (entry_len >= 5) 
+	    je = tc_get_item(entry, 4);
+	else
+	    je = NULL;
+
+	if (tagobj == NULL ||
+	    command == NULL ||
+	    args == NULL ||
+	    (entry_len >= 4 && jne == NULL) ||
+	    (entry_len >= 5 && je == NULL)) {
+	    Py_ErrorWithArg(PyExc_TypeError,
+			    "tag table entry %d: "
+			    "expected an entry of the form "
+			    "(tagobj,command,arg[,jne[,je]])",(unsigned int) i);
+	}
+
+	/* Store tagobj, None gets converted to NULL */
+	if (tagobj != Py_None)
+	    Py_INCREF(tagobj);
+	else
+	    tagobj = NULL;
+	tagtableentry->tagobj = tagobj;
+
+	/* Decode command and flags */
+	Py_AssertWithArg(PyInt_Check(command),
+			 PyExc_TypeError,
+			 "tag table entry %d: "
+			 "command must be an integer",(unsigned int)i);
+	tagtableentry->cmd = PyInt_AS_LONG(command) & 0xFF;
+	tagtableentry->flags = PyInt_AS_LONG(command) - tagtableentry->cmd;
+
+	/* Check command arguments */
+	Py_INCREF(args);
+	own_args = 1;
+
+	switch (tagtableentry->cmd) {
+
+	case MATCH_JUMP: /* == MATCH_FAIL */
+	case MATCH_EOF:
+	case MATCH_LOOP:
+	    /* args is ignored */
+	    break;
+	
+	case MATCH_SKIP:
+	case MATCH_MOVE:
+	case MATCH_LOOPCONTROL:
+	    Py_AssertWithArg(PyInt_Check(args),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "Skip|Move|LoopControl command argument "
+			     "must be an integer", (unsigned int)i);
+	    break;
+	
+	case MATCH_JUMPTARGET:
+	    Py_AssertWithArg(PyString_Check(args),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "JumpMark command argument must be a string",(unsigned int)i);
+	    if (tc_add_jumptarget(jumpdict, args, i + 1))
+		goto onError;
+	    break;
+
+	case MATCH_ALLIN:
+	case MATCH_ALLNOTIN:
+	case MATCH_IS:
+	case MATCH_ISIN:
+	case MATCH_ISNOTIN:
+	case MATCH_WORD:
+	case MATCH_WORDSTART:
+	case MATCH_WORDEND:
+	case MATCH_CIWORD:
+	case MATCH_CIWORDSTART:
+	case MATCH_CIWORDEND:
+	    args = tc_convert_string_arg(args, i, tabletype);
+	    if (args == NULL) {
+		/* the conversion released our reference */
+		own_args = 0;
+		goto onError;
+	    }
+	    break;
+
+	case MATCH_ALLINSET:
+	case MATCH_ISINSET:
+	    Py_AssertWithArg(PyString_Check(args) && 
+			     PyString_GET_SIZE(args) == 32,
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "AllInSet|IsInSet command argument must "
+			     "be a set() string",(unsigned int)i);
+	    break;
+
+	case MATCH_ALLINCHARSET:
+	case MATCH_ISINCHARSET:
+	    Py_AssertWithArg(mxCharSet_Check(args),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "AllInCharSet|IsInCharSet command argument must "
+			     "be a CharSet instance",(unsigned int)i);
+	    break;
+
+	case MATCH_SWORDSTART: /* == MATCH_NOWORD */
+	case MATCH_SWORDEND:
+	case MATCH_SFINDWORD:
+	    Py_AssertWithArg(mxTextSearch_Check(args) ||
+			     mxTextSearchSet_Check(args),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "sWordStart|sWordEnd|sFindWord command "
+			     "argument must be a TextSearch or "
+			     "TextSearchSet search object",(unsigned int)i);
+	    args = tc_convert_search_arg(args, i, tabletype);
+	    if (args == NULL) {
+		/* the conversion released our reference */
+		own_args = 0;
+		goto onError;
+	    }
+	    break;
+	
+	case MATCH_TABLE:
+	case MATCH_SUBTABLE:
+	    Py_AssertWithArg(mxTagTable_Check(args) ||
+			     PyTuple_Check(args) ||
+			     PyList_Check(args) ||
+			     (PyInt_Check(args) && 
+			      PyInt_AS_LONG(args) == MATCH_THISTABLE),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "Table|SubTable command argument "
+			     "must be a tag table tuple/object or "
+			     "ThisTable", (unsigned int)i);
+	    /* XXX We shouldn't recursively compile tag table tuples here
+		   because this will slow down the compile process
+		   too much and it's not clear whether this particular
+		   table will ever be used during tagging.
+	    */
+	    if (!mxTagTable_Check(args) && !PyInt_Check(args)) {
+		Py_DECREF(args);
+		own_args = 0;
+		args = mxTagTable_New(args, tabletype, cacheable);
+		if (args == NULL)
+		    goto onError;
+		own_args = 1;
+	    }
+	    break;
+	
+	case MATCH_TABLEINLIST:
+	case MATCH_SUBTABLEINLIST:
+	    Py_AssertWithArg(PyTuple_Check(args) &&
+			     PyTuple_GET_SIZE(args) == 2 &&
+			     PyList_Check(PyTuple_GET_ITEM(args, 0)) &&
+			     PyInt_Check(PyTuple_GET_ITEM(args, 1)),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "TableInList|SubTableInList command argument "
+			     "must be a 2-tuple (list, integer)",
+			     (unsigned int)i);
+	    /* tables which linktables() compiled into the list can
+	       be referenced directly */
+	    tc_link_entry(tagtableentry, args, tabletype);
+	    break;
+
+	case MATCH_REPEAT:
+	    Py_AssertWithArg(PyTuple_Check(args) &&
+			     PyTuple_GET_SIZE(args) == 3 &&
+			     (mxTagTable_Check(PyTuple_GET_ITEM(args, 0)) ||
+			      PyTuple_Check(PyTuple_GET_ITEM(args, 0)) ||
+			      PyList_Check(PyTuple_GET_ITEM(args, 0))) &&
+			     PyInt_Check(PyTuple_GET_ITEM(args, 1)) &&
+			     PyInt_AS_LONG(PyTuple_GET_ITEM(args, 1)) >= 0 &&
+			     (PyTuple_GET_ITEM(args, 2) == Py_None ||
+			      (PyInt_Check(PyTuple_GET_ITEM(args, 2)) &&
+			       PyInt_AS_LONG(PyTuple_GET_ITEM(args, 2)) > 0 &&
+			       PyInt_AS_LONG(PyTuple_GET_ITEM(args, 2)) >=
+			       PyInt_AS_LONG(PyTuple_GET_ITEM(args, 1)))),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "Repeat command argument must be a 3-tuple "
+			     "(tag table, min, max or None) with "
+			     "0 <= min <= max and max > 0",
+			     (unsigned int)i);
+	    if (!mxTagTable_Check(PyTuple_GET_ITEM(args, 0))) {
+		/* compile the repeated table, see Table for caveats */
+		PyObject *repeated;
+
+		repeated = mxTagTable_New(PyTuple_GET_ITEM(args, 0),
+					  tabletype, cacheable);
+		if (repeated == NULL)
+		    goto onError;
+		v = PyTuple_Pack(3,
+				 repeated,
+				 PyTuple_GET_ITEM(args, 1),
+				 PyTuple_GET_ITEM(args, 2));
+		Py_DECREF(repeated);
+		if (v == NULL)
+		    goto onError;
+		Py_DECREF(args);
+		args = v;
+	    }
+	    break;
+
+	case MATCH_CALL:
+	    Py_AssertWithArg(PyCallable_Check(args),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "Call command argument "
+			     "must be a callable object",
+			     (unsigned int)i);
+	    break;
+
+	case MATCH_CALLARG:
+	    Py_AssertWithArg(PyTuple_Check(args) &&
+			     PyTuple_GET_SIZE(args) > 0 &&
+			     PyCallable_Check(PyTuple_GET_ITEM(args, 0)),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "CallArg command argument "
+			     "must be a tuple (fct,[arg0,arg1,...])",
+			     (unsigned int)i);
+	    break;
+	    
+	default:
+	    Py_ErrorWith2Args(PyExc_TypeError,
+			      "tag table entry %d: "
+			      "unknown command integer: %i", 
+			      (unsigned int)i, tagtableentry->cmd);
+	
+	}
+
+	/* Store command args */
+	tagtableentry->args = args;
+	own_args = 0;
+
+	/* Decode jump offsets */
+	if (jne) {
+	    if (PyInt_Check(jne))
+		tagtableentry->jne = PyInt_AS_LONG(jne);
+	    else if (PyString_Check(jne)) {
+		/* Mark for back-patching */
+		tagtableentry->jne = -424242;
+		secondpass = 1;
+	    }
+	    else
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"jne must be an integer or string", (unsigned int)i);
+	}
+	else
+	    tagtableentry->jne = 0;
+
+	if (je) {
+	    if (PyInt_Check(je))
+		tagtableentry->je = PyInt_AS_LONG(je);
+	    else if (PyString_Check(je)) {
+		/* Mark for back-patching */
+		tagtableentry->je = -424242;
+		secondpass = 1;
+	    }
+	    else
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"je must be an integer or string", (unsigned int)i);
+	}
+	else
+	    tagtableentry->je = 1;
+    }
+
+    /* Second pass (needed to patch string jump targets) */
+    if (secondpass)
+	for (i = 0; i < size; i++) {
+	    mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+
+	    if (tagtableentry->je != -424242 &&
+		tagtableentry->jne != -424242)
+		continue;
+
+	    /* Entry (most probably) needs back-patching */
+	    entry = tc_get_item(table, i);
+	    if (entry == NULL) {
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"unexpected error (not found)", (unsigned int)i);
+	    }
+
+	    /* Get entry length */
+	    entry_len = tc_length(entry);
+	    if (entry_len < 0) {
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"unexpected error (no length)", (unsigned int)i);
+	    }
+
+	    /* Decode jump offsets */
+	    if (entry_len >= 4)
+		jne = tc_get_item(entry, 3);
+	    else
+		jne = NULL;
+	    if (entry_len >= 5) 
+		je = tc_get_item(entry, 4);
+	    else
+		je = NULL;
+
+	    /* Patch jump offsets */
+	    if (jne && PyString_Check(jne)) {
+		v = PyDict_GetItem(jumpdict, jne);
+		if (v == NULL || !PyInt_Check(v))
+		    Py_ErrorWith2Args(PyExc_TypeError,
+				      "tag table entry %d: "
+				      "jne jump target '%s' not found", 
+				      (unsigned int)i, PyString_AS_STRING(jne));
+		tagtableentry->jne = PyInt_AS_LONG(v) - i;
+	    }
+	    if (je && PyString_Check(je)) {
+		v = PyDict_GetItem(jumpdict, je);
+		if (v == NULL || !PyInt_Check(v))
+		    Py_ErrorWith2Args(PyExc_TypeError,
+				      "tag table entry %d: "
+				      "je jump target '%s' not found", 
+				      (unsigned int)i, PyString_AS_STRING(je));
+		tagtableentry->je = PyInt_AS_LONG(v) - i;
+	    }
+	}
+    
+    Py_DECREF(jumpdict);
+    return 0;
+
+ onError:
+    if (own_args) {
+	Py_DECREF(args);
+    }
+    return -1;
+}
+
+/* Check the cache for an already compiled TagTable for this
+   definition.  Return NULL in case of an error, Py_None without
+   INCREF in case no such table was found or the TagTable object. */
+
+static
+PyObject *consult_tagtable_cache(PyObject *definition,
+				 int tabletype,
+				 int cacheable)
+{
+    PyObject *v, *key, *tt;
+
+    if (!PyTuple_Check(definition) || !cacheable)
+	return Py_None;
+
+    key = PyTuple_New(2);
+    if (key == NULL)
+	goto onError;
+    v = PyInt_FromLong((long) definition);
+    if (v == NULL)
+	goto onError;
+    PyTuple_SET_ITEM(key, 0, v);
+    v = PyInt_FromLong(tabletype);
+    if (v == NULL)
+	goto onError;
+    PyTuple_SET_ITEM(key, 1, v);
+    tt = PyDict_GetItem(mxTextTools_TagTables, key);
+    Py_DECREF(key);
+    if (tt != NULL) {
+	Py_INCREF(tt);
+	return tt;
+    }
+    return Py_None;
+
+ onError:
+    return NULL;
+}
+
+/* Adds the compiled tagtable to the cache. Returns -1 in case of an
+   error, 0 on success. */
+
+static
+int add_to_tagtable_cache(PyObject *definition,
+			  int tabletype,
+			  int cacheable,
+			  PyObject *tagtable)
+{
+    PyObject *v, *key;
+    int rc;
+
+    if (!PyTuple_Check(definition) || !cacheable)
+	return 0;
+    
+    key = PyTuple_New(2);
+    if (key == NULL)
+	goto onError;
+    v = PyInt_FromLong((long) definition);
+    if (v == NULL)
+	goto onError;
+    PyTuple_SET_ITEM(key, 0, v);
+    v = PyInt_FromLong(tabletype);
+    if (v == NULL)
+	goto onError;
+    PyTuple_SET_ITEM(key, 1, v);
+
+    /* Hard-limit the cache size */
+    if (PyDict_Size(mxTextTools_TagTables) >= MAX_TAGTABLES_CACHE_SIZE)
+	PyDict_Clear(mxTextTools_TagTables);
+
+    rc = PyDict_SetItem(mxTextTools_TagTables, key, tagtable);
+    Py_DECREF(key);
+    if (rc)
+	goto onError;
+    return 0;
+
+ onError:
+    return -1;
+}
+
+		       
+/* allocation */
+
+PyObject *mxTagTable_New(PyObject *definition,
+			 int tabletype,
+			 int cacheable)
+{
+    mxTagTableObject *tagtable = 0;
+    PyObject *v;
+    Py_ssize_t size;
+
+    /* First, consult the TagTable cache */
+    v = consult_tagtable_cache(definition, tabletype, cacheable);
+    if (v == NULL)
+	goto onError;
+    else if (v != Py_None)
+	return v;
+
+    size = tc_length(definition);
+    if (size < 0)
+	Py_Error(PyExc_TypeError,
+		 "tag table definition must be a tuple or a list");
+
+    tagtable = PyObject_GC_NewVar(mxTagTableObject, &mxTagTable_Type, size);
+    if (tagtable == NULL) 
+	goto onError;
+    tagtable->numentries = 0;
+    if (cacheable) {
+	Py_INCREF(definition);
+	tagtable->definition = definition;
+    }
+    else
+	tagtable->definition = NULL;
+    tagtable->tabletype = tabletype;
+    
+    /* Compile table ... */
+    if (init_tag_table(tagtable, definition, size, tabletype, cacheable))
+	goto onError;
+
+    /* Tables in a linked list of tables reference each other */
+    PyObject_GC_Track(tagtable);
+
+    /* Cache the compiled table if it is cacheable and derived from a
+       tuple */
+    if (add_to_tagtable_cache(definition, tabletype, cacheable, 
+			      (PyObject *)tagtable))
+	goto onError;
+
+    return (PyObject *)tagtable;
+
+ onError:
+    Py_XDECREF(tagtable);
+    return NULL;
+}
+
+Py_C_Function( mxTagTable_TagTable,
+	       "TagTable(definition[,cachable=1])\n\n"
+	       )
+{
+    PyObject *definition;
+    int cacheable = 1;
+
+    Py_Get2Args("O|i:TagTable", definition, cacheable);
+    return mxTagTable_New(definition, 0, cacheable);
+
+ onError:
+    return NULL;
+}
+
+/* Create a TagTable from the entries returned by compiled() for a
+   table of the given type.  The entries are used as they are, they
+   are not compiled again, only the types the Tagging Engine relies
+   on for the string commands are checked. */
+
+static
+PyObject *mxTagTable_FromEntries(PyObject *entries,
+				 int tabletype,
+				 PyObject *definition)
+{
+    mxTagTableObject *tagtable = 0;
+    Py_ssize_t size, i;
+
+    Py_Assert(PyTuple_Check(entries),
+	      PyExc_TypeError,
+	      "entries must be a tuple");
+    Py_Assert(tabletype == MXTAGTABLE_STRINGTYPE ||
+	      tabletype == MXTAGTABLE_UNICODETYPE,
+	      PyExc_ValueError,
+	      "unsupported table type");
+    size = PyTuple_GET_SIZE(entries);
+
+    tagtable = PyObject_GC_NewVar(mxTagTableObject, &mxTagTable_Type, size);
+    if (tagtable == NULL) 
+	goto onError;
+    memset(&tagtable->entry[0], 0, size * sizeof(mxTagTableEntry));
+    tagtable->numentries = size;
+    /* the definition is only used to compile the table for the
+       other text type, when it is looked up in a list of tables */
+    if (definition != NULL && definition != Py_None) {
+	Py_INCREF(definition);
+	tagtable->definition = definition;
+    }
+    else
+	tagtable->definition = NULL;
+    tagtable->tabletype = tabletype;
+
+    for (i = 0; i < size; i++) {
+	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+	PyObject *entry = PyTuple_GET_ITEM(entries, i);
+	PyObject *tagobj, *args;
+	long command;
+
+	Py_AssertWithArg(PyTuple_Check(entry) &&
+			 PyTuple_GET_SIZE(entry) == 5 &&
+			 PyInt_Check(PyTuple_GET_ITEM(entry, 1)) &&
+			 PyInt_Check(PyTuple_GET_ITEM(entry, 3)) &&
+			 PyInt_Check(PyTuple_GET_ITEM(entry, 4)),
+			 PyExc_TypeError,
+			 "tag table entry %d: "
+			 "expected a compiled entry "
+			 "(tagobj,command,args,jne,je)", (unsigned int)i);
+	tagobj = PyTuple_GET_ITEM(entry, 0);
+	command = PyInt_AS_LONG(PyTuple_GET_ITEM(entry, 1));
+	args = PyTuple_GET_ITEM(entry, 2);
+
+	tagtableentry->cmd = command & 0xFF;
+	tagtableentry->flags = command - tagtableentry->cmd;
+	switch (tagtableentry->cmd) {
+
+	case MATCH_ALLIN:
+	case MATCH_ALLNOTIN:
+	case MATCH_IS:
+	case MATCH_ISIN:
+	case MATCH_ISNOTIN:
+	case MATCH_WORD:
+	case MATCH_WORDSTART:
+	case MATCH_WORDEND:
+	case MATCH_CIWORD:
+	case MATCH_CIWORDSTART:
+	case MATCH_CIWORDEND:
+	    Py_AssertWithArg(tabletype == MXTAGTABLE_STRINGTYPE ?
+			     PyString_Check(args) : PyUnicode_Check(args),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "command argument doesn't match the table type",
+			     (unsigned int)i);
+	    break;
+	}
+
+	if (tagobj != Py_None) {
+	    Py_INCREF(tagobj);
+	    tagtableentry->tagobj = tagobj;
+	}
+	Py_INCREF(args);
+	tagtableentry->args = args;
+	tagtableentry->jne = PyInt_AS_LONG(PyTuple_GET_ITEM(entry, 3));
+	tagtableentry->je = PyInt_AS_LONG(PyTuple_GET_ITEM(entry, 4));
+    }
+
+    PyObject_GC_Track(tagtable);
+    return (PyObject *)tagtable;
+
+ onError:
+    Py_XDECREF(tagtable);
+    return NULL;
+}
+
+Py_C_Function( mxTagTable_restoretagtable,
+	       "restoretagtable(entries,tabletype[,definition])\n\n"
+	       "Create a TagTable of the given tabletype from the entries\n"
+	       "returned by the compiled() method of such a table, without\n"
+	       "compiling them again. This is used when unpickling tag\n"
+	       "tables: the entries are trusted to be valid. definition\n"
+	       "is kept as the table's definition attribute."
+	       )
+{
+    PyObject *entries;
+    int tabletype;
+    PyObject *definition = NULL;
+
+    Py_Get3Args("Oi|O:restoretagtable", entries, tabletype, definition);
+    return mxTagTable_FromEntries(entries, tabletype, definition);
+
+ onError:
+    return NULL;
+}
+
+#ifdef HAVE_UNICODE
+Py_C_Function( mxTagTable_UnicodeTagTable,
+	       "TagTable(definition[,cachable=1])\n\n"
+	       )
+{
+    PyObject *definition;
+    int cacheable = 1;
+
+    Py_Get2Args("O|i:UnicodeTagTable", definition, cacheable);
+    return mxTagTable_New(definition, 1, cacheable);
+
+ onError:
+    return NULL;
+}
+#endif
+
+static 
+void mxTagTable_Free(mxTagTableObject *tagtable)
+{
+    PyObject_GC_UnTrack(tagtable);
+    tc_cleanup(tagtable);
+    Py_XDECREF(tagtable->definition);
+    PyObject_GC_Del(tagtable);
+}
+
+static
+int mxTagTable_Traverse(mxTagTableObject *tagtable,
+			visitproc visit,
+			void *arg)
+{
+    Py_ssize_t i;
+
+    Py_VISIT(tagtable->definition);
+    for (i = 0; i < tagtable->numentries; i++) {
+	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+
+	Py_VISIT(tagtableentry->tagobj);
+	Py_VISIT(tagtableentry->args);
+	Py_VISIT(tagtableentry->linked);
+    }
+    return 0;
+}
+
+static
+int mxTagTable_Clear(mxTagTableObject *tagtable)
+{
+    tc_cleanup(tagtable);
+    Py_CLEAR(tagtable->definition);
+    return 0;
+}
+
+/* C APIs */
+
+#define tagtable ((mxTagTableObject *)self)
+
+static
+PyObject *mxTagTable_CompiledDefinition(PyObject *self)
+{
+    PyObject *tuple = 0, *v, *w;
+    Py_ssize_t i;
+    Py_ssize_t size;
+
+    if (!mxTagTable_Check(self)) {
+	PyErr_BadInternalCall();
+	goto onError;
+    }
+
+    size = tagtable->numentries;
+    tuple = PyTuple_New(size);
+    if (tuple == NULL)
+	goto onError;
+    
+    for (i = 0; i < size; i++) {
+	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+
+	/* Build tuple (tagobj, command, args, jne, je) */
+	v = PyTuple_New(5);
+	if (v == NULL)
+	    goto onError;
+	w = tagtableentry->tagobj;
+	if (w == NULL)
+	    w = Py_None;
+	Py_INCREF(w);
+	PyTuple_SET_ITEM(v, 0, w);
+	PyTuple_SET_ITEM(v, 1, PyInt_FromLong(tagtableentry->cmd |
+					      tagtableentry->flags));
+	w = tagtableentry->args;
+	if (w == NULL)
+	    w = Py_None;
+	Py_INCREF(w);
+	PyTuple_SET_ITEM(v, 2, w);
+	PyTuple_SET_ITEM(v, 3, PyInt_FromLong(tagtableentry->jne));
+	PyTuple_SET_ITEM(v, 4, PyInt_FromLong(tagtableentry->je));
+	if (PyErr_Occurred()) {
+	    Py_DECREF(v);
+	    goto onError;
+	}
+	PyTuple_SET_ITEM(tuple, i, v);
+    }
+    
+    return tuple;
+
+ onError:
+    Py_XDECREF(tuple);
+    return NULL;
+}
+
+
+/* methods */
+
+Py_C_Function( mxTagTable_compiled,
+	       ".compiled()\n\n"
+	       )
+{
+    Py_NoArgsCheck();
+    return mxTagTable_CompiledDefinition(self);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTagTable_getstate,
+	       "__getstate__()\n\n"
+	       "Return a tuple with the table each TableInList|SubTableInList\n"
+	       "entry is linked to, None for the other entries, or None if\n"
+	       "no entry is linked. Used for pickling."
+	       )
+{
+    PyObject *links;
+    Py_ssize_t i;
+    int linked = 0;
+
+    Py_NoArgsCheck();
+    for (i = 0; i < tagtable->numentries; i++)
+	if (tagtable->entry[i].linked != NULL) {
+	    linked = 1;
+	    break;
+	}
+    if (!linked) {
+	Py_INCREF(Py_None);
+	return Py_None;
+    }
+    links = PyTuple_New(tagtable->numentries);
+    if (links == NULL)
+	goto onError;
+    for (i = 0; i < tagtable->numentries; i++) {
+	PyObject *target = tagtable->entry[i].linked;
+
+	if (target == NULL)
+	    target = Py_None;
+	Py_INCREF(target);
+	PyTuple_SET_ITEM(links, i, target);
+    }
+    return links;
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTagTable_setstate,
+	       "__setstate__(links)\n\n"
+	       "Link TableInList|SubTableInList entries to the tables\n"
+	       "returned by __getstate__(). Entries which are already\n"
+	       "linked are left alone. Used for unpickling."
+	       )
+{
+    PyObject *links;
+    Py_ssize_t i;
+
+    Py_GetArg("O:__setstate__", links);
+    Py_Assert(PyTuple_Check(links) &&
+	      PyTuple_GET_SIZE(links) == tagtable->numentries,
+	      PyExc_TypeError,
+	      "expected a tuple with one item per table entry");
+    for (i = 0; i < tagtable->numentries; i++) {
+	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+	PyObject *target = PyTuple_GET_ITEM(links, i);
+
+	if (target == Py_None || tagtableentry->linked != NULL)
+	    continue;
+	Py_AssertWithArg((tagtableentry->cmd == MATCH_TABLEINLIST ||
+			  tagtableentry->cmd == MATCH_SUBTABLEINLIST) &&
+			 mxTagTable_Check(target) &&
+			 mxTagTable_Type(target) == tagtable->tabletype,
+			 PyExc_TypeError,
+			 "tag table entry %d: "
+			 "can only link TableInList|SubTableInList entries "
+			 "to a TagTable of the same type", (unsigned int)i);
+	Py_INCREF(target);
+	tagtableentry->linked = target;
+    }
+    Py_INCREF(Py_None);
+    return Py_None;
+
+ onError:
+    return NULL;
+}
+
+#ifdef COPY_PROTOCOL
+Py_C_Function( mxTagTable_copy,
+	       "copy([memo])\n\n"
+	       "Return a new reference for the instance. This function\n"
+	       "is used for the copy-protocol. Real copying doesn't take\n"
+	       "place, since the instances are immutable.")
+{
+    PyObject *memo;
+    
+    Py_GetArg("|O",memo);
+    Py_INCREF(tagtable);
+    return (PyObject *)tagtable;
+
+ onError:
+    return NULL;
+}
+#endif
+
+#undef tagtable
+
+/* --- slots --- */
+
+static
+PyObject *mxTagTable_Repr(mxTagTableObject *self)
+{
+    char t[100];
+
+    if (self->tabletype == MXTAGTABLE_STRINGTYPE)
+	sprintf(t,"<String Tag Table object at 0x%lx>", (long)self);
+    else if (self->tabletype == MXTAGTABLE_UNICODETYPE)
+	sprintf(t,"<Unicode Tag Table object at 0x%lx>", (long)self);
+    else
+	sprintf(t,"<Tag Table object at 0x%lx>", (long)self);
+    return PyString_FromString(t);
+}
+
+static
+PyMethodDef mxTagTable_Methods[] =
+{   
+    Py_MethodListEntryNoArgs("compiled",mxTagTable_compiled),
+    Py_MethodListEntryNoArgs("__getstate__",mxTagTable_getstate),
+    Py_MethodListEntry("__setstate__",mxTagTable_setstate),
+#ifdef COPY_PROTOCOL
+    Py_MethodListEntry("__deepcopy__",mxTagTable_copy),
+    Py_MethodListEntry("__copy__",mxTagTable_copy),
+#endif
+    {NULL,NULL} /* end of list */
+};
+
+static
+PyMemberDef mxTagTable_Members[] = {
+    {"definition",T_OBJECT_EX,offsetof(mxTagTableObject,definition),READONLY,"Definition"},
+    {"tabletype",T_INT,offsetof(mxTagTableObject,tabletype),READONLY,"Table type: 0 - 8-bit strings, 1 - Unicode"},
+    {NULL}
+};
+
+/* Python Type Tables */
+
+PyTypeObject mxTagTable_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)          /* init at startup ! */
+    "Tag Table",                            /* tp_name */
+    sizeof(mxTagTableObject),               /* tp_basicsize */
+    sizeof(mxTagTableEntry),                /* tp_itemsize */
+    /* methods */
+    (destructor)mxTagTable_Free,            /* tp_dealloc */
+    (printfunc)0,                           /* tp_print */
+    (getattrfunc)0,                         /* tp_getattr */
+    (setattrfunc)0,                         /* tp_setattr */
+    0,                                      /* tp_compare */
+    (reprfunc)mxTagTable_Repr,              /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    (hashfunc)0,                            /* tp_hash */
+    (ternaryfunc)0,                         /* tp_call */
+    (reprfunc)0,                            /* tp_str */
+    (getattrofunc)0,                        /* tp_getattro */
+    (setattrofunc)0,                        /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC, /* tp_flags */
+    (char*) 0,                              /* tp_doc */
+    (traverseproc)mxTagTable_Traverse,      /* tp_traverse */
+    (inquiry)mxTagTable_Clear,              /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    0,                                      /* tp_iter */
+    0,                                      /* tp_iternext */
+    mxTagTable_Methods,                     /* tp_methods */
+    mxTagTable_Members,                     /* tp_members */
+};
+
+/* --- Split Iterator Object -------------------------------------------*/
+
+/* Get the ordinal of character i of the iterator's text */
+#define SPLIT_CHAR(si, i) \
+    ((si)->unicode ? (Py_UCS4)((Py_UNICODE *)(si)->tx)[(i)] \
+                   : (Py_UCS4)((unsigned char *)(si)->tx)[(i)])
+
+/* Is ch in the set() string setstr ? */
+#define SPLIT_INSET(setstr, ch) \
+    ((ch) < 256 && \
+     ((unsigned char)(setstr)[(ch) >> 3] & (1 << ((ch) & 7))))
+
+/* Create an iterator over the parts of text[start:stop]; text may be
+   a Unicode object or any object providing an 8-bit buffer, e.g. a
+   string, an mmap or a memoryview. */
+
+static
+PyObject *mxSplitIterator_New(PyObject *text,
+			      Py_ssize_t start,
+			      Py_ssize_t stop,
+			      int kind,
+			      PyObject *separator,
+			      int offsets)
+{
+    mxSplitIteratorObject *si;
+
+    si = PyObject_NEW(mxSplitIteratorObject, &mxSplitIterator_Type);
+    if (si == NULL)
+	return NULL;
+    si->kind = kind;
+    si->text = NULL;
+    si->view.obj = NULL;
+    si->separator = NULL;
+    si->sepchar = 0;
+    si->finished = 0;
+    si->offsets = offsets;
+
+#ifdef HAVE_UNICODE
+    if (PyUnicode_Check(text)) {
+	Py_CheckUnicodeSlice(text, start, stop);
+	si->tx = PyUnicode_AS_UNICODE(text);
+	if (si->tx == NULL)
+	    goto onError;
+	si->unicode = 1;
+    }
+    else
+#endif
+    {
+	if (PyObject_GetBuffer(text, &si->view, PyBUF_SIMPLE)) {
+#if PY_MAJOR_VERSION < 3
+	    /* mmap only has the old buffer interface in Python 2 */
+	    const void *buffer;
+	    Py_ssize_t length;
+
+	    if (!PyObject_CheckReadBuffer(text))
+		goto onError;
+	    PyErr_Clear();
+	    if (PyObject_AsReadBuffer(text, &buffer, &length) ||
+		PyBuffer_FillInfo(&si->view, text, (void *)buffer, length,
+				  1, PyBUF_SIMPLE))
+		goto onError;
+#else
+	    goto onError;
+#endif
+	}
+	Py_CheckBufferSlice(si->view.len, start, stop);
+	si->tx = si->view.buf;
+	si->unicode = 0;
+    }
+    Py_INCREF(text);
+    si->text = text;
+    si->position = start;
+    si->stop = stop;
+
+    switch (kind) {
+
+    case MXSPLIT_CHAR:
+#ifdef HAVE_UNICODE
+	if (PyUnicode_Check(separator) && si->unicode) {
+	    Py_Assert(PyUnicode_GET_SIZE(separator) == 1,
+		      PyExc_TypeError,
+		      "separator must be a single character");
+	    si->sepchar = (Py_UCS4)PyUnicode_AS_UNICODE(separator)[0];
+	    break;
+	}
+#endif
+	Py_Assert(PyString_Check(separator),
+		  PyExc_TypeError,
+		  "separator must be of the same type as text");
+	Py_Assert(PyString_GET_SIZE(separator) == 1,
+		  PyExc_TypeError,
+		  "separator must be a single character");
+	si->sepchar = (unsigned char)PyString_AS_STRING(separator)[0];
+	separator = NULL;
+	break;
+
+    case MXSPLIT_SET:
+	Py_Assert(PyString_Check(separator) &&
+		  PyString_GET_SIZE(separator) == 32,
+		  PyExc_TypeError,
+		  "separator needs to be a set as obtained from set()");
+	break;
+
+    case MXSPLIT_CHARSET:
+	Py_Assert(mxCharSet_Check(separator),
+		  PyExc_TypeError,
+		  "expected a CharSet object");
+	break;
+
+    case MXSPLIT_SEARCH:
+	Py_Assert(mxTextSearch_Check(separator) ||
+		  mxTextSearchSet_Check(separator),
+		  PyExc_TypeError,
+		  "expected a TextSearch or TextSearchSet object");
+	break;
+
+    default:
+	separator = NULL;
+    }
+    Py_XINCREF(separator);
+    si->separator = separator;
+    return (PyObject *)si;
+
+ onError:
+    Py_DECREF(si);
+    return NULL;
+}
+
+static
+void mxSplitIterator_Free(mxSplitIteratorObject *si)
+{
+    if (si->view.obj)
+	PyBuffer_Release(&si->view);
+    Py_XDECREF(si->text);
+    Py_XDECREF(si->separator);
+    PyObject_Del(si);
+}
+
+/* --- slots --- */
+
+static
+PyObject *mxSplitIterator_Next(mxSplitIteratorObject *si)
+{
+    Py_ssize_t x = si->position;
+    Py_ssize_t stop = si->stop;
+    Py_ssize_t left, right;
+
+    if (si->finished)
+	return NULL;
+
+    switch (si->kind) {
+
+    case MXSPLIT_CHAR:
+	left = x;
+	while (x < stop && SPLIT_CHAR(si, x) != si->sepchar)
+	    x++;
+	right = x;
+	if (x < stop)
+	    /* Skip separator */
+	    x++;
+	else
+	    si->finished = 1;
+	break;
+
+    case MXSPLIT_SET:
+	{
+	    char *setstr = PyString_AS_STRING(si->separator);
+
+	    /* Skip all text in set */
+	    while (x < stop && SPLIT_INSET(setstr, SPLIT_CHAR(si, x)))
+		x++;
+	    left = x;
+	    /* Skip all text not in set */
+	    while (x < stop && !SPLIT_INSET(setstr, SPLIT_CHAR(si, x)))
+		x++;
+	    right = x;
+	}
+	if (right == left) {
+	    /* Empty parts are omitted, so this is the end */
+	    si->finished = 1;
+	    return NULL;
+	}
+	break;
+
+    case MXSPLIT_CHARSET:
+	/* Skip all text in set, then all text not in set */
+#ifdef HAVE_UNICODE
+	if (si->unicode) {
+	    left = mxCharSet_FindUnicodeChar(si->separator, 
+					     (Py_UNICODE *)si->tx,
+					     x, stop, 0, 1);
+	    if (left < -1)
+		goto onError;
+	    right = mxCharSet_FindUnicodeChar(si->separator, 
+					      (Py_UNICODE *)si->tx,
+					      left, stop, 1, 1);
+	}
+	else
+#endif
+	{
+	    left = mxCharSet_FindChar(si->separator, 
+				      (unsigned char *)si->tx,
+				      x, stop, 0, 1);
+	    if (left < -1)
+		goto onError;
+	    right = mxCharSet_FindChar(si->separator, 
+				       (unsigned char *)si->tx,
+				       left, stop, 1, 1);
+	}
+	if (right < -1)
+	    goto onError;
+	if (right == left) {
+	    si->finished = 1;
+	    return NULL;
+	}
+	x = right;
+	break;
+
+    case MXSPLIT_SEARCH:
+	{
+	    Py_ssize_t sliceleft, sliceright;
+	    Py_ssize_t rc;
+
+#ifdef HAVE_UNICODE
+	    if (si->unicode)
+		rc = mxTextSearch_SearchUnicode(si->separator,
+						(Py_UNICODE *)si->tx,
+						x, stop,
+						&sliceleft, &sliceright);
+	    else
+#endif
+		rc = mxTextSearch_SearchBuffer(si->separator,
+					       (char *)si->tx,
+					       x, stop,
+					       &sliceleft, &sliceright);
+	    if (rc < 0)
+		goto onError;
+	    left = x;
+	    if (rc > 0 && sliceright > sliceleft) {
+		right = sliceleft;
+		x = sliceright;
+	    }
+	    else {
+		right = stop;
+		x = stop;
+		si->finished = 1;
+	    }
+	}
+	break;
+
+    case MXSPLIT_LINES:
+	/* Skip a line end: '\r', '\n' or '\r\n' */
+	if (x < stop && SPLIT_CHAR(si, x) == '\r')
+	    x++;
+	if (x < stop && SPLIT_CHAR(si, x) == '\n')
+	    x++;
+	left = x;
+	while (x < stop) {
+	    Py_UCS4 ch = SPLIT_CHAR(si, x);
+
+	    if (ch == '\r' || ch == '\n')
+		break;
+	    x++;
+	}
+	right = x;
+	/* An empty part is an empty line unless the text ends here */
+	if (right == left && x >= stop) {
+	    si->finished = 1;
+	    return NULL;
+	}
+	break;
+
+    default:
+	Py_Error(PyExc_SystemError,
+		 "unknown split iterator kind");
+    }
+
+    si->position = x;
+
+    if (si->offsets)
+	return Py_BuildValue("nn", left, right);
+#ifdef HAVE_UNICODE
+    if (si->unicode)
+	return PyUnicode_FromUnicode((Py_UNICODE *)si->tx + left,
+				     right - left);
+#endif
+    return PyString_FromStringAndSize((char *)si->tx + left,
+				      right - left);
+
+ onError:
+    return NULL;
+}
+
+#undef SPLIT_CHAR
+#undef SPLIT_INSET
+
+static
+PyObject *mxSplitIterator_Repr(mxSplitIteratorObject *self)
+{
+#if PY_MAJOR_VERSION >= 3
+    return PyUnicode_FromFormat("<SplitIterator object at %p>", self);
+#else
+    return PyString_FromFormat("<SplitIterator object at %p>", self);
+#endif
+}
+
+/* Python Type Table */
+
+PyTypeObject mxSplitIterator_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)      /* init at startup ! */
+    "SplitIterator",                    /*tp_name*/
+    sizeof(mxSplitIteratorObject),      /*tp_basicsize*/
+    0,                                  /*tp_itemsize*/
+    /* methods */
+    (destructor)mxSplitIterator_Free,   /*tp_dealloc*/
+    (printfunc)0,                       /*tp_print*/
+    (getattrfunc)0,                     /*tp_getattr*/
+    (setattrfunc)0,                     /*tp_setattr*/
+    0,                                  /*tp_compare*/
+    (reprfunc)mxSplitIterator_Repr,     /*tp_repr*/
+    0,                                  /*tp_as_number*/
+    0,                                  /*tp_as_sequence*/
+    0,                                  /*tp_as_mapping*/
+    (hashfunc)0,                        /*tp_hash*/
+    (ternaryfunc)0,                     /*tp_call*/
+    (reprfunc)0,                        /*tp_str*/
+    (getattrofunc)0,                    /*tp_getattro*/
+    (setattrofunc)0,                    /*tp_setattro*/
+    0,                                  /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT,                 /*tp_flags*/
+    "mxTextTools split iterator",       /*tp_doc*/
+    0,                                  /*tp_traverse*/
+    0,                                  /*tp_clear*/
+    0,                                  /*tp_richcompare*/
+    0,                                  /*tp_weaklistoffset*/
+    PyObject_SelfIter,                  /*tp_iter*/
+    (iternextfunc)mxSplitIterator_Next, /*tp_iternext*/
+};
+
+/* --- ISO dates -------------------------------------------------------*/
+
+/* Fields of an ISO 8601 date/time as matched by the ISO_date_time and
+   ISO_date_time_loose productions of simpleparse.common */
+
+typedef struct {
+    long year, month, day;
+    long hour, minute, second, microsecond;
+    int hasoffset;
+    long offset;		/* Minutes east of UTC */
+} mxTextTools_ISODate;
+
+/* Largest value read for a field */
+#define MXISODATE_MAXFIELD 999999999L
+
+#ifdef HAVE_UNICODE
+# define MXISODATE_CHAR(i) \
+    (itemsize != 1 ? (Py_UCS4)((const Py_UNICODE *)text)[(i)] \
+                   : (Py_UCS4)((const unsigned char *)text)[(i)])
+#else
+# define MXISODATE_CHAR(i) ((Py_UCS4)((const unsigned char *)text)[(i)])
+#endif
+#define MXISODATE_ISDIGIT(ch) ((ch) >= '0' && (ch) <= '9')
+
+/* Read an integer field at *pos, preceded by any number of signs if
+   signed is set; returns 1 and advances *pos if there is one, 0 if
+   not */
+
+static
+int mxISODate_Field(const void *text,
+		    int itemsize,
+		    Py_ssize_t *pos,
+		    Py_ssize_t stop,
+		    int signed_,
+		    long *value)
+{
+    Py_ssize_t i = *pos;
+    long x = 0;
+    int negative = 0;
+
+    while (signed_ && i < stop &&
+	   (MXISODATE_CHAR(i) == '-' || MXISODATE_CHAR(i) == '+')) {
+	if (MXISODATE_CHAR(i) == '-')
+	    negative = !negative;
+	i++;
+    }
+    if (i == stop || !MXISODATE_ISDIGIT(MXISODATE_CHAR(i)))
+	return 0;
+    for (; i < stop && MXISODATE_ISDIGIT(MXISODATE_CHAR(i)); i++)
+	if (x <= MXISODATE_MAXFIELD)
+	    x = x * 10 + (long)(MXISODATE_CHAR(i) - '0');
+    *value = negative ? -x : x;
+    *pos = i;
+    return 1;
+}
+
+/* Read the seconds at *pos: an int or a float (with optional
+   exponent) as in simpleparse.common.numbers; fractions are truncated
+   to microseconds. Returns 1 and advances *pos if there are seconds,
+   0 if not and -1 on error. */
+
+static
+int mxISODate_Seconds(const void *text,
+		      int itemsize,
+		      Py_ssize_t *pos,
+		      Py_ssize_t stop,
+		      mxTextTools_ISODate *date)
+{
+    Py_ssize_t i = *pos, begin;
+    long second = 0, microsecond = 0;
+    int negative = 0, ndigits = 0, nfraction = 0, scale;
+
+    while (i < stop &&
+	   (MXISODATE_CHAR(i) == '-' || MXISODATE_CHAR(i) == '+')) {
+	if (MXISODATE_CHAR(i) == '-')
+	    negative = !negative;
+	i++;
+    }
+    begin = i;
+    for (; i < stop && MXISODATE_ISDIGIT(MXISODATE_CHAR(i)); i++, ndigits++)
+	if (second <= MXISODATE_MAXFIELD)
+	    second = second * 10 + (long)(MXISODATE_CHAR(i) - '0');
+    if (i < stop && MXISODATE_CHAR(i) == '.') {
+	for (i++; i < stop && MXISODATE_ISDIGIT(MXISODATE_CHAR(i));
+	     i++, nfraction++)
+	    if (nfraction < 6)
+		microsecond = microsecond * 10 +
+		    (long)(MXISODATE_CHAR(i) - '0');
+	for (scale = nfraction; scale < 6; scale++)
+	    microsecond *= 10;
+    }
+    if (ndigits == 0 && nfraction == 0)
+	return 0;
+
+    if (i < stop && (MXISODATE_CHAR(i) == 'e' || MXISODATE_CHAR(i) == 'E')) {
+	/* rare enough to go through a double */
+	char literal[64];
+	Py_ssize_t j, len;
+	double value;
+
+	for (i++; i < stop &&
+		 (MXISODATE_CHAR(i) == '-' || MXISODATE_CHAR(i) == '+' ||
+		  MXISODATE_ISDIGIT(MXISODATE_CHAR(i)));
+	     i++)
+	    ;
+	len = i - begin;
+	if (len >= (Py_ssize_t)sizeof(literal))
+	    return -1;
+	for (j = 0; j < len; j++)
+	    literal[j] = (char)MXISODATE_CHAR(begin + j);
+	literal[len] = '\0';
+	value = PyOS_string_to_double(literal, NULL, NULL);
+	if (value == -1.0 && PyErr_Occurred()) {
+	    PyErr_Clear();
+	    return -1;
+	}
+	if (!(value >= 0.0 && value < 60.0))
+	    value = 60.0;
+	second = (long)value;
+	microsecond = (long)((value - second) * 1e6);
+    }
+    date->second = negative ? -second : second;
+    date->microsecond = microsecond;
+    *pos = i;
+    return 1;
+}
+
+static
+int mxISODate_DaysInMonth(long year,
+			  long month)
+{
+    static const int days[12] = {31,28,31,30,31,30,31,31,30,31,30,31};
+
+    if (month == 2 &&
+	year % 4 == 0 && (year % 100 != 0 || year % 400 == 0))
+	return 29;
+    return days[month - 1];
+}
+
+/* Parse the ISO date/time text[start:stop] (itemsize bytes per
+   character) into date. The text is read the way the ISO_date_time
+   and ISO_date_time_loose productions match it; missing fields
+   default to the start of the year or day. Returns -1 (with a
+   ValueError set) for text which isn't a valid date/time. */
+
+static
+int mxTextTools_ParseISODate(const void *text,
+			     int itemsize,
+			     Py_ssize_t start,
+			     Py_ssize_t stop,
+			     mxTextTools_ISODate *date)
+{
+    Py_ssize_t i = start, j;
+    long value;
+    char literal[64];
+    Py_ssize_t len;
+
+    date->month = date->day = 1;
+    date->hour = date->minute = date->second = date->microsecond = 0;
+    date->hasoffset = 0;
+    date->offset = 0;
+
+    /* date */
+    if (!mxISODate_Field(text, itemsize, &i, stop, 1, &date->year))
+	goto onInvalid;
+    j = i + 1;
+    if (i < stop && MXISODATE_CHAR(i) == '-' &&
+	mxISODate_Field(text, itemsize, &j, stop, 1, &date->month)) {
+	i = j++;
+	if (i < stop && MXISODATE_CHAR(i) == '-' &&
+	    mxISODate_Field(text, itemsize, &j, stop, 1, &date->day))
+	    i = j;
+    }
+
+    /* time */
+    j = i + 1;
+    if (i < stop && (MXISODATE_CHAR(i) == 'T' || MXISODATE_CHAR(i) == ' ') &&
+	mxISODate_Field(text, itemsize, &j, stop, 1, &date->hour)) {
+	i = j++;
+	if (i < stop && MXISODATE_CHAR(i) == ':' &&
+	    mxISODate_Field(text, itemsize, &j, stop, 1, &date->minute)) {
+	    i = j++;
+	    if (i < stop && MXISODATE_CHAR(i) == ':') {
+		int rc = mxISODate_Seconds(text, itemsize, &j, stop, date);
+
+		if (rc < 0)
+		    goto onInvalid;
+		if (rc > 0)
+		    i = j;
+	    }
+	}
+    }
+
+    /* offset */
+    if (i < stop && MXISODATE_CHAR(i) == ' ')
+	i++;
+    if (i + 2 < stop &&
+	(MXISODATE_CHAR(i) == '-' || MXISODATE_CHAR(i) == '+') &&
+	MXISODATE_ISDIGIT(MXISODATE_CHAR(i + 1)) &&
+	MXISODATE_ISDIGIT(MXISODATE_CHAR(i + 2))) {
+	long minutes = 0;
+
+	value = (long)(MXISODATE_CHAR(i + 1) - '0') * 10 +
+	    (long)(MXISODATE_CHAR(i + 2) - '0');
+	j = i + 3;
+	if (j < stop && MXISODATE_CHAR(j) == ':')
+	    j++;
+	if (j + 1 < stop &&
+	    MXISODATE_ISDIGIT(MXISODATE_CHAR(j)) &&
+	    MXISODATE_ISDIGIT(MXISODATE_CHAR(j + 1))) {
+	    minutes = (long)(MXISODATE_CHAR(j) - '0') * 10 +
+		(long)(MXISODATE_CHAR(j + 1) - '0');
+	    j += 2;
+	}
+	if (value > 23 || minutes > 59)
+	    goto onInvalid;
+	date->hasoffset = 1;
+	date->offset = value * 60 + minutes;
+	if (MXISODATE_CHAR(i) == '-')
+	    date->offset = -date->offset;
+	i = j;
+    }
+    if (i != stop)
+	goto onInvalid;
+
+    if (date->year < 1 || date->year > 9999 ||
+	date->month < 1 || date->month > 12 ||
+	date->day < 1 ||
+	date->day > mxISODate_DaysInMonth(date->year, date->month) ||
+	date->hour < 0 || date->hour > 23 ||
+	date->minute < 0 || date->minute > 59 ||
+	date->second < 0 || date->second > 59)
+	goto onInvalid;
+    return 0;
+
+ onInvalid:
+    len = stop - start;
+    if (len >= (Py_ssize_t)sizeof(literal))
+	len = sizeof(literal) - 1;
+    for (j = 0; j < len; j++) {
+	Py_UCS4 ch = MXISODATE_CHAR(start + j);
+
+	literal[j] = (ch >= 32 && ch < 127) ? (char)ch : '?';
+    }
+    literal[len] = '\0';
+    PyErr_Format(PyExc_ValueError,
+		 "invalid ISO date/time: '%s'",
+		 literal);
+    return -1;
+}
+
+#undef MXISODATE_CHAR
+#undef MXISODATE_ISDIGIT
+
+/* Microseconds since 1970-01-01T00:00:00 UTC of date; naive dates are
+   taken to be UTC */
+
+static
+long long mxTextTools_ISODateTimestamp(const mxTextTools_ISODate *date)
+{
+    /* days since the epoch of the proleptic Gregorian calendar */
+    long y = date->month <= 2 ? date->year - 1 : date->year;
+    long era = y / 400;
+    long yoe = y - era * 400;
+    long doy = (153 * (date->month + (date->month > 2 ? -3 : 9)) + 2) / 5 +
+	date->day - 1;
+    long doe = yoe * 365 + yoe / 4 - yoe / 100 + doy;
+    long long days = (long long)era * 146097 + doe - 719468;
+    long long seconds = ((days * 24 + date->hour) * 60 +
+			 date->minute - date->offset) * 60 + date->second;
+
+    return seconds * 1000000 + date->microsecond;
+}
+
+/* --- Number Sink Object ----------------------------------------------*/
+
+/* Items collected for an array target before they're appended to it
+   in one go */
+#define MXNUMBERSINK_CHUNK 4096
+
+/* Longest number literal converted */
+#define MXNUMBERSINK_MAXLEN 511
+
+/* Supported typecodes; signed integers are stored if they are in
+   [-max-1, max], unsigned ones in [0, max] */
+#define MXNUMBERSINK_SIGNED	0
+#define MXNUMBERSINK_UNSIGNED	1
+#define MXNUMBERSINK_FLOAT	2
+
+typedef struct {
+    char typecode;
+    int kind;
+    Py_ssize_t itemsize;
+    unsigned long long max;
+} mxnumbersink_type;
+
+static
+const mxnumbersink_type mxNumberSink_Types[] = {
+    {'b', MXNUMBERSINK_SIGNED, sizeof(signed char), SCHAR_MAX},
+    {'B', MXNUMBERSINK_UNSIGNED, sizeof(unsigned char), UCHAR_MAX},
+    {'h', MXNUMBERSINK_SIGNED, sizeof(short), SHRT_MAX},
+    {'H', MXNUMBERSINK_UNSIGNED, sizeof(unsigned short), USHRT_MAX},
+    {'i', MXNUMBERSINK_SIGNED, sizeof(int), INT_MAX},
+    {'I', MXNUMBERSINK_UNSIGNED, sizeof(unsigned int), UINT_MAX},
+    {'l', MXNUMBERSINK_SIGNED, sizeof(long), LONG_MAX},
+    {'L', MXNUMBERSINK_UNSIGNED, sizeof(unsigned long), ULONG_MAX},
+    {'q', MXNUMBERSINK_SIGNED, sizeof(long long), PY_LLONG_MAX},
+    {'Q', MXNUMBERSINK_UNSIGNED, sizeof(unsigned long long), PY_ULLONG_MAX},
+    {'f', MXNUMBERSINK_FLOAT, sizeof(float), 0},
+    {'d', MXNUMBERSINK_FLOAT, sizeof(double), 0},
+    {0}
+};
+
+static
+const mxnumbersink_type *mxNumberSink_Type_For(char typecode)
+{
+    const mxnumbersink_type *type;
+
+    for (type = mxNumberSink_Types; type->typecode; type++)
+	if (type->typecode == typecode)
+	    return type;
+    return NULL;
+}
+
+/* Returns the typecode of an array.array like target, or 0 */
+
+static
+char mxNumberSink_ArrayTypecode(PyObject *target)
+{
+    PyObject *v;
+    char typecode = 0;
+
+    v = PyObject_GetAttrString(target, "typecode");
+    if (v == NULL) {
+	PyErr_Clear();
+	return 0;
+    }
+#ifdef HAVE_UNICODE
+    if (PyUnicode_Check(v) && PyUnicode_GET_SIZE(v) == 1 &&
+	PyUnicode_AS_UNICODE(v)[0] < 128)
+	typecode = (char)PyUnicode_AS_UNICODE(v)[0];
+    else
+#endif
+    if (PyString_Check(v) && PyString_GET_SIZE(v) == 1)
+	typecode = PyString_AS_STRING(v)[0];
+    Py_DECREF(v);
+    return typecode;
+}
+
+static
+PyObject *mxNumberSink_New(PyObject *target,
+			   int base,
+			   int timestamps)
+{
+    mxNumberSinkObject *sink;
+    const mxnumbersink_type *type;
+    char typecode;
+
+    Py_Assert(base >= 2 && base <= 36,
+	      PyExc_ValueError,
+	      "base must be between 2 and 36");
+
+    sink = PyObject_NEW(mxNumberSinkObject, &mxNumberSink_Type);
+    if (sink == NULL)
+	return NULL;
+    sink->extend = NULL;
+    sink->view.obj = NULL;
+    sink->base = base;
+    sink->timestamps = timestamps;
+    sink->count = 0;
+    sink->capacity = 0;
+    sink->pending = NULL;
+    sink->npending = 0;
+    sink->registered = 0;
+    Py_INCREF(target);
+    sink->target = target;
+
+    typecode = mxNumberSink_ArrayTypecode(target);
+    if (typecode) {
+	/* array.array: append the items in chunks */
+	sink->extend = PyObject_GetAttrString(target, "frombytes");
+	if (sink->extend == NULL) {
+	    PyErr_Clear();
+	    sink->extend = PyObject_GetAttrString(target, "fromstring");
+	}
+	if (sink->extend == NULL)
+	    goto onBadSink;
+	type = mxNumberSink_Type_For(typecode);
+    }
+    else {
+	/* writable buffer: store the items in place */
+	const char *format;
+
+	if (PyObject_GetBuffer(target, &sink->view,
+			       PyBUF_WRITABLE | PyBUF_FORMAT |
+			       PyBUF_C_CONTIGUOUS))
+	    goto onBadSink;
+	format = sink->view.format ? sink->view.format : "B";
+	if (format[0] == '@')
+	    format++;
+	typecode = format[0];
+	type = typecode && !format[1] ? mxNumberSink_Type_For(typecode) : NULL;
+	if (type != NULL && type->itemsize != sink->view.itemsize)
+	    type = NULL;
+	if (type == NULL) {
+	    PyErr_Format(PyExc_ValueError,
+			 "unsupported buffer format '%.20s'",
+			 sink->view.format ? sink->view.format : "B");
+	    goto onSinkError;
+	}
+	sink->capacity = sink->view.len / sink->view.itemsize;
+    }
+    if (type == NULL) {
+	PyErr_Format(PyExc_ValueError,
+		     "unsupported typecode '%c'",
+		     typecode);
+	goto onSinkError;
+    }
+    if (timestamps &&
+	(type->kind != MXNUMBERSINK_SIGNED || type->itemsize < 8)) {
+	PyErr_Format(PyExc_ValueError,
+		     "timestamps need a 64-bit signed typecode, found '%c'",
+		     typecode);
+	goto onSinkError;
+    }
+    sink->typecode = typecode;
+    sink->itemsize = type->itemsize;
+    return (PyObject *)sink;
+
+ onBadSink:
+    PyErr_Clear();
+    PyErr_Format(PyExc_TypeError,
+		 "expected an array.array or a writable buffer, found %.50s",
+		 Py_TYPE(target)->tp_name);
+ onSinkError:
+    Py_DECREF(sink);
+ onError:
+    return NULL;
+}
+
+static
+void mxNumberSink_Free(mxNumberSinkObject *sink)
+{
+    if (sink->pending)
+	PyMem_Free(sink->pending);
+    if (sink->view.obj)
+	PyBuffer_Release(&sink->view);
+    Py_XDECREF(sink->extend);
+    Py_XDECREF(sink->target);
+    PyObject_Del(sink);
+}
+
+/* Append the pending items to the target array, they are dropped if
+   that fails */
+
+static
+int mxNumberSink_Extend(mxNumberSinkObject *sink)
+{
+    PyObject *data, *v;
+    Py_ssize_t npending = sink->npending;
+
+    if (npending == 0)
+	return 0;
+    sink->npending = 0;
+    data = PyString_FromStringAndSize(sink->pending,
+				      npending * sink->itemsize);
+    if (data == NULL)
+	goto onError;
+    v = PyObject_CallFunctionObjArgs(sink->extend, data, NULL);
+    Py_DECREF(data);
+    if (v == NULL)
+	goto onError;
+    Py_DECREF(v);
+    return 0;
+
+ onError:
+    sink->count -= npending;
+    return -1;
+}
+
+int mxNumberSink_Flush(PyObject *obj)
+{
+    mxNumberSinkObject *sink = (mxNumberSinkObject *)obj;
+
+    sink->registered = 0;
+    return mxNumberSink_Extend(sink);
+}
+
+int mxNumberSink_Drop(PyObject *obj,
+		      Py_ssize_t n)
+{
+    mxNumberSinkObject *sink = (mxNumberSinkObject *)obj;
+    Py_ssize_t len;
+
+    if (n > sink->count)
+	n = sink->count;
+    sink->count -= n;
+    if (sink->extend == NULL)
+	return 0;
+    if (n <= sink->npending) {
+	sink->npending -= n;
+	return 0;
+    }
+    /* the others were appended to the array already */
+    n -= sink->npending;
+    sink->npending = 0;
+    len = PySequence_Size(sink->target);
+    if (len < 0)
+	return -1;
+    if (n > len)
+	n = len;
+    return PySequence_DelSlice(sink->target, len - n, len);
+}
+
+/* Parse the digits in [p, end) as an unsigned integer in base;
+   returns -1 for invalid literals, 1 if the value doesn't fit into
+   *value (*dvalue is still set) and 0 otherwise */
+
+static
+int mxNumberSink_ParseDigits(const char *p,
+			     const char *end,
+			     int base,
+			     unsigned long long *value,
+			     double *dvalue)
+{
+    unsigned long long x = 0;
+    double dx = 0.0;
+    int overflow = 0;
+
+    if (p == end)
+	return -1;
+    for (; p < end; p++) {
+	int digit;
+
+	if (*p >= '0' && *p <= '9')
+	    digit = *p - '0';
+	else if (*p >= 'a' && *p <= 'z')
+	    digit = *p - 'a' + 10;
+	else if (*p >= 'A' && *p <= 'Z')
+	    digit = *p - 'A' + 10;
+	else
+	    return -1;
+	if (digit >= base)
+	    return -1;
+	if (x > (PY_ULLONG_MAX - digit) / base)
+	    overflow = 1;
+	else
+	    x = x * base + digit;
+	dx = dx * base + digit;
+    }
+    *value = x;
+    *dvalue = dx;
+    return overflow;
+}
+
+int mxNumberSink_Append(PyObject *obj,
+			const void *text,
+			int itemsize,
+			Py_ssize_t left,
+			Py_ssize_t right)
+{
+    mxNumberSinkObject *sink = (mxNumberSinkObject *)obj;
+    const mxnumbersink_type *type = mxNumberSink_Type_For(sink->typecode);
+    char literal[MXNUMBERSINK_MAXLEN + 1];
+    const char *p, *end;
+    Py_ssize_t len = right - left;
+    Py_ssize_t i;
+    int negative = 0;
+    int base = sink->base;
+    unsigned long long value = 0;
+    double dvalue = 0.0;
+    char *item;
+
+    if (sink->timestamps) {
+	mxTextTools_ISODate date;
+	long long timestamp;
+
+	if (mxTextTools_ParseISODate(text, itemsize, left, right, &date))
+	    goto onError;
+	timestamp = mxTextTools_ISODateTimestamp(&date);
+	negative = timestamp < 0;
+	value = negative ? -(unsigned long long)timestamp
+			 : (unsigned long long)timestamp;
+	goto onStore;
+    }
+
+    Py_AssertWithArg(len <= MXNUMBERSINK_MAXLEN,
+		     PyExc_ValueError,
+		     "number literal too long (%ld characters)",
+		     (long)len);
+    for (i = 0; i < len; i++) {
+	Py_UCS4 ch;
+
+#ifdef HAVE_UNICODE
+	if (itemsize != 1)
+	    ch = (Py_UCS4)((const Py_UNICODE *)text)[left + i];
+	else
+#endif
+	    ch = ((const unsigned char *)text)[left + i];
+	if (ch == 0 || ch >= 128) {
+	    literal[i] = '\0';
+	    goto onInvalid;
+	}
+	literal[i] = (char)ch;
+    }
+    literal[len] = '\0';
+    p = literal;
+    end = literal + len;
+
+    /* any number of signs, as in the sign production of
+       simpleparse.common.numbers */
+    while (p < end && (*p == '-' || *p == '+')) {
+	if (*p == '-')
+	    negative = !negative;
+	p++;
+    }
+    if (end - p > 2 && p[0] == '0' && (p[1] == 'x' || p[1] == 'X')) {
+	base = 16;
+	p += 2;
+    }
+    else if (base == 2 && end > p && (end[-1] == 'b' || end[-1] == 'B'))
+	end--;
+
+    if (type->kind == MXNUMBERSINK_FLOAT && base == 10) {
+	char *stop;
+
+	if (p == end)
+	    goto onInvalid;
+	dvalue = PyOS_string_to_double(p, &stop, NULL);
+	if (dvalue == -1.0 && PyErr_Occurred()) {
+	    PyErr_Clear();
+	    goto onInvalid;
+	}
+	if (stop != end)
+	    goto onInvalid;
+    }
+    else {
+	int rc = mxNumberSink_ParseDigits(p, end, base, &value, &dvalue);
+
+	if (rc < 0)
+	    goto onInvalid;
+	if (type->kind != MXNUMBERSINK_FLOAT &&
+	    (rc > 0 ||
+	     (type->kind == MXNUMBERSINK_UNSIGNED && negative && value != 0) ||
+	     value > type->max + (type->kind == MXNUMBERSINK_SIGNED && negative)))
+	    Py_ErrorWith2Args(PyExc_OverflowError,
+			      "number %.200s out of range for typecode '%c'",
+			      literal, sink->typecode);
+    }
+    if (negative)
+	dvalue = -dvalue;
+
+ onStore:
+    /* find the place for the item */
+    if (sink->extend != NULL) {
+	if (sink->pending == NULL) {
+	    sink->pending = (char *)PyMem_Malloc(MXNUMBERSINK_CHUNK *
+						 sink->itemsize);
+	    if (sink->pending == NULL) {
+		PyErr_NoMemory();
+		goto onError;
+	    }
+	}
+	else if (sink->npending == MXNUMBERSINK_CHUNK &&
+		 mxNumberSink_Extend(sink))
+	    goto onError;
+	item = sink->pending + sink->npending * sink->itemsize;
+    }
+    else {
+	Py_AssertWithArg(sink->count < sink->capacity,
+			 PyExc_IndexError,
+			 "NumberSink target is full (%ld items)",
+			 (long)sink->capacity);
+	item = (char *)sink->view.buf + sink->count * sink->itemsize;
+    }
+
+#define MXNUMBERSINK_STORE(ctype, v) \
+    {ctype stored = (ctype)(v); memcpy(item, &stored, sizeof(stored));}
+
+    switch (sink->typecode) {
+    case 'f': MXNUMBERSINK_STORE(float, dvalue); break;
+    case 'd': MXNUMBERSINK_STORE(double, dvalue); break;
+    case 'B': MXNUMBERSINK_STORE(unsigned char, value); break;
+    case 'H': MXNUMBERSINK_STORE(unsigned short, value); break;
+    case 'I': MXNUMBERSINK_STORE(unsigned int, value); break;
+    case 'L': MXNUMBERSINK_STORE(unsigned long, value); break;
+    case 'Q': MXNUMBERSINK_STORE(unsigned long long, value); break;
+    default:
+	{
+	    /* signed integer, value <= PY_LLONG_MAX + 1 */
+	    long long x = negative ? -(long long)(value - 1) - 1
+				   : (long long)value;
+
+	    if (negative && value == 0)
+		x = 0;
+	    switch (sink->typecode) {
+	    case 'b': MXNUMBERSINK_STORE(signed char, x); break;
+	    case 'h': MXNUMBERSINK_STORE(short, x); break;
+	    case 'i': MXNUMBERSINK_STORE(int, x); break;
+	    case 'l': MXNUMBERSINK_STORE(long, x); break;
+	    default: MXNUMBERSINK_STORE(long long, x); break;
+	    }
+	}
+    }
+
+#undef MXNUMBERSINK_STORE
+
+    sink->count++;
+    if (sink->extend == NULL)
+	return 0;
+    sink->npending++;
+    if (sink->registered)
+	return 0;
+    sink->registered = 1;
+    return 1;
+
+ onInvalid:
+    PyErr_Format(PyExc_ValueError,
+		 "invalid number literal for typecode '%c': %.200s",
+		 sink->typecode, literal);
+ onError:
+    return -1;
+}
+
+/* --- methods --- */
+
+Py_C_Function( mxNumberSink_flush,
+	       ".flush()\n\n"
+	       "Append the numbers still pending to the target array;\n"
+	       "the Tagging Engine does this before returning.")
+{
+    Py_NoArgsCheck();
+    if (mxNumberSink_Flush(self))
+	goto onError;
+    Py_ReturnNone();
+
+ onError:
+    return NULL;
+}
+
+/* Python Method Table */
+
+static
+PyMethodDef mxNumberSink_Methods[] =
+{
+    Py_MethodListEntryNoArgs("flush",mxNumberSink_flush),
+    {NULL,NULL} /* end of list */
+};
+
+static PyMemberDef mxNumberSink_members[] = {
+    {"target",T_OBJECT_EX,offsetof(mxNumberSinkObject,target),READONLY,"Array or buffer the numbers are stored in"},
+    {"typecode",T_CHAR,offsetof(mxNumberSinkObject,typecode),READONLY,"Typecode of the stored numbers"},
+    {"base",T_INT,offsetof(mxNumberSinkObject,base),READONLY,"Base of integer literals"},
+    {"timestamps",T_INT,offsetof(mxNumberSinkObject,timestamps),READONLY,"Are ISO dates/times stored as epoch microseconds ?"},
+    {"count",T_PYSSIZET,offsetof(mxNumberSinkObject,count),READONLY,"Number of numbers stored"},
+    {NULL}
+};
+
+/* Python Type Table */
+
+PyTypeObject mxNumberSink_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)      /* init at startup ! */
+    "NumberSink",                       /*tp_name*/
+    sizeof(mxNumberSinkObject),         /*tp_basicsize*/
+    0,                                  /*tp_itemsize*/
+    /* methods */
+    (destructor)mxNumberSink_Free,      /*tp_dealloc*/
+    (printfunc)0,                       /*tp_print*/
+    (getattrfunc)0,                     /*tp_getattr*/
+    (setattrfunc)0,                     /*tp_setattr*/
+    0,                                  /*tp_compare*/
+    (reprfunc)0,                        /*tp_repr*/
+    0,                                  /*tp_as_number*/
+    0,                                  /*tp_as_sequence*/
+    0,                                  /*tp_as_mapping*/
+    (hashfunc)0,                        /*tp_hash*/
+    (ternaryfunc)0,                     /*tp_call*/
+    (reprfunc)0,                        /*tp_str*/
+    (getattrofunc)0,                    /*tp_getattro*/
+    (setattrofunc)0,                    /*tp_setattro*/
+    0,                                  /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT,                 /*tp_flags*/
+    "mxTextTools number sink",          /*tp_doc*/
+    0,                                  /*tp_traverse*/
+    0,                                  /*tp_clear*/
+    0,                                  /*tp_richcompare*/
+    0,                                  /*tp_weaklistoffset*/
+    0,                                  /*tp_iter*/
+    0,                                  /*tp_iternext*/
+    mxNumberSink_Methods,               /*tp_methods*/
+    mxNumberSink_members,               /*tp_members*/
+};
+
+Py_C_Function_WithKeywords(
+	       mxNumberSink_NumberSink,
+	       "NumberSink(target,base=10,timestamps=0)\n\n"
+	       "Create a sink for AppendNumber table entries which converts\n"
+	       "the matched numbers and appends them to the array.array\n"
+	       "target or stores them in the writable buffer target (e.g.\n"
+	       "a NumPy array), using its typecode. Integer literals are\n"
+	       "read in base unless they have a 0x prefix. With timestamps\n"
+	       "set, the matches are read as ISO 8601 dates/times (see\n"
+	       "isodatetime()) and stored as microseconds since the epoch,\n"
+	       "taking dates/times without an offset to be UTC; target\n"
+	       "must then have a 64-bit signed typecode such as 'q'."
+	       )
+{
+    PyObject *target;
+    int base = 10;
+    int timestamps = 0;
+
+    Py_KeywordsGet3Args("O|ii:NumberSink",target,base,timestamps);
+    return mxNumberSink_New(target, base, timestamps);
+
+ onError:
+    return NULL;
+}
+
+/* --- Internal functions ----------------------------------------------*/
+
+#ifdef HAVE_UNICODE
+
+/* Same as mxTextTools_Join() for Unicode objects. */
+
+static
+PyObject *mxTextTools_UnicodeJoin(PyObject *seq,
+				  Py_ssize_t start,
+				  Py_ssize_t stop,
+				  PyObject *separator)
+{
+    PyObject *newstring = 0, *tempstr = 0;
+    Py_ssize_t newstring_len,current_len = 0;
+    Py_UNICODE *p;
+    Py_ssize_t i;
+    Py_UNICODE *sep;
+    Py_ssize_t sep_len;
+    
+    if (separator) {
+	separator = PyUnicode_FromObject(separator);
+	if (separator == NULL)
+	    goto onError;
+	sep = PyUnicode_AS_UNICODE(separator);
+	sep_len = PyUnicode_GET_SIZE(separator);
+    }
+    else {
+	sep = NULL;
+	sep_len = 0;
+    }
+    
+    /* Create an empty new string */
+    newstring_len = (10 + sep_len) * (stop - start);
+    newstring = PyUnicode_FromUnicode(NULL, newstring_len);
+    if (newstring == NULL) 
+	goto onError;
+    p = PyUnicode_AS_UNICODE(newstring);
+
+    /* Join with separator */
+    for (i = start; i < stop; i++) {
+	register PyObject *o;
+	Py_UNICODE *st;
+	Py_ssize_t len_st;
+
+	o = PySequence_GetItem(seq, i);
+
+	if PyTuple_Check(o) {
+	    /* Tuple entry: (string,l,r,[...]) */
+	    register Py_ssize_t l,r;
+
+	    /* parse tuple */
+	    Py_Assert((PyTuple_GET_SIZE(o) >= 3) &&
+		      PyInt_Check(PyTuple_GET_ITEM(o,1)) && 
+		      PyInt_Check(PyTuple_GET_ITEM(o,2)),
+		      PyExc_TypeError,
+		      "tuples must be of the format (string,l,r[,...])");
+	    tempstr = PyUnicode_FromObject(PyTuple_GET_ITEM(o,0));
+	    if (tempstr == NULL)
+		goto onError;
+	    st = PyUnicode_AS_UNICODE(tempstr);
+	    len_st = PyUnicode_GET_SIZE(tempstr);
+	    l = PyInt_AS_LONG(PyTuple_GET_ITEM(o,1));
+	    r = PyInt_AS_LONG(PyTuple_GET_ITEM(o,2));
+
+	    /* compute slice */
+	    if (r > len_st) r = len_st;
+	    else if (r < 0) {
+		r += len_st + 1;
+		if (r < 0)
+		    r = 0;
+	    }
+	    if (l > len_st) l = len_st;
+	    else if (l < 0) {
+		l += len_st + 1;
+		if (l < 0)
+		    l = 0;
+	    }
+
+	    /* empty ? */
+	    if (l > r)
+		continue;
+	    len_st = r - l;
+	    if (len_st == 0) 
+		continue;
+
+	    /* get pointer right */
+	    st += l;
+	}
+	else {
+	    /* Must be a string entry: take the whole string */
+	    tempstr = PyUnicode_FromObject(o);
+	    if (tempstr == NULL)
+		goto onError;
+	    st = PyUnicode_AS_UNICODE(tempstr);
+	    len_st = PyUnicode_GET_SIZE(tempstr);
 	}
 
-	/* Special handling for jump marks (args is set to the jump
-	   mark string, jump target index is the next table entry) */
-	if (PyString_Check(entry)) {
-	    if (tc_add_jumptarget(jumpdict, entry, i + 1))
+        Py_DECREF(o);
+    
+	/* Resize the new string if needed */
+	while (current_len + len_st + sep_len >= newstring_len) {
+	    newstring_len += newstring_len >> 1;
+	    if (PyUnicode_Resize(&newstring, newstring_len))
 		goto onError;
-	    tagtableentry->tagobj = NULL;
-	    tagtableentry->cmd = MATCH_JUMPTARGET;
-	    tagtableentry->flags = 0;
-	    Py_INCREF(entry);
-	    tagtableentry->args = entry;
-	    tagtableentry->jne = 0;
-	    tagtableentry->je = 1;
-	    continue;
+	    p = PyUnicode_AS_UNICODE(newstring) + current_len;
 	}
 
-	/* Get entry length */
-	entry_len = tc_length(entry);
-	if (entry_len < 3) {
-	    Py_ErrorWithArg(PyExc_TypeError,
-			    "tag table entry %d: "
-			    "expected an entry of the form "
-			    "(tagobj,command,arg[,jne[,je]])", (unsigned int)i);
+	/* Insert separator */
+	if (i > 0 && sep_len > 0) {
+	    Py_UNICODE_COPY(p, sep, sep_len);
+	    p += sep_len;
+	    current_len += sep_len;
 	}
 
-	/* Decode entry parts: (tagobj, command, args[, jne[, je]]) */
-	tagobj = tc_get_item(entry, 0);
-	command = tc_get_item(entry, 1);
-	args = tc_get_item(entry, 2);
-	if (entry_len >= 4)
-	    jne = tc_get_item(entry, 3);
-	else
-	    jne = NULL;
-	if (entry_len >= 5) 
-	    je = tc_get_item(entry, 4);
-	else
-	    je = NULL;
+	/* Copy snippet into new string */
+	Py_UNICODE_COPY(p, st, len_st);
+	p += len_st;
+	current_len += len_st;
+	
+	Py_DECREF(tempstr);
+	tempstr = NULL;
+    }
+    
+    /* Resize new string to the actual length */
+    if (PyUnicode_Resize(&newstring, current_len))
+	goto onError;
 
-	if (tagobj == NULL ||
-	    command == NULL ||
-	    args == NULL ||
-	    (entry_len >= 4 && jne == NULL) ||
-	    (entry_len >= 5 && je == NULL)) {
-	    Py_ErrorWithArg(PyExc_TypeError,
-			    "tag table entry %d: "
-			    "expected an entry of the form "
-			    "(tagobj,command,arg[,jne[,je]])",(unsigned int) i);
+    Py_XDECREF(separator);
+    return newstring;
+
+ onError:
+    Py_XDECREF(newstring);
+    Py_XDECREF(separator);
+    Py_XDECREF(tempstr);
+    return NULL;
+}
+
+#endif
+
+/* Enhanced string join: also excepts tuple (text, left, right,...)
+   entries which then cause text[left:right] to be used as string
+   snippet.
+
+   separator may be NULL; in that case, "" is used as separator.
+
+*/
+
+static
+PyObject *mxTextTools_Join(PyObject *seq,
+			   Py_ssize_t start,
+			   Py_ssize_t stop,
+			   PyObject *separator)
+{
+    PyObject *newstring = 0;
+    Py_ssize_t newstring_len, current_len = 0;
+    char *p;
+    Py_ssize_t i;
+    char *sep;
+    Py_ssize_t sep_len;
+
+    if (separator) {
+#ifdef HAVE_UNICODE
+	if (PyUnicode_Check(separator))
+	    return mxTextTools_UnicodeJoin(seq, start, stop, separator);
+#endif
+	Py_Assert(PyString_Check(separator),
+		  PyExc_TypeError,
+		  "separator must be a string");
+	sep = PyString_AS_STRING(separator);
+	sep_len = PyString_GET_SIZE(separator);
+    }
+    else {
+	sep = NULL;
+	sep_len = 0;
+    }
+    
+    /* Create an empty new string */
+    newstring_len = (10 + sep_len) * (stop - start);
+    newstring = PyString_FromStringAndSize((char*)NULL, newstring_len);
+    if (newstring == NULL) 
+	goto onError;
+    p = PyString_AS_STRING(newstring);
+
+    /* Join with separator */
+    for (i = start; i < stop; i++) {
+	register PyObject *o;
+	char *st;
+	Py_ssize_t len_st;
+
+	o = PySequence_GetItem(seq, i);
+
+	if PyTuple_Check(o) {
+	    /* Tuple entry: (string,l,r,[...]) */
+	    register Py_ssize_t l,r;
+
+	    /* parse tuple */
+	    Py_Assert((PyTuple_GET_SIZE(o) >= 3) &&
+		      PyInt_Check(PyTuple_GET_ITEM(o,1)) && 
+		      PyInt_Check(PyTuple_GET_ITEM(o,2)),
+		      PyExc_TypeError,
+		      "tuples must be of the format (string,int,int[,...])");
+#ifdef HAVE_UNICODE
+	    if (PyUnicode_Check(PyTuple_GET_ITEM(o,0))) {
+		/* Redirect to Unicode implementation; all previous work
+		   is lost. */
+		Py_DECREF(o);
+		Py_DECREF(newstring);
+		return mxTextTools_UnicodeJoin(seq, start, stop, separator);
+	    }
+#endif
+	    Py_Assert(PyString_Check(PyTuple_GET_ITEM(o,0)),
+		      PyExc_TypeError,
+		      "tuples must be of the format (string,int,int[,...])");
+	    st = PyString_AS_STRING(PyTuple_GET_ITEM(o,0));
+	    len_st = PyString_GET_SIZE(PyTuple_GET_ITEM(o,0));
+	    l = PyInt_AS_LONG(PyTuple_GET_ITEM(o,1));
+	    r = PyInt_AS_LONG(PyTuple_GET_ITEM(o,2));
+
+	    /* compute slice */
+	    if (r > len_st) r = len_st;
+	    else if (r < 0) {
+		r += len_st + 1;
+		if (r < 0)
+		    r = 0;
+	    }
+	    if (l > len_st) l = len_st;
+	    else if (l < 0) {
+		l += len_st + 1;
+		if (l < 0)
+		    l = 0;
+	    }
+
+	    /* empty ? */
+	    if (l > r)
+		continue;
+	    len_st = r - l;
+	    if (len_st == 0) 
+		continue;
+
+	    /* get pointer right */
+	    st += l;
+	}
+	else if (PyString_Check(o)) {
+	    /* String entry: take the whole string */
+	    st = PyString_AS_STRING(o);
+	    len_st = PyString_GET_SIZE(o);
+	}
+#ifdef HAVE_UNICODE
+	else if (PyUnicode_Check(o)) {
+	    /* Redirect to Unicode implementation; all previous work
+	       is lost. */
+	    Py_DECREF(o);
+	    Py_DECREF(newstring);
+	    return mxTextTools_UnicodeJoin(seq, start, stop, separator);
+	}
+#endif
+	else {
+	    Py_DECREF(o);
+	    Py_Error(PyExc_TypeError,
+		     "list must contain tuples or strings as entries");
 	}
 
-	/* Store tagobj, None gets converted to NULL */
-	if (tagobj != Py_None)
-	    Py_INCREF(tagobj);
-	else
-	    tagobj = NULL;
-	tagtableentry->tagobj = tagobj;
+        Py_DECREF(o);
+    
+	/* Resize the new string if needed */
+	while (current_len + len_st + sep_len >= newstring_len) {
+	    newstring_len += newstring_len >> 1;
+	    if (_PyString_Resize(&newstring, newstring_len))
+		goto onError;
+	    p = PyString_AS_STRING(newstring) + current_len;
+	}
+
+	/* Insert separator */
+	if (i > 0 && sep_len > 0) {
+	    memcpy(p, sep, sep_len);
+	    p += sep_len;
+	    current_len += sep_len;
+	}
+
+	/* Copy snippet into new string */
+	memcpy(p,st,len_st);
+	p += len_st;
+	current_len += len_st;
+    }
+    
+    /* Resize new string to the actual length */
+    if (_PyString_Resize(&newstring, current_len))
+	goto onError;
+
+    return newstring;
+
+ onError:
+    Py_XDECREF(newstring);
+    return NULL;
+}
+
+static
+PyObject *mxTextTools_HexStringFromString(char *str,
+					  Py_ssize_t len) 
+{
+    PyObject *w = 0;
+    Py_ssize_t i;
+    char *hex;
+    static const char hexdigits[] = "0123456789abcdef";
+
+    /* Convert to HEX */
+    w = PyString_FromStringAndSize(NULL,2*len);
+    if (!w)
+	goto onError;
+    hex = PyString_AS_STRING(w);
+    for (i = 0; i < len; i ++) {
+	unsigned char c = (unsigned char)*str;
+	
+	*hex++ = hexdigits[c >> 4];
+	*hex++ = hexdigits[c & 0x0F];
+	str++;
+    }
+    return w;
 
-	/* Decode command and flags */
-	Py_AssertWithArg(PyInt_Check(command),
-			 PyExc_TypeError,
-			 "tag table entry %d: "
-			 "command must be an integer",(unsigned int)i);
-	tagtableentry->cmd = PyInt_AS_LONG(command) & 0xFF;
-	tagtableentry->flags = PyInt_AS_LONG(command) - tagtableentry->cmd;
+ onError:
+    Py_XDECREF(w);
+    return NULL;
+}
 
-	/* Check command arguments */
-	Py_INCREF(args);
-	own_args = 1;
+static
+PyObject *mxTextTools_StringFromHexString(char *hex,
+					  Py_ssize_t len)
+{
+    PyObject *w = 0;
+    Py_ssize_t i;
+    char *str;
+    static const char hexdigits[] = "0123456789abcdef";
 
-	switch (tagtableentry->cmd) {
+    /* Convert to string */
+    Py_Assert(len % 2 == 0,
+	      PyExc_TypeError,
+	      "need 2-digit hex string argument");
+    len >>= 1;
+    w = PyString_FromStringAndSize(NULL,len);
+    if (!w)
+	goto onError;
+    str = PyString_AS_STRING(w);
+    for (i = 0; i < len; i++,str++) {
+	register char c;
+	register Py_ssize_t j;
 
-	case MATCH_JUMP: /* == MATCH_FAIL */
-	case MATCH_EOF:
-	case MATCH_LOOP:
-	    /* args is ignored */
-	    break;
-	
-	case MATCH_SKIP:
-	case MATCH_MOVE:
-	case MATCH_LOOPCONTROL:
-	    Py_AssertWithArg(PyInt_Check(args),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "Skip|Move|LoopControl command argument "
-			     "must be an integer", (unsigned int)i);
-	    break;
-	
-	case MATCH_JUMPTARGET:
-	    Py_AssertWithArg(PyString_Check(args),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "JumpMark command argument must be a string",(unsigned int)i);
-	    if (tc_add_jumptarget(jumpdict, args, i + 1))
-		goto onError;
+	c = tolower(*hex++);
+	for (j = 0; j < (Py_ssize_t)sizeof(hexdigits); j++)
+	  if (c == hexdigits[j]) {
+	    *str = j << 4;
 	    break;
+	  }
+	if (j == sizeof(hexdigits)) {
+	  DPRINTF("Failed: '%c' (%u) at %i\n",c,(unsigned int)c,i);
+	  Py_Error(PyExc_ValueError,
+		   "argument contains non-hex characters");
+	}
 
-	case MATCH_ALLIN:
-	case MATCH_ALLNOTIN:
-	case MATCH_IS:
-	case MATCH_ISIN:
-	case MATCH_ISNOTIN:
-	case MATCH_WORD:
-	case MATCH_WORDSTART:
-	case MATCH_WORDEND:
-	    args = tc_convert_string_arg(args, i, tabletype);
-	    if (args == NULL)
-		goto onError;
+	c = tolower(*hex++);
+	for (j = 0; j < (Py_ssize_t)sizeof(hexdigits); j++)
+	  if (c == hexdigits[j]) {
+	    *str += j;
 	    break;
+	  }
+	if (j == sizeof(hexdigits)) {
+	  DPRINTF("Failed2: '%c' (%u) at %i\n",c,(unsigned int)c,i);
+	  Py_Error(PyExc_ValueError,
+		   "argument contains non-hex characters");
+	}
+    }
+    return w;
 
-	case MATCH_ALLINSET:
-	case MATCH_ISINSET:
-	    Py_AssertWithArg(PyString_Check(args) && 
-			     PyString_GET_SIZE(args) == 32,
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "AllInSet|IsInSet command argument must "
-			     "be a set() string",(unsigned int)i);
-	    break;
+ onError:
+    Py_XDECREF(w);
+    return NULL;
+}
 
-	case MATCH_ALLINCHARSET:
-	case MATCH_ISINCHARSET:
-	    Py_AssertWithArg(mxCharSet_Check(args),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "AllInCharSet|IsInCharSet command argument must "
-			     "be a CharSet instance",(unsigned int)i);
-	    break;
+/* Value of the hex digit ch or -1 */
 
-	case MATCH_SWORDSTART: /* == MATCH_NOWORD */
-	case MATCH_SWORDEND:
-	case MATCH_SFINDWORD:
-	    Py_AssertWithArg(mxTextSearch_Check(args),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "sWordStart|sWordEnd|sFindWord command "
-			     "argument must be a TextSearch search "
-			     "object",(unsigned int)i);
-	    break;
-	
-	case MATCH_TABLE:
-	case MATCH_SUBTABLE:
-	    Py_AssertWithArg(mxTagTable_Check(args) ||
-			     PyTuple_Check(args) ||
-			     PyList_Check(args) ||
-			     (PyInt_Check(args) && 
-			      PyInt_AS_LONG(args) == MATCH_THISTABLE),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "Table|SubTable command argument "
-			     "must be a tag table tuple/object or "
-			     "ThisTable", (unsigned int)i);
-	    /* XXX We shouldn't recursively compile tag table tuples here
-		   because this will slow down the compile process
-		   too much and it's not clear whether this particular
-		   table will ever be used during tagging.
-	    */
-	    if (!mxTagTable_Check(args) && !PyInt_Check(args)) {
-		Py_DECREF(args);
-		args = mxTagTable_New(args, tabletype, cacheable);
-		if (args == NULL)
-		    goto onError;
-	    }
-	    break;
-	
-	case MATCH_TABLEINLIST:
-	case MATCH_SUBTABLEINLIST:
-	    Py_AssertWithArg(PyTuple_Check(args) &&
-			     PyTuple_GET_SIZE(args) == 2 &&
-			     PyList_Check(PyTuple_GET_ITEM(args, 0)) &&
-			     PyInt_Check(PyTuple_GET_ITEM(args, 1)),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "TableInList|SubTableInList command argument "
-			     "must be a 2-tuple (list, integer)",
-			     (unsigned int)i);
-	    break;
+static
+int mxTextTools_HexDigit(Py_UCS4 ch)
+{
+    if (ch >= '0' && ch <= '9')
+	return ch - '0';
+    if (ch >= 'a' && ch <= 'f')
+	return ch - 'a' + 10;
+    if (ch >= 'A' && ch <= 'F')
+	return ch - 'A' + 10;
+    return -1;
+}
 
-	case MATCH_CALL:
-	    Py_AssertWithArg(PyCallable_Check(args),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "Call command argument "
-			     "must be a callable object",
-			     (unsigned int)i);
-	    break;
+/* Decode the backslash escapes in text[start:stop] like
+   simpleparse.common.strings does: a backslash followed by a key of
+   escapes is replaced with its value, \xhh and \ooo (up to three
+   octal digits) with the character of that code, any other backslash
+   is kept. */
 
-	case MATCH_CALLARG:
-	    Py_AssertWithArg(PyTuple_Check(args) &&
-			     PyTuple_GET_SIZE(args) > 0 &&
-			     PyCallable_Check(PyTuple_GET_ITEM(args, 0)),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "CallArg command argument "
-			     "must be a tuple (fct,[arg0,arg1,...])",
-			     (unsigned int)i);
-	    break;
-	    
-	default:
-	    Py_ErrorWith2Args(PyExc_TypeError,
-			      "tag table entry %d: "
-			      "unknown command integer: %i", 
-			      (unsigned int)i, tagtableentry->cmd);
-	
-	}
+static
+PyObject *mxTextTools_Unescape(PyObject *text,
+			       PyObject *escapes,
+			       Py_ssize_t start,
+			       Py_ssize_t stop)
+{
+    void *tx;
+    int unicode;
+    char *out = NULL;
+    Py_ssize_t itemsize;
+    Py_ssize_t outlen = 0;
+    Py_ssize_t allocated;
+    Py_ssize_t i;
+    PyObject *result;
 
-	/* Store command args */
-	tagtableentry->args = args;
-	own_args = 0;
+#ifdef HAVE_UNICODE
+    if (PyUnicode_Check(text)) {
+	Py_CheckUnicodeSlice(text, start, stop);
+	tx = (void *)PyUnicode_AS_UNICODE(text);
+	unicode = 1;
+	itemsize = sizeof(Py_UNICODE);
+    }
+    else
+#endif
+    if (PyString_Check(text)) {
+	Py_CheckStringSlice(text, start, stop);
+	tx = (void *)PyString_AS_STRING(text);
+	unicode = 0;
+	itemsize = 1;
+    }
+    else
+	Py_Error(PyExc_TypeError,
+		 "expected string or unicode");
+    Py_Assert(PyDict_Check(escapes),
+	      PyExc_TypeError,
+	      "escapes must be a dictionary");
 
-	/* Decode jump offsets */
-	if (jne) {
-	    if (PyInt_Check(jne))
-		tagtableentry->jne = PyInt_AS_LONG(jne);
-	    else if (PyString_Check(jne)) {
-		/* Mark for back-patching */
-		tagtableentry->jne = -424242;
-		secondpass = 1;
-	    }
-	    else
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"jne must be an integer or string", (unsigned int)i);
-	}
-	else
-	    tagtableentry->jne = 0;
+#define UNESCAPE_CHAR(i) \
+    (unicode ? (Py_UCS4)((Py_UNICODE *)tx)[(i)] \
+             : (Py_UCS4)((unsigned char *)tx)[(i)])
 
-	if (je) {
-	    if (PyInt_Check(je))
-		tagtableentry->je = PyInt_AS_LONG(je);
-	    else if (PyString_Check(je)) {
-		/* Mark for back-patching */
-		tagtableentry->je = -424242;
-		secondpass = 1;
-	    }
-	    else
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"je must be an integer or string", (unsigned int)i);
-	}
-	else
-	    tagtableentry->je = 1;
+    /* most strings don't have any escapes */
+    for (i = start; i < stop; i++)
+	if (UNESCAPE_CHAR(i) == '\\')
+	    break;
+    if (i == stop) {
+#ifdef HAVE_UNICODE
+	if (unicode)
+	    return PyUnicode_FromUnicode((Py_UNICODE *)tx + start,
+					 stop - start);
+#endif
+	return PyString_FromStringAndSize((char *)tx + start,
+					  stop - start);
+    }
+
+    /* escapes make the text shorter, unless escapes maps to longer
+       replacements */
+    allocated = stop - start;
+    out = (char *)PyMem_Malloc(allocated * itemsize);
+    if (out == NULL) {
+	PyErr_NoMemory();
+	goto onError;
+    }
+
+#define UNESCAPE_RESERVE(n) \
+    if (outlen + (n) > allocated) { \
+	char *newout; \
+	allocated = 2 * (outlen + (n)); \
+	newout = (char *)PyMem_Realloc(out, allocated * itemsize); \
+	if (newout == NULL) { \
+	    PyErr_NoMemory(); \
+	    goto onError; \
+	} \
+	out = newout; \
+    }
+#define UNESCAPE_PUT(ch) \
+    if (unicode) \
+	((Py_UNICODE *)out)[outlen++] = (Py_UNICODE)(ch); \
+    else { \
+	Py_AssertWithArg((ch) < 256, \
+			 PyExc_ValueError, \
+			 "escaped character code %ld out of range", \
+			 (long)(ch)); \
+	out[outlen++] = (char)(ch); \
     }
 
-    /* Second pass (needed to patch string jump targets) */
-    if (secondpass)
-	for (i = 0; i < size; i++) {
-	    mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+    i = start;
+    while (i < stop) {
+	Py_UCS4 ch = UNESCAPE_CHAR(i);
 
-	    if (tagtableentry->je != -424242 &&
-		tagtableentry->jne != -424242)
-		continue;
+	if (ch == '\\' && i + 1 < stop) {
+	    Py_UCS4 next = UNESCAPE_CHAR(i + 1);
+	    PyObject *key, *value;
 
-	    /* Entry (most probably) needs back-patching */
-	    entry = tc_get_item(table, i);
-	    if (entry == NULL) {
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"unexpected error (not found)", (unsigned int)i);
+	    /* escapes given by the caller */
+#ifdef HAVE_UNICODE
+	    if (unicode)
+		key = PyUnicode_FromOrdinal(next);
+	    else
+#endif
+	    {
+		char c = (char)next;
+		key = PyString_FromStringAndSize(&c, 1);
 	    }
+	    if (key == NULL)
+		goto onError;
+	    value = PyDict_GetItem(escapes, key);
+	    Py_DECREF(key);
+	    if (value != NULL) {
+		Py_ssize_t len;
 
-	    /* Get entry length */
-	    entry_len = tc_length(entry);
-	    if (entry_len < 0) {
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"unexpected error (no length)", (unsigned int)i);
+#ifdef HAVE_UNICODE
+		if (unicode) {
+		    Py_Assert(PyUnicode_Check(value),
+			      PyExc_TypeError,
+			      "escapes values must be unicode");
+		    len = PyUnicode_GET_SIZE(value);
+		    UNESCAPE_RESERVE(len);
+		    memcpy(out + outlen * itemsize,
+			   PyUnicode_AS_UNICODE(value),
+			   len * itemsize);
+		}
+		else
+#endif
+		{
+		    Py_Assert(PyString_Check(value),
+			      PyExc_TypeError,
+			      "escapes values must be strings");
+		    len = PyString_GET_SIZE(value);
+		    UNESCAPE_RESERVE(len);
+		    memcpy(out + outlen, PyString_AS_STRING(value), len);
+		}
+		outlen += len;
+		i += 2;
+		continue;
 	    }
 
-	    /* Decode jump offsets */
-	    if (entry_len >= 4)
-		jne = tc_get_item(entry, 3);
-	    else
-		jne = NULL;
-	    if (entry_len >= 5) 
-		je = tc_get_item(entry, 4);
-	    else
-		je = NULL;
+	    /* \xhh */
+	    if (next == 'x' && i + 3 < stop) {
+		int high = mxTextTools_HexDigit(UNESCAPE_CHAR(i + 2));
+		int low = mxTextTools_HexDigit(UNESCAPE_CHAR(i + 3));
 
-	    /* Patch jump offsets */
-	    if (jne && PyString_Check(jne)) {
-		v = PyDict_GetItem(jumpdict, jne);
-		if (v == NULL || !PyInt_Check(v))
-		    Py_ErrorWith2Args(PyExc_TypeError,
-				      "tag table entry %d: "
-				      "jne jump target '%s' not found", 
-				      (unsigned int)i, PyString_AS_STRING(jne));
-		tagtableentry->jne = PyInt_AS_LONG(v) - i;
+		if (high >= 0 && low >= 0) {
+		    UNESCAPE_RESERVE(1);
+		    UNESCAPE_PUT(high * 16 + low);
+		    i += 4;
+		    continue;
+		}
 	    }
-	    if (je && PyString_Check(je)) {
-		v = PyDict_GetItem(jumpdict, je);
-		if (v == NULL || !PyInt_Check(v))
-		    Py_ErrorWith2Args(PyExc_TypeError,
-				      "tag table entry %d: "
-				      "je jump target '%s' not found", 
-				      (unsigned int)i, PyString_AS_STRING(je));
-		tagtableentry->je = PyInt_AS_LONG(v) - i;
+
+	    /* \o, \oo or \ooo */
+	    if (next >= '0' && next <= '7') {
+		Py_UCS4 code = 0;
+		Py_ssize_t j;
+
+		for (j = i + 1;
+		     j < stop && j < i + 4 &&
+			 UNESCAPE_CHAR(j) >= '0' && UNESCAPE_CHAR(j) <= '7';
+		     j++)
+		    code = code * 8 + (UNESCAPE_CHAR(j) - '0');
+		UNESCAPE_RESERVE(1);
+		UNESCAPE_PUT(code);
+		i = j;
+		continue;
 	    }
 	}
-    
-    Py_DECREF(jumpdict);
-    return 0;
-
- onError:
-    if (own_args) {
-	Py_DECREF(args);
+	/* plain character or a backslash which doesn't start an
+	   escape */
+	UNESCAPE_RESERVE(1);
+	UNESCAPE_PUT(ch);
+	i++;
     }
-    return -1;
-}
-
-/* Check the cache for an already compiled TagTable for this
-   definition.  Return NULL in case of an error, Py_None without
-   INCREF in case no such table was found or the TagTable object. */
 
-static
-PyObject *consult_tagtable_cache(PyObject *definition,
-				 int tabletype,
-				 int cacheable)
-{
-    PyObject *v, *key, *tt;
-
-    if (!PyTuple_Check(definition) || !cacheable)
-	return Py_None;
+#undef UNESCAPE_CHAR
+#undef UNESCAPE_RESERVE
+#undef UNESCAPE_PUT
 
-    key = PyTuple_New(2);
-    if (key == NULL)
-	goto onError;
-    v = PyInt_FromLong((long) definition);
-    if (v == NULL)
-	goto onError;
-    PyTuple_SET_ITEM(key, 0, v);
-    v = PyInt_FromLong(tabletype);
-    if (v == NULL)
-	goto onError;
-    PyTuple_SET_ITEM(key, 1, v);
-    tt = PyDict_GetItem(mxTextTools_TagTables, key);
-    Py_DECREF(key);
-    if (tt != NULL) {
-	Py_INCREF(tt);
-	return tt;
-    }
-    return Py_None;
+#ifdef HAVE_UNICODE
+    if (unicode)
+	result = PyUnicode_FromUnicode((Py_UNICODE *)out, outlen);
+    else
+#endif
+	result = PyString_FromStringAndSize(out, outlen);
+    PyMem_Free(out);
+    return result;
 
  onError:
+    if (out != NULL)
+	PyMem_Free(out);
     return NULL;
 }
 
-/* Adds the compiled tagtable to the cache. Returns -1 in case of an
-   error, 0 on success. */
+/* datetime.timezone and the instances of it used last */
+static PyObject *mxTextTools_TimeZoneType = NULL;
+static PyObject *mxTextTools_UTC = NULL;
+static PyObject *mxTextTools_LastTimeZone = NULL;
+static long mxTextTools_LastOffset = 0;
+
+/* Return a new reference to a datetime.timezone for offset minutes
+   east of UTC; dates/times from the same source usually share their
+   offset, so the last one is kept around. */
 
 static
-int add_to_tagtable_cache(PyObject *definition,
-			  int tabletype,
-			  int cacheable,
-			  PyObject *tagtable)
+PyObject *mxTextTools_TimeZone(long offset)
 {
-    PyObject *v, *key;
-    int rc;
-
-    if (!PyTuple_Check(definition) || !cacheable)
-	return 0;
-    
-    key = PyTuple_New(2);
-    if (key == NULL)
-	goto onError;
-    v = PyInt_FromLong((long) definition);
-    if (v == NULL)
-	goto onError;
-    PyTuple_SET_ITEM(key, 0, v);
-    v = PyInt_FromLong(tabletype);
-    if (v == NULL)
-	goto onError;
-    PyTuple_SET_ITEM(key, 1, v);
+    PyObject *delta, *tz;
 
-    /* Hard-limit the cache size */
-    if (PyDict_Size(mxTextTools_TagTables) >= MAX_TAGTABLES_CACHE_SIZE)
-	PyDict_Clear(mxTextTools_TagTables);
+    if (offset == 0 && mxTextTools_UTC != NULL) {
+	Py_INCREF(mxTextTools_UTC);
+	return mxTextTools_UTC;
+    }
+    if (mxTextTools_LastTimeZone != NULL && mxTextTools_LastOffset == offset) {
+	Py_INCREF(mxTextTools_LastTimeZone);
+	return mxTextTools_LastTimeZone;
+    }
+    if (mxTextTools_TimeZoneType == NULL) {
+	PyObject *module = PyImport_ImportModule("datetime");
 
-    rc = PyDict_SetItem(mxTextTools_TagTables, key, tagtable);
-    Py_DECREF(key);
-    if (rc)
+	if (module == NULL)
+	    goto onError;
+	mxTextTools_TimeZoneType = PyObject_GetAttrString(module, "timezone");
+	Py_DECREF(module);
+	if (mxTextTools_TimeZoneType == NULL)
+	    goto onError;
+    }
+    delta = PyDelta_FromDSU(0, offset * 60, 0);
+    if (delta == NULL)
 	goto onError;
-    return 0;
+    tz = PyObject_CallFunctionObjArgs(mxTextTools_TimeZoneType, delta, NULL);
+    Py_DECREF(delta);
+    if (tz == NULL)
+	goto onError;
+    if (offset == 0) {
+	Py_INCREF(tz);
+	mxTextTools_UTC = tz;
+    }
+    else {
+	Py_XDECREF(mxTextTools_LastTimeZone);
+	Py_INCREF(tz);
+	mxTextTools_LastTimeZone = tz;
+	mxTextTools_LastOffset = offset;
+    }
+    return tz;
 
  onError:
-    return -1;
+    return NULL;
 }
 
-		       
-/* allocation */
+/* Return the ISO 8601 date/time in text[start:stop] as a
+   timezone-aware datetime.datetime; tzinfo is used for dates/times
+   without an offset, UTC if it is NULL or None. */
 
-PyObject *mxTagTable_New(PyObject *definition,
-			 int tabletype,
-			 int cacheable)
+static
+PyObject *mxTextTools_ISODateTime(PyObject *text,
+				  Py_ssize_t start,
+				  Py_ssize_t stop,
+				  PyObject *tzinfo)
 {
-    mxTagTableObject *tagtable = 0;
-    PyObject *v;
-    Py_ssize_t size;
-
-    /* First, consult the TagTable cache */
-    v = consult_tagtable_cache(definition, tabletype, cacheable);
-    if (v == NULL)
-	goto onError;
-    else if (v != Py_None)
-	return v;
+    mxTextTools_ISODate date;
+    PyObject *tz, *result;
+    const void *tx;
+    int itemsize;
 
-    size = tc_length(definition);
-    if (size < 0)
+#ifdef HAVE_UNICODE
+    if (PyUnicode_Check(text)) {
+	Py_CheckUnicodeSlice(text, start, stop);
+	tx = (const void *)PyUnicode_AS_UNICODE(text);
+	itemsize = sizeof(Py_UNICODE);
+    }
+    else
+#endif
+    if (PyString_Check(text)) {
+	Py_CheckStringSlice(text, start, stop);
+	tx = (const void *)PyString_AS_STRING(text);
+	itemsize = 1;
+    }
+    else
 	Py_Error(PyExc_TypeError,
-		 "tag table definition must be a tuple or a list");
+		 "expected string or unicode");
 
-    tagtable = PyObject_NEW_VAR(mxTagTableObject, &mxTagTable_Type, size);
-    if (tagtable == NULL) 
+    if (mxTextTools_ParseISODate(tx, itemsize, start, stop, &date))
 	goto onError;
-    if (cacheable) {
-	Py_INCREF(definition);
-	tagtable->definition = definition;
+    if (PyDateTimeAPI == NULL) {
+	PyDateTime_IMPORT;
+	if (PyDateTimeAPI == NULL)
+	    goto onError;
     }
-    else
-	tagtable->definition = NULL;
-    tagtable->tabletype = tabletype;
-    
-    /* Compile table ... */
-    if (init_tag_table(tagtable, definition, size, tabletype, cacheable))
-	goto onError;
-
-    /* Cache the compiled table if it is cacheable and derived from a
-       tuple */
-    if (add_to_tagtable_cache(definition, tabletype, cacheable, 
-			      (PyObject *)tagtable))
+    if (date.hasoffset || tzinfo == NULL || tzinfo == Py_None)
+	tz = mxTextTools_TimeZone(date.offset);
+    else {
+	Py_Assert(PyTZInfo_Check(tzinfo),
+		  PyExc_TypeError,
+		  "tzinfo must be a datetime.tzinfo or None");
+	Py_INCREF(tzinfo);
+	tz = tzinfo;
+    }
+    if (tz == NULL)
 	goto onError;
-
-    return (PyObject *)tagtable;
+    result = PyDateTimeAPI->DateTime_FromDateAndTime(
+	(int)date.year, (int)date.month, (int)date.day,
+	(int)date.hour, (int)date.minute, (int)date.second,
+	(int)date.microsecond, tz, PyDateTimeAPI->DateTimeType);
+    Py_DECREF(tz);
+    return result;
 
  onError:
-    Py_XDECREF(tagtable);
     return NULL;
 }
 
-Py_C_Function( mxTagTable_TagTable,
-	       "TagTable(definition[,cachable=1])\n\n"
-	       )
+static 
+int mxTextTools_IsASCII(PyObject *text,
+			Py_ssize_t left,
+			Py_ssize_t right)
 {
-    PyObject *definition;
-    int cacheable = 1;
-
-    Py_Get2Args("O|i:TagTable", definition, cacheable);
-    return mxTagTable_New(definition, 0, cacheable);
+    if (PyString_Check(text)) {
+	Py_ssize_t len;
+	register Py_ssize_t i;
+	register unsigned char *str = (unsigned char *)PyString_AS_STRING(text);
 
- onError:
-    return NULL;
-}
+	len = PyString_GET_SIZE(text);
+	Py_CheckSequenceSlice(len, left, right);
+	for (i = left; i < right; i++)
+	    if (str[i] >= 128)
+		return 0;
+	return 1;
+    }
 
 #ifdef HAVE_UNICODE
-Py_C_Function( mxTagTable_UnicodeTagTable,
-	       "TagTable(definition[,cachable=1])\n\n"
-	       )
-{
-    PyObject *definition;
-    int cacheable = 1;
-
-    Py_Get2Args("O|i:UnicodeTagTable", definition, cacheable);
-    return mxTagTable_New(definition, 1, cacheable);
-
- onError:
-    return NULL;
-}
-#endif
+    else if (PyUnicode_Check(text)) {
+	Py_ssize_t len;
+	register Py_ssize_t i;
+	register Py_UNICODE *str = PyUnicode_AS_UNICODE(text);
 
-static 
-void mxTagTable_Free(mxTagTableObject *tagtable)
-{
-    tc_cleanup(tagtable);
-    Py_XDECREF(tagtable->definition);
-    PyObject_Del(tagtable);
-}
+	len = PyUnicode_GET_SIZE(text);
+	Py_CheckSequenceSlice(len, left, right);
+	for (i = left; i < right; i++)
+	    if (str[i] >= 128)
+		return 0;
+	return 1;
+    }
+#endif
 
-/* C APIs */
+    else
+	Py_Error(PyExc_TypeError,
+		 "need string object");
+    
+ onError:
+    return -1;
+}
 
-#define tagtable ((mxTagTableObject *)self)
+/* Returns a copy of taglist in which the slice of every
+   (tagobj,l,r,subtags) tuple, including those in subtags, is moved
+   by delta. Other entries are copied as they are. */
 
 static
-PyObject *mxTagTable_CompiledDefinition(PyObject *self)
+PyObject *mxTextTools_ShiftTaglist(PyObject *taglist,
+				   Py_ssize_t delta)
 {
-    PyObject *tuple = 0, *v, *w;
-    Py_ssize_t i;
-    Py_ssize_t size;
+    PyObject *shifted = 0;
+    Py_ssize_t i, taglist_len;
 
-    if (!mxTagTable_Check(self)) {
-	PyErr_BadInternalCall();
+    Py_Assert(PyList_Check(taglist),
+	      PyExc_TypeError,
+	      "taglist must be a list");
+    taglist_len = PyList_GET_SIZE(taglist);
+    shifted = PyList_New(taglist_len);
+    if (shifted == NULL)
 	goto onError;
-    }
 
-    size = tagtable->numentries;
-    tuple = PyTuple_New(size);
-    if (tuple == NULL)
-	goto onError;
-    
-    for (i = 0; i < size; i++) {
-	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+    for (i = 0; i < taglist_len; i++) {
+	PyObject *t = PyList_GET_ITEM(taglist, i);
+	PyObject *subtags, *v;
 
-	/* Build tuple (tagobj, command, args, jne, je) */
-	v = PyTuple_New(5);
-	if (v == NULL)
-	    goto onError;
-	w = tagtableentry->tagobj;
-	if (w == NULL)
-	    w = Py_None;
-	Py_INCREF(w);
-	PyTuple_SET_ITEM(v, 0, w);
-	PyTuple_SET_ITEM(v, 1, PyInt_FromLong(tagtableentry->cmd |
-					      tagtableentry->flags));
-	w = tagtableentry->args;
-	if (w == NULL)
-	    w = Py_None;
-	Py_INCREF(w);
-	PyTuple_SET_ITEM(v, 2, w);
-	PyTuple_SET_ITEM(v, 3, PyInt_FromLong(tagtableentry->jne));
-	PyTuple_SET_ITEM(v, 4, PyInt_FromLong(tagtableentry->je));
-	if (PyErr_Occurred()) {
-	    Py_DECREF(v);
+	if (!PyTuple_Check(t) || PyTuple_GET_SIZE(t) != 4) {
+	    Py_INCREF(t);
+	    PyList_SET_ITEM(shifted, i, t);
+	    continue;
+	}
+	subtags = PyTuple_GET_ITEM(t, 3);
+	if (PyList_Check(subtags) && PyList_GET_SIZE(subtags) > 0) {
+	    subtags = mxTextTools_ShiftTaglist(subtags, delta);
+	    if (subtags == NULL)
+		goto onError;
+	}
+	else
+	    Py_INCREF(subtags);
+	v = PyTuple_New(4);
+	if (v == NULL) {
+	    Py_DECREF(subtags);
 	    goto onError;
 	}
-	PyTuple_SET_ITEM(tuple, i, v);
+	PyList_SET_ITEM(shifted, i, v);
+	Py_INCREF(PyTuple_GET_ITEM(t, 0));
+	PyTuple_SET_ITEM(v, 0, PyTuple_GET_ITEM(t, 0));
+	PyTuple_SET_ITEM(v, 1, PyInt_FromSsize_t(
+	    PyInt_AsSsize_t(PyTuple_GET_ITEM(t, 1)) + delta));
+	PyTuple_SET_ITEM(v, 2, PyInt_FromSsize_t(
+	    PyInt_AsSsize_t(PyTuple_GET_ITEM(t, 2)) + delta));
+	PyTuple_SET_ITEM(v, 3, subtags);
+	if (PyErr_Occurred() ||
+	    PyTuple_GET_ITEM(v, 1) == NULL ||
+	    PyTuple_GET_ITEM(v, 2) == NULL)
+	    goto onError;
     }
-    
-    return tuple;
+    return shifted;
 
  onError:
-    Py_XDECREF(tuple);
+    Py_XDECREF(shifted);
     return NULL;
 }
 
+/* --- Taglist serialization -------------------------------------------*/
 
-/* methods */
+/* Growable output buffer */
 
-Py_C_Function( mxTagTable_compiled,
-	       ".compiled()\n\n"
-	       )
-{
-    Py_NoArgsCheck();
-    return mxTagTable_CompiledDefinition(self);
+typedef struct {
+    char *data;
+    Py_ssize_t len;
+    Py_ssize_t size;
+} mxTextTools_Buffer;
 
- onError:
-    return NULL;
+static
+int mxTextTools_Buffer_Reserve(mxTextTools_Buffer *buffer,
+			       Py_ssize_t needed)
+{
+    if (buffer->len + needed > buffer->size) {
+	Py_ssize_t size = buffer->size ? buffer->size : 256;
+	char *data;
+
+	while (size < buffer->len + needed)
+	    size *= 2;
+	data = (char *)PyMem_Realloc(buffer->data, size);
+	if (data == NULL) {
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	buffer->data = data;
+	buffer->size = size;
+    }
+    return 0;
 }
 
-#ifdef COPY_PROTOCOL
-Py_C_Function( mxTagTable_copy,
-	       "copy([memo])\n\n"
-	       "Return a new reference for the instance. This function\n"
-	       "is used for the copy-protocol. Real copying doesn't take\n"
-	       "place, since the instances are immutable.")
+static
+int mxTextTools_Buffer_Write(mxTextTools_Buffer *buffer,
+			     const char *data,
+			     Py_ssize_t len)
 {
-    PyObject *memo;
-    
-    Py_GetArg("|O",memo);
-    Py_INCREF(tagtable);
-    return (PyObject *)tagtable;
-
- onError:
-    return NULL;
+    if (mxTextTools_Buffer_Reserve(buffer, len))
+	return -1;
+    memcpy(buffer->data + buffer->len, data, len);
+    buffer->len += len;
+    return 0;
 }
-#endif
-
-#undef tagtable
-
-/* --- slots --- */
 
 static
-PyObject *mxTagTable_Repr(mxTagTableObject *self)
+int mxTextTools_Buffer_WriteVarint(mxTextTools_Buffer *buffer,
+				   size_t value)
 {
-    char t[100];
-
-    if (self->tabletype == MXTAGTABLE_STRINGTYPE)
-	sprintf(t,"<String Tag Table object at 0x%lx>", (long)self);
-    else if (self->tabletype == MXTAGTABLE_UNICODETYPE)
-	sprintf(t,"<Unicode Tag Table object at 0x%lx>", (long)self);
-    else
-	sprintf(t,"<Tag Table object at 0x%lx>", (long)self);
-    return PyString_FromString(t);
+    if (mxTextTools_Buffer_Reserve(buffer, 10))
+	return -1;
+    while (value >= 0x80) {
+	buffer->data[buffer->len++] = (char)((value & 0x7F) | 0x80);
+	value >>= 7;
+    }
+    buffer->data[buffer->len++] = (char)value;
+    return 0;
 }
 
-static
-PyMethodDef mxTagTable_Methods[] =
-{   
-    Py_MethodListEntryNoArgs("compiled",mxTagTable_compiled),
-#ifdef COPY_PROTOCOL
-    Py_MethodListEntry("__deepcopy__",mxTagTable_copy),
-    Py_MethodListEntry("__copy__",mxTagTable_copy),
-#endif
-    {NULL,NULL} /* end of list */
-};
+/* Signed values are written zigzag encoded: 0, -1, 1, -2, ... */
 
 static
-PyMemberDef mxTagTable_Members[] = {
-    {"definition",T_OBJECT_EX,offsetof(mxTagTableObject,definition),READONLY,"Definition"},
-    {NULL}
-};
+int mxTextTools_Buffer_WriteSigned(mxTextTools_Buffer *buffer,
+				   Py_ssize_t value)
+{
+    return mxTextTools_Buffer_WriteVarint(buffer,
+	value < 0 ? ((size_t)(-(value + 1)) << 1) | 1 : (size_t)value << 1);
+}
 
-/* Python Type Tables */
+/* Get the (tagobj, l, r, subtags) items of a taglist entry */
 
-PyTypeObject mxTagTable_Type = {
-    PyVarObject_HEAD_INIT(NULL, 0)          /* init at startup ! */
-    "Tag Table",                            /* tp_name */
-    sizeof(mxTagTableObject),               /* tp_basicsize */
-    sizeof(mxTagTableEntry),                /* tp_itemsize */
-    /* methods */
-    (destructor)mxTagTable_Free,            /* tp_dealloc */
-    (printfunc)0,                           /* tp_print */
-    (getattrfunc)0,                         /* tp_getattr */
-    (setattrfunc)0,                         /* tp_setattr */
-    0,                                      /* tp_compare */
-    (reprfunc)mxTagTable_Repr,              /* tp_repr */
-    0,                                      /* tp_as_number */
-    0,                                      /* tp_as_sequence */
-    0,                                      /* tp_as_mapping */
-    (hashfunc)0,                            /* tp_hash */
-    (ternaryfunc)0,                         /* tp_call */
-    (reprfunc)0,                            /* tp_str */
-    (getattrofunc)0,                        /* tp_getattro */
-    (setattrofunc)0,                        /* tp_setattro */
-    0,                                      /* tp_as_buffer */
-    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
-    (char*) 0,                              /* tp_doc */
-    0,                                      /* tp_traverse */
-    0,                                      /* tp_clear */
-    0,                                      /* tp_richcompare */
-    0,                                      /* tp_weaklistoffset */
-    0,                                      /* tp_iter */
-    0,                                      /* tp_iternext */
-    mxTagTable_Methods,                     /* tp_methods */
-    mxTagTable_Members,                     /* tp_members */
-};
+static
+int mxTextTools_TaglistEntry(PyObject *entry,
+			     PyObject **tagobj,
+			     Py_ssize_t *left,
+			     Py_ssize_t *right,
+			     PyObject **subtags)
+{
+    Py_Assert(PyTuple_Check(entry) && PyTuple_GET_SIZE(entry) == 4,
+	      PyExc_TypeError,
+	      "taglist entries must be (tagobj,l,r,subtags) tuples");
+    *tagobj = PyTuple_GET_ITEM(entry, 0);
+    *left = PyInt_AsSsize_t(PyTuple_GET_ITEM(entry, 1));
+    *right = PyInt_AsSsize_t(PyTuple_GET_ITEM(entry, 2));
+    if (PyErr_Occurred())
+	goto onError;
+    *subtags = PyTuple_GET_ITEM(entry, 3);
+    Py_Assert(*subtags == Py_None || PyList_Check(*subtags),
+	      PyExc_TypeError,
+	      "subtags must be a list or None");
+    return 0;
 
-/* --- Internal functions ----------------------------------------------*/
+ onError:
+    return -1;
+}
 
-#ifdef HAVE_UNICODE
+/* JSON: each entry is written as [tagobj, l, r, subtags] or, if the
+   text is given, [tagobj, l, r, subtags, text[l:r]]; subtags is an
+   array or null. */
 
-/* Same as mxTextTools_Join() for Unicode objects. */
+/* Write data as a JSON string; with latin1 set, data holds Latin-1
+   characters rather than UTF-8 */
 
 static
-PyObject *mxTextTools_UnicodeJoin(PyObject *seq,
-				  Py_ssize_t start,
-				  Py_ssize_t stop,
-				  PyObject *separator)
+int mxTextTools_JSON_WriteString(mxTextTools_Buffer *buffer,
+				 const unsigned char *data,
+				 Py_ssize_t len,
+				 int latin1)
 {
-    PyObject *newstring = 0, *tempstr = 0;
-    Py_ssize_t newstring_len,current_len = 0;
-    Py_UNICODE *p;
+    static const char hexdigits[] = "0123456789abcdef";
     Py_ssize_t i;
-    Py_UNICODE *sep;
-    Py_ssize_t sep_len;
-    
-    if (separator) {
-	separator = PyUnicode_FromObject(separator);
-	if (separator == NULL)
-	    goto onError;
-	sep = PyUnicode_AS_UNICODE(separator);
-	sep_len = PyUnicode_GET_SIZE(separator);
-    }
-    else {
-	sep = NULL;
-	sep_len = 0;
-    }
-    
-    /* Create an empty new string */
-    newstring_len = (10 + sep_len) * (stop - start);
-    newstring = PyUnicode_FromUnicode(NULL, newstring_len);
-    if (newstring == NULL) 
-	goto onError;
-    p = PyUnicode_AS_UNICODE(newstring);
-
-    /* Join with separator */
-    for (i = start; i < stop; i++) {
-	register PyObject *o;
-	Py_UNICODE *st;
-	Py_ssize_t len_st;
 
-	o = PySequence_GetItem(seq, i);
-
-	if PyTuple_Check(o) {
-	    /* Tuple entry: (string,l,r,[...]) */
-	    register Py_ssize_t l,r;
+    /* worst case: every character escaped as \u00XX */
+    if (mxTextTools_Buffer_Reserve(buffer, 6 * len + 2))
+	return -1;
+    buffer->data[buffer->len++] = '"';
+    for (i = 0; i < len; i++) {
+	unsigned char c = data[i];
+	char *out = buffer->data + buffer->len;
+
+	if (c == '"' || c == '\\') {
+	    out[0] = '\\';
+	    out[1] = (char)c;
+	    buffer->len += 2;
+	}
+	else if (c < 0x20 || (latin1 && c >= 0x80)) {
+	    out[0] = '\\';
+	    out[1] = 'u';
+	    out[2] = '0';
+	    out[3] = '0';
+	    out[4] = hexdigits[c >> 4];
+	    out[5] = hexdigits[c & 0xF];
+	    buffer->len += 6;
+	}
+	else
+	    buffer->data[buffer->len++] = (char)c;
+    }
+    buffer->data[buffer->len++] = '"';
+    return 0;
+}
 
-	    /* parse tuple */
-	    Py_Assert((PyTuple_GET_SIZE(o) >= 3) &&
-		      PyInt_Check(PyTuple_GET_ITEM(o,1)) && 
-		      PyInt_Check(PyTuple_GET_ITEM(o,2)),
-		      PyExc_TypeError,
-		      "tuples must be of the format (string,l,r[,...])");
-	    tempstr = PyUnicode_FromObject(PyTuple_GET_ITEM(o,0));
-	    if (tempstr == NULL)
-		goto onError;
-	    st = PyUnicode_AS_UNICODE(tempstr);
-	    len_st = PyUnicode_GET_SIZE(tempstr);
-	    l = PyInt_AS_LONG(PyTuple_GET_ITEM(o,1));
-	    r = PyInt_AS_LONG(PyTuple_GET_ITEM(o,2));
+static
+int mxTextTools_JSON_WriteObject(mxTextTools_Buffer *buffer,
+				 PyObject *obj)
+{
+    if (obj == Py_None)
+	return mxTextTools_Buffer_Write(buffer, "null", 4);
+    if (PyString_Check(obj))
+	return mxTextTools_JSON_WriteString(buffer,
+	    (unsigned char *)PyString_AS_STRING(obj),
+	    PyString_GET_SIZE(obj), 1);
+#ifdef HAVE_UNICODE
+    if (PyUnicode_Check(obj)) {
+	PyObject *utf8 = PyUnicode_AsUTF8String(obj);
+	int rc;
 
-	    /* compute slice */
-	    if (r > len_st) r = len_st;
-	    else if (r < 0) {
-		r += len_st + 1;
-		if (r < 0)
-		    r = 0;
-	    }
-	    if (l > len_st) l = len_st;
-	    else if (l < 0) {
-		l += len_st + 1;
-		if (l < 0)
-		    l = 0;
-	    }
+	if (utf8 == NULL)
+	    return -1;
+	rc = mxTextTools_JSON_WriteString(buffer,
+	    (unsigned char *)PyString_AS_STRING(utf8),
+	    PyString_GET_SIZE(utf8), 0);
+	Py_DECREF(utf8);
+	return rc;
+    }
+#endif
+    if (PyInt_Check(obj)
+#if PY_MAJOR_VERSION < 3
+	|| PyLong_Check(obj)
+#endif
+	) {
+	char number[32];
+	Py_ssize_t value = PyInt_AsSsize_t(obj);
+
+	if (value == -1 && PyErr_Occurred())
+	    return -1;
+	PyOS_snprintf(number, sizeof(number), "%" PY_FORMAT_SIZE_T "d", value);
+	return mxTextTools_Buffer_Write(buffer, number, strlen(number));
+    }
+    PyErr_Format(PyExc_TypeError,
+		 "can't serialize tagobj of type %.50s",
+		 Py_TYPE(obj)->tp_name);
+    return -1;
+}
 
-	    /* empty ? */
-	    if (l > r)
-		continue;
-	    len_st = r - l;
-	    if (len_st == 0) 
-		continue;
+static
+int mxTextTools_TaglistToJSON(mxTextTools_Buffer *buffer,
+			      PyObject *taglist,
+			      PyObject *text)
+{
+    Py_ssize_t i;
+    char number[64];
 
-	    /* get pointer right */
-	    st += l;
-	}
-	else {
-	    /* Must be a string entry: take the whole string */
-	    tempstr = PyUnicode_FromObject(o);
-	    if (tempstr == NULL)
-		goto onError;
-	    st = PyUnicode_AS_UNICODE(tempstr);
-	    len_st = PyUnicode_GET_SIZE(tempstr);
-	}
+    if (Py_EnterRecursiveCall(" while serializing a taglist"))
+	return -1;
+    if (mxTextTools_Buffer_Write(buffer, "[", 1))
+	goto onError;
+    for (i = 0; i < PyList_GET_SIZE(taglist); i++) {
+	PyObject *tagobj, *subtags;
+	Py_ssize_t left, right;
 
-        Py_DECREF(o);
-    
-	/* Resize the new string if needed */
-	while (current_len + len_st + sep_len >= newstring_len) {
-	    newstring_len += newstring_len >> 1;
-	    if (PyUnicode_Resize(&newstring, newstring_len))
+	if (mxTextTools_TaglistEntry(PyList_GET_ITEM(taglist, i),
+				     &tagobj, &left, &right, &subtags))
+	    goto onError;
+	if (mxTextTools_Buffer_Write(buffer, i ? ",[" : "[", i ? 2 : 1) ||
+	    mxTextTools_JSON_WriteObject(buffer, tagobj))
+	    goto onError;
+	PyOS_snprintf(number, sizeof(number),
+		      ",%" PY_FORMAT_SIZE_T "d,%" PY_FORMAT_SIZE_T "d,",
+		      left, right);
+	if (mxTextTools_Buffer_Write(buffer, number, strlen(number)))
+	    goto onError;
+	if (subtags == Py_None) {
+	    if (mxTextTools_Buffer_Write(buffer, "null", 4))
 		goto onError;
-	    p = PyUnicode_AS_UNICODE(newstring) + current_len;
 	}
+	else if (mxTextTools_TaglistToJSON(buffer, subtags, text))
+	    goto onError;
+	if (text != NULL) {
+	    PyObject *slice = PySequence_GetSlice(text, left, right);
+	    int rc;
 
-	/* Insert separator */
-	if (i > 0 && sep_len > 0) {
-	    Py_UNICODE_COPY(p, sep, sep_len);
-	    p += sep_len;
-	    current_len += sep_len;
+	    if (slice == NULL)
+		goto onError;
+	    rc = mxTextTools_Buffer_Write(buffer, ",", 1) ||
+		mxTextTools_JSON_WriteObject(buffer, slice);
+	    Py_DECREF(slice);
+	    if (rc)
+		goto onError;
 	}
-
-	/* Copy snippet into new string */
-	Py_UNICODE_COPY(p, st, len_st);
-	p += len_st;
-	current_len += len_st;
-	
-	Py_DECREF(tempstr);
-	tempstr = NULL;
+	if (mxTextTools_Buffer_Write(buffer, "]", 1))
+	    goto onError;
     }
-    
-    /* Resize new string to the actual length */
-    if (PyUnicode_Resize(&newstring, current_len))
+    if (mxTextTools_Buffer_Write(buffer, "]", 1))
 	goto onError;
-
-    Py_XDECREF(separator);
-    return newstring;
+    Py_LeaveRecursiveCall();
+    return 0;
 
  onError:
-    Py_XDECREF(newstring);
-    Py_XDECREF(separator);
-    Py_XDECREF(tempstr);
-    return NULL;
+    Py_LeaveRecursiveCall();
+    return -1;
 }
 
-#endif
+/* Reading JSON back only needs to understand what is written above:
+   arrays, strings, integers and null */
 
-/* Enhanced string join: also excepts tuple (text, left, right,...)
-   entries which then cause text[left:right] to be used as string
-   snippet.
+#define MXTEXTTOOLS_JSON_CACHESIZE 32
 
-   separator may be NULL; in that case, "" is used as separator.
+typedef struct {
+    const unsigned char *data;
+    Py_ssize_t pos;
+    Py_ssize_t len;
+    mxTextTools_Buffer string;	/* unescaped UTF-8 of the last string */
+    struct {			/* tagobjs created for string tokens */
+	Py_ssize_t start;
+	Py_ssize_t len;
+	PyObject *obj;
+    } cache[MXTEXTTOOLS_JSON_CACHESIZE];
+    int nextcache;
+} mxTextTools_JSONReader;
 
-*/
+static
+int mxTextTools_JSON_Invalid(mxTextTools_JSONReader *reader)
+{
+    PyErr_Format(PyExc_ValueError,
+		 "invalid taglist JSON at position %" PY_FORMAT_SIZE_T "d",
+		 reader->pos);
+    return -1;
+}
+
+/* Skip whitespace and return the next character, 0 at the end */
 
 static
-PyObject *mxTextTools_Join(PyObject *seq,
-			   Py_ssize_t start,
-			   Py_ssize_t stop,
-			   PyObject *separator)
+int mxTextTools_JSON_Peek(mxTextTools_JSONReader *reader)
 {
-    PyObject *newstring = 0;
-    Py_ssize_t newstring_len, current_len = 0;
-    char *p;
-    Py_ssize_t i;
-    char *sep;
-    Py_ssize_t sep_len;
+    while (reader->pos < reader->len) {
+	unsigned char c = reader->data[reader->pos];
 
-    if (separator) {
-#ifdef HAVE_UNICODE
-	if (PyUnicode_Check(separator))
-	    return mxTextTools_UnicodeJoin(seq, start, stop, separator);
-#endif
-	Py_Assert(PyString_Check(separator),
-		  PyExc_TypeError,
-		  "separator must be a string");
-	sep = PyString_AS_STRING(separator);
-	sep_len = PyString_GET_SIZE(separator);
+	if (c != ' ' && c != '\t' && c != '\n' && c != '\r')
+	    return c;
+	reader->pos++;
     }
-    else {
-	sep = NULL;
-	sep_len = 0;
+    return 0;
+}
+
+static
+int mxTextTools_JSON_Expect(mxTextTools_JSONReader *reader,
+			    char c)
+{
+    if (mxTextTools_JSON_Peek(reader) != c)
+	return mxTextTools_JSON_Invalid(reader);
+    reader->pos++;
+    return 0;
+}
+
+static
+int mxTextTools_JSON_ReadInt(mxTextTools_JSONReader *reader,
+			     Py_ssize_t *value)
+{
+    int negative = 0;
+    size_t result = 0;
+    Py_ssize_t start;
+
+    mxTextTools_JSON_Peek(reader);
+    if (reader->pos < reader->len && reader->data[reader->pos] == '-') {
+	negative = 1;
+	reader->pos++;
     }
-    
-    /* Create an empty new string */
-    newstring_len = (10 + sep_len) * (stop - start);
-    newstring = PyString_FromStringAndSize((char*)NULL, newstring_len);
-    if (newstring == NULL) 
-	goto onError;
-    p = PyString_AS_STRING(newstring);
+    start = reader->pos;
+    while (reader->pos < reader->len &&
+	   reader->data[reader->pos] >= '0' &&
+	   reader->data[reader->pos] <= '9') {
+	if (result > (size_t)PY_SSIZE_T_MAX / 10) {
+	    PyErr_SetString(PyExc_OverflowError,
+			    "taglist JSON integer too large");
+	    return -1;
+	}
+	result = result * 10 + (reader->data[reader->pos++] - '0');
+    }
+    /* the negative range reaches one further, to PY_SSIZE_T_MIN */
+    if (reader->pos == start ||
+	result > (size_t)PY_SSIZE_T_MAX + negative)
+	return mxTextTools_JSON_Invalid(reader);
+    if (negative && result)
+	*value = -(Py_ssize_t)(result - 1) - 1;
+    else
+	*value = (Py_ssize_t)result;
+    return 0;
+}
 
-    /* Join with separator */
-    for (i = start; i < stop; i++) {
-	register PyObject *o;
-	char *st;
-	Py_ssize_t len_st;
+static
+int mxTextTools_JSON_ReadHex(mxTextTools_JSONReader *reader,
+			     unsigned int *value)
+{
+    int i;
+
+    if (reader->pos + 4 > reader->len)
+	return mxTextTools_JSON_Invalid(reader);
+    *value = 0;
+    for (i = 0; i < 4; i++) {
+	unsigned char c = reader->data[reader->pos++];
+
+	*value <<= 4;
+	if (c >= '0' && c <= '9')
+	    *value |= c - '0';
+	else if (c >= 'a' && c <= 'f')
+	    *value |= c - 'a' + 10;
+	else if (c >= 'A' && c <= 'F')
+	    *value |= c - 'A' + 10;
+	else
+	    return mxTextTools_JSON_Invalid(reader);
+    }
+    return 0;
+}
 
-	o = PySequence_GetItem(seq, i);
+/* Read a string into reader->string as UTF-8 */
 
-	if PyTuple_Check(o) {
-	    /* Tuple entry: (string,l,r,[...]) */
-	    register Py_ssize_t l,r;
+static
+int mxTextTools_JSON_ReadString(mxTextTools_JSONReader *reader)
+{
+    reader->string.len = 0;
+    if (mxTextTools_JSON_Expect(reader, '"'))
+	return -1;
+    while (1) {
+	Py_ssize_t start = reader->pos;
+	unsigned int c;
+	char utf8[4];
+	int n;
+
+	while (reader->pos < reader->len &&
+	       reader->data[reader->pos] != '"' &&
+	       reader->data[reader->pos] != '\\')
+	    reader->pos++;
+	if (reader->pos >= reader->len)
+	    return mxTextTools_JSON_Invalid(reader);
+	if (mxTextTools_Buffer_Write(&reader->string,
+				     (const char *)reader->data + start,
+				     reader->pos - start))
+	    return -1;
+	if (reader->data[reader->pos++] == '"')
+	    return 0;
 
-	    /* parse tuple */
-	    Py_Assert((PyTuple_GET_SIZE(o) >= 3) &&
-		      PyInt_Check(PyTuple_GET_ITEM(o,1)) && 
-		      PyInt_Check(PyTuple_GET_ITEM(o,2)),
-		      PyExc_TypeError,
-		      "tuples must be of the format (string,int,int[,...])");
-#ifdef HAVE_UNICODE
-	    if (PyUnicode_Check(PyTuple_GET_ITEM(o,0))) {
-		/* Redirect to Unicode implementation; all previous work
-		   is lost. */
-		Py_DECREF(o);
-		Py_DECREF(newstring);
-		return mxTextTools_UnicodeJoin(seq, start, stop, separator);
+	/* escape sequence */
+	if (reader->pos >= reader->len)
+	    return mxTextTools_JSON_Invalid(reader);
+	switch (reader->data[reader->pos++]) {
+	case '"': c = '"'; break;
+	case '\\': c = '\\'; break;
+	case '/': c = '/'; break;
+	case 'b': c = '\b'; break;
+	case 'f': c = '\f'; break;
+	case 'n': c = '\n'; break;
+	case 'r': c = '\r'; break;
+	case 't': c = '\t'; break;
+	case 'u':
+	    if (mxTextTools_JSON_ReadHex(reader, &c))
+		return -1;
+	    if (c >= 0xD800 && c < 0xDC00 &&
+		reader->pos + 6 <= reader->len &&
+		reader->data[reader->pos] == '\\' &&
+		reader->data[reader->pos + 1] == 'u') {
+		/* surrogate pair */
+		unsigned int low;
+
+		reader->pos += 2;
+		if (mxTextTools_JSON_ReadHex(reader, &low))
+		    return -1;
+		if (low < 0xDC00 || low >= 0xE000)
+		    return mxTextTools_JSON_Invalid(reader);
+		c = 0x10000 + ((c - 0xD800) << 10) + (low - 0xDC00);
 	    }
+	    break;
+	default:
+	    reader->pos--;
+	    return mxTextTools_JSON_Invalid(reader);
+	}
+	if (c < 0x80) {
+	    utf8[0] = (char)c;
+	    n = 1;
+	}
+	else if (c < 0x800) {
+	    utf8[0] = (char)(0xC0 | (c >> 6));
+	    utf8[1] = (char)(0x80 | (c & 0x3F));
+	    n = 2;
+	}
+	else if (c < 0x10000) {
+	    utf8[0] = (char)(0xE0 | (c >> 12));
+	    utf8[1] = (char)(0x80 | ((c >> 6) & 0x3F));
+	    utf8[2] = (char)(0x80 | (c & 0x3F));
+	    n = 3;
+	}
+	else {
+	    utf8[0] = (char)(0xF0 | (c >> 18));
+	    utf8[1] = (char)(0x80 | ((c >> 12) & 0x3F));
+	    utf8[2] = (char)(0x80 | ((c >> 6) & 0x3F));
+	    utf8[3] = (char)(0x80 | (c & 0x3F));
+	    n = 4;
+	}
+	if (mxTextTools_Buffer_Write(&reader->string, utf8, n))
+	    return -1;
+    }
+}
+
+/* Read a tagobj: a string, integer or null */
+
+static
+PyObject *mxTextTools_JSON_ReadTagobj(mxTextTools_JSONReader *reader)
+{
+    int c = mxTextTools_JSON_Peek(reader);
+    Py_ssize_t start = reader->pos;
+    PyObject *obj;
+    int i;
+
+    if (c == 'n') {
+	if (reader->pos + 4 > reader->len ||
+	    memcmp(reader->data + reader->pos, "null", 4)) {
+	    mxTextTools_JSON_Invalid(reader);
+	    return NULL;
+	}
+	reader->pos += 4;
+	Py_INCREF(Py_None);
+	return Py_None;
+    }
+    if (c != '"') {
+	Py_ssize_t value;
+
+	if (mxTextTools_JSON_ReadInt(reader, &value))
+	    return NULL;
+	return PyInt_FromSsize_t(value);
+    }
+
+    /* tagobjs repeat a lot, reuse the objects created for the
+       same string tokens */
+    if (mxTextTools_JSON_ReadString(reader))
+	return NULL;
+    for (i = 0; i < MXTEXTTOOLS_JSON_CACHESIZE; i++) {
+	if (reader->cache[i].obj != NULL &&
+	    reader->cache[i].len == reader->pos - start &&
+	    memcmp(reader->data + reader->cache[i].start,
+		   reader->data + start,
+		   reader->pos - start) == 0) {
+	    Py_INCREF(reader->cache[i].obj);
+	    return reader->cache[i].obj;
+	}
+    }
+#if PY_MAJOR_VERSION < 3
+    for (i = 0; i < reader->string.len; i++)
+	if ((unsigned char)reader->string.data[i] >= 0x80)
+	    break;
+    if (i == reader->string.len)
+	obj = PyString_FromStringAndSize(reader->string.data,
+					 reader->string.len);
+    else
 #endif
-	    Py_Assert(PyString_Check(PyTuple_GET_ITEM(o,0)),
-		      PyExc_TypeError,
-		      "tuples must be of the format (string,int,int[,...])");
-	    st = PyString_AS_STRING(PyTuple_GET_ITEM(o,0));
-	    len_st = PyString_GET_SIZE(PyTuple_GET_ITEM(o,0));
-	    l = PyInt_AS_LONG(PyTuple_GET_ITEM(o,1));
-	    r = PyInt_AS_LONG(PyTuple_GET_ITEM(o,2));
+	obj = PyUnicode_DecodeUTF8(reader->string.data,
+				   reader->string.len,
+				   NULL);
+    if (obj == NULL)
+	return NULL;
+    i = reader->nextcache;
+    reader->nextcache = (i + 1) % MXTEXTTOOLS_JSON_CACHESIZE;
+    Py_XDECREF(reader->cache[i].obj);
+    reader->cache[i].start = start;
+    reader->cache[i].len = reader->pos - start;
+    reader->cache[i].obj = obj;
+    Py_INCREF(obj);
+    return obj;
+}
 
-	    /* compute slice */
-	    if (r > len_st) r = len_st;
-	    else if (r < 0) {
-		r += len_st + 1;
-		if (r < 0)
-		    r = 0;
-	    }
-	    if (l > len_st) l = len_st;
-	    else if (l < 0) {
-		l += len_st + 1;
-		if (l < 0)
-		    l = 0;
-	    }
+/* Read an array of entries */
 
-	    /* empty ? */
-	    if (l > r)
-		continue;
-	    len_st = r - l;
-	    if (len_st == 0) 
-		continue;
+static
+PyObject *mxTextTools_JSON_ReadTaglist(mxTextTools_JSONReader *reader)
+{
+    PyObject *taglist = NULL;
 
-	    /* get pointer right */
-	    st += l;
+    if (Py_EnterRecursiveCall(" while loading a taglist"))
+	return NULL;
+    if (mxTextTools_JSON_Expect(reader, '['))
+	goto onError;
+    taglist = PyList_New(0);
+    if (taglist == NULL)
+	goto onError;
+    if (mxTextTools_JSON_Peek(reader) == ']') {
+	reader->pos++;
+	Py_LeaveRecursiveCall();
+	return taglist;
+    }
+    while (1) {
+	PyObject *entry, *tagobj, *subtags;
+	Py_ssize_t left, right;
+	int c;
+
+	if (mxTextTools_JSON_Expect(reader, '['))
+	    goto onError;
+	tagobj = mxTextTools_JSON_ReadTagobj(reader);
+	if (tagobj == NULL)
+	    goto onError;
+	if (mxTextTools_JSON_Expect(reader, ',') ||
+	    mxTextTools_JSON_ReadInt(reader, &left) ||
+	    mxTextTools_JSON_Expect(reader, ',') ||
+	    mxTextTools_JSON_ReadInt(reader, &right) ||
+	    mxTextTools_JSON_Expect(reader, ',')) {
+	    Py_DECREF(tagobj);
+	    goto onError;
 	}
-	else if (PyString_Check(o)) {
-	    /* String entry: take the whole string */
-	    st = PyString_AS_STRING(o);
-	    len_st = PyString_GET_SIZE(o);
+	if (mxTextTools_JSON_Peek(reader) == 'n') {
+	    subtags = mxTextTools_JSON_ReadTagobj(reader);
+	    if (subtags != NULL && subtags != Py_None) {
+		Py_DECREF(subtags);
+		subtags = NULL;
+		mxTextTools_JSON_Invalid(reader);
+	    }
 	}
-#ifdef HAVE_UNICODE
-	else if (PyUnicode_Check(o)) {
-	    /* Redirect to Unicode implementation; all previous work
-	       is lost. */
-	    Py_DECREF(o);
-	    Py_DECREF(newstring);
-	    return mxTextTools_UnicodeJoin(seq, start, stop, separator);
+	else
+	    subtags = mxTextTools_JSON_ReadTaglist(reader);
+	if (subtags == NULL) {
+	    Py_DECREF(tagobj);
+	    goto onError;
 	}
-#endif
-	else {
-	    Py_DECREF(o);
-	    Py_Error(PyExc_TypeError,
-		     "list must contain tuples or strings as entries");
+	entry = Py_BuildValue("NnnN", tagobj, left, right, subtags);
+	if (entry == NULL)
+	    goto onError;
+	if (PyList_Append(taglist, entry)) {
+	    Py_DECREF(entry);
+	    goto onError;
 	}
+	Py_DECREF(entry);
 
-        Py_DECREF(o);
-    
-	/* Resize the new string if needed */
-	while (current_len + len_st + sep_len >= newstring_len) {
-	    newstring_len += newstring_len >> 1;
-	    if (_PyString_Resize(&newstring, newstring_len))
+	/* the matched text is redundant */
+	if (mxTextTools_JSON_Peek(reader) == ',') {
+	    reader->pos++;
+	    if (mxTextTools_JSON_ReadString(reader))
 		goto onError;
-	    p = PyString_AS_STRING(newstring) + current_len;
 	}
-
-	/* Insert separator */
-	if (i > 0 && sep_len > 0) {
-	    memcpy(p, sep, sep_len);
-	    p += sep_len;
-	    current_len += sep_len;
+	if (mxTextTools_JSON_Expect(reader, ']'))
+	    goto onError;
+	c = mxTextTools_JSON_Peek(reader);
+	reader->pos++;
+	if (c == ']')
+	    break;
+	if (c != ',') {
+	    reader->pos--;
+	    mxTextTools_JSON_Invalid(reader);
+	    goto onError;
 	}
-
-	/* Copy snippet into new string */
-	memcpy(p,st,len_st);
-	p += len_st;
-	current_len += len_st;
     }
-    
-    /* Resize new string to the actual length */
-    if (_PyString_Resize(&newstring, current_len))
-	goto onError;
-
-    return newstring;
+    Py_LeaveRecursiveCall();
+    return taglist;
 
  onError:
-    Py_XDECREF(newstring);
+    Py_LeaveRecursiveCall();
+    Py_XDECREF(taglist);
     return NULL;
 }
 
+/* Binary format: the magic MXTEXTTOOLS_BINARY_MAGIC, the number of
+   distinct tagobjs and the tagobjs, then the taglist. Integers are
+   varints (7 bits per byte, least significant first, the high bit
+   set on all but the last byte), signed ones zigzag encoded.
+
+   tagobj: kind byte, then for strings and Unicode the varint length
+           and the bytes (UTF-8 for Unicode), for integers the signed
+           value, nothing for None
+   taglist: number of entries, then for each entry the tagobj index,
+            l relative to the previous entry's r (the parent's l for
+            the first entry), r - l, and the subtags: 0 for None,
+            1 followed by the taglist otherwise */
+
+#define MXTEXTTOOLS_BINARY_MAGIC "TTB1"
+
+#define MXTEXTTOOLS_BINARY_NONE		0
+#define MXTEXTTOOLS_BINARY_UNICODE	1
+#define MXTEXTTOOLS_BINARY_STRING	2
+#define MXTEXTTOOLS_BINARY_INT		3
+
+/* Write the tagobj table of binary taglist data */
+
 static
-PyObject *mxTextTools_HexStringFromString(char *str,
-					  Py_ssize_t len) 
+int mxTextTools_Binary_WriteTagobj(mxTextTools_Buffer *buffer,
+				   PyObject *obj)
 {
-    PyObject *w = 0;
-    Py_ssize_t i;
-    char *hex;
-    static const char hexdigits[] = "0123456789abcdef";
+    if (obj == Py_None)
+	return mxTextTools_Buffer_WriteVarint(buffer, MXTEXTTOOLS_BINARY_NONE);
+    if (PyString_Check(obj))
+	return mxTextTools_Buffer_WriteVarint(buffer, MXTEXTTOOLS_BINARY_STRING) ||
+	    mxTextTools_Buffer_WriteVarint(buffer, PyString_GET_SIZE(obj)) ||
+	    mxTextTools_Buffer_Write(buffer,
+				     PyString_AS_STRING(obj),
+				     PyString_GET_SIZE(obj));
+#ifdef HAVE_UNICODE
+    if (PyUnicode_Check(obj)) {
+	PyObject *utf8 = PyUnicode_AsUTF8String(obj);
+	int rc;
 
-    /* Convert to HEX */
-    w = PyString_FromStringAndSize(NULL,2*len);
-    if (!w)
-	goto onError;
-    hex = PyString_AS_STRING(w);
-    for (i = 0; i < len; i ++) {
-	unsigned char c = (unsigned char)*str;
-	
-	*hex++ = hexdigits[c >> 4];
-	*hex++ = hexdigits[c & 0x0F];
-	str++;
+	if (utf8 == NULL)
+	    return -1;
+	rc = mxTextTools_Buffer_WriteVarint(buffer, MXTEXTTOOLS_BINARY_UNICODE) ||
+	    mxTextTools_Buffer_WriteVarint(buffer, PyString_GET_SIZE(utf8)) ||
+	    mxTextTools_Buffer_Write(buffer,
+				     PyString_AS_STRING(utf8),
+				     PyString_GET_SIZE(utf8));
+	Py_DECREF(utf8);
+	return rc;
     }
-    return w;
+#endif
+    if (PyInt_Check(obj)
+#if PY_MAJOR_VERSION < 3
+	|| PyLong_Check(obj)
+#endif
+	) {
+	Py_ssize_t value = PyInt_AsSsize_t(obj);
 
- onError:
-    Py_XDECREF(w);
-    return NULL;
+	if (value == -1 && PyErr_Occurred())
+	    return -1;
+	return mxTextTools_Buffer_WriteVarint(buffer, MXTEXTTOOLS_BINARY_INT) ||
+	    mxTextTools_Buffer_WriteSigned(buffer, value);
+    }
+    PyErr_Format(PyExc_TypeError,
+		 "can't serialize tagobj of type %.50s",
+		 Py_TYPE(obj)->tp_name);
+    return -1;
 }
 
+/* Write taglist, collecting the tagobjs in tagobjs (a list) and
+   tagids (a dict mapping them to their index) */
+
 static
-PyObject *mxTextTools_StringFromHexString(char *hex,
-					  Py_ssize_t len)
+int mxTextTools_TaglistToBinary(mxTextTools_Buffer *buffer,
+				PyObject *taglist,
+				Py_ssize_t base,
+				PyObject *tagobjs,
+				PyObject *tagids)
 {
-    PyObject *w = 0;
     Py_ssize_t i;
-    char *str;
-    static const char hexdigits[] = "0123456789abcdef";
 
-    /* Convert to string */
-    Py_Assert(len % 2 == 0,
-	      PyExc_TypeError,
-	      "need 2-digit hex string argument");
-    len >>= 1;
-    w = PyString_FromStringAndSize(NULL,len);
-    if (!w)
+    if (Py_EnterRecursiveCall(" while serializing a taglist"))
+	return -1;
+    if (mxTextTools_Buffer_WriteVarint(buffer, PyList_GET_SIZE(taglist)))
 	goto onError;
-    str = PyString_AS_STRING(w);
-    for (i = 0; i < len; i++,str++) {
-	register char c;
-	register Py_ssize_t j;
+    for (i = 0; i < PyList_GET_SIZE(taglist); i++) {
+	PyObject *tagobj, *subtags, *tagid;
+	Py_ssize_t left, right;
 
-	c = tolower(*hex++);
-	for (j = 0; j < (Py_ssize_t)sizeof(hexdigits); j++)
-	  if (c == hexdigits[j]) {
-	    *str = j << 4;
-	    break;
-	  }
-	if (j == sizeof(hexdigits)) {
-	  DPRINTF("Failed: '%c' (%u) at %i\n",c,(unsigned int)c,i);
-	  Py_Error(PyExc_ValueError,
-		   "argument contains non-hex characters");
+	if (mxTextTools_TaglistEntry(PyList_GET_ITEM(taglist, i),
+				     &tagobj, &left, &right, &subtags))
+	    goto onError;
+	tagid = PyDict_GetItem(tagids, tagobj);
+	if (tagid == NULL) {
+	    if (PyErr_Occurred())
+		goto onError;
+	    tagid = PyInt_FromSsize_t(PyList_GET_SIZE(tagobjs));
+	    if (tagid == NULL)
+		goto onError;
+	    if (PyDict_SetItem(tagids, tagobj, tagid) ||
+		PyList_Append(tagobjs, tagobj)) {
+		Py_DECREF(tagid);
+		goto onError;
+	    }
+	    Py_DECREF(tagid);
 	}
-
-	c = tolower(*hex++);
-	for (j = 0; j < (Py_ssize_t)sizeof(hexdigits); j++)
-	  if (c == hexdigits[j]) {
-	    *str += j;
-	    break;
-	  }
-	if (j == sizeof(hexdigits)) {
-	  DPRINTF("Failed2: '%c' (%u) at %i\n",c,(unsigned int)c,i);
-	  Py_Error(PyExc_ValueError,
-		   "argument contains non-hex characters");
+	if (mxTextTools_Buffer_WriteVarint(buffer, PyInt_AsSsize_t(tagid)) ||
+	    mxTextTools_Buffer_WriteSigned(buffer, left - base) ||
+	    mxTextTools_Buffer_WriteSigned(buffer, right - left))
+	    goto onError;
+	if (subtags == Py_None) {
+	    if (mxTextTools_Buffer_WriteVarint(buffer, 0))
+		goto onError;
 	}
+	else if (mxTextTools_Buffer_WriteVarint(buffer, 1) ||
+		 mxTextTools_TaglistToBinary(buffer, subtags, left,
+					     tagobjs, tagids))
+	    goto onError;
+	base = right;
     }
-    return w;
+    Py_LeaveRecursiveCall();
+    return 0;
 
  onError:
-    Py_XDECREF(w);
-    return NULL;
+    Py_LeaveRecursiveCall();
+    return -1;
 }
 
-static 
-int mxTextTools_IsASCII(PyObject *text,
-			Py_ssize_t left,
-			Py_ssize_t right)
+typedef struct {
+    const unsigned char *data;
+    Py_ssize_t pos;
+    Py_ssize_t len;
+    PyObject *tagobjs;
+} mxTextTools_BinaryReader;
+
+static
+int mxTextTools_Binary_ReadVarint(mxTextTools_BinaryReader *reader,
+				  size_t *value)
 {
-    if (PyString_Check(text)) {
-	Py_ssize_t len;
-	register Py_ssize_t i;
-	register unsigned char *str = (unsigned char *)PyString_AS_STRING(text);
+    size_t result = 0;
+    int shift = 0;
 
-	len = PyString_GET_SIZE(text);
-	Py_CheckSequenceSlice(len, left, right);
-	for (i = left; i < right; i++)
-	    if (str[i] >= 128)
-		return 0;
-	return 1;
+    while (1) {
+	unsigned char c;
+
+	if (reader->pos >= reader->len) {
+	    PyErr_SetString(PyExc_ValueError,
+			    "truncated binary taglist data");
+	    return -1;
+	}
+	c = reader->data[reader->pos++];
+	if (shift >= 8 * (int)sizeof(size_t) ||
+	    (shift && ((size_t)(c & 0x7F) >> (8 * sizeof(size_t) - shift)))) {
+	    PyErr_SetString(PyExc_ValueError,
+			    "invalid varint in binary taglist data");
+	    return -1;
+	}
+	result |= (size_t)(c & 0x7F) << shift;
+	if (!(c & 0x80))
+	    break;
+	shift += 7;
     }
+    *value = result;
+    return 0;
+}
 
-#ifdef HAVE_UNICODE
-    else if (PyUnicode_Check(text)) {
-	Py_ssize_t len;
-	register Py_ssize_t i;
-	register Py_UNICODE *str = PyUnicode_AS_UNICODE(text);
+static
+int mxTextTools_Binary_ReadSigned(mxTextTools_BinaryReader *reader,
+				  Py_ssize_t *value)
+{
+    size_t v;
 
-	len = PyUnicode_GET_SIZE(text);
-	Py_CheckSequenceSlice(len, left, right);
-	for (i = left; i < right; i++)
-	    if (str[i] >= 128)
-		return 0;
-	return 1;
+    if (mxTextTools_Binary_ReadVarint(reader, &v))
+	return -1;
+    *value = (v & 1) ? -(Py_ssize_t)(v >> 1) - 1 : (Py_ssize_t)(v >> 1);
+    return 0;
+}
+
+static
+PyObject *mxTextTools_Binary_ReadTagobj(mxTextTools_BinaryReader *reader)
+{
+    size_t kind, len;
+    Py_ssize_t value;
+    PyObject *obj;
+
+    if (mxTextTools_Binary_ReadVarint(reader, &kind))
+	return NULL;
+    switch (kind) {
+    case MXTEXTTOOLS_BINARY_NONE:
+	Py_INCREF(Py_None);
+	return Py_None;
+    case MXTEXTTOOLS_BINARY_INT:
+	if (mxTextTools_Binary_ReadSigned(reader, &value))
+	    return NULL;
+	return PyInt_FromSsize_t(value);
+    case MXTEXTTOOLS_BINARY_UNICODE:
+    case MXTEXTTOOLS_BINARY_STRING:
+	if (mxTextTools_Binary_ReadVarint(reader, &len))
+	    return NULL;
+	if (len > (size_t)(reader->len - reader->pos)) {
+	    PyErr_SetString(PyExc_ValueError,
+			    "truncated binary taglist data");
+	    return NULL;
+	}
+	if (kind == MXTEXTTOOLS_BINARY_STRING)
+	    obj = PyString_FromStringAndSize(
+		(const char *)reader->data + reader->pos, len);
+	else
+	    obj = PyUnicode_DecodeUTF8(
+		(const char *)reader->data + reader->pos, len, NULL);
+	reader->pos += len;
+	return obj;
     }
-#endif
+    PyErr_SetString(PyExc_ValueError,
+		    "unknown tagobj kind in binary taglist data");
+    return NULL;
+}
+
+static
+PyObject *mxTextTools_Binary_ReadTaglist(mxTextTools_BinaryReader *reader,
+					 Py_ssize_t base)
+{
+    PyObject *taglist = NULL;
+    size_t count, i;
+
+    if (Py_EnterRecursiveCall(" while loading a taglist"))
+	return NULL;
+    if (mxTextTools_Binary_ReadVarint(reader, &count))
+	goto onError;
+    /* every entry takes at least 4 bytes */
+    Py_Assert(count <= (size_t)(reader->len - reader->pos) / 4,
+	      PyExc_ValueError,
+	      "truncated binary taglist data");
+    taglist = PyList_New(count);
+    if (taglist == NULL)
+	goto onError;
+    for (i = 0; i < count; i++) {
+	size_t tagid, hassubtags;
+	Py_ssize_t left, length;
+	PyObject *tagobj, *subtags, *entry;
+
+	if (mxTextTools_Binary_ReadVarint(reader, &tagid) ||
+	    mxTextTools_Binary_ReadSigned(reader, &left) ||
+	    mxTextTools_Binary_ReadSigned(reader, &length) ||
+	    mxTextTools_Binary_ReadVarint(reader, &hassubtags))
+	    goto onError;
+	Py_Assert(tagid < (size_t)PyList_GET_SIZE(reader->tagobjs),
+		  PyExc_ValueError,
+		  "invalid tagobj index in binary taglist data");
+	left += base;
+	if (hassubtags) {
+	    subtags = mxTextTools_Binary_ReadTaglist(reader, left);
+	    if (subtags == NULL)
+		goto onError;
+	}
+	else {
+	    Py_INCREF(Py_None);
+	    subtags = Py_None;
+	}
+	tagobj = PyList_GET_ITEM(reader->tagobjs, tagid);
+	Py_INCREF(tagobj);
+	entry = Py_BuildValue("NnnN", tagobj, left, left + length, subtags);
+	if (entry == NULL)
+	    goto onError;
+	PyList_SET_ITEM(taglist, i, entry);
+	base = left + length;
+    }
+    Py_LeaveRecursiveCall();
+    return taglist;
 
-    else
-	Py_Error(PyExc_TypeError,
-		 "need string object");
-    
  onError:
-    return -1;
+    Py_LeaveRecursiveCall();
+    Py_XDECREF(taglist);
+    return NULL;
 }
 
 /* Takes a list of tuples (replacement,l,r,...) and produces a taglist
@@ -4347,48 +8236,24 @@ PyObject *mxTextTools_UnicodeLower(PyObject *text)
 
 /* Interface to the tagging engine in mxte.c */
 
-Py_C_Function_WithKeywords( 
-               mxTextTools_tag,
-	       "tag(text,tagtable,sliceleft=0,sliceright=len(text),taglist=[],context=None) \n"""
-	       "Produce a tag list for a string, given a tag-table\n"
-	       "- returns a tuple (success, taglist, nextindex)\n"
-	       "- if taglist == None, then no taglist is created"
-	       )
+/* Compile tagtable if needed and run the matching Tagging Engine
+   for text; returns the engine's result code (0 for errors) */
+
+static
+int mxTextTools_RunEngine(PyObject *text,
+			  PyObject *tagtable,
+			  Py_ssize_t sliceleft,
+			  Py_ssize_t sliceright,
+			  PyObject *taglist,
+			  PyObject *context,
+			  mxTextTools_Columns *columns,
+			  mxTextTools_Limits *limits,
+			  mxTextTools_Heatmap *heatmap,
+			  PyObject *consume,
+			  Py_ssize_t *next)
 {
-    PyObject *text;
-    PyObject *tagtable;
-    Py_ssize_t sliceright = INT_MAX;
-    Py_ssize_t sliceleft = 0;
-    PyObject *taglist = 0;
-    Py_ssize_t taglist_len;
-    PyObject *context = 0;
-    Py_ssize_t next, result;
-    PyObject *res;
-    
-    Py_KeywordsGet6Args("OO|iiOO:tag",
-			text,tagtable,sliceleft,sliceright,taglist,context);
+    int result;
 
-    if (taglist == NULL) { 
-	/* not given, so use default: an empty list */
-	taglist = PyList_New(0);
-	if (taglist == NULL)
-	    goto onError;
-	taglist_len = 0;
-    }
-    else {
-	Py_INCREF(taglist);
-	Py_Assert(PyList_Check(taglist) || taglist == Py_None,
-		  PyExc_TypeError,
-		  "taglist must be a list or None");
-	if (taglist != Py_None) {
-	    taglist_len = PyList_Size(taglist);
-	    if (taglist_len < 0)
-		goto onError;
-	}
-	else
-	    taglist_len = 0;
-    }
-    
     Py_Assert(mxTagTable_Check(tagtable) ||
 	      PyTuple_Check(tagtable) ||
 	      PyList_Check(tagtable),
@@ -4420,7 +8285,11 @@ Py_C_Function_WithKeywords(
 					   (mxTagTableObject *)tagtable,
 					   taglist,
 					   context,
-					   &next);
+					   columns,
+					   limits,
+					   heatmap,
+					   consume,
+					   next);
 	Py_DECREF(tagtable);
 
     }
@@ -4448,7 +8317,11 @@ Py_C_Function_WithKeywords(
 						  (mxTagTableObject *)tagtable,
 						  taglist,
 						  context,
-						  &next);
+						  columns,
+						  limits,
+						  heatmap,
+						  consume,
+						  next);
 	Py_DECREF(tagtable);
 
     }
@@ -4457,6 +8330,127 @@ Py_C_Function_WithKeywords(
 	Py_Error(PyExc_TypeError,
 		 "text must be a string or unicode");
 
+    return result;
+
+ onError:
+    return 0;
+}
+
+Py_C_Function_WithKeywords( 
+               mxTextTools_tag,
+	       "tag(text,tagtable,sliceleft=0,sliceright=len(text),taglist=[],context=None,\n"
+	       "    max_results=0,max_depth=0,max_result_bytes=0,max_steps=0,deadline=None,\n"
+	       "    consume=None,intern_matches=0) \n"""
+	       "Produce a tag list for a string, given a tag-table\n"
+	       "- returns a tuple (success, taglist, nextindex)\n"
+	       "- if taglist == None, then no taglist is created\n"
+	       "- LimitError is raised if more than max_results results\n"
+	       "  (or max_result_bytes bytes of them) are created, tables\n"
+	       "  nest deeper than max_depth or more than max_steps table\n"
+	       "  entries are executed, 0 meaning no limit, or when\n"
+	       "  time.monotonic() reaches deadline\n"
+	       "- consume maps tagobjs to handlers: results with those tagobjs\n"
+	       "  are passed to handler(result, text) and removed from taglist\n"
+	       "  as soon as they are top-level results and the top-level\n"
+	       "  table has moved on\n"
+	       "- identical AppendMatch results of up to intern_matches\n"
+	       "  characters share one string, 0 meaning none"
+	       )
+{
+    static char *kwslist[] = {"text", "tagtable", "sliceleft", "sliceright",
+			      "taglist", "context", "max_results", "max_depth",
+			      "max_result_bytes", "max_steps", "deadline", "consume",
+			      "intern_matches", NULL};
+    PyObject *text;
+    PyObject *tagtable;
+    Py_ssize_t sliceright = INT_MAX;
+    Py_ssize_t sliceleft = 0;
+    PyObject *taglist = 0;
+    Py_ssize_t taglist_len;
+    PyObject *context = 0;
+    Py_ssize_t max_results = 0;
+    Py_ssize_t max_depth = 0;
+    Py_ssize_t max_result_bytes = 0;
+    Py_ssize_t max_steps = 0;
+    PyObject *deadline = NULL;
+    PyObject *consume = NULL;
+    Py_ssize_t intern_matches = 0;
+    mxTextTools_Limits limits;
+    Py_ssize_t next, result;
+    PyObject *res;
+    
+    memset(&limits, 0, sizeof(limits));
+    if (!PyArg_ParseTupleAndKeywords(args, kws, "OO|iiOOnnnnOOn:tag", kwslist,
+				     &text, &tagtable, &sliceleft, &sliceright,
+				     &taglist, &context,
+				     &max_results, &max_depth, &max_result_bytes,
+				     &max_steps, &deadline, &consume,
+				     &intern_matches))
+	return NULL;
+
+    if (taglist == NULL) { 
+	/* not given, so use default: an empty list */
+	taglist = PyList_New(0);
+	if (taglist == NULL)
+	    goto onError;
+	taglist_len = 0;
+    }
+    else {
+	Py_INCREF(taglist);
+	Py_Assert(PyList_Check(taglist) || taglist == Py_None,
+		  PyExc_TypeError,
+		  "taglist must be a list or None");
+	if (taglist != Py_None) {
+	    taglist_len = PyList_Size(taglist);
+	    if (taglist_len < 0)
+		goto onError;
+	}
+	else
+	    taglist_len = 0;
+    }
+    if (consume == Py_None)
+	consume = NULL;
+    Py_Assert(consume == NULL || PyDict_Check(consume),
+	      PyExc_TypeError,
+	      "consume must be a dictionary or None");
+    limits.max_results = max_results;
+    limits.max_depth = max_depth;
+    limits.max_result_bytes = max_result_bytes;
+    limits.max_steps = max_steps;
+    limits.intern_matches = intern_matches;
+    if (deadline != NULL && deadline != Py_None) {
+	/* time.monotonic() is only available in Python 3 */
+	PyObject *timemodule = PyImport_ImportModule("time");
+
+	if (timemodule == NULL)
+	    goto onError;
+	limits.clock = PyObject_GetAttrString(timemodule, "monotonic");
+	if (limits.clock == NULL) {
+	    PyErr_Clear();
+	    limits.clock = PyObject_GetAttrString(timemodule, "time");
+	}
+	Py_DECREF(timemodule);
+	if (limits.clock == NULL)
+	    goto onError;
+	limits.deadline = deadline;
+    }
+
+    result = mxTextTools_RunEngine(text,
+				   tagtable,
+				   sliceleft,
+				   sliceright,
+				   taglist,
+				   context,
+				   NULL,
+				   (max_results > 0 || max_depth > 0 ||
+				    max_result_bytes > 0 || max_steps > 0 ||
+				    intern_matches > 0 ||
+				    limits.clock != NULL) ? &limits : NULL,
+				   NULL,
+				   consume,
+				   &next);
+    Py_CLEAR(limits.clock);
+
     /* Check for exceptions during matching */
     if (result == 0)
 	goto onError;
@@ -4489,10 +8483,421 @@ Py_C_Function_WithKeywords(
     if (!PyErr_Occurred())
 	Py_Error(PyExc_SystemError,
 		 "NULL result without error in builtin tag()");
+    Py_XDECREF(limits.clock);
     Py_XDECREF(taglist);
     return NULL;
 }
 
+/* Columnar results for the Tagging Engine */
+
+int mxTextTools_Columns_Append(mxTextTools_Columns *columns,
+			       PyObject *tagobj,
+			       Py_ssize_t left,
+			       Py_ssize_t right,
+			       Py_ssize_t depth)
+{
+    PyObject *tagid;
+    Py_ssize_t row = columns->length;
+
+    if (row == columns->allocated) {
+	Py_ssize_t allocated = columns->allocated ? 2 * columns->allocated : 256;
+	Py_ssize_t **field;
+	Py_ssize_t *fields[4];
+	int i;
+
+	fields[0] = columns->tag;
+	fields[1] = columns->left;
+	fields[2] = columns->right;
+	fields[3] = columns->depth;
+	for (i = 0; i < 4; i++) {
+	    Py_ssize_t *resized;
+	    resized = (Py_ssize_t *)PyMem_Realloc(fields[i],
+						  allocated * sizeof(Py_ssize_t));
+	    if (resized == NULL) {
+		PyErr_NoMemory();
+		return -1;
+	    }
+	    switch (i) {
+	    case 0: field = &columns->tag; break;
+	    case 1: field = &columns->left; break;
+	    case 2: field = &columns->right; break;
+	    default: field = &columns->depth; break;
+	    }
+	    *field = resized;
+	}
+	columns->allocated = allocated;
+    }
+
+    /* tagobjs are interned in the tags list, so that each row only
+       needs to store an index */
+    tagid = PyDict_GetItem(columns->tagids, tagobj);
+    if (tagid == NULL) {
+	if (PyErr_Occurred())
+	    return -1;
+	tagid = PyInt_FromSsize_t(PyList_GET_SIZE(columns->tags));
+	if (tagid == NULL)
+	    return -1;
+	if (PyDict_SetItem(columns->tagids, tagobj, tagid) ||
+	    PyList_Append(columns->tags, tagobj)) {
+	    Py_DECREF(tagid);
+	    return -1;
+	}
+	Py_DECREF(tagid);
+    }
+
+    columns->tag[row] = PyInt_AsSsize_t(tagid);
+    columns->left[row] = left;
+    columns->right[row] = right;
+    columns->depth[row] = depth;
+    columns->length = row + 1;
+    return 0;
+}
+
+static
+PyObject *mxTextTools_Columns_AsString(Py_ssize_t *field,
+				       Py_ssize_t length)
+{
+    if (length == 0)
+	return PyString_FromStringAndSize(NULL, 0);
+    return PyString_FromStringAndSize((char *)field,
+				      length * sizeof(Py_ssize_t));
+}
+
+Py_C_Function_WithKeywords( 
+               mxTextTools_tagcolumns,
+	       "tagcolumns(text,tagtable,sliceleft=0,sliceright=len(text)) \n"""
+	       "Produce columnar results for a string, given a tag-table\n"
+	       "- returns a tuple (success, columns, nextindex) where columns\n"
+	       "  is (tags, tag, left, right, depth, parent), tags being the list\n"
+	       "  of distinct tagobjs and the others strings holding one native\n"
+	       "  Py_ssize_t per row, rows being in post-order (children first)\n"
+	       "  with parent -1 for top-level rows"
+	       )
+{
+    PyObject *text;
+    PyObject *tagtable;
+    Py_ssize_t sliceright = INT_MAX;
+    Py_ssize_t sliceleft = 0;
+    PyObject *taglist = NULL;
+    Py_ssize_t next, result, row;
+    Py_ssize_t *parent = NULL;
+    Py_ssize_t *lastAtDepth = NULL;
+    Py_ssize_t maxDepth = 0;
+    mxTextTools_Columns columns;
+    PyObject *res = NULL;
+
+    memset(&columns, 0, sizeof(columns));
+
+    Py_KeywordsGet4Args("OO|nn:tagcolumns",
+			text,tagtable,sliceleft,sliceright);
+
+    /* the engine still wants a list for results of flagged entries,
+       those are not reported */
+    taglist = PyList_New(0);
+    columns.tags = PyList_New(0);
+    columns.tagids = PyDict_New();
+    if (taglist == NULL || columns.tags == NULL || columns.tagids == NULL)
+	goto onError;
+
+    result = mxTextTools_RunEngine(text,
+				   tagtable,
+				   sliceleft,
+				   sliceright,
+				   taglist,
+				   NULL,
+				   &columns,
+				   NULL,
+				   NULL,
+				   NULL,
+				   &next);
+    if (result == 0)
+	goto onError;
+    if (result == 1)
+	columns.length = 0;
+
+    /* Rows are in post-order, so a row's parent is the next row one
+       level up; scan backwards remembering the last row per depth */
+    for (row = 0; row < columns.length; row++)
+	if (columns.depth[row] > maxDepth)
+	    maxDepth = columns.depth[row];
+    if (columns.length) {
+	parent = (Py_ssize_t *)PyMem_Malloc(columns.length * sizeof(Py_ssize_t));
+	lastAtDepth = (Py_ssize_t *)PyMem_Malloc((maxDepth + 1) * sizeof(Py_ssize_t));
+	if (parent == NULL || lastAtDepth == NULL) {
+	    PyErr_NoMemory();
+	    goto onError;
+	}
+    }
+    for (row = columns.length - 1; row >= 0; row--) {
+	Py_ssize_t depth = columns.depth[row];
+	parent[row] = depth ? lastAtDepth[depth - 1] : -1;
+	lastAtDepth[depth] = row;
+    }
+
+    res = Py_BuildValue("n(ONNNNN)n",
+			result - 1,
+			columns.tags,
+			mxTextTools_Columns_AsString(columns.tag, columns.length),
+			mxTextTools_Columns_AsString(columns.left, columns.length),
+			mxTextTools_Columns_AsString(columns.right, columns.length),
+			mxTextTools_Columns_AsString(columns.depth, columns.length),
+			mxTextTools_Columns_AsString(parent, columns.length),
+			next);
+
+ onError:
+    Py_XDECREF(taglist);
+    Py_XDECREF(columns.tags);
+    Py_XDECREF(columns.tagids);
+    PyMem_Free(columns.tag);
+    PyMem_Free(columns.left);
+    PyMem_Free(columns.right);
+    PyMem_Free(columns.depth);
+    PyMem_Free(parent);
+    PyMem_Free(lastAtDepth);
+    return res;
+}
+
+/* Backtracking heatmap for the Tagging Engine */
+
+/* Return the cell for (key1, key2) in table, adding an empty one if
+   needed; NULL (with an exception set) on error */
+
+static
+mxTextTools_HeatmapCell *mxTextTools_HeatmapTable_Cell(mxTextTools_HeatmapTable *table,
+						       Py_ssize_t key1,
+						       Py_ssize_t key2,
+						       int *added)
+{
+    mxTextTools_HeatmapCell *cell;
+    size_t mask, i;
+
+    /* keep the table at most half full */
+    if (2 * (table->used + 1) > table->allocated) {
+	Py_ssize_t allocated = table->allocated ? 2 * table->allocated : 256;
+	mxTextTools_HeatmapCell *cells;
+	Py_ssize_t j;
+
+	cells = (mxTextTools_HeatmapCell *)PyMem_Malloc(
+	    allocated * sizeof(mxTextTools_HeatmapCell));
+	if (cells == NULL) {
+	    PyErr_NoMemory();
+	    return NULL;
+	}
+	for (j = 0; j < allocated; j++)
+	    cells[j].key1 = PY_SSIZE_T_MIN;
+	mask = (size_t)allocated - 1;
+	for (j = 0; j < table->allocated; j++) {
+	    cell = table->cells + j;
+	    if (cell->key1 == PY_SSIZE_T_MIN)
+		continue;
+	    i = ((size_t)cell->key1 * 1000003U ^ (size_t)cell->key2) * 2654435761U;
+	    while (cells[i & mask].key1 != PY_SSIZE_T_MIN)
+		i++;
+	    cells[i & mask] = *cell;
+	}
+	PyMem_Free(table->cells);
+	table->cells = cells;
+	table->allocated = allocated;
+    }
+
+    /* open addressing with linear probing */
+    mask = (size_t)table->allocated - 1;
+    i = ((size_t)key1 * 1000003U ^ (size_t)key2) * 2654435761U;
+    for (;; i++) {
+	cell = table->cells + (i & mask);
+	if (cell->key1 == key1 && cell->key2 == key2) {
+	    *added = 0;
+	    return cell;
+	}
+	if (cell->key1 == PY_SSIZE_T_MIN)
+	    break;
+    }
+    cell->key1 = key1;
+    cell->key2 = key2;
+    cell->failed = 0;
+    cell->reentries = 0;
+    table->used++;
+    *added = 1;
+    return cell;
+}
+
+int mxTextTools_Heatmap_Failed(mxTextTools_Heatmap *heatmap,
+			       Py_ssize_t production,
+			       Py_ssize_t position,
+			       Py_ssize_t length)
+{
+    mxTextTools_HeatmapCell *cell;
+    int added;
+
+    cell = mxTextTools_HeatmapTable_Cell(&heatmap->cells,
+					 position / heatmap->bucketsize,
+					 production,
+					 &added);
+    if (cell == NULL)
+	return -1;
+    cell->failed += length;
+    return 0;
+}
+
+int mxTextTools_Heatmap_Enter(mxTextTools_Heatmap *heatmap,
+			      int command,
+			      PyObject *match,
+			      PyObject *tagobj,
+			      Py_ssize_t position,
+			      Py_ssize_t *entered)
+{
+    mxTextTools_HeatmapCell *cell;
+    Py_ssize_t production;
+    int added;
+
+    if ((command == MATCH_TABLEINLIST || command == MATCH_SUBTABLEINLIST) &&
+	PyTuple_GET_ITEM(match, 0) == heatmap->tablelist)
+	production = PyInt_AsSsize_t(PyTuple_GET_ITEM(match, 1));
+    else if (heatmap->productions != NULL && tagobj != Py_None) {
+	PyObject *value = PyDict_GetItem(heatmap->productions, tagobj);
+
+	if (value == NULL)
+	    return PyErr_Occurred() ? -1 : 0;
+	production = PyInt_AsSsize_t(value);
+    }
+    else
+	return 0;
+    if (production == -1 && PyErr_Occurred())
+	return -1;
+    *entered = production;
+
+    if (mxTextTools_HeatmapTable_Cell(&heatmap->entered,
+				      production,
+				      position,
+				      &added) == NULL)
+	return -1;
+    if (added)
+	return 0;
+    cell = mxTextTools_HeatmapTable_Cell(&heatmap->cells,
+					 position / heatmap->bucketsize,
+					 production,
+					 &added);
+    if (cell == NULL)
+	return -1;
+    cell->reentries++;
+    return 0;
+}
+
+Py_C_Function_WithKeywords( 
+               mxTextTools_tagheatmap,
+	       "tagheatmap(text,tagtable,sliceleft=0,sliceright=len(text),tablelist=None,\n"
+	       "           productions=None,bucketsize=1024) \n"""
+	       "Produce a tag list for a string, given a tag-table, recording\n"
+	       "where the tagging engine backtracks\n"
+	       "- returns a tuple (success, taglist, nextindex, heatmap) where\n"
+	       "  heatmap is (bucketsize, bucket, production, failed, reentries),\n"
+	       "  the last four being strings holding one native Py_ssize_t per\n"
+	       "  cell: the characters matched by attempts of the production\n"
+	       "  starting in the bucket which then failed, and how often the\n"
+	       "  production was entered again at a position in the bucket\n"
+	       "  it had been tried at before\n"
+	       "- productions are entered via TableInList/SubTableInList\n"
+	       "  entries referring to tablelist, with the index into it, and\n"
+	       "  via table entries whose tagobj is a key of the productions\n"
+	       "  dictionary, with the value for it; -1 is reported for\n"
+	       "  everything outside of productions"
+	       )
+{
+    static char *kwslist[] = {"text", "tagtable", "sliceleft", "sliceright",
+			      "tablelist", "productions", "bucketsize", NULL};
+    PyObject *text;
+    PyObject *tagtable;
+    Py_ssize_t sliceright = INT_MAX;
+    Py_ssize_t sliceleft = 0;
+    PyObject *tablelist = NULL;
+    PyObject *productions = NULL;
+    Py_ssize_t bucketsize = 1024;
+    PyObject *taglist = NULL;
+    Py_ssize_t next, result, i, cell;
+    Py_ssize_t *fields[4] = {NULL, NULL, NULL, NULL};
+    mxTextTools_Heatmap heatmap;
+    PyObject *res = NULL;
+
+    memset(&heatmap, 0, sizeof(heatmap));
+    if (!PyArg_ParseTupleAndKeywords(args, kws, "OO|nnOOn:tagheatmap", kwslist,
+				     &text, &tagtable, &sliceleft, &sliceright,
+				     &tablelist, &productions, &bucketsize))
+	goto onError;
+    Py_Assert(bucketsize > 0,
+	      PyExc_ValueError,
+	      "bucketsize must be positive");
+    heatmap.bucketsize = bucketsize;
+    if (tablelist != NULL && tablelist != Py_None)
+	heatmap.tablelist = tablelist;
+    if (productions != NULL && productions != Py_None) {
+	Py_Assert(PyDict_Check(productions),
+		  PyExc_TypeError,
+		  "productions must be a dictionary");
+	heatmap.productions = productions;
+    }
+
+    taglist = PyList_New(0);
+    if (taglist == NULL)
+	goto onError;
+
+    result = mxTextTools_RunEngine(text,
+				   tagtable,
+				   sliceleft,
+				   sliceright,
+				   taglist,
+				   NULL,
+				   NULL,
+				   NULL,
+				   &heatmap,
+				   NULL,
+				   &next);
+    if (result == 0)
+	goto onError;
+    if (result == 1 && PyList_SetSlice(taglist, 0, PyList_GET_SIZE(taglist), NULL))
+	goto onError;
+
+    /* Flatten the cells into columns */
+    if (heatmap.cells.used) {
+	for (i = 0; i < 4; i++) {
+	    fields[i] = (Py_ssize_t *)PyMem_Malloc(
+		heatmap.cells.used * sizeof(Py_ssize_t));
+	    if (fields[i] == NULL) {
+		PyErr_NoMemory();
+		goto onError;
+	    }
+	}
+    }
+    for (i = 0, cell = 0; i < heatmap.cells.allocated; i++) {
+	mxTextTools_HeatmapCell *c = heatmap.cells.cells + i;
+
+	if (c->key1 == PY_SSIZE_T_MIN)
+	    continue;
+	fields[0][cell] = c->key1;
+	fields[1][cell] = c->key2;
+	fields[2][cell] = c->failed;
+	fields[3][cell] = c->reentries;
+	cell++;
+    }
+
+    res = Py_BuildValue("nOn(nNNNN)",
+			result - 1,
+			taglist,
+			next,
+			bucketsize,
+			mxTextTools_Columns_AsString(fields[0], heatmap.cells.used),
+			mxTextTools_Columns_AsString(fields[1], heatmap.cells.used),
+			mxTextTools_Columns_AsString(fields[2], heatmap.cells.used),
+			mxTextTools_Columns_AsString(fields[3], heatmap.cells.used));
+
+ onError:
+    Py_XDECREF(taglist);
+    PyMem_Free(heatmap.cells.cells);
+    PyMem_Free(heatmap.entered.cells);
+    for (i = 0; i < 4; i++)
+	PyMem_Free(fields[i]);
+    return res;
+}
+
 /* An extended version of string.join() for taglists: */
 
 Py_C_Function( mxTextTools_join,
@@ -4607,6 +9012,258 @@ Py_C_Function( mxTextTools_joinlist,
     return NULL;
 }
 
+Py_C_Function( mxTextTools_shifttaglist,
+	       "shifttaglist(taglist,delta)\n\n"
+	       "Returns a copy of taglist (as produced by tag()) with\n"
+	       "the slices of all entries and their subtags moved by delta"
+)
+{
+    PyObject *taglist;
+    Py_ssize_t delta;
+
+    Py_Get2Args("On:shifttaglist",taglist,delta);
+
+    return mxTextTools_ShiftTaglist(taglist, delta);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTextTools_taglist2json,
+	       "taglist2json(taglist,text=None)\n\n"
+	       "Serialize taglist (as produced by tag()) to JSON, returned\n"
+	       "as UTF-8 encoded string. Each entry (tagobj,l,r,subtags)\n"
+	       "becomes an array [tagobj,l,r,subtags], subtags being an\n"
+	       "array or null; if text is given, text[l:r] is appended\n"
+	       "to each of them. tagobjs must be strings, integers or\n"
+	       "None, 8-bit strings are written as Latin-1."
+)
+{
+    PyObject *taglist;
+    PyObject *text = NULL;
+    mxTextTools_Buffer buffer;
+    PyObject *result = NULL;
+
+    memset(&buffer, 0, sizeof(buffer));
+    Py_Get2Args("O|O:taglist2json",taglist,text);
+    Py_Assert(PyList_Check(taglist),
+	      PyExc_TypeError,
+	      "taglist must be a list");
+    if (text == Py_None)
+	text = NULL;
+
+    if (mxTextTools_TaglistToJSON(&buffer, taglist, text))
+	goto onError;
+    result = PyString_FromStringAndSize(buffer.data, buffer.len);
+
+ onError:
+    PyMem_Free(buffer.data);
+    return result;
+}
+
+Py_C_Function( mxTextTools_json2taglist,
+	       "json2taglist(data)\n\n"
+	       "Rebuild a taglist from the JSON produced by taglist2json(),\n"
+	       "data can be a string or Unicode. Matched text included in\n"
+	       "the data is skipped."
+)
+{
+    PyObject *data;
+    PyObject *utf8 = NULL;
+    PyObject *taglist = NULL;
+    mxTextTools_JSONReader reader;
+    int i;
+
+    memset(&reader, 0, sizeof(reader));
+    Py_GetArg("O:json2taglist",data);
+#ifdef HAVE_UNICODE
+    if (PyUnicode_Check(data)) {
+	utf8 = PyUnicode_AsUTF8String(data);
+	if (utf8 == NULL)
+	    goto onError;
+	data = utf8;
+    }
+#endif
+    Py_Assert(PyString_Check(data),
+	      PyExc_TypeError,
+	      "data must be a string or unicode");
+    reader.data = (const unsigned char *)PyString_AS_STRING(data);
+    reader.len = PyString_GET_SIZE(data);
+
+    taglist = mxTextTools_JSON_ReadTaglist(&reader);
+    if (taglist != NULL && mxTextTools_JSON_Peek(&reader) != 0) {
+	Py_CLEAR(taglist);
+	mxTextTools_JSON_Invalid(&reader);
+    }
+
+ onError:
+    Py_XDECREF(utf8);
+    PyMem_Free(reader.string.data);
+    for (i = 0; i < MXTEXTTOOLS_JSON_CACHESIZE; i++)
+	Py_XDECREF(reader.cache[i].obj);
+    return taglist;
+}
+
+Py_C_Function( mxTextTools_taglist2bin,
+	       "taglist2bin(taglist)\n\n"
+	       "Serialize taglist (as produced by tag()) to a compact\n"
+	       "binary string: the distinct tagobjs are stored once, the\n"
+	       "slices as varints relative to the previous entry's end.\n"
+	       "tagobjs must be strings, integers or None."
+)
+{
+    PyObject *taglist;
+    PyObject *tagobjs = NULL;
+    PyObject *tagids = NULL;
+    mxTextTools_Buffer body, header;
+    PyObject *result = NULL;
+    Py_ssize_t i;
+
+    memset(&body, 0, sizeof(body));
+    memset(&header, 0, sizeof(header));
+    Py_GetArg("O:taglist2bin",taglist);
+    Py_Assert(PyList_Check(taglist),
+	      PyExc_TypeError,
+	      "taglist must be a list");
+    tagobjs = PyList_New(0);
+    tagids = PyDict_New();
+    if (tagobjs == NULL || tagids == NULL)
+	goto onError;
+
+    /* the tagobjs are only known once the taglist has been written */
+    if (mxTextTools_TaglistToBinary(&body, taglist, 0, tagobjs, tagids))
+	goto onError;
+    if (mxTextTools_Buffer_Write(&header, MXTEXTTOOLS_BINARY_MAGIC, 4) ||
+	mxTextTools_Buffer_WriteVarint(&header, PyList_GET_SIZE(tagobjs)))
+	goto onError;
+    for (i = 0; i < PyList_GET_SIZE(tagobjs); i++)
+	if (mxTextTools_Binary_WriteTagobj(&header, PyList_GET_ITEM(tagobjs, i)))
+	    goto onError;
+
+    result = PyString_FromStringAndSize(NULL, header.len + body.len);
+    if (result == NULL)
+	goto onError;
+    memcpy(PyString_AS_STRING(result), header.data, header.len);
+    memcpy(PyString_AS_STRING(result) + header.len, body.data, body.len);
+
+ onError:
+    Py_XDECREF(tagobjs);
+    Py_XDECREF(tagids);
+    PyMem_Free(body.data);
+    PyMem_Free(header.data);
+    return result;
+}
+
+Py_C_Function( mxTextTools_bin2taglist,
+	       "bin2taglist(data)\n\n"
+	       "Rebuild a taglist from the binary string produced by\n"
+	       "taglist2bin()."
+)
+{
+    char *data;
+    Py_ssize_t len;
+    size_t count, i;
+    mxTextTools_BinaryReader reader;
+    PyObject *taglist = NULL;
+
+    memset(&reader, 0, sizeof(reader));
+    Py_Get2Args("s#:bin2taglist",data,len);
+    Py_Assert(len >= 4 && memcmp(data, MXTEXTTOOLS_BINARY_MAGIC, 4) == 0,
+	      PyExc_ValueError,
+	      "not binary taglist data");
+    reader.data = (const unsigned char *)data;
+    reader.pos = 4;
+    reader.len = len;
+
+    if (mxTextTools_Binary_ReadVarint(&reader, &count))
+	goto onError;
+    Py_Assert(count <= (size_t)(reader.len - reader.pos),
+	      PyExc_ValueError,
+	      "truncated binary taglist data");
+    reader.tagobjs = PyList_New(count);
+    if (reader.tagobjs == NULL)
+	goto onError;
+    for (i = 0; i < count; i++) {
+	PyObject *tagobj = mxTextTools_Binary_ReadTagobj(&reader);
+
+	if (tagobj == NULL)
+	    goto onError;
+	PyList_SET_ITEM(reader.tagobjs, i, tagobj);
+    }
+
+    taglist = mxTextTools_Binary_ReadTaglist(&reader, 0);
+    if (taglist != NULL && reader.pos != reader.len) {
+	Py_CLEAR(taglist);
+	PyErr_SetString(PyExc_ValueError,
+			"trailing data after binary taglist");
+    }
+
+ onError:
+    Py_XDECREF(reader.tagobjs);
+    return taglist;
+}
+
+Py_C_Function( mxTextTools_linktables,
+	       "linktables(tablelist,unicode=0)\n\n"
+	       "Compiles the tag table definitions in tablelist in place\n"
+	       "and links the TableInList|SubTableInList entries which\n"
+	       "refer to them directly to the compiled tables.\n"
+	       "Definitions which can't be compiled for the table type\n"
+	       "(TypeError) are left in the list as they are"
+)
+{
+    PyObject *tablelist;
+    int unicode = 0;
+    int tabletype;
+    Py_ssize_t i;
+
+    Py_Get2Args("O|i:linktables",tablelist,unicode);
+    Py_Assert(PyList_Check(tablelist),
+	      PyExc_TypeError,
+	      "tablelist must be a list");
+    tabletype = unicode ? MXTAGTABLE_UNICODETYPE : MXTAGTABLE_STRINGTYPE;
+
+    /* Compile every table once; the tables may reference each
+       other, so linking has to wait until all are compiled */
+    for (i = 0; i < PyList_GET_SIZE(tablelist); i++) {
+	PyObject *definition = PyList_GET_ITEM(tablelist, i);
+	PyObject *compiled;
+
+	if (mxTagTable_Check(definition)) {
+	    if (mxTagTable_Type(definition) == tabletype)
+		continue;
+	    definition = mxTagTable_Definition(definition);
+	    Py_AssertWithArg(definition != NULL,
+			     PyExc_TypeError,
+			     "table %d in list was compiled for another "
+			     "text type without keeping its definition",
+			     (unsigned int)i);
+	}
+	compiled = mxTagTable_New(definition, tabletype, 1);
+	if (compiled == NULL) {
+	    /* e.g. Unicode arguments without an 8-bit form: leave the
+	       table to be compiled for the text it is used on */
+	    if (!PyErr_ExceptionMatches(PyExc_TypeError))
+		goto onError;
+	    PyErr_Clear();
+	    continue;
+	}
+	if (PyList_SetItem(tablelist, i, compiled))
+	    goto onError;
+    }
+    for (i = 0; i < PyList_GET_SIZE(tablelist); i++) {
+	PyObject *table = PyList_GET_ITEM(tablelist, i);
+
+	if (mxTagTable_Check(table) && mxTagTable_Type(table) == tabletype)
+	    tc_link_table((mxTagTableObject *)table);
+    }
+
+    Py_ReturnNone();
+
+ onError:
+    return NULL;
+}
+
 Py_C_Function( mxTextTools_charsplit,
 	       "charsplit(text,char,start=0,stop=len(text))\n\n"
 	       "Split text[start:stop] into substrings at char and\n"
@@ -4627,6 +9284,29 @@ Py_C_Function( mxTextTools_charsplit,
     return NULL;
 }
 
+Py_C_Function_WithKeywords( mxTextTools_itercharsplit,
+	       "itercharsplit(text,separator,start=0,stop=len(text),offsets=0)\n\n"
+	       "Return an iterator over the substrings of text[start:stop]\n"
+	       "between the separator characters, like charsplit(); text\n"
+	       "may also be an mmap or memoryview. With offsets true,\n"
+	       "(l,r) slices are returned instead of substrings."
+)
+{
+    PyObject *text, *separator;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = INT_MAX;
+    int offsets = 0;
+
+    Py_KeywordsGet5Args("OO|nni:itercharsplit",
+			text,separator,start,stop,offsets);
+
+    return mxSplitIterator_New(text, start, stop,
+			       MXSPLIT_CHAR, separator, offsets);
+
+ onError:
+    return NULL;
+}
+
 Py_C_Function( mxTextTools_splitat,
 	       "splitat(text,char,nth=1,start=0,stop=len(text))\n\n"
 	       "Split text[start:stop] into two substrings at the nth\n"
@@ -4838,6 +9518,51 @@ Py_C_Function( mxTextTools_setsplit,
     return NULL;
 }
 
+Py_C_Function_WithKeywords( mxTextTools_itersetsplit,
+	       "itersetsplit(text,set,start=0,stop=len(text),offsets=0)\n\n"
+	       "Iterator version of setsplit(); text may also be an mmap\n"
+	       "or memoryview. With offsets true, (l,r) slices are\n"
+	       "returned instead of substrings."
+	       )
+{
+    PyObject *text, *set;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = INT_MAX;
+    int offsets = 0;
+
+    Py_KeywordsGet5Args("OO|nni:itersetsplit",
+			text,set,start,stop,offsets);
+
+    return mxSplitIterator_New(text, start, stop,
+			       MXSPLIT_SET, set, offsets);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function_WithKeywords( mxTextTools_itersplitlines,
+	       "itersplitlines(text,start=0,stop=len(text),offsets=0)\n\n"
+	       "Return an iterator over the lines of text[start:stop],\n"
+	       "splitting like splitlines() does; text may also be an\n"
+	       "mmap or memoryview. With offsets true, (l,r) slices are\n"
+	       "returned instead of the lines."
+	       )
+{
+    PyObject *text;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = INT_MAX;
+    int offsets = 0;
+
+    Py_KeywordsGet4Args("O|nni:itersplitlines",
+			text,start,stop,offsets);
+
+    return mxSplitIterator_New(text, start, stop,
+			       MXSPLIT_LINES, NULL, offsets);
+
+ onError:
+    return NULL;
+}
+
 Py_C_Function( mxTextTools_setsplitx,
 	       "setsplitx(text,set,start=0,stop=len(text))\n\n"
 	       "Split text[start:stop] into substrings using set, so\n"
@@ -4937,6 +9662,51 @@ Py_C_Function( mxTextTools_hex2str,
     return NULL;
 }
 
+Py_C_Function( mxTextTools_unescape,
+	       "unescape(text,escapes,start=0,stop=len(text))\n\n"
+	       "Return text[start:stop] with its backslash escapes decoded:\n"
+	       "a backslash followed by a key of the dictionary escapes is\n"
+	       "replaced with the value for it, \\xhh and \\ooo (one to three\n"
+	       "octal digits) with the character of that code. Other\n"
+	       "backslashes are kept.")
+{
+    PyObject *text, *escapes;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = INT_MAX;
+
+    Py_Get4Args("OO|nn:unescape",
+		text,escapes,start,stop);
+
+    return mxTextTools_Unescape(text, escapes, start, stop);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function_WithKeywords(
+	       mxTextTools_isodatetime,
+	       "isodatetime(text,start=0,stop=len(text),tzinfo=None)\n\n"
+	       "Return the ISO 8601 date/time text[start:stop], e.g. a match\n"
+	       "of simpleparse.common's ISO_date_time or ISO_date_time_loose,\n"
+	       "as a timezone-aware datetime.datetime. Dates/times without\n"
+	       "an offset are taken to be in tzinfo, UTC if not given.\n"
+	       "Fractions of a second beyond microseconds are truncated."
+	       )
+{
+    PyObject *text;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = INT_MAX;
+    PyObject *tzinfo = NULL;
+
+    Py_KeywordsGet4Args("O|nnO:isodatetime",
+			text,start,stop,tzinfo);
+
+    return mxTextTools_ISODateTime(text, start, stop, tzinfo);
+
+ onError:
+    return NULL;
+}
+
 Py_C_Function( mxTextTools_isascii,
 	       "isascii(text,start=0,stop=len(text))\n\n"
 	       "Return 1/0 depending on whether text only contains ASCII\n"
@@ -4964,28 +9734,44 @@ Py_C_Function( mxTextTools_isascii,
 static PyMethodDef Module_methods[] =
 {   
     Py_MethodWithKeywordsListEntry("tag",mxTextTools_tag),
+    Py_MethodWithKeywordsListEntry("tagcolumns",mxTextTools_tagcolumns),
+    Py_MethodWithKeywordsListEntry("tagheatmap",mxTextTools_tagheatmap),
     Py_MethodListEntry("join",mxTextTools_join),
     Py_MethodListEntry("cmp",mxTextTools_cmp),
     Py_MethodListEntry("joinlist",mxTextTools_joinlist),
+    Py_MethodListEntry("shifttaglist",mxTextTools_shifttaglist),
+    Py_MethodListEntry("taglist2json",mxTextTools_taglist2json),
+    Py_MethodListEntry("json2taglist",mxTextTools_json2taglist),
+    Py_MethodListEntry("taglist2bin",mxTextTools_taglist2bin),
+    Py_MethodListEntry("bin2taglist",mxTextTools_bin2taglist),
+    Py_MethodListEntry("linktables",mxTextTools_linktables),
     Py_MethodListEntry("set",mxTextTools_set),
     Py_MethodListEntry("setfind",mxTextTools_setfind),
     Py_MethodListEntry("setsplit",mxTextTools_setsplit),
     Py_MethodListEntry("setsplitx",mxTextTools_setsplitx),
+    Py_MethodWithKeywordsListEntry("itersetsplit",mxTextTools_itersetsplit),
+    Py_MethodWithKeywordsListEntry("itersplitlines",mxTextTools_itersplitlines),
     Py_MethodListEntry("setstrip",mxTextTools_setstrip),
     Py_MethodWithKeywordsListEntry("TextSearch",mxTextSearch_TextSearch),
+    Py_MethodWithKeywordsListEntry("TextSearchSet",mxTextSearchSet_TextSearchSet),
     Py_MethodListEntry("CharSet",mxCharSet_CharSet),
+    Py_MethodWithKeywordsListEntry("NumberSink",mxNumberSink_NumberSink),
     Py_MethodListEntry("TagTable",mxTagTable_TagTable),
+    Py_MethodListEntry("restoretagtable",mxTagTable_restoretagtable),
 #ifdef HAVE_UNICODE
     Py_MethodListEntry("UnicodeTagTable",mxTagTable_UnicodeTagTable),
 #endif
     Py_MethodListEntrySingleArg("upper",mxTextTools_upper),
     Py_MethodListEntrySingleArg("lower",mxTextTools_lower),
     Py_MethodListEntry("charsplit",mxTextTools_charsplit),
+    Py_MethodWithKeywordsListEntry("itercharsplit",mxTextTools_itercharsplit),
     Py_MethodListEntry("splitat",mxTextTools_splitat),
     Py_MethodListEntry("suffix",mxTextTools_suffix),
     Py_MethodListEntry("prefix",mxTextTools_prefix),
     Py_MethodListEntry("hex2str",mxTextTools_hex2str),
     Py_MethodListEntry("str2hex",mxTextTools_str2hex),
+    Py_MethodListEntry("unescape",mxTextTools_unescape),
+    Py_MethodWithKeywordsListEntry("isodatetime",mxTextTools_isodatetime),
     Py_MethodListEntrySingleArg("isascii",mxTextTools_isascii),
     {NULL,NULL} /* end of list */
 };
@@ -5023,10 +9809,16 @@ static PyObject* mxTextToolsModule_Initialize(void)
     /* Init type objects */
     if (PyType_Ready(&mxTextSearch_Type) < 0)
         return NULL;
+    if (PyType_Ready(&mxTextSearchSet_Type) < 0)
+        return NULL;
     if (PyType_Ready(&mxCharSet_Type) < 0)
         return NULL;
     if (PyType_Ready(&mxTagTable_Type) < 0)
         return NULL;
+    if (PyType_Ready(&mxSplitIterator_Type) < 0)
+        return NULL;
+    if (PyType_Ready(&mxNumberSink_Type) < 0)
+        return NULL;
 
     /* create module */
 #if PY_MAJOR_VERSION >= 3
@@ -5061,6 +9853,7 @@ static PyObject* mxTextToolsModule_Initialize(void)
     mx_ToLower = mxTextTools_ToLower();
     if (!mx_ToLower)
         return NULL;
+    mxTextTools_ToLowerTable = (unsigned char *)PyString_AS_STRING(mx_ToLower);
     if (PyModule_AddObject(module, "to_lower", mx_ToLower) < 0)
         return NULL;
 
@@ -5073,6 +9866,7 @@ static PyObject* mxTextToolsModule_Initialize(void)
     ADD_INT_CONSTANT("BOYERMOORE", MXTEXTSEARCH_BOYERMOORE);
     ADD_INT_CONSTANT("FASTSEARCH", MXTEXTSEARCH_FASTSEARCH);
     ADD_INT_CONSTANT("TRIVIAL", MXTEXTSEARCH_TRIVIAL);
+    ADD_INT_CONSTANT("HORSPOOL", MXTEXTSEARCH_HORSPOOL);
 
     /* Init exceptions */
     mxTextTools_Error = PyErr_NewException("mxTextTools.Error", PyExc_Exception, NULL);
@@ -5080,17 +9874,31 @@ static PyObject* mxTextToolsModule_Initialize(void)
         return NULL;
     if (PyModule_AddObject(module, "Error", mxTextTools_Error) < 0)
         return NULL;
+    mxTextTools_LimitError = PyErr_NewException("mxTextTools.LimitError", mxTextTools_Error, NULL);
+    if (!mxTextTools_LimitError)
+        return NULL;
+    if (PyModule_AddObject(module, "LimitError", mxTextTools_LimitError) < 0)
+        return NULL;
 
     /* Type objects */
     Py_INCREF(&mxTextSearch_Type);
     if (PyModule_AddObject(module, "TextSearchType", (PyObject*) &mxTextSearch_Type) < 0)
         return NULL;
+    Py_INCREF(&mxTextSearchSet_Type);
+    if (PyModule_AddObject(module, "TextSearchSetType", (PyObject*) &mxTextSearchSet_Type) < 0)
+        return NULL;
     Py_INCREF(&mxCharSet_Type);
     if (PyModule_AddObject(module, "CharSetType", (PyObject*) &mxCharSet_Type) < 0)
         return NULL;
     Py_INCREF(&mxTagTable_Type);
     if (PyModule_AddObject(module, "TagTableType", (PyObject*) &mxTagTable_Type) < 0)
         return NULL;
+    Py_INCREF(&mxSplitIterator_Type);
+    if (PyModule_AddObject(module, "SplitIteratorType", (PyObject*) &mxSplitIterator_Type) < 0)
+        return NULL;
+    Py_INCREF(&mxNumberSink_Type);
+    if (PyModule_AddObject(module, "NumberSinkType", (PyObject*) &mxNumberSink_Type) < 0)
+        return NULL;
 
     /* Tag Table command symbols (these will be exposed via
        simpleparse.stt.TextTools.Constants.TagTables) */
@@ -5104,6 +9912,9 @@ static PyObject* mxTextToolsModule_Initialize(void)
     ADD_INT_CONSTANT("_const_Word", MATCH_WORD);
     ADD_INT_CONSTANT("_const_WordStart", MATCH_WORDSTART);
     ADD_INT_CONSTANT("_const_WordEnd", MATCH_WORDEND);
+    ADD_INT_CONSTANT("_const_CIWord", MATCH_CIWORD);
+    ADD_INT_CONSTANT("_const_CIWordStart", MATCH_CIWORDSTART);
+    ADD_INT_CONSTANT("_const_CIWordEnd", MATCH_CIWORDEND);
 
     ADD_INT_CONSTANT("_const_AllInSet", MATCH_ALLINSET);
     ADD_INT_CONSTANT("_const_IsInSet", MATCH_ISINSET);
@@ -5134,12 +9945,15 @@ static PyObject* mxTextToolsModule_Initialize(void)
     ADD_INT_CONSTANT("_const_Loop", MATCH_LOOP);
     ADD_INT_CONSTANT("_const_LoopControl", MATCH_LOOPCONTROL);
 
+    ADD_INT_CONSTANT("_const_Repeat", MATCH_REPEAT);
+
     /* Tag Table command flags */
     ADD_INT_CONSTANT("_const_CallTag", MATCH_CALLTAG);
     ADD_INT_CONSTANT("_const_AppendToTagobj", MATCH_APPENDTAG);
     ADD_INT_CONSTANT("_const_AppendTagobj", MATCH_APPENDTAGOBJ);
     ADD_INT_CONSTANT("_const_AppendMatch", MATCH_APPENDMATCH);
     ADD_INT_CONSTANT("_const_LookAhead", MATCH_LOOKAHEAD);
+    ADD_INT_CONSTANT("_const_AppendNumber", MATCH_APPENDNUMBER);
 
     /* Tag Table argument integers */
     ADD_INT_CONSTANT("_const_To", MATCH_JUMP_TO);
@@ -34,6 +34,7 @@ extern "C" {
 #define MXTEXTSEARCH_BOYERMOORE		0
 #define MXTEXTSEARCH_FASTSEARCH		1
 #define MXTEXTSEARCH_TRIVIAL		2
+#define MXTEXTSEARCH_HORSPOOL		3
 
 typedef struct {
     PyObject_HEAD
@@ -43,6 +44,12 @@ typedef struct {
     void *data;             /* Internal data used by the algorithm or NULL */
 } mxTextSearchObject;
 
+/* Internal data of the HORSPOOL algorithm */
+typedef struct {
+    Py_ssize_t match_len;
+    Py_ssize_t shift[256];  /* shift table, indexed by the low byte */
+} mxhorspool_data;
+
 MXTEXTTOOLS_EXTERNALIZE(PyTypeObject) mxTextSearch_Type;
 
 #define mxTextSearch_Check(v) \
@@ -61,6 +68,9 @@ Py_ssize_t mxTextSearch_SearchBuffer(PyObject *self,
 			      Py_ssize_t *sliceleft,
 			      Py_ssize_t *sliceright);
 
+/* The to_lower() translation table, used by the 8-bit CIWord commands */
+extern unsigned char *mxTextTools_ToLowerTable;
+
 #ifdef HAVE_UNICODE
 extern
 Py_ssize_t mxTextSearch_SearchUnicode(PyObject *self,
@@ -71,6 +81,55 @@ Py_ssize_t mxTextSearch_SearchUnicode(PyObject *self,
 			       Py_ssize_t *sliceright);
 #endif
 
+/* --- Text Search Set Object ----------------------------------------- */
+
+/* Aho-Corasick automaton over the characters (ordinals) of a set of
+   match strings */
+
+typedef struct {
+    Py_UCS4 ch;             /* Character of the edge */
+    Py_ssize_t target;      /* Node the edge leads to */
+} mxsearchset_edge;
+
+typedef struct {
+    Py_ssize_t edges;       /* Index of the first child edge */
+    Py_ssize_t edgecount;   /* Number of child edges, sorted by character */
+    Py_ssize_t fail;        /* Node for the longest proper suffix */
+    Py_ssize_t depth;       /* Length of the node's string */
+    Py_ssize_t matchlen;    /* Length of the longest match ending here or 0 */
+    Py_ssize_t pattern;     /* Index of that match string */
+} mxsearchset_node;
+
+typedef struct {
+    PyObject_HEAD
+    PyObject *patterns;     /* Tuple of match strings */
+    PyObject *translate;    /* Translate string object or NULL */
+    Py_ssize_t nodecount;   /* Number of nodes, node 0 is the root */
+    mxsearchset_node *node;
+    mxsearchset_edge *edge;
+    Py_ssize_t root[256];   /* Root transitions for the first 256 ordinals */
+} mxTextSearchSetObject;
+
+MXTEXTTOOLS_EXTERNALIZE(PyTypeObject) mxTextSearchSet_Type;
+
+#define mxTextSearchSet_Check(v) \
+        (Py_TYPE((v)) == &mxTextSearchSet_Type)
+
+/* Search text[start:stop] for the leftmost (and longest) match of
+   any of the match strings, text is a Py_UNICODE buffer if unicode
+   is true. Returns 1 and sets the slice and the match string index
+   (if pattern is not NULL) in case a match was found, 0 otherwise. */
+
+extern
+Py_ssize_t mxTextSearchSet_Search(PyObject *self,
+				  void *text,
+				  int unicode,
+				  Py_ssize_t start,
+				  Py_ssize_t stop,
+				  Py_ssize_t *sliceleft,
+				  Py_ssize_t *sliceright,
+				  Py_ssize_t *pattern);
+
 /* --- Character Set Object -------------------------------------*/
 
 /* Mode values */
@@ -124,6 +183,9 @@ typedef struct {
     PyObject *args;			/* Command arguments */
     int jne;				/* Non-match jump offset */
     int je;				/* Match jump offset */
+    PyObject *linked;			/* Compiled target table of a
+					   TableInList|SubTableInList
+					   entry or NULL if not linked */
 } mxTagTableEntry;
 
 #define MXTAGTABLE_STRINGTYPE	0
@@ -158,6 +220,204 @@ PyObject *mxTagTable_New(PyObject *definition,
 			 int tabletype,
 			 int cacheable);
 
+/* --- Split Iterator Object ----------------------------------*/
+
+/* Kinds of split iterators */
+#define MXSPLIT_CHAR		0	/* at a character, keeping empty parts */
+#define MXSPLIT_SET		1	/* at runs of characters in a set() string */
+#define MXSPLIT_CHARSET		2	/* at runs of characters in a CharSet */
+#define MXSPLIT_SEARCH		3	/* at the matches of a search object,
+					   keeping empty parts */
+#define MXSPLIT_LINES		4	/* into lines, like splitlines() */
+
+typedef struct {
+    PyObject_HEAD
+    int kind;			/* Kind of iterator, see above */
+    PyObject *text;		/* Unicode object, or the object
+				   providing view */
+    Py_buffer view;		/* Buffer of 8-bit text */
+    void *tx;			/* Py_UNICODE or char buffer */
+    int unicode;		/* Is tx a Py_UNICODE buffer ? */
+    Py_ssize_t position;	/* Where the next part starts */
+    Py_ssize_t stop;		/* End of the slice to split */
+    int finished;		/* All parts returned ? */
+    int offsets;		/* Return (l,r) instead of the parts ? */
+    PyObject *separator;	/* set() string, CharSet or search
+				   object or NULL */
+    Py_UCS4 sepchar;		/* Separator for MXSPLIT_CHAR */
+} mxSplitIteratorObject;
+
+MXTEXTTOOLS_EXTERNALIZE(PyTypeObject) mxSplitIterator_Type;
+
+#define mxSplitIterator_Check(v) \
+        (Py_TYPE((v)) == &mxSplitIterator_Type)
+
+/* --- Number Sink Object -------------------------------------*/
+
+/* Receives the numbers matched by AppendNumber table entries,
+   converted straight into machine values: either appended to an
+   array.array (via a chunk of pending items) or written into a
+   writable buffer such as a NumPy array. Timestamp sinks read ISO
+   8601 dates/times instead and store their epoch microseconds. */
+
+typedef struct {
+    PyObject_HEAD
+    PyObject *target;		/* array.array or the object providing
+				   view */
+    PyObject *extend;		/* target.frombytes for arrays, else NULL */
+    Py_buffer view;		/* Buffer of the items for buffer targets */
+    char typecode;		/* struct/array typecode of the items */
+    int base;			/* Base for integer literals */
+    int timestamps;		/* Store ISO dates/times as epoch
+				   microseconds ? */
+    Py_ssize_t itemsize;
+    Py_ssize_t count;		/* Number of numbers stored */
+    Py_ssize_t capacity;	/* Items in view, unused for arrays */
+    char *pending;		/* Items not yet appended to an array */
+    Py_ssize_t npending;
+    int registered;		/* Is a Tagging Engine going to flush
+				   the pending items ? */
+} mxNumberSinkObject;
+
+MXTEXTTOOLS_EXTERNALIZE(PyTypeObject) mxNumberSink_Type;
+
+#define mxNumberSink_Check(v) \
+        (Py_TYPE((v)) == &mxNumberSink_Type)
+
+/* Exporting these APIs for mxTextTools internal use only ! */
+
+/* Convert the number (or date/time) in text[left:right] (itemsize
+   bytes per character) and store it in sink; returns 1 if the sink now needs a
+   flush the caller hasn't been told about yet, 0 if not and -1 (with
+   an exception set) on error */
+extern
+int mxNumberSink_Append(PyObject *sink,
+			const void *text,
+			int itemsize,
+			Py_ssize_t left,
+			Py_ssize_t right);
+
+/* Append the pending items to the target array; returns -1 (with an
+   exception set) on error */
+extern
+int mxNumberSink_Flush(PyObject *sink);
+
+/* Remove the last n numbers stored in sink (those of a match which
+   was backtracked); returns -1 (with an exception set) on error */
+extern
+int mxNumberSink_Drop(PyObject *sink,
+		      Py_ssize_t n);
+
+/* --- Columnar results -----------------------------------------*/
+
+/* Result rows recorded by the Tagging Engine instead of result
+   tuples (see tagcolumns()); rows are stored in post-order, i.e.
+   a node's children precede it. */
+
+typedef struct {
+    Py_ssize_t length;		/* Number of rows in use */
+    Py_ssize_t allocated;	/* Number of rows allocated */
+    Py_ssize_t *tag;		/* Index of the row's tagobj in tags */
+    Py_ssize_t *left;		/* Start of the match */
+    Py_ssize_t *right;		/* End of the match */
+    Py_ssize_t *depth;		/* Nesting depth, 0 for top-level rows */
+    PyObject *tags;		/* List of distinct tagobjs */
+    PyObject *tagids;		/* Dictionary mapping tagobj to index in tags */
+} mxTextTools_Columns;
+
+/* Exporting these APIs for mxTextTools internal use only ! */
+
+/* Append a row for tagobj, returns -1 (with an exception set) on
+   error */
+extern
+int mxTextTools_Columns_Append(mxTextTools_Columns *columns,
+			       PyObject *tagobj,
+			       Py_ssize_t left,
+			       Py_ssize_t right,
+			       Py_ssize_t depth);
+
+/* --- Backtracking heatmap -------------------------------------*/
+
+/* Statistics recorded by the Tagging Engine in diagnostic mode (see
+   tagheatmap()): for each bucket of bucketsize text positions and each
+   production, i.e. index of a table in tablelist (-1 for the tables
+   outside of those), the characters matched by attempts which then
+   failed, and how often the production was entered again at a
+   position it had been tried at before. Productions are entered via
+   TableInList/SubTableInList entries referring to tablelist (with
+   the index into it) or via table entries whose tagobj is a key of
+   productions (with the value for it). Cells are kept in hash
+   tables. */
+
+typedef struct {
+    Py_ssize_t key1;		/* PY_SSIZE_T_MIN for unused cells */
+    Py_ssize_t key2;
+    Py_ssize_t failed;		/* Characters matched by failed attempts */
+    Py_ssize_t reentries;	/* Repeated attempts at the same position */
+} mxTextTools_HeatmapCell;
+
+typedef struct {
+    Py_ssize_t used;		/* Number of cells in use */
+    Py_ssize_t allocated;	/* Number of cells, a power of 2 */
+    mxTextTools_HeatmapCell *cells;
+} mxTextTools_HeatmapTable;
+
+typedef struct {
+    Py_ssize_t bucketsize;	/* Text positions per bucket */
+    PyObject *tablelist;	/* List of the productions' tables or NULL */
+    PyObject *productions;	/* Dict mapping tagobjs to productions or NULL */
+    mxTextTools_HeatmapTable cells; /* Keyed by (bucket, production) */
+    mxTextTools_HeatmapTable entered; /* Keyed by (production, position) */
+} mxTextTools_Heatmap;
+
+/* Record an attempt of production starting at position which matched
+   length characters and then failed; returns -1 (with an exception
+   set) on error */
+extern
+int mxTextTools_Heatmap_Failed(mxTextTools_Heatmap *heatmap,
+			       Py_ssize_t production,
+			       Py_ssize_t position,
+			       Py_ssize_t length);
+
+/* Called when the table entry (command, match, tagobj) enters a
+   table at position: if that enters a production, sets *production
+   and records the attempt; returns -1 (with an exception set) on
+   error */
+extern
+int mxTextTools_Heatmap_Enter(mxTextTools_Heatmap *heatmap,
+			      int command,
+			      PyObject *match,
+			      PyObject *tagobj,
+			      Py_ssize_t position,
+			      Py_ssize_t *production);
+
+/* --- Tagging Engine limits ------------------------------------*/
+
+/* Limits on the results, nesting and running time of one Tagging
+   Engine run (see tag()), 0 meaning no limit. results and
+   result_bytes count what the run created so far, including results
+   which backtracking dropped again. intern_matches isn't a limit but
+   is set per run as well. */
+
+typedef struct {
+    Py_ssize_t max_results;	/* Number of results */
+    Py_ssize_t max_depth;	/* Nesting depth of tables */
+    Py_ssize_t max_result_bytes; /* Approximate memory of the results */
+    Py_ssize_t max_steps;	/* Number of table entries executed */
+    Py_ssize_t intern_matches;	/* AppendMatch results up to this length
+				   are shared between identical matches,
+				   0 for none */
+    PyObject *deadline;		/* Float time or NULL */
+    PyObject *clock;		/* Callable returning the time deadline
+				   refers to, NULL if there's no deadline */
+    Py_ssize_t results;		/* Results created so far */
+    Py_ssize_t result_bytes;	/* Their approximate memory */
+} mxTextTools_Limits;
+
+/* Raised when a run exceeds one of its limits */
+extern
+PyObject *mxTextTools_LimitError;
+
 /* --- Tagging Engine -------------------------------------------*/
 
 /* Exporting these APIs for mxTextTools internal use only ! */
@@ -167,6 +427,16 @@ PyObject *mxTagTable_New(PyObject *definition,
    - return codes: rc = 2: match ok; rc = 1: match failed; rc = 0: error
    - doesn't check type of passed arguments !
    - doesn't increment reference counts of passed objects !
+   - if columns is not NULL, matches are recorded there instead
+     of appending result tuples to taglist
+   - if limits is not NULL, the run fails with LimitError when it
+     exceeds one of them
+   - if heatmap is not NULL, failed attempts and repeated attempts at
+     the same position are recorded there
+   - if consume is not NULL, it maps tagobjs to handlers: once a
+     result with one of those tagobjs is in taglist and control is
+     back in the top-level table, the handler is called with the
+     result and the text, and the result is removed from taglist
 */
 
 extern 
@@ -176,6 +446,10 @@ int mxTextTools_TaggingEngine(PyObject *textobj,
 			      mxTagTableObject *table,
 			      PyObject *taglist,
 			      PyObject *context,
+			      mxTextTools_Columns *columns,
+			      mxTextTools_Limits *limits,
+			      mxTextTools_Heatmap *heatmap,
+			      PyObject *consume,
 			      Py_ssize_t *next);
 
 extern 
@@ -185,6 +459,10 @@ int mxTextTools_UnicodeTaggingEngine(PyObject *textobj,
 				     mxTagTableObject *table,
 				     PyObject *taglist,
 				     PyObject *context,
+				     mxTextTools_Columns *columns,
+				     mxTextTools_Limits *limits,
+				     mxTextTools_Heatmap *heatmap,
+				     PyObject *consume,
 				     Py_ssize_t *next);
 
 /* Command integers for cmd; see Constants/TagTable.py for details */
@@ -203,6 +481,11 @@ int mxTextTools_UnicodeTaggingEngine(PyObject *textobj,
 #define MATCH_WORDSTART       	22
 #define MATCH_WORDEND		23
 
+/* Same as the Word commands, but ignoring case */
+#define MATCH_CIWORD 		24
+#define MATCH_CIWORDSTART     	25
+#define MATCH_CIWORDEND		26
+
 #define MATCH_ALLINSET 		31
 #define MATCH_ISINSET		32
 
@@ -240,6 +523,7 @@ int mxTextTools_UnicodeTaggingEngine(PyObject *textobj,
 #define MATCH_SUBTABLEINLIST 	208
 #define MATCH_LOOP 		205
 #define MATCH_LOOPCONTROL	206
+#define MATCH_REPEAT		209
 
 /* Special argument integers */
 #define MATCH_JUMP_TO		0
@@ -258,6 +542,7 @@ int mxTextTools_UnicodeTaggingEngine(PyObject *textobj,
 #define MATCH_APPENDTAGOBJ	(1 << 10)
 #define MATCH_APPENDMATCH	(1 << 11)
 #define MATCH_LOOKAHEAD		(1 << 12)
+#define MATCH_APPENDNUMBER	(1 << 13)
 
 /* EOF */
 #ifdef __cplusplus
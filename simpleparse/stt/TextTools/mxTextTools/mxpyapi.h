@@ -28,6 +28,8 @@
 #define PyInt_FromLong                  PyLong_FromLong
 #define PyInt_Check                     PyLong_Check
 #define PyInt_AS_LONG                   PyLong_AS_LONG
+#define PyInt_FromSsize_t               PyLong_FromSsize_t
+#define PyInt_AsSsize_t                 PyLong_AsSsize_t
 
 #define PyString_FromStringAndSize      PyBytes_FromStringAndSize
 #define PyString_AsString               PyBytes_AsString
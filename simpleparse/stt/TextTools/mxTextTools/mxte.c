@@ -17,8 +17,431 @@
 #include "mx.h"
 #include "mxstdlib.h"
 #include "mxTextTools.h"
-
-
+
+/* --- Result objects ----------------------------------------------------- */
+
+/* Objects reused while building the results of one Tagging Engine
+   run: position integers, which neighbouring results share (a
+   child's right is the next child's left, a parent's left is its
+   first child's left), and the short strings of AppendMatch results
+   if tag() was asked to intern them.  Both caches are direct-mapped,
+   a collision simply replaces the older object.  The run's
+   NumberSinks with pending items are kept here as well, so they get
+   flushed before the engine returns, along with a log of the numbers
+   stored in them, so those of a failing table can be removed again
+   like its entries in the results list. */
+
+#define TE_POSITIONS_SIZE 64		/* power of 2 */
+#define TE_MATCHES_SIZE 256		/* power of 2 */
+
+typedef struct {
+    PyObject *match;			/* String object or NULL */
+    Py_ssize_t start;			/* Slice of the text it was made from */
+    Py_ssize_t length;
+} te_match;
+
+typedef struct {
+    PyObject *sink;			/* NumberSink */
+    Py_ssize_t count;			/* Numbers stored in it in a row */
+} te_numbers;
+
+typedef struct {
+    PyObject *positions[TE_POSITIONS_SIZE];
+    te_match *matches;			/* Allocated on first use */
+    PyObject *sinks;			/* List of NumberSinks or NULL */
+    te_numbers *numbers;		/* Log of the numbers stored */
+    Py_ssize_t numbers_len;
+    Py_ssize_t numbers_size;
+    Py_ssize_t numbered;		/* Numbers stored so far */
+} te_resultcache;
+
+static
+void te_resultcache_free(te_resultcache *cache)
+{
+    Py_ssize_t i;
+
+    for (i = 0; i < TE_POSITIONS_SIZE; i++)
+	Py_XDECREF(cache->positions[i]);
+    if (cache->matches != NULL) {
+	for (i = 0; i < TE_MATCHES_SIZE; i++)
+	    Py_XDECREF(cache->matches[i].match);
+	PyMem_Free(cache->matches);
+    }
+    Py_XDECREF(cache->sinks);
+    for (i = 0; i < cache->numbers_len; i++)
+	Py_DECREF(cache->numbers[i].sink);
+    if (cache->numbers != NULL)
+	PyMem_Free(cache->numbers);
+}
+
+/* Log a number stored in sink; returns -1 (with an exception set)
+   on error */
+
+static
+int te_log_number(te_resultcache *cache,
+		  PyObject *sink)
+{
+    te_numbers *last = cache->numbers_len > 0 ?
+	&cache->numbers[cache->numbers_len - 1] : NULL;
+
+    if (last == NULL || last->sink != sink) {
+	if (cache->numbers_len == cache->numbers_size) {
+	    Py_ssize_t size = cache->numbers_size ? 2 * cache->numbers_size : 8;
+	    te_numbers *numbers = (te_numbers *)PyMem_Realloc(
+		cache->numbers, size * sizeof(te_numbers));
+
+	    if (numbers == NULL) {
+		PyErr_NoMemory();
+		return -1;
+	    }
+	    cache->numbers = numbers;
+	    cache->numbers_size = size;
+	}
+	last = &cache->numbers[cache->numbers_len++];
+	Py_INCREF(sink);
+	last->sink = sink;
+	last->count = 0;
+    }
+    last->count++;
+    cache->numbered++;
+    return 0;
+}
+
+/* Remove the numbers stored after the first numbered ones from their
+   sinks; returns -1 (with an exception set) on error */
+
+static
+int te_drop_numbers(te_resultcache *cache,
+		    Py_ssize_t numbered)
+{
+    while (cache->numbered > numbered) {
+	te_numbers *last = &cache->numbers[cache->numbers_len - 1];
+	Py_ssize_t n = cache->numbered - numbered;
+
+	if (n > last->count)
+	    n = last->count;
+	last->count -= n;
+	cache->numbered -= n;
+	if (mxNumberSink_Drop(last->sink, n))
+	    return -1;
+	if (last->count == 0) {
+	    Py_DECREF(last->sink);
+	    cache->numbers_len--;
+	}
+    }
+    return 0;
+}
+
+/* Remember sink for te_flush_sinks(); returns -1 (with an exception
+   set) on error */
+
+static
+int te_register_sink(te_resultcache *cache,
+		     PyObject *sink)
+{
+    if (cache->sinks == NULL) {
+	cache->sinks = PyList_New(0);
+	if (cache->sinks == NULL)
+	    return -1;
+    }
+    return PyList_Append(cache->sinks, sink);
+}
+
+/* Flush the registered NumberSinks; returns -1 (with an exception
+   set) if one of them failed, the others are flushed anyway */
+
+static
+int te_flush_sinks(te_resultcache *cache)
+{
+    Py_ssize_t i;
+    int rc = 0;
+
+    if (cache->sinks == NULL)
+	return 0;
+    for (i = 0; i < PyList_GET_SIZE(cache->sinks); i++) {
+	if (rc == 0)
+	    rc = mxNumberSink_Flush(PyList_GET_ITEM(cache->sinks, i));
+	else {
+	    /* keep the first error */
+	    PyObject *type, *value, *traceback;
+
+	    PyErr_Fetch(&type, &value, &traceback);
+	    mxNumberSink_Flush(PyList_GET_ITEM(cache->sinks, i));
+	    PyErr_Clear();
+	    PyErr_Restore(type, value, traceback);
+	}
+    }
+    Py_CLEAR(cache->sinks);
+    return rc;
+}
+
+/* Return a new reference to an integer object for position */
+
+static
+PyObject *te_position(te_resultcache *cache,
+		      Py_ssize_t position)
+{
+    PyObject **slot = &cache->positions[position & (TE_POSITIONS_SIZE - 1)];
+
+    if (*slot == NULL || PyInt_AsSsize_t(*slot) != position) {
+	PyObject *v = PyInt_FromSsize_t(position);
+
+	if (v == NULL)
+	    return NULL;
+	Py_XDECREF(*slot);
+	*slot = v;
+    }
+    Py_INCREF(*slot);
+    return *slot;
+}
+
+/* Build the (tagobj,left,right,subtags) result tuple */
+
+static
+PyObject *te_result_tuple(te_resultcache *cache,
+			  PyObject *tagobj,
+			  Py_ssize_t left,
+			  Py_ssize_t right,
+			  PyObject *subtags)
+{
+    PyObject *result, *v;
+
+    result = PyTuple_New(4);
+    if (result == NULL)
+	return NULL;
+    Py_INCREF(tagobj);
+    PyTuple_SET_ITEM(result, 0, tagobj);
+    v = te_position(cache, left);
+    if (v == NULL)
+	goto onError;
+    PyTuple_SET_ITEM(result, 1, v);
+    v = te_position(cache, right);
+    if (v == NULL)
+	goto onError;
+    PyTuple_SET_ITEM(result, 2, v);
+    Py_INCREF(subtags);
+    PyTuple_SET_ITEM(result, 3, subtags);
+    return result;
+
+ onError:
+    Py_DECREF(result);
+    return NULL;
+}
+
+/* Find the slot for the match text[start:start+length], text holds
+   characters of charsize bytes */
+
+static
+te_match *te_match_slot(te_resultcache *cache,
+			const char *text,
+			size_t charsize,
+			Py_ssize_t start,
+			Py_ssize_t length)
+{
+    const unsigned char *p = (const unsigned char *)text + start * charsize;
+    size_t i, size = length * charsize;
+    unsigned long hash = 2166136261UL;
+
+    if (cache->matches == NULL) {
+	cache->matches = PyMem_Malloc(TE_MATCHES_SIZE * sizeof(te_match));
+	if (cache->matches == NULL)
+	    return NULL;
+	memset(cache->matches, 0, TE_MATCHES_SIZE * sizeof(te_match));
+    }
+    for (i = 0; i < size; i++)
+	hash = (hash ^ p[i]) * 16777619UL;
+    return &cache->matches[hash & (TE_MATCHES_SIZE - 1)];
+}
+
+/* Return a new reference to the string object of an earlier
+   identical match, or NULL (without exception) if there is none */
+
+static
+PyObject *te_cached_match(te_match *slot,
+			  const char *text,
+			  size_t charsize,
+			  Py_ssize_t start,
+			  Py_ssize_t length)
+{
+    if (slot == NULL || slot->match == NULL || slot->length != length ||
+	memcmp(text + slot->start * charsize,
+	       text + start * charsize,
+	       length * charsize) != 0)
+	return NULL;
+    Py_INCREF(slot->match);
+    return slot->match;
+}
+
+static
+void te_cache_match(te_match *slot,
+		    Py_ssize_t start,
+		    Py_ssize_t length,
+		    PyObject *match)
+{
+    if (slot == NULL)
+	return;
+    Py_INCREF(match);
+    Py_XDECREF(slot->match);
+    slot->match = match;
+    slot->start = start;
+    slot->length = length;
+}
+
+/* --- Limits ------------------------------------------------------------- */
+
+/* Raise LimitError for the limit named limit (of maximum) which was
+   exceeded at position while matching production */
+
+static
+void te_limit_error_object(const char *limit,
+			   PyObject *maximum,
+			   Py_ssize_t position,
+			   PyObject *production)
+{
+    static char *names[] = {"limit", "maximum", "position", "production"};
+    PyObject *message, *values, *error;
+    int i;
+
+#if PY_MAJOR_VERSION >= 3
+    message = PyUnicode_FromFormat(
+	"%s limit of %S exceeded at position %zd in production %R",
+	limit, maximum, position, production);
+#else
+    {
+	PyObject *str = PyObject_Str(maximum);
+	PyObject *repr = PyObject_Repr(production);
+
+	if (str == NULL || repr == NULL) {
+	    Py_XDECREF(str);
+	    Py_XDECREF(repr);
+	    return;
+	}
+	message = PyString_FromFormat(
+	    "%s limit of %s exceeded at position %zd in production %s",
+	    limit, PyString_AS_STRING(str), position,
+	    PyString_AS_STRING(repr));
+	Py_DECREF(str);
+	Py_DECREF(repr);
+    }
+#endif
+    if (message == NULL)
+	return;
+    error = PyObject_CallFunctionObjArgs(mxTextTools_LimitError, message, NULL);
+    Py_DECREF(message);
+    if (error == NULL)
+	return;
+    values = Py_BuildValue("(sOnO)", limit, maximum, position, production);
+    if (values == NULL)
+	goto onError;
+    for (i = 0; i < 4; i++)
+	if (PyObject_SetAttrString(error, names[i], PyTuple_GET_ITEM(values, i)))
+	    goto onError;
+    Py_DECREF(values);
+    PyErr_SetObject(mxTextTools_LimitError, error);
+    Py_DECREF(error);
+    return;
+
+ onError:
+    Py_XDECREF(values);
+    Py_DECREF(error);
+}
+
+static
+void te_limit_error(const char *limit,
+		    Py_ssize_t maximum,
+		    Py_ssize_t position,
+		    PyObject *production)
+{
+    PyObject *v = PyInt_FromSsize_t(maximum);
+
+    if (v == NULL)
+	return;
+    te_limit_error_object(limit, v, position, production);
+    Py_DECREF(v);
+}
+
+/* Count a result of about size bytes, returns -1 with LimitError set
+   if that exceeds max_results or max_result_bytes */
+
+static
+int te_limit_result(mxTextTools_Limits *limits,
+		    Py_ssize_t size,
+		    Py_ssize_t position,
+		    PyObject *production)
+{
+    limits->results++;
+    limits->result_bytes += size;
+    if (limits->max_results > 0 &&
+	limits->results > limits->max_results) {
+	te_limit_error("max_results", limits->max_results,
+		       position, production);
+	return -1;
+    }
+    if (limits->max_result_bytes > 0 &&
+	limits->result_bytes > limits->max_result_bytes) {
+	te_limit_error("max_result_bytes", limits->max_result_bytes,
+		       position, production);
+	return -1;
+    }
+    return 0;
+}
+
+/* The engine runs signal handlers and checks max_steps and the
+   deadline every TE_CHECK_INTERVAL table entries */
+
+#define TE_CHECK_INTERVAL 4096
+
+/* Return the number of steps after which te_check_steps() is due */
+
+static
+Py_ssize_t te_next_check(mxTextTools_Limits *limits,
+			 Py_ssize_t steps)
+{
+    Py_ssize_t next = steps + TE_CHECK_INTERVAL;
+
+    if (limits != NULL && limits->max_steps > 0 &&
+	next > limits->max_steps + 1)
+	next = limits->max_steps + 1;
+    return next;
+}
+
+/* Run signal handlers (so that e.g. KeyboardInterrupt isn't delayed
+   until the run is done) and check the step budget and the deadline
+   of limits (which may be NULL); returns -1 with an exception set to
+   abort the run */
+
+static
+int te_check_steps(mxTextTools_Limits *limits,
+		   Py_ssize_t steps,
+		   Py_ssize_t position,
+		   PyObject *production)
+{
+    if (PyErr_CheckSignals())
+	return -1;
+    if (limits == NULL)
+	return 0;
+    if (limits->max_steps > 0 && steps > limits->max_steps) {
+	te_limit_error("max_steps", limits->max_steps, position, production);
+	return -1;
+    }
+    if (limits->clock != NULL) {
+	PyObject *now = PyObject_CallObject(limits->clock, NULL);
+	int expired;
+
+	if (now == NULL)
+	    return -1;
+	expired = PyObject_RichCompareBool(now, limits->deadline, Py_GE);
+	Py_DECREF(now);
+	if (expired < 0)
+	    return -1;
+	if (expired) {
+	    te_limit_error_object("deadline", limits->deadline,
+				  position, production);
+	    return -1;
+	}
+    }
+    return 0;
+}
 
 /* --- Tagging Engine --- 8-bit String version ---------------------------- */
 
@@ -40,6 +463,8 @@
 #define TE_TABLETYPE MXTAGTABLE_STRINGTYPE
 #undef TE_SEARCHAPI
 #define TE_SEARCHAPI mxTextSearch_SearchBuffer
+#undef TE_CHAR_FOLD
+#define TE_CHAR_FOLD(c) ((char)mxTextTools_ToLowerTable[(unsigned char)(c)])
 
 #include "mxte_impl.h"
 
@@ -47,6 +472,44 @@
 
 #ifdef HAVE_UNICODE
 
+/* Simple Unicode case folding for the CIWord commands, so the length
+   of a match doesn't change: a character folds to its lowercase form,
+   except for those listed here, whose folding differs (e.g. final
+   sigma and the micro sign).  Characters whose full case folding has
+   more than one character, like the German sharp s, fold to
+   themselves, and their capital forms to them. */
+
+static
+Py_UNICODE te_unicode_fold(Py_UNICODE c)
+{
+    switch (c) {
+    case 0x00B5: return 0x03BC;		/* micro sign */
+    case 0x0130: return 0x0130;		/* capital I with dot above */
+    case 0x017F: return 0x0073;		/* long s */
+    case 0x0345: return 0x03B9;		/* combining ypogegrammeni */
+    case 0x03C2: return 0x03C3;		/* final sigma */
+    case 0x03D0: return 0x03B2;		/* Greek symbols */
+    case 0x03D1: return 0x03B8;
+    case 0x03D5: return 0x03C6;
+    case 0x03D6: return 0x03C0;
+    case 0x03F0: return 0x03BA;
+    case 0x03F1: return 0x03C1;
+    case 0x03F5: return 0x03B5;
+    case 0x1C80: return 0x0432;		/* Cyrillic small letter variants */
+    case 0x1C81: return 0x0434;
+    case 0x1C82: return 0x043E;
+    case 0x1C83: return 0x0441;
+    case 0x1C84: return 0x0442;
+    case 0x1C85: return 0x0442;
+    case 0x1C86: return 0x044A;
+    case 0x1C87: return 0x0463;
+    case 0x1C88: return 0xA64B;
+    case 0x1E9B: return 0x1E61;		/* long s with dot above */
+    case 0x1FBE: return 0x03B9;		/* Greek prosgegrammeni */
+    default: return Py_UNICODE_TOLOWER(c);
+    }
+}
+
 #undef TE_STRING_CHECK 
 #define TE_STRING_CHECK(obj) PyUnicode_Check(obj)
 #undef TE_STRING_AS_STRING
@@ -65,6 +528,8 @@
 #define TE_TABLETYPE MXTAGTABLE_UNICODETYPE
 #undef TE_SEARCHAPI
 #define TE_SEARCHAPI mxTextSearch_SearchUnicode
+#undef TE_CHAR_FOLD
+#define TE_CHAR_FOLD(c) te_unicode_fold(c)
 
 #include "mxte_impl.h"
 
@@ -118,6 +118,18 @@ typedef struct stack_entry {
 	Py_ssize_t childStart; /* text start position for the child table */
 	PyObject * results; /* the result-target of the parent */
 	Py_ssize_t resultsLength; /* the length of the results list before the sub-table is called */
+
+	Py_ssize_t repeatCount; /* iterations completed by the parent's Repeat tag */
+	Py_ssize_t repeatResultsLength; /* length of the results list before the parent's Repeat tag started */
+
+	Py_ssize_t columnsLength; /* number of result rows when the parent table started */
+	Py_ssize_t columnsDepth; /* result row depth of the parent table */
+	Py_ssize_t repeatColumnsLength; /* number of result rows before the parent's Repeat tag started */
+
+	Py_ssize_t numbersLength; /* numbers stored in NumberSinks when the parent table started */
+	Py_ssize_t repeatNumbersLength; /* numbers stored before the parent's Repeat tag started */
+
+	Py_ssize_t production; /* heatmap production of the parent table */
 } recursive_stack_entry;
 
 
@@ -131,7 +143,9 @@ XXX Not sure if loop vars are table or tag specific
 	returnCode = NULL_CODE;\
 	loopcount = -1;\
 	loopstart = startPosition;\
-	taglist_len = PyList_Size( taglist );\
+	taglist_len = taglist == Py_None ? 0 : PyList_Size( taglist );\
+	columnsLength = columns ? columns->length : 0;\
+	numbersLength = resultCache.numbered;\
 }
 
 /* Macro to reset tag-specific variables 
@@ -142,6 +156,7 @@ XXX Not sure if loop vars are table or tag specific
 	childPosition = position;\
 	childReturnCode = NULL_CODE;\
 	childResults = NULL;\
+	repeatCount = 0;\
 }
 /* Macro to decode a tag-entry into local variables */
 #define DECODE_TAG {\
@@ -172,8 +187,17 @@ XXX Not sure if loop vars are table or tag specific
 	stackTemp->childStart = childStart;\
 	stackTemp->resultsLength = taglist_len;\
 	stackTemp->results = taglist;\
+	stackTemp->repeatCount = repeatCount;\
+	stackTemp->repeatResultsLength = repeatResultsLength;\
+	stackTemp->columnsLength = columnsLength;\
+	stackTemp->columnsDepth = columnsDepth;\
+	stackTemp->repeatColumnsLength = repeatColumnsLength;\
+	stackTemp->numbersLength = numbersLength;\
+	stackTemp->repeatNumbersLength = repeatNumbersLength;\
+	stackTemp->production = production;\
 	\
 	stackParent = stackTemp;\
+	stackDepth++;\
 	childReturnCode = PENDING_CODE;\
 	\
 	startPosition = position;\
@@ -195,17 +219,81 @@ XXX Not sure if loop vars are table or tag specific
 		table = stackParent->table;\
 		table_len = table->numentries;\
 		index = stackParent->index;\
+		repeatCount = stackParent->repeatCount;\
+		repeatResultsLength = stackParent->repeatResultsLength;\
+		/* rows of a child table at a deeper level belong to the tag\
+		   which called it, remember where they start */\
+		columnsChildLength = (columnsDepth != stackParent->columnsDepth) ? columnsLength : -1;\
+		columnsLength = stackParent->columnsLength;\
+		columnsDepth = stackParent->columnsDepth;\
+		repeatColumnsLength = stackParent->repeatColumnsLength;\
+		numbersLength = stackParent->numbersLength;\
+		repeatNumbersLength = stackParent->repeatNumbersLength;\
+		production = stackParent->production;\
 		\
 		stackTemp = stackParent->parent;\
 		PyMem_Free( stackParent );\
 		stackParent = stackTemp;\
 		stackTemp = NULL;\
+		stackDepth--;\
+		if (stackDepth < appendNumberDepth) {\
+			/* left the table of an AppendNumber match */\
+			appendNumberDepth = -1;\
+		}\
 		\
 		childReturnCode = returnCode;\
 		returnCode = NULL_CODE;\
 	}\
 }
 
+/* The production reported by limit errors: tagobj, or if that is None
+   the nearest tagobj of the table entries on the stack */
+static
+PyObject *te_limit_production(recursive_stack_entry *stack, PyObject *tagobj)
+{
+	while (tagobj == NULL || tagobj == Py_None) {
+		if (stack == NULL)
+			return Py_None;
+		tagobj = stack->table->entry[stack->index].tagobj;
+		stack = stack->parent;
+	}
+	return tagobj;
+}
+
+/* Hand the results from taglist[*consumed:] whose tagobj is a key of
+   consume to the handler for it and remove them from taglist; only
+   called in the top-level table, where a result can't be undone by
+   backtracking any more */
+static
+int te_consume_results(PyObject *consume, PyObject *taglist,
+	Py_ssize_t *consumed, PyObject *textobj)
+{
+	Py_ssize_t i = *consumed;
+
+	while (i < PyList_GET_SIZE(taglist)) {
+		PyObject *result = PyList_GET_ITEM(taglist, i);
+		PyObject *handler, *value;
+
+		if (!PyTuple_Check(result) || PyTuple_GET_SIZE(result) != 4 ||
+			(handler = PyDict_GetItem(consume, PyTuple_GET_ITEM(result, 0))) == NULL) {
+			i++;
+			continue;
+		}
+		Py_INCREF(result);
+		if (PyList_SetSlice(taglist, i, i + 1, NULL)) {
+			Py_DECREF(result);
+			return -1;
+		}
+		value = PyObject_CallFunctionObjArgs(handler, result, textobj, NULL);
+		Py_DECREF(result);
+		if (value == NULL)
+			return -1;
+		Py_DECREF(value);
+	}
+	*consumed = i;
+	return 0;
+}
+
 
 #endif
 
@@ -225,6 +313,10 @@ int TE_ENGINE_API(
 	mxTagTableObject *table,
 	PyObject *taglist,
 	PyObject *context,
+	mxTextTools_Columns *columns,
+	mxTextTools_Limits *limits,
+	mxTextTools_Heatmap *heatmap,
+	PyObject *consume,
 	Py_ssize_t *next
 ) {
     TE_CHAR *text = NULL;		/* Pointer to the text object's data */
@@ -237,7 +329,7 @@ int TE_ENGINE_API(
 		short returnCode = NULL_CODE;		/* return code: -1 not set, 0 error, 1
 					   not ok, 2 ok */
 		Py_ssize_t index=0; 			/* index of current table entry */
-		Py_ssize_t taglist_len = PyList_Size( taglist );
+		Py_ssize_t taglist_len = taglist == Py_None ? 0 : PyList_Size( taglist );
 
 
 		/* variables tracking status of the current tag */
@@ -253,6 +345,15 @@ int TE_ENGINE_API(
 		int loopcount = -1; 	/* loop counter */
 		Py_ssize_t loopstart = startPosition;	/* loop start position */
 		PyObject *tagobj = NULL;
+		Py_ssize_t repeatCount = 0;	/* iterations completed by a Repeat tag */
+		Py_ssize_t repeatResultsLength = 0;	/* results list length before a Repeat tag */
+		Py_ssize_t columnsLength = columns ? columns->length : 0; /* result rows when the table started */
+		Py_ssize_t columnsDepth = 0;	/* depth of result rows for the current table */
+		Py_ssize_t repeatColumnsLength = 0;	/* result rows before a Repeat tag */
+		Py_ssize_t columnsChildLength = -1;	/* first result row of a finished child table, -1 if none */
+		Py_ssize_t production = -1;	/* heatmap production the table belongs to */
+		Py_ssize_t numbersLength = 0;	/* numbers stored in NumberSinks when the table started */
+		Py_ssize_t repeatNumbersLength = 0;	/* numbers stored before a Repeat tag */
 
 
 	/* parentTable is our nearest parent, i.e. the next item to pop
@@ -262,11 +363,19 @@ int TE_ENGINE_API(
 	*/
 	recursive_stack_entry * stackParent = NULL;
 	recursive_stack_entry * stackTemp = NULL; /* just temporary storage for parent pointers */
+	Py_ssize_t stackDepth = 0; /* number of entries on the stack */
+	Py_ssize_t appendNumberDepth = -1; /* stack depth of the table of an AppendNumber match, -1 if none */
+	Py_ssize_t steps = 0; /* number of table entries executed */
+	Py_ssize_t nextCheck = te_next_check(limits, 0); /* steps when te_check_steps() is due */
+	Py_ssize_t consumed = taglist == Py_None ? 0 : PyList_Size( taglist ); /* top-level results checked for consume */
 
 	/* Error-management variables */
 	PyObject * errorType = NULL;
 	PyObject * errorMessage = NULL;
 
+	/* objects reused for the results of this run */
+	te_resultcache resultCache;
+
     /* Initialise the buffer
 	
 	Here is where we will add memory-mapped file support I think...
@@ -277,6 +386,7 @@ int TE_ENGINE_API(
 			buffer = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_READ )
 
 	*/
+	memset(&resultCache, 0, sizeof(resultCache));
 	if (!TE_STRING_CHECK(textobj)) {
 		returnCode = ERROR_CODE;
 		errorType = PyExc_TypeError;
@@ -309,8 +419,20 @@ int TE_ENGINE_API(
 				childStart = position;
 				childPosition = position;
 
+				if (++steps >= nextCheck) {
+					if (te_check_steps(
+							limits, steps, position,
+							te_limit_production(stackParent, tagobj)
+						)) {
+						/* the exception is set, handled as an error of this entry */
+						childReturnCode = ERROR_CODE;
+					}
+					nextCheck = te_next_check(limits, steps);
+				}
 			}
-			if (command < MATCH_MAX_LOWLEVEL) {
+			if (childReturnCode == ERROR_CODE) {
+				/* interrupted before running the command */
+			} else if (command < MATCH_MAX_LOWLEVEL) {
 #include "lowlevelcommands.h"
 			} else {
 				switch (command) {
@@ -398,6 +520,14 @@ int TE_ENGINE_API(
 						PyObject * parameter = NULL;
 						DPRINTF( "finishing success-code or null \n" );
 
+						if (columnsChildLength >= 0 && (
+								tagobj == Py_None ||
+								flags & (MATCH_CALLTAG|MATCH_APPENDTAG|MATCH_APPENDMATCH|MATCH_APPENDTAGOBJ|MATCH_APPENDNUMBER)
+							)) {
+							/* nothing to hang the child table's rows on, discard them
+							as the results list would have been for tag() */
+							columns->length = columnsChildLength;
+						}
 						if (tagobj == Py_None  ) {
 							/* XXX note: this short-circuits around "AppendTagobj" flagged items which
 							specified tagobj == None... don't know if that's wanted or not.  Similarly
@@ -405,6 +535,75 @@ int TE_ENGINE_API(
 							*/
 							DPRINTF( "tagobj was none\n" );
 							DPRINTF( "Matched %i:%i but result not saved", childStart, childPosition );
+						} else if (taglist == Py_None &&
+								!(flags & (MATCH_CALLTAG|MATCH_APPENDTAG|MATCH_APPENDNUMBER))) {
+							/* tag(...,taglist=None), only the tag object
+							callbacks get to see the result */
+							DPRINTF( "no taglist, result not saved\n" );
+						} else if (flags & MATCH_APPENDNUMBER && appendNumberDepth >= 0) {
+							/* part of an enclosing AppendNumber match, which
+							stores the number for the whole of it */
+							DPRINTF( "number inside a number, not appended\n" );
+							if (childResults != NULL && childResults != taglist) {
+								Py_DECREF( childResults );
+							}
+							childResults = NULL;
+						} else if (flags & MATCH_APPENDNUMBER) {
+							/* convert the match straight into the NumberSink,
+							no result tuple and no children (see recursecommands.h) */
+							DPRINTF( "appending number\n" );
+							if (!mxNumberSink_Check(tagobj)) {
+								returnCode = ERROR_CODE;
+								errorType = PyExc_TypeError;
+								errorMessage = PyString_FromFormat(
+									 "tagobj (type %.50s) for table entry %d (flags include AppendNumber) isn't a NumberSink",
+									 Py_TYPE(tagobj)->tp_name,
+									 (unsigned int)index
+								);
+							} else {
+								int appended = mxNumberSink_Append(
+									tagobj, (const void *)text, sizeof(TE_CHAR),
+									childStart, childPosition
+								);
+								if (appended < 0 ||
+									te_log_number(&resultCache, tagobj) ||
+									(appended > 0 && te_register_sink(&resultCache, tagobj))) {
+									returnCode = ERROR_CODE;
+								}
+							}
+							if (childResults != NULL && childResults != taglist) {
+								Py_DECREF( childResults );
+							}
+							childResults = NULL;
+						} else if (limits != NULL && te_limit_result(
+								limits,
+								/* list slot plus the row, string or result tuple (and children list) */
+								sizeof(PyObject *) + (
+									columns != NULL && !(flags & (MATCH_CALLTAG|MATCH_APPENDTAG|MATCH_APPENDMATCH|MATCH_APPENDTAGOBJ)) ?
+										4 * sizeof(Py_ssize_t) :
+									flags & MATCH_APPENDMATCH ?
+										sizeof(PyVarObject) + (childPosition - childStart) * sizeof(TE_CHAR) :
+									flags & MATCH_APPENDTAGOBJ ?
+										0 :
+										sizeof(PyTupleObject) + 3 * sizeof(PyObject *) + (
+											childResults != NULL && childResults != taglist ? sizeof(PyListObject) : 0
+										)
+								),
+								childPosition, tagobj
+							)) {
+							/* LimitError is set */
+							returnCode = ERROR_CODE;
+						} else if (columns != NULL &&
+								!(flags & (MATCH_CALLTAG|MATCH_APPENDTAG|MATCH_APPENDMATCH|MATCH_APPENDTAGOBJ))) {
+							/* record a result row rather than building a result tuple,
+							any child table's rows are already in place at depth+1 */
+							DPRINTF( "recording result row\n" );
+							if (mxTextTools_Columns_Append(
+									columns, tagobj, childStart, childPosition, columnsDepth
+								)) {
+								returnCode = ERROR_CODE;
+							}
+							childResults = NULL;
 						} else {
 							/* get the callable object */
 							/* normally it's taglist.append, do the exceptions first */
@@ -465,10 +664,31 @@ int TE_ENGINE_API(
 									the string, not a tuple wrapping the string.  That is,
 									everywhere else we use tuples, here we don't
 									*/
-									parameter = TE_STRING_FROM_STRING(
-										TE_STRING_AS_STRING(textobj) + childStart,
-										childPosition - childStart
-									);
+									te_match *slot = NULL;
+
+									if (limits != NULL && limits->intern_matches > 0 &&
+										childPosition - childStart <= limits->intern_matches) {
+										/* reuse the string of an identical short match */
+										slot = te_match_slot(
+											&resultCache, (const char *)text, sizeof(TE_CHAR),
+											childStart, childPosition - childStart
+										);
+										parameter = te_cached_match(
+											slot, (const char *)text, sizeof(TE_CHAR),
+											childStart, childPosition - childStart
+										);
+									}
+									if (parameter == NULL) {
+										parameter = TE_STRING_FROM_STRING(
+											text + childStart,
+											childPosition - childStart
+										);
+										if (parameter != NULL) {
+											te_cache_match(
+												slot, childStart, childPosition - childStart, parameter
+											);
+										}
+									}
 									if (parameter == NULL) {
 										/* error occured getting parameter, report the exception */
 										returnCode = ERROR_CODE;
@@ -507,16 +727,18 @@ int TE_ENGINE_API(
 										} else if (flags & MATCH_APPENDTAG) {
 											/* AppendToTagobj -> want to call append with a 4-tuple of values, so parameter needs to be ((x,y,z,w),) */
 											/* XXX can't get the darn thing to accept "((OiiO))" :( */
-											parameter = Py_BuildValue(
-												"((OiiO))",
-												Py_None,
-												childStart,
-												childPosition,
-												childResults
+											PyObject *result = te_result_tuple(
+												&resultCache, Py_None, childStart, childPosition, childResults
 											);
+											if (result != NULL) {
+												parameter = PyTuple_Pack( 1, result );
+												Py_DECREF( result );
+											}
 										} else {
 											/* either we are calling a method that requires the 4 args, or we're appending the 4-tuple to a list */
-											parameter = Py_BuildValue( "OiiO", tagobj, childStart, childPosition, childResults );
+											parameter = te_result_tuple(
+												&resultCache, tagobj, childStart, childPosition, childResults
+											);
 										}
 										if (parameter == NULL) {
 											returnCode = ERROR_CODE;
@@ -596,6 +818,11 @@ int TE_ENGINE_API(
 							position = childPosition;
 						}
 						index += successJump;
+						if (consume != NULL && stackDepth == 0 &&
+							taglist != Py_None && returnCode == NULL_CODE &&
+							te_consume_results(consume, taglist, &consumed, textobj)) {
+							returnCode = ERROR_CODE;
+						}
 						DPRINTF( "finished success-handler code\n" );
 						break;
 					}
@@ -659,6 +886,7 @@ int TE_ENGINE_API(
 					}
 			}
 			childReturnCode = NULL_CODE;
+			columnsChildLength = -1;
 			/* single entry processing loop complete */
 		}
 		/* we're done the table, figure out what to do. */
@@ -686,9 +914,16 @@ int TE_ENGINE_API(
 				returnCode = FAILURE_CODE;
 			}
 		}
+		if (returnCode == FAILURE_CODE && heatmap != NULL &&
+			position > startPosition &&
+			mxTextTools_Heatmap_Failed(
+				heatmap, production, startPosition, position - startPosition
+			)) {
+			returnCode = ERROR_CODE;
+		}
 		if (returnCode == FAILURE_CODE) {
 			/* truncate result list */
-			if (PyList_SetSlice(
+			if (taglist != Py_None && PyList_SetSlice(
 					taglist,
 					taglist_len,
 					PyList_Size(taglist),
@@ -700,6 +935,12 @@ int TE_ENGINE_API(
 					 Py_TYPE(taglist)->tp_name
 				);
 			}
+			if (columns != NULL) {
+				columns->length = columnsLength;
+			}
+			if (te_drop_numbers(&resultCache, numbersLength)) {
+				returnCode = ERROR_CODE;
+			}
 			/* reset position */
 			position = startPosition;
 		}
@@ -770,6 +1011,16 @@ int TE_ENGINE_API(
 				childResults = NULL;
 			}
 			*next = startPosition;
+			if (resultCache.sinks != NULL) {
+				/* the numbers stored so far stay in the sinks */
+				PyObject *type, *value, *traceback;
+
+				PyErr_Fetch(&type, &value, &traceback);
+				te_flush_sinks(&resultCache);
+				PyErr_Clear();
+				PyErr_Restore(type, value, traceback);
+			}
+			te_resultcache_free(&resultCache);
 			return 0;
 		} else {
 			if (stackParent != NULL) {
@@ -787,6 +1038,10 @@ int TE_ENGINE_API(
 				} else {
 					*next = position;
 				}
+				if (te_flush_sinks(&resultCache)) {
+					returnCode = ERROR_CODE;
+				}
+				te_resultcache_free(&resultCache);
 				return returnCode;
 			}
 		}
@@ -43,8 +43,14 @@ case MATCH_SUBTABLEINLIST:
 				case MATCH_TABLEINLIST:
 				case MATCH_SUBTABLEINLIST:
 					{
-						/* switch to explicitly specified table in a list (compiling if necessary) */
-
+						/* switch to the linked table or to the explicitly
+						   specified table in a list (compiling if necessary) */
+						newTable = table->entry[index].linked;
+						if (newTable != NULL) {
+							/* This is decref'd in POP */
+							Py_INCREF(newTable);
+							break;
+						}
 
 						newTable = PyList_GetItem(
 							PyTuple_GET_ITEM(match, 0),
@@ -60,15 +66,22 @@ case MATCH_SUBTABLEINLIST:
 								(unsigned int)index
 							);
 						} else {
-							if (mxTagTable_Check(newTable)) {
+							if (mxTagTable_Check(newTable) &&
+								mxTagTable_Type(newTable) == table->tabletype) {
 								/* This is decref'd in POP */
 								Py_INCREF(newTable);
 							} else {
+								if (mxTagTable_Check(newTable)) {
+									/* compiled for the other text type */
+									newTable = mxTagTable_Definition(newTable);
+								}
 								/* These tables are considered to be
 								   cacheable. */
-								newTable = mxTagTable_New(newTable,
-										   table->tabletype,
-										   1);
+								if (newTable != NULL) {
+									newTable = mxTagTable_New(newTable,
+											   table->tabletype,
+											   1);
+								}
 								/* why didn't we increment the refcount here? does New give us a new ref? */
 								if (newTable == NULL) {
 									childReturnCode = ERROR_CODE;
@@ -85,11 +98,24 @@ case MATCH_SUBTABLEINLIST:
 
 			}
 
+			if (childReturnCode == NULL_CODE && limits != NULL &&
+				limits->max_depth > 0 && stackDepth >= limits->max_depth) {
+				/* entering the table would exceed the nesting limit */
+				Py_DECREF(newTable);
+				te_limit_error("max_depth", limits->max_depth,
+					       position, te_limit_production(stackParent, tagobj));
+				childReturnCode = ERROR_CODE;
+			}
 			if (childReturnCode == NULL_CODE) { 
 				/* we found a valid newTable */
 				PyObject *subtags = NULL;
 
-				if (taglist != Py_None && command != MATCH_SUBTABLE && command != MATCH_SUBTABLEINLIST) {
+				if (taglist != Py_None && flags & MATCH_APPENDNUMBER) {
+					/* the match becomes a number, don't build results
+					for its children (like tag(...,taglist=None)) */
+					subtags = Py_None;
+					Py_INCREF(subtags);
+				} else if (taglist != Py_None && columns == NULL && command != MATCH_SUBTABLE && command != MATCH_SUBTABLEINLIST) {
 					/* Create a new list for use as subtaglist 
 					
 						Will be decref'd by the child-finished clause if necessary
@@ -111,9 +137,123 @@ case MATCH_SUBTABLEINLIST:
 
 				/* match other table */
 				PUSH_STACK( newTable, subtags );
+				if (flags & MATCH_APPENDNUMBER && appendNumberDepth < 0) {
+					/* AppendNumber entries in there are part of this number */
+					appendNumberDepth = stackDepth;
+				}
+				if (columns != NULL && command != MATCH_SUBTABLE && command != MATCH_SUBTABLEINLIST) {
+					/* rows share the one list, depth tells them apart */
+					columnsDepth++;
+				}
 				RESET_TABLE_VARIABLES
+				if (heatmap != NULL &&
+					mxTextTools_Heatmap_Enter(
+						heatmap, command, match, tagobj, position, &production
+					)) {
+					returnCode = ERROR_CODE;
+				}
 			}
 		} 
 		break;
 	}
 	    
+
+case MATCH_REPEAT:
+	{
+		/* bounded repetition of a sub-table: (table, min, max)
+
+			The table is run in a native loop rather than via
+			the jump/EOF-check triads the generator used to emit.
+			Each iteration reuses our taglist (as for SubTable).
+			The loop stops when an iteration fails, matches
+			without consuming input or max iterations are done.
+		*/
+		PyObject * repeatTable = PyTuple_GET_ITEM(match, 0);
+		Py_ssize_t repeatMin = PyInt_AS_LONG(PyTuple_GET_ITEM(match, 1));
+		PyObject * repeatMax = PyTuple_GET_ITEM(match, 2);
+		int repeatAgain = 0;
+
+		if (childReturnCode == NULL_CODE) {
+			/* starting the first iteration */
+			repeatCount = 0;
+			if (taglist != Py_None) {
+				repeatResultsLength = PyList_GET_SIZE(taglist);
+			}
+			repeatColumnsLength = columns ? columns->length : 0;
+			repeatNumbersLength = resultCache.numbered;
+			repeatAgain = 1;
+		} else if (childReturnCode == SUCCESS_CODE) {
+			if (childPosition > position) {
+				/* iteration matched and moved forward */
+				repeatCount++;
+				if (childPosition > sliceright) {
+					/* a negated item (Skip) stepped past EOF, it would
+					   keep "matching" there, so treat it as a null match */
+					childPosition = sliceright;
+					if (repeatCount < repeatMin) {
+						repeatCount = repeatMin;
+					}
+				} else if (childPosition == sliceright && repeatCount >= repeatMin) {
+					/* at EOF, further iterations can only match empty */
+				} else if (repeatMax == Py_None || repeatCount < PyInt_AS_LONG(repeatMax)) {
+					repeatAgain = 1;
+				}
+			} else {
+				/* null match, every further iteration would match
+				   here as well, so consider the minimum satisfied */
+				repeatCount = repeatMin;
+			}
+		} else {
+			/* iteration failed, we end where the last one ended */
+			childPosition = position;
+		}
+		DPRINTF("\nRepeat: %i iterations done, again=%i\n", repeatCount, repeatAgain);
+
+		if (repeatAgain) {
+			if (!mxTagTable_Check(repeatTable)) {
+				childReturnCode = ERROR_CODE;
+				errorType = PyExc_TypeError;
+				errorMessage = PyString_FromFormat(
+					 "Repeat argument must be a compiled TagTable: was a %.50s",
+					 Py_TYPE(repeatTable)->tp_name
+				);
+			} else if (limits != NULL &&
+				limits->max_depth > 0 && stackDepth >= limits->max_depth) {
+				te_limit_error("max_depth", limits->max_depth,
+					       childPosition, te_limit_production(stackParent, tagobj));
+				childReturnCode = ERROR_CODE;
+			} else {
+				/* we decref in POP */
+				Py_INCREF(repeatTable);
+				/* next iteration starts where the last one stopped */
+				position = childPosition;
+				PUSH_STACK( repeatTable, taglist );
+				RESET_TABLE_VARIABLES
+			}
+		} else if (repeatCount >= repeatMin) {
+			childReturnCode = SUCCESS_CODE;
+		} else {
+			/* too few iterations, drop the results of those which matched */
+			if (columns != NULL) {
+				columns->length = repeatColumnsLength;
+			}
+			if (te_drop_numbers(&resultCache, repeatNumbersLength)) {
+				childReturnCode = ERROR_CODE;
+			} else if (taglist != Py_None && PyList_SetSlice(
+					taglist,
+					repeatResultsLength,
+					PyList_GET_SIZE(taglist),
+					NULL)
+			) {
+				childReturnCode = ERROR_CODE;
+				errorType = PyExc_SystemError;
+				errorMessage = PyString_FromFormat(
+					 "Unable to truncate list object (likely tagging engine error) type(%.50s)",
+					 Py_TYPE(taglist)->tp_name
+				);
+			} else {
+				childReturnCode = FAILURE_CODE;
+			}
+		}
+		break;
+	}
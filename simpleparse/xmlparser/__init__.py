@@ -8,4 +8,8 @@ support.  There is only very minimal
 support for Reference types, basically
 we note that a Reference exists, but
 don't do any further processing of it.
+
+The events module streams large documents as a flat
+series of tag, character data and other events rather
+than parsing them into a single result tree.
 """
\ No newline at end of file
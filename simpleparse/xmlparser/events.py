@@ -0,0 +1,173 @@
+"""Incremental XML tokenizer built on the xml_parser productions
+
+Parsing a whole document with the xml_parser grammar builds a
+result tree of everything in it (and its element production
+can't really describe nested content anyway).  iterevents instead
+reads a file in chunks and yields the markup and character data
+as a flat series of events, each matched with the grammar's own
+productions:
+
+    for production, text, children in iterevents( open( name, 'rb' )):
+        if production == 'STag':
+            ...
+
+The events are named by the production which matched them:
+
+    XMLDecl, doctypedecl, Misc -- the prolog (Misc being the
+        whitespace between its declarations)
+    STag, ETag, EmptyElemTag -- tags
+    CharData, Reference, CDSect -- content
+    PI, XMLComment -- processing instructions and comments
+        anywhere in the document (XMLComment wraps the
+        grammar's unreported Comment production)
+
+Only the buffered chunk and the events matched from it are held
+in memory, so memory use doesn't grow with the size of the
+document.  An event which reaches the end of the buffered data
+is held back until more data has been read, as it could
+otherwise be cut short, and so is markup which isn't complete
+yet (and only matches as CharData until it is), so no single
+event may be longer than limit characters.
+
+The events aren't checked for well-formedness (e.g. that end tags
+match their start tags), and anything which isn't well-formed
+markup is reported as CharData.
+"""
+import codecs, re
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools.TextTools import tag, shifttaglist
+from simpleparse.error import ParserSyntaxError
+from simpleparse.xmlparser import xml_parser
+
+# CharData never matches where markup starts, so the order of the
+# alternatives only affects speed: the most common events come first
+declaration = xml_parser.declaration + """
+XMLComment := Comment
+xml_prolog := (XMLDecl / doctypedecl / PI / XMLComment / Misc)*
+xml_events := (STag / ETag / CharData / EmptyElemTag / Reference / XMLComment / CDSect / PI)*
+"""
+
+# markup which content only matches as CharData while it's cut short
+# by the end of the buffer, with the text that completes it
+_closers = [
+    ('<!--', '-->'),
+    ('<![CDATA[', ']]>'),
+    ('<?', '?>'),
+]
+_tagEnd = re.compile( r'''<[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*>''' )
+_subsetEnd = re.compile( r'\]\s*>' )
+
+def _truncated( buffer, position ):
+    """Whether the '<' at position may start markup which isn't complete yet"""
+    for opener, closer in _closers:
+        if buffer.startswith( opener, position ):
+            return buffer.find( closer, position + len(opener) ) < 0
+    match = _tagEnd.match( buffer, position )
+    if match is None:
+        return True
+    internal = buffer.find( '[', position, match.end() )
+    if internal >= 0 and buffer.startswith( '<!', position ):
+        # a DOCTYPE declaration's internal subset holds more markup
+        return _subsetEnd.search( buffer, internal ) is None
+    return False
+
+_parser = None
+def getParser( ):
+    """Get the (shared) parser for the event productions"""
+    global _parser
+    if _parser is None:
+        _parser = Parser( declaration, 'xml_events' )
+    return _parser
+
+def iterevents( source, encoding='utf-8', chunkSize=65536, limit=2**24 ):
+    """Iterate over the events of the XML document read from source
+
+    source -- file-like object whose read(n) method returns
+        bytes or (unicode) strings, empty at the end of the document
+    encoding -- encoding of bytes read from source
+    chunkSize -- number of bytes (or characters) to read at a time
+    limit -- maximum number of characters buffered for a single
+        event, ValueError is raised beyond that
+
+    yields (production, text, children) with the offsets of the
+    children relative to text
+    """
+    parser = getParser()
+    prolog = tagger = parser.buildTagger( 'xml_prolog' )
+    content = parser.buildTagger( 'xml_events' )
+    decoder = None
+    buffer = u''
+    # data read since the buffer was last tagged
+    chunks = []
+    buffered = 0
+    # a held back event is only tagged again from its start once
+    # the buffered data has doubled, so long events stay linear
+    threshold = 0
+    final = False
+    while not final:
+        data = source.read( chunkSize )
+        final = not data
+        if decoder is None and isinstance( data, bytes ):
+            decoder = codecs.getincrementaldecoder( encoding )()
+        if decoder is not None:
+            data = decoder.decode( data, final )
+        if data:
+            chunks.append( data )
+            buffered += len(data)
+        if not buffered or not (
+            final or buffered >= threshold or buffered > limit
+        ):
+            continue
+        buffer = buffer + u''.join( chunks )
+        chunks = []
+        length = len(buffer)
+        success, children, next = tag( buffer, tagger, 0, length )
+        if tagger is prolog and next < length:
+            # the prolog ends here, unless a declaration is cut short
+            if final or not (
+                buffer.startswith( '<', next ) and _truncated( buffer, next )
+            ):
+                tagger = content
+                success, rest, next = tag( buffer, content, next, length )
+                children.extend( rest )
+        if final:
+            if next != length:
+                error = ParserSyntaxError( )
+                error.production = tagger is prolog and 'xml_prolog' or 'xml_events'
+                error.buffer = buffer
+                error.position = next
+                raise error
+        elif tagger is content:
+            # markup cut short by the end of the buffer is matched
+            # as CharData, hold it back until more data is read, as
+            # well as an event reaching the end, which may continue
+            cut = None
+            for index, (production, start, stop, subtree) in enumerate( children ):
+                if production == 'CharData':
+                    position = buffer.find( '<', start, stop )
+                    while position >= 0 and not _truncated( buffer, position ):
+                        position = buffer.find( '<', position + 1, stop )
+                    if position >= 0:
+                        cut = index
+                        break
+            if cut is None and children and children[-1][2] == length:
+                cut = len(children) - 1
+            if cut is not None:
+                next = children[cut][1]
+                del children[cut:]
+        elif children and children[-1][2] == length:
+            # the prolog's last event may continue
+            next = children.pop()[1]
+        for production, start, stop, subtree in children:
+            if start and subtree:
+                subtree = shifttaglist( subtree, -start )
+            yield production, buffer[start:stop], subtree
+        buffer = buffer[next:]
+        buffered = len(buffer)
+        threshold = 2 * buffered
+        if buffered > limit:
+            raise ValueError(
+                """Event buffer exceeded %s characters without a complete event"""%(
+                    limit,
+                )
+            )
@@ -49,6 +49,20 @@ class MXFlagTests(unittest.TestCase):
                 "abbaab",
             ],6),
         )
+    def testAppendMatch2( self ):
+        """Test AppendMatch with identical short matches interned"""
+        table = (
+            ( "word", AllIn + AppendMatch, "ab", 1, 1 ),
+            ( None, Is, " ", 1, -1 ),
+        )
+        for text in (u"ab ab abab abab ba", b"ab ab abab abab ba"):
+            success, words, next = tag( text, table, intern_matches=4 )
+            assert words == [text[:2],text[:2],text[6:10],text[6:10],text[16:]], words
+            assert words[0] is words[1] and words[2] is words[3], words
+        success, words, next = tag( "abab abab", table, intern_matches=2 )
+        assert words == ["abab","abab"] and words[0] is not words[1], words
+        success, words, next = tag( "ab ab", table )
+        assert words == ["ab","ab"] and words[0] is not words[1], words
     def testAppendToTagobj1( self ):
         """Test AppendToTagobj"""
         class X:
@@ -1,3 +1,4 @@
+# -*- coding: utf-8 -*-
 """Low-level matching tests for mx.TextTools"""
 import unittest
 from simpleparse.stt.TextTools import *
@@ -123,6 +124,179 @@ class MXHighTests(unittest.TestCase):
                     b"cdffgg",
                     ( 1,[],0),
                 )
+        def testsWordStartUnicode( self ):
+            """Test sWordStart command with Unicode search algorithms"""
+            for algo in [TRIVIAL, HORSPOOL]:
+                for match in [u"*/", u"абв*/"]:
+                    text = u"/* бв *абв*абв*/ x"
+                    self.doBasicTest(
+                        (
+                            ( None, sWordStart, TextSearch(match, algorithm=algo), 0 ),
+                        ),
+                        text,
+                        ( 1,[],text.index(match)),
+                    )
+        def testsWordStartOtherTextType( self ):
+            """Test search objects which only search the other type of text"""
+            for search, text in [
+                (TextSearch( b"*/", algorithm=BOYERMOORE ), u"/* x */"),
+                (TextSearch( u"*/", algorithm=HORSPOOL ), b"/* x */"),
+            ]:
+                self.doBasicTest(
+                    (
+                        ( None, sWordStart, search, 0 ),
+                    ),
+                    text,
+                    ( 1,[],5),
+                )
+        def testSearchUnicode( self ):
+            """Test Unicode TextSearch against str.find"""
+            for match in [u"а", u"ab", u"bаbаa", u"İbaаaа"]:
+                search = TextSearch( match )
+                assert search.algorithm == HORSPOOL, search.algorithm
+                for text in [u"", u"bаbаabаbаaİbaаaа", u"Ȱab" * 5]:
+                    for start in range(len(text)+1):
+                        for stop in range(start, len(text)+1):
+                            found = text.find( match, start, stop )
+                            if found == -1:
+                                expected = (start, start)
+                            else:
+                                expected = (found, found+len(match))
+                            assert search.search( text, start, stop ) == expected, (match, text, start, stop)
+        def testSearchUnicodeTranslate( self ):
+            """Test Unicode TextSearch with a translate table"""
+            translate = bytes( bytearray( range(256) )).upper()
+            search = TextSearch( u"HELLO, вORLD", translate )
+            text = u"Hello, вorld and hello, вorld"
+            assert search.search( text ) == (0,12), search.search( text )
+            assert search.search( text, 1 ) == (17,29), search.search( text, 1 )
+            assert search.search( u"hello, Вorld" ) == (0,0)
+        def testSearchSet( self ):
+            """Test TextSearchSet finds the leftmost, longest match"""
+            for patterns, text in [
+                ([b"bc", b"abcd", b"x"], b"zzabcdx"),
+                ([u"bc", u"abcd", u"x"], u"zzabcdx"),
+                ([u"abc", u"bc", u"бв"], u"ааабвabc"),
+            ]:
+                search = TextSearchSet( patterns )
+                expected = []
+                position = 0
+                while True:
+                    found = [
+                        (text.find( pattern, position ), -len(pattern), index)
+                        for index, pattern in enumerate( patterns )
+                        if text.find( pattern, position ) >= 0
+                    ]
+                    if not found:
+                        break
+                    left, length, index = min( found )
+                    if not expected:
+                        assert search.search( text ) == (left, left-length), search.search( text )
+                        assert search.searchindex( text ) == (left, left-length, index)
+                        assert search.find( text ) == left
+                    expected.append( (left, left-length) )
+                    position = left-length
+                assert search.findall( text ) == expected, (patterns, search.findall( text ))
+            search = TextSearchSet( [u"*/", u"-->"] )
+            assert search.search( u"abc", 1 ) == (1,1)
+            assert search.searchindex( u"abc" ) == (0,0,-1)
+            assert search.find( u"a-->*/", 0, 4 ) == 1
+            assert search.find( u"a-->*/", 0, 3 ) == -1
+        def testSearchSetTranslate( self ):
+            """Test TextSearchSet with a translate table"""
+            translate = bytes( bytearray( range(256) )).upper()
+            search = TextSearchSet( [u"HELLO", u"WORLD"], translate )
+            assert search.findall( u"hello World" ) == [(0,5),(6,11)]
+            search = TextSearchSet( [b"HELLO", b"WORLD"], translate )
+            assert search.findall( b"hello World" ) == [(0,5),(6,11)]
+        def testSearchSetErrors( self ):
+            """Test TextSearchSet rejects empty sets and match strings"""
+            self.assertRaises( ValueError, TextSearchSet, [] )
+            self.assertRaises( ValueError, TextSearchSet, [b"a", b""] )
+            self.assertRaises( TypeError, TextSearchSet, [b"a", 1] )
+        def testSearchSetReplace( self ):
+            """Test TextSearchSet.replace in one pass, to a string or a file"""
+            import io
+            for patterns, replacements, text, expected in [
+                ([b"bc", b"abcd", b"x"], [b"1", b"", b"xx"], b"zzabcdxbc", b"zzxx1"),
+                ([u"a", u"бв"], [u"бв", u"a"], u"aбвaб", u"бвaбвб"),
+                ([u"q"], [u"long"], u"abc", u"abc"),
+            ]:
+                search = TextSearchSet( patterns )
+                assert search.replace( text, replacements ) == expected, search.replace( text, replacements )
+                assert search.replace( text, replacements, 1, len(text)-1 ) == search.replace( text[1:-1], replacements )
+                output = io.BytesIO() if isinstance( text, bytes ) else io.StringIO()
+                count = search.replace( text, replacements, file=output )
+                assert output.getvalue() == expected
+                assert count == len( search.findall( text ))
+            chunks = []
+            class Output:
+                def write( self, data ):
+                    chunks.append( data )
+            text = u"abc " * 40000
+            assert replaceall( text, {u"abc": u"x"*30, u"c": u""}, file=Output()) == 40000
+            assert len( chunks ) > 1
+            assert u"".join( chunks ) == text.replace( u"abc", u"x"*30 )
+            assert replaceall( u"hello world", [(u"hello",u"bye"),(u"o",u"0")] ) == u"bye w0rld"
+            assert replaceall( u"hello", {} ) == u"hello"
+            search = TextSearchSet( [u"a"] )
+            self.assertRaises( TypeError, search.replace, u"a", [b"x"] )
+            self.assertRaises( ValueError, search.replace, u"a", [u"x", u"y"] )
+        def testIterSplit( self ):
+            """Test the iterator versions of the split functions"""
+            for text in [u"a,b\r\n\n,c d ,\r", u"", u"\n\n", u"бв г,\rд"]:
+                for text in [text, text.encode('utf-8')]:
+                    if isinstance( text, bytes ):
+                        sep, space = b",", b" "
+                    else:
+                        sep, space = u",", u" "
+                    assert list( itersplitlines( text )) == splitlines( text ), text
+                    assert list( itercharsplit( text, sep )) == charsplit( text, sep ), text
+                    assert list( itersplitwords( text )) == splitwords( text ), text
+                    assert list( itersplit( text, space )) == text.split( space ), text
+                    assert list( itersplit( text, TextSearchSet( [sep, space] ))) == \
+                        text.replace( sep, space ).split( space ), text
+                    assert list( itersetsplit( text, set( b", " ))) == \
+                        [part for part in text.replace( sep, space ).split( space ) if part], text
+                    for l, r in itersplitlines( text, 1, len(text), offsets=1 ):
+                        assert 1 <= l <= r <= len(text)
+            assert list( itercharsplit( u"a,b,c", u",", 1, 4 )) == [u"", u"b", u""]
+            assert list( itersplitlines( u"ab\r\ncd", offsets=1 )) == [(0,2),(4,6)]
+            assert list( itersplitwords( u" ab  cd ", offsets=1 )) == [(1,3),(5,7)]
+        def testIterSplitBuffer( self ):
+            """Test splitting memoryviews and mmaps with the iterators"""
+            import mmap, tempfile
+            assert list( itersplitlines( memoryview( b"ab\ncd" ))) == [b"ab", b"cd"]
+            assert list( whitespace_charset.itersplit( bytearray( b" ab c" ))) == [b"ab", b"c"]
+            handle = tempfile.TemporaryFile()
+            try:
+                handle.write( b"line one\r\nline two\n" )
+                handle.flush()
+                buffer = mmap.mmap( handle.fileno(), 0 )
+                lines = itersplitlines( buffer )
+                assert next( lines ) == b"line one"
+                assert list( lines ) == [b"line two"]
+                del lines
+                buffer.close()
+            finally:
+                handle.close()
+            self.assertRaises( TypeError, itersplitlines, 3 )
+            self.assertRaises( TypeError, itercharsplit, b"abc", u"," )
+        def testsWordStartSearchSet( self ):
+            """Test sWordStart, sWordEnd and sFindWord with a TextSearchSet"""
+            search = TextSearchSet( [u"*/", u"-->", u"]]>"] )
+            for command, expected in [
+                (sWordStart, ( 1,[("x",0,5,None)],5)),
+                (sWordEnd, ( 1,[("x",0,8,None)],8)),
+                (sFindWord, ( 1,[("x",5,8,None)],8)),
+            ]:
+                self.doBasicTest(
+                    (
+                        ( "x", command, search ),
+                    ),
+                    u"comme]]> */",
+                    expected,
+                )
     else:
         def testsWordStart1( self ):
             """Test simple sWordStart command"""
@@ -1,3 +1,4 @@
+# -*- coding: utf-8 -*-
 """Low-level matching tests for mx.TextTools"""
 import unittest
 from simpleparse.stt.TextTools import *
@@ -216,6 +217,89 @@ class MXLowTests(unittest.TestCase):
             ( 1,[],0),
         )
 
+    def testCIWord1( self ):
+        """Test CIWord command ignoring case"""
+        self.doBasicTest(
+            (
+                ( "ab", CIWord, "aB", 0 ),
+            ),
+            "Abc",
+            ( 1,[("ab",0,2,None)],2),
+        )
+        self.doBasicTest(
+            (
+                ( "ab", CIWord, b"aB", 0 ),
+            ),
+            b"Abc",
+            ( 1,[("ab",0,2,None)],2),
+        )
+    def testCIWord2( self ):
+        """Test CIWord command ignore fail"""
+        self.doBasicTest(
+            (
+                ( "ab", CIWord, "ab", 1,1),
+            ),
+            "Ac",
+            ( 1,[],0),
+        )
+    def testCIWord3( self ):
+        """Test CIWord command's Unicode case folding"""
+        self.doBasicTest(
+            (
+                ( "word", CIWord, u"σοφοςk", 0 ),
+            ),
+            u"ΣΟΦΟΣK",
+            ( 1,[("word",0,6,None)],6),
+        )
+        self.doBasicTest(
+            (
+                ( "word", CIWord, u"s", 1,1 ),
+            ),
+            u"\xdf",
+            ( 1,[],0),
+        )
+        self.doBasicTest(
+            (
+                ( "word", CIWord, u"ßµ", 0 ),
+            ),
+            u"ẞΜ",
+            ( 1,[("word",0,2,None)],2),
+        )
+        self.doBasicTest(
+            (
+                ( "word", CIWord, u"i", 1,1 ),
+            ),
+            u"İ",
+            ( 1,[],0),
+        )
+    def testCIWordStart1( self ):
+        """Test CIWordStart command ignoring case"""
+        self.doBasicTest(
+            (
+                ( "ab", CIWordStart, "ab", 0 ),
+            ),
+            "ddeeffAB",
+            ( 1,[("ab",0,6,None)],6),
+        )
+    def testCIWordEnd1( self ):
+        """Test CIWordEnd command ignoring case"""
+        self.doBasicTest(
+            (
+                ( "ab", CIWordEnd, "Ab", 0 ),
+            ),
+            b"ddeeffaB",
+            ( 1,[("ab",0,8,None)],8),
+        )
+    def testCIWordEnd2( self ):
+        """Test CIWordEnd command ignore fail"""
+        self.doBasicTest(
+            (
+                ( "ab", CIWordEnd, "ab", 1,1),
+            ),
+            "cdffgA",
+            ( 1,[],0),
+        )
+
     def testAllInSet1( self ):
         """Test simple AllInSet command"""
         self.doBasicTest(
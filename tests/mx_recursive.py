@@ -1,5 +1,5 @@
 """Low-level matching tests for mx.TextTools"""
-import unittest, pprint
+import unittest, pprint, pickle
 from simpleparse.stt.TextTools import *
 
 ab = (
@@ -154,7 +154,132 @@ class MXRecursiveTests(unittest.TestCase):
             ],6),
         )
 
-        
+    def testRepeat1( self ):
+        """Test Repeat command within bounds"""
+        self.doBasicTest(
+            (
+                (None, Repeat, (ab, 1, 2)),
+            ),
+            "abababcd",
+            ( 1,[
+                ("ab",0,2,None),
+                ("ab",2,4,None),
+            ],4),
+        )
+    def testRepeat2( self ):
+        """Test Repeat command with no maximum"""
+        self.doBasicTest(
+            (
+                (None, Repeat, (ab, 2, None)),
+            ),
+            "abababcd",
+            ( 1,[
+                ("ab",0,2,None),
+                ("ab",2,4,None),
+                ("ab",4,6,None),
+            ],6),
+        )
+    def testRepeat3( self ):
+        """Test Repeat command failing below minimum discards results"""
+        self.doBasicTest(
+            (
+                (None, Repeat, (ab, 3, None),1,1),
+                ("rest", AllIn, "abcd"),
+            ),
+            "ababcd",
+            ( 1,[
+                ("rest",0,6,None),
+            ],6),
+        )
+    def testRepeat4( self ):
+        """Test Repeat command with zero minimum"""
+        self.doBasicTest(
+            (
+                (None, Repeat, (ab, 0, 1)),
+                ("cd", Word, "cd"),
+            ),
+            "cdef",
+            ( 1,[
+                ("cd",0,2,None),
+            ],2),
+        )
+    def testLinkTables1( self ):
+        """Test TableInList commands linked to compiled tables"""
+        linked = [ ab, cdef ]
+        linktables( linked )
+        assert isinstance( linked[0], TagTableType ), linked[0]
+        self.doBasicTest(
+            (
+                ("first", TableInList, (linked,0)),
+                ("second", SubTableInList,(linked,1)),
+            ),
+            b"abcdef",
+            ( 1,[
+                ("first",0,2,[
+                    ("ab",0,2,None),
+                ]),
+                ("cd",2,4,None),
+                ("ef",4,6,None),
+                ("second",2,6,None),
+            ],6),
+        )
+    def testLinkTables2( self ):
+        """Test recursive tables linked for the other text type"""
+        linked = []
+        linked.append( (
+            ("a", Word, "a"),
+            (None, SubTableInList, (linked,0), 1, 1),
+        ) )
+        linktables( linked, 1 )
+        for text in (u"aaab", b"aaab"):
+            self.doBasicTest(
+                (
+                    ("x", TableInList, (linked,0)),
+                ),
+                text,
+                ( 1,[
+                    ("x",0,3,[
+                        ("a",0,1,None),
+                        ("a",1,2,None),
+                        ("a",2,3,None),
+                    ]),
+                ],3),
+            )
+    def testPickleLinked( self ):
+        """Test pickling linked tables restores types and links"""
+        linked = []
+        linked.append( (
+            ("a", Word, "a"),
+            (None, SubTableInList, (linked,0), 1, 1),
+        ) )
+        linktables( linked, 1 )
+        restored = pickle.loads( pickle.dumps( linked ))
+        assert isinstance( restored[0], TagTableType ), restored[0]
+        assert restored[0].tabletype == 1
+        assert restored[0].compiled()[1][2][0] is restored
+        assert restored[0].__getstate__()[1] is restored[0]
+        for text in (u"aaab", b"aaab"):
+            table = (("x", TableInList, (restored,0)),)
+            assert tag( text, table ) == (1,[
+                ("x",0,3,[("a",0,1,None),("a",1,2,None),("a",2,3,None)]),
+            ],3), text
+        string = pickle.loads( pickle.dumps( TagTable( cdef )))
+        assert string.tabletype == 0
+        self.doBasicTest( string, b"cdef", (1,[("cd",0,2,None),("ef",2,4,None)],4) )
+        self.assertRaises(
+            TypeError, restoretagtable, ((None, Word, b"ab", 1, 1),), 1,
+        )
+    def testNoTaglist( self ):
+        """Test tagging with taglist None, reporting tables included"""
+        table = (
+            ("x", TableInList, (tableList,0)),
+            ("y", Table, cdef),
+        )
+        assert tag( "abcdef", table, 0, 6, None ) == (1, None, 6)
+        assert tag( "abcdxx", table, 0, 6, None ) == (1, None, 4)
+        assert tag( "abxxef", table, 0, 6, None ) == (0, None, 2)
+        assert tag( "xbcdef", table, 0, 6, None ) == (0, None, 0)
+
 def getSuite():
     return unittest.makeSuite(MXRecursiveTests,'test')
 
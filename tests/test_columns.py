@@ -0,0 +1,91 @@
+import unittest
+from simpleparse.parser import Parser
+from simpleparse.columns import Columns
+from simpleparse.stt.TextTools import TextTools
+
+declaration = r'''
+root := (word/num/ws)+
+word := letter+
+<letter> := [a-z]
+num := digits, ('.', digits)?
+digits := [0-9]+
+<ws> := [ ]+
+'''
+
+class ColumnsTests(unittest.TestCase):
+    """Tests columnar result export via parse_columns"""
+    def setUp( self ):
+        self.parser = Parser( declaration )
+    def rows( self, columns ):
+        """Rebuild (tagname, left, right, depth, parent) rows"""
+        return [
+            (columns.tags[t], l, r, d, p)
+            for (t, l, r, d, p) in zip(
+                columns.tag, columns.left, columns.right,
+                columns.depth, columns.parent,
+            )
+        ]
+    def testColumns( self ):
+        """Test rows, depths and parents in post-order"""
+        success, columns, next = self.parser.parse_columns( 'abc 12.5 de 7' )
+        assert success
+        assert next == 13, next
+        assert len(columns) == 7, len(columns)
+        assert self.rows( columns ) == [
+            ('word', 0, 3, 0, -1),
+            ('digits', 4, 6, 1, 3),
+            ('digits', 7, 8, 1, 3),
+            ('num', 4, 8, 0, -1),
+            ('word', 9, 11, 0, -1),
+            ('digits', 12, 13, 1, 6),
+            ('num', 12, 13, 0, -1),
+        ], self.rows( columns )
+    def testMatchesTag( self ):
+        """Test columns carry the same nodes as the tuple results"""
+        text = 'ab 1.2 c 3 4.56 def'
+        def flatten( results, depth=0 ):
+            for (tag, left, right, children) in results:
+                for row in flatten( children or [], depth+1 ):
+                    yield row
+                yield (tag, left, right, depth)
+        expected = list(flatten( self.parser.parse( text )[1] ))
+        success, columns, next = self.parser.parse_columns( text )
+        assert [row[:4] for row in self.rows( columns )] == expected
+    def testFailure( self ):
+        """Test a failed parse records no rows"""
+        success, columns, next = self.parser.parse_columns( '!!!' )
+        assert not success
+        assert len(columns) == 0
+        assert len(columns.parent) == 0
+    def testBacktrack( self ):
+        """Test rows of a failed alternative are discarded"""
+        parser = Parser( r'''
+        root := (a, 'x') / (a, 'y')
+        a := [a]
+        ''' )
+        success, columns, next = parser.parse_columns( 'ay' )
+        assert success
+        assert self.rows( columns ) == [
+            ('a', 0, 1, 0, -1),
+        ], self.rows( columns )
+    def testEngine( self ):
+        """Test tagcolumns directly with an unreported table"""
+        table = (
+            (None, TextTools.Table, (
+                ('a', TextTools.Is, 'a'),
+            )),
+            ('b', TextTools.Is, 'b'),
+        )
+        success, raw, next = TextTools.tagcolumns( 'ab', table )
+        assert success == 1
+        assert next == 2
+        columns = Columns( *raw )
+        assert self.rows( columns ) == [
+            ('b', 1, 2, 0, -1),
+        ], self.rows( columns )
+
+def getSuite():
+    return unittest.makeSuite(ColumnsTests,'test')
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -1,4 +1,5 @@
-import unittest, string, logging
+import unittest, string, logging, datetime, sys
+from array import array
 from simpleparse.parser import Parser
 from simpleparse.common import iso_date, iso_date_loose
 log = logging.getLogger(__name__)
@@ -120,3 +121,57 @@ else:
             ]:
                 success, children, next = iso_date_loose._p.parse( to_parse,production )
                 assert next == len(to_parse), "couldn't parse %s as a %s"%( to_parse, production)
+
+class DateTimeTests(unittest.TestCase):
+    """Tests for the datetime interpreter and timestamp collector"""
+    @unittest.skipIf( not hasattr( datetime, 'timezone' ), "isodatetime requires datetime.timezone" )
+    def testISODate( self ):
+        """Test interpreting ISO dates and times as datetime values"""
+        utc = datetime.timezone.utc
+        values = [
+            ("2002-02-03", datetime.datetime( 2002, 2, 3, tzinfo=utc)),
+            ("2002", datetime.datetime( 2002, 1, 1, tzinfo=utc)),
+            ("2002-02-03T04:15:16", datetime.datetime( 2002, 2, 3, 4, 15, 16, tzinfo=utc)),
+            ("2002-02-03T04:15-0500", datetime.datetime( 2002, 2, 3, 9, 15, tzinfo=utc)),
+            ("2002-02-03T04:15:16+05:30", datetime.datetime( 2002, 2, 2, 22, 45, 16, tzinfo=utc)),
+        ]
+        p = Parser( "d := ISO_date_time", "d" )
+        proc = iso_date.DateTimeInterpreter()
+        for to_parse, date in values:
+            success, children, next = p.parse( to_parse, processor=proc )
+            assert next == len(to_parse), to_parse
+            assert children[0] == date, (to_parse, children[0], date)
+            assert children[0].utcoffset() is not None
+        assert p.parse( "2002-02-03T04:15-0500", processor=proc )[1][0].utcoffset() == datetime.timedelta( hours=-5 )
+    @unittest.skipIf( not hasattr( datetime, 'timezone' ), "isodatetime requires datetime.timezone" )
+    def testISODateLoose( self ):
+        """Test interpreting loose ISO dates and times as datetime values"""
+        tz = datetime.timezone( datetime.timedelta( hours=2 ))
+        values = [
+            ("2002-2-3", datetime.datetime( 2002, 2, 3, tzinfo=tz)),
+            ("2002-02-03 4:5", datetime.datetime( 2002, 2, 3, 4, 5, tzinfo=tz)),
+            ("2002-02-03 4:5:16.25", datetime.datetime( 2002, 2, 3, 4, 5, 16, 250000, tzinfo=tz)),
+            ("2002-02-03 4:5:16 +00:00", datetime.datetime( 2002, 2, 3, 4, 5, 16, tzinfo=datetime.timezone.utc)),
+            ("2002-2-1 2:13 -05:30", datetime.datetime( 2002, 2, 1, 2, 13, tzinfo=datetime.timezone( datetime.timedelta( hours=-5, minutes=-30 )))),
+        ]
+        p = Parser( "d := ISO_date_time_loose", "d" )
+        proc = iso_date_loose.DateTimeInterpreter( tz )
+        for to_parse, date in values:
+            success, children, next = p.parse( to_parse, processor=proc )
+            assert next == len(to_parse), to_parse
+            assert children[0] == date, (to_parse, children[0], date)
+        self.assertRaises( ValueError, p.parse, "2002-02-30", processor=proc )
+    @unittest.skipIf( sys.version_info[0] < 3, "array('q') requires Python 3" )
+    def testTimestamps( self ):
+        """Test storing ISO dates and times as epoch microseconds"""
+        p = Parser( "file := (ISO_date_time_loose, [\n])*", "file" )
+        source = "1970-01-01\n2002-02-03 04:15:16.5 +01:00\n1969-12-31 23:59:59\n"
+        collector = iso_date_loose.TimestampCollector( array('q') )
+        success, children, next = p.parse( source, processor=collector )
+        assert next == len(source)
+        assert children == []
+        assert collector.target == array('q', [
+            0, 1012706116500000, -1000000,
+        ]), collector.target
+        assert len( collector ) == 3
+        self.assertRaises( ValueError, iso_date_loose.TimestampCollector, array('i') )
@@ -1,7 +1,9 @@
-import unittest
+import unittest, sys
+from array import array
 from simpleparse.parser import Parser
 from simpleparse.common import numbers
 from simpleparse import dispatchprocessor
+from simpleparse.stt.TextTools import TextTools
 
 _data = [
     (
@@ -176,9 +178,104 @@ class CommonTests(unittest.TestCase):
                 assert not success, """Parsed %s of %s as a %s result=%s"""%( repr(data[:length]), repr(data), production, (success, results, next))
                 
         
-        
+
+_vectors = r"""
+file := ts, (vec, ts)*
+vec := number, ts, number, ts, number, ts, ','
+<ts> := [ \t\n]*
+"""
+
+class CollectorTests(unittest.TestCase):
+    """Tests for converting numbers straight into arrays"""
+    def setUp( self ):
+        self.parser = Parser( _vectors, 'file' )
+    def testFloats( self ):
+        """Test storing floats, ints and hex numbers as doubles"""
+        collector = numbers.NumberCollector( array('d') )
+        source = '1 2.5 -3.0e2,\n0x10 --4 +.5 ,'
+        success, results, next = self.parser.parse( source, processor=collector )
+        assert next == len(source)
+        assert results == [('vec', 0, 13, []), ('vec', 14, 28, [])], results
+        assert collector.target == array('d', [1, 2.5, -300, 16, 4, .5]), collector.target
+        assert len( collector ) == 6
+    @unittest.skipIf( sys.version_info[0] < 3, "array('q') requires Python 3" )
+    def testChunks( self ):
+        """Test that all pending values get appended"""
+        collector = numbers.NumberCollector( array('q'), ('int',) )
+        parser = Parser( 'file := (int, ts)*\n<ts> := [ ]*', 'file' )
+        values = list(range( -5000, 5000, 3 ))
+        source = ' '.join([str(value) for value in values])
+        assert parser.parse( source, processor=collector )[2] == len(source)
+        assert collector.target == array('q', values)
+    @unittest.skipIf( sys.version_info[0] < 3, "memoryview.cast requires Python 3" )
+    def testBuffer( self ):
+        """Test filling a writable buffer"""
+        buffer = bytearray( 3 * array('i').itemsize )
+        collector = numbers.NumberCollector( memoryview( buffer ).cast( 'i' ) )
+        self.parser.parse( '1 -2 0x3,', processor=collector )
+        assert array('i', bytes( buffer )) == array('i', [1, -2, 3])
+        self.assertRaises( IndexError, self.parser.parse, '4 5 6,', processor=collector )
+    def testBacktracking( self ):
+        """Test that values of matches which are backtracked over are removed"""
+        parser = Parser( r'''
+        file := (item, ts)*
+        item := vec3/vec2
+        vec3 := number, ts, number, ts, number, ts, ';'
+        vec2 := number, ts, number, ts, ','
+        <ts> := [ \t\n]*
+        ''', 'file' )
+        collector = numbers.NumberCollector( array('d') )
+        parser.parse( '1 2 3; 4 5,', processor=collector )
+        assert collector.target == array('d', [1, 2, 3, 4, 5]), collector.target
+        assert len( collector ) == 5
+        # int_unsigned only matches in float, which fails for these
+        collector = numbers.NumberCollector( array('d'), ('int_unsigned',) )
+        parser = Parser( 'file := (number, ts)*\n<ts> := [ ]*', 'file' )
+        parser.parse( '1 2', processor=collector )
+        assert collector.target == array('d'), collector.target
+        # values already appended to the array are removed as well
+        collector = numbers.NumberCollector( array('l', [-1]), ('int',) )
+        parser = Parser( "file := ((int, ts)+, ';') / (int, ts)+\n<ts> := [ ]*", 'file' )
+        values = list(range( 3000 ))
+        parser.parse( ' '.join([str(value) for value in values]), processor=collector )
+        assert collector.target == array('l', [-1] + values )
+    def testNested( self ):
+        """Test that collected productions inside collected productions store nothing"""
+        collector = numbers.NumberCollector( array('d'), ('int', 'float', 'number') )
+        parser = Parser( "file := (number, ts)*, ';'\n<ts> := [ ]*", 'file' )
+        parser.parse( '1 2.5 3;', processor=collector )
+        assert collector.target == array('d', [1, 2.5, 3]), collector.target
+    def testErrors( self ):
+        """Test literals which can't be stored"""
+        collector = numbers.NumberCollector( array('b') )
+        self.assertRaises( ValueError, self.parser.parse, '1 2 3.5,', processor=collector )
+        self.assertRaises( OverflowError, self.parser.parse, '1 2 128,', processor=collector )
+        collector = numbers.NumberCollector( array('b') )
+        self.parser.parse( '1 2 -128,', processor=collector )
+        assert collector.target == array('b', [1, 2, -128])
+        collector = numbers.NumberCollector( array('I') )
+        self.assertRaises( OverflowError, self.parser.parse, '1 2 -3,', processor=collector )
+        self.assertRaises( TypeError, TextTools.NumberSink, [] )
+        self.assertRaises( ValueError, TextTools.NumberSink, array('u') )
+        self.assertRaises( ValueError, TextTools.NumberSink, array('d'), 1 )
+    def testBinary( self ):
+        """Test binary_number with base=2"""
+        collector = numbers.NumberCollector( array('i'), ('binary_number',), base=2 )
+        parser = Parser( 'file := (binary_number, ts)*\n<ts> := [ ]*', 'file' )
+        parser.parse( '101b -11B 0b', processor=collector )
+        assert collector.target == array('i', [5, -3, 0])
+    def testGenerator( self ):
+        """Test that AppendNumber requires a NumberSink"""
+        class Source( object ):
+            _m_number = TextTools.AppendNumber
+            _o_number = array('d')
+        self.assertRaises( ValueError, self.parser.parse, '1 2 3,', processor=Source() )
+
 def getSuite():
-    return unittest.makeSuite(CommonTests, 'test')
+    return unittest.TestSuite((
+        unittest.makeSuite(CommonTests,'test'),
+        unittest.makeSuite(CollectorTests,'test'),
+    ))
 
 if __name__ == "__main__":
     unittest.main(defaultTest="getSuite")
@@ -57,8 +57,63 @@ class CommonTests(unittest.TestCase):
                 success, results, next = p.parse( data)
                 assert not success, """Parsed %s of %s as a %s result=%s"""%( repr(data), production, (success, results, next))
                 
-        
-        
+    def testInterpreted( self ):
+        """Test decoding escapes the way the grammar reads them"""
+        interpreter = strings.StringInterpreter()
+        p = Parser( "x := string", 'x')
+        for data, expected in [
+            (r"'\'\"'", "'\\\""),
+            (r'"\'\""', "\\'\""),
+            (r"'''a\''' '''", "a''' "),
+            (r'""""\""""', '""'),
+            (r'"\x4g\x41\1010\8\\"', "\\x4gAA0\\8\\"),
+            ("'''line\\\nnext'''", "line\\\nnext"),
+            (u'"\\777\xe9"', u'\u01ff\xe9'),
+            ("''''''", ""),
+        ]:
+            success, results, next = p.parse( data )
+            assert success and next == len(data), data
+            value = interpreter.string( results[0], data )
+            assert value == expected, (data, value, expected)
+    def testInterpretedOtherType( self ):
+        """Test decoding bytes on Python 3 and unicode on Python 2
+
+        These gave the same values as str literals before escapes
+        were decoded natively, so they still have to.
+        """
+        interpreter = strings.StringInterpreter()
+        p = Parser( "x := string", 'x')
+        if isinstance( '', bytes ):
+            convert = lambda data: data.decode( 'latin-1' )
+        else:
+            convert = lambda data: data.encode( 'latin-1' )
+        for data, expected in [
+            ('""', ''),
+            (r'"\x41"', 'A'),
+            (r'"a\n"', 'a\n'),
+            (r"'\'\"'", "'\\\""),
+            (r'"\x4g\x41\1010\8\\"', "\\x4gAA0\\8\\"),
+            (r'''"""a\""" """''', 'a""" '),
+        ]:
+            data = convert( data )
+            success, results, next = p.parse( data )
+            assert success and next == len(data), data
+            value = interpreter.string( results[0], data )
+            assert value == expected, (data, value, expected)
+    def testUnescape( self ):
+        """Test the native escape decoder"""
+        unescape = strings.TextTools.unescape
+        escapes = {'n': '\n', 'q': '<quote>'}
+        assert unescape( r'a\nb\q\z\\', escapes ) == 'a\nb<quote>\\z\\\\'
+        assert unescape( r'"\x41"', escapes, 1, 5 ) == 'A'
+        assert unescape( 'plain', escapes, 1 ) == 'lain'
+        assert unescape( br'\n\101', {b'n': b'\n'} ) == b'\nA'
+        self.assertRaises( ValueError, unescape, br'\777', {} )
+        if not isinstance( '', bytes ):
+            # on Python 2 the replacement is the same type as the text
+            self.assertRaises( TypeError, unescape, r'a\n', {'n': b'\n'} )
+        self.assertRaises( TypeError, unescape, 'a', [] )
+
 def getSuite():
     return unittest.makeSuite(CommonTests, 'test')
 
@@ -0,0 +1,113 @@
+import unittest, threading, pickle
+from simpleparse.parser import Parser, CompiledParser
+from simpleparse import dispatchprocessor
+from simpleparse.common import strings
+
+declaration = r'''
+root := (word/number/string/ts)+
+word := [a-z]+
+number := int, fraction?
+>fraction< := '.', int
+<int> := [0-9]+
+<ts> := [ \t]+
+'''
+
+class Counter( dispatchprocessor.DispatchProcessor ):
+    """Processor reporting the number of words"""
+    def __call__( self, value, buffer ):
+        success, children, next = value
+        return len([child for child in children if child[0] == 'word'])
+
+class CompiledParserTests(unittest.TestCase):
+    """Tests for the immutable parsers produced by Parser.compile"""
+    def setUp( self ):
+        self.parser = Parser( declaration, 'root' )
+    def testMatchesParse( self ):
+        """Test that compiled parsers give the same results as parse"""
+        compiled = self.parser.compile()
+        for source in (
+            'this 23 that 4.5',
+            'this 23 that!',
+            '',
+            b'this 23 that 4.5',
+            b'4. x',
+        ):
+            assert compiled.parse( source ) == self.parser.parse( source ), source
+        number = self.parser.compile( 'number' )
+        assert number.parse( 'x4.5 ', 1 ) == self.parser.parse( 'x4.5 ', 'number', start=1 )
+        assert number.parse( 'x4.5 ', 1, 2 ) == (1, [], 2)
+    def testProcessor( self ):
+        """Test that the processor is applied to the results"""
+        compiled = self.parser.compile( processor=Counter() )
+        assert compiled.parse( 'a 1 bc d' ) == 3
+    def testNoRebuild( self ):
+        """Test that parsing doesn't use the parser or its generator"""
+        compiled = self.parser.compile()
+        expected = self.parser.parse( 'this 23' )
+        expectedBytes = self.parser.parse( b'this 23' )
+        def fail( *args, **named ):
+            raise AssertionError( "tables were rebuilt" )
+        self.parser._generator.buildParser = fail
+        self.parser.buildTagger = fail
+        assert compiled.parse( 'this 23' ) == expected
+        assert compiled.parse( b'this 23' ) == expectedBytes
+    def testImmutable( self ):
+        """Test that compiled parsers can't be modified"""
+        compiled = self.parser.compile()
+        assert isinstance( compiled, CompiledParser )
+        self.assertRaises( AttributeError, setattr, compiled, 'production', 'word' )
+        self.assertRaises( AttributeError, setattr, compiled, 'cache', {} )
+        self.assertRaises( AttributeError, delattr, compiled, 'unicodeTable' )
+    def testPickle( self ):
+        """Test that pickled compiled parsers parse without rebuilding"""
+        compiled = self.parser.compile()
+        sources = ['this 23 "str" that 4.5', b"4.5 'x' y", 'this!']
+        expected = [compiled.parse( source ) for source in sources]
+        data = pickle.dumps( compiled, 2 )
+        def fail( *args, **named ):
+            raise AssertionError( "tables were rebuilt" )
+        self.parser._generator.buildParser = fail
+        restored = pickle.loads( data )
+        assert restored.production == 'root'
+        assert restored.stringTable.tabletype == 0
+        assert restored.unicodeTable.tabletype == 1
+        for source, result in zip( sources, expected ):
+            assert restored.parse( source ) == result, source
+    def testPickleProcessor( self ):
+        """Test that processors are pickled with the compiled parser"""
+        compiled = self.parser.compile( processor=Counter() )
+        restored = pickle.loads( pickle.dumps( compiled ))
+        assert isinstance( restored.processor, Counter )
+        assert restored.parse( 'a 1 bc d' ) == 3
+        assert restored.parse( b'a "b" c' ) == 2
+    def testThreads( self ):
+        """Test sharing one compiled parser between threads"""
+        compiled = self.parser.compile()
+        sources = [
+            ' '.join( ['word%s %s.%s'%(chr(97+i%26), i, j) for j in range(50)] )
+            for i in range(8)
+        ]
+        expected = [self.parser.parse( source ) for source in sources]
+        failures = []
+        def run( index ):
+            try:
+                for i in range(20):
+                    if compiled.parse( sources[index] ) != expected[index]:
+                        failures.append( index )
+            except Exception as err:
+                failures.append( err )
+        threads = [
+            threading.Thread( target=run, args=(index,) )
+            for index in range(len(sources))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not failures, failures
+
+def getSuite():
+    return unittest.makeSuite(CompiledParserTests,'test')
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,80 @@
+import unittest
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import TextTools
+
+declaration = r'''
+root := (record/ts)*
+marked := ((record, '!')/other/ts)*
+nested := header, (pair/record/ts)*
+pair := record, '+', record
+record := 'r', [0-9]+, ';'
+other := 'r', [0-9]+, ';', '?'
+header := 'H'
+<ts> := [ ]+
+'''
+
+class Failure( Exception ):
+    """Raised by a handler"""
+
+class ConsumeTests(unittest.TestCase):
+    """Tests for handling and dropping results as soon as they are final"""
+    def setUp( self ):
+        self.parser = Parser( declaration, 'root' )
+        self.seen = []
+    def handler( self, result, buffer ):
+        self.seen.append( buffer[result[1]:result[2]] )
+    def testTopLevel( self ):
+        """Test consuming the items of the root production"""
+        result = self.parser.parse( 'r1; r22; r3;', consume={'record': self.handler} )
+        assert result == (1, [], 12), result
+        assert self.seen == ['r1;', 'r22;', 'r3;'], self.seen
+    def testBacktracking( self ):
+        """Test that matches undone by backtracking aren't consumed"""
+        result = self.parser.parse(
+            'r1;! r2;? r3;!', 'marked', consume={'record': self.handler},
+        )
+        assert result == (1, [('other', 5, 9, [])], 14), result
+        assert self.seen == ['r1;', 'r3;'], self.seen
+    def testNested( self ):
+        """Test that matches nested in other results are left alone"""
+        result = self.parser.parse(
+            'H r1; r2;+r3; r4;', 'nested', consume={'record': self.handler},
+        )
+        assert result[1] == [
+            ('header', 0, 1, None),
+            ('pair', 6, 13, [('record', 6, 9, []), ('record', 10, 13, [])]),
+        ], result
+        assert self.seen == ['r1;', 'r4;'], self.seen
+    def testBoundedResults( self ):
+        """Test that consumed results don't accumulate"""
+        sizes = []
+        taglist = []
+        def handler( result, buffer ):
+            sizes.append( len(taglist) )
+        success, children, next = TextTools.tag(
+            'r1; ' * 1000, self.parser.buildTagger( 'root' ), taglist=taglist,
+            consume={'record': handler},
+        )
+        assert next == 4000 and children is taglist and taglist == []
+        assert len(sizes) == 1000 and max(sizes) == 0, max(sizes)
+    def testCompiled( self ):
+        """Test consuming with compiled parsers"""
+        compiled = self.parser.compile()
+        assert compiled.parse( b'r1; r2;', consume={'record': self.handler} ) == (1, [], 7)
+        assert self.seen == [b'r1;', b'r2;'], self.seen
+    def testHandlerError( self ):
+        """Test that errors in handlers abort the parse"""
+        def handler( result, buffer ):
+            raise Failure( result )
+        self.assertRaises(
+            Failure, self.parser.parse, 'r1; r2;', consume={'record': handler},
+        )
+        self.assertRaises(
+            TypeError, self.parser.parse, 'r1;', consume=[('record', handler)],
+        )
+
+def getSuite():
+    return unittest.makeSuite(ConsumeTests,'test')
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,79 @@
+import unittest
+from simpleparse.parser import Parser
+
+declaration = r'''
+date := year, '-', month, '-', day
+year := digit, digit, digit, digit
+<month> := digit, digit
+<day> := digit, digit
+<digit> := [0-9]
+call := 'call(', word?, ')'
+word := [a-z]+
+either := 'call(x)' / 'call(y)' / date
+keyword := c'select'
+signed := [-+^]?, digit+
+spaces := ' '*
+anything := -'!'
+'''
+
+class FindIterTests(unittest.TestCase):
+    """Tests for scanning for a production anywhere in a buffer"""
+    def setUp( self ):
+        self.parser = Parser( declaration, 'date' )
+    def scan( self, production, source ):
+        """Scan with finditer and by trying the production at every offset"""
+        found = list( self.parser.finditer( source, production ))
+        expected = []
+        position = 0
+        while position <= len(source):
+            success, children, next = self.parser.parse( source, production, start=position )
+            if success:
+                expected.append( (production, position, next, children) )
+                if next > position:
+                    position = next
+                    continue
+            position += 1
+        assert found == expected, "%s in %r:\n\t%s\n\t%s"%( production, source, found, expected )
+        return found
+    def testDates( self ):
+        """Test finding dates with a first-character prefilter"""
+        found = self.scan( 'date', 'on 2020-01-02 and 1999-12-3, 1999-12-31x' )
+        assert [item[1:3] for item in found] == [(3,13),(29,39)], found
+        found = self.scan( 'date', b'on 2020-01-02 and 1999-12-31x' )
+        assert [item[1:3] for item in found] == [(3,13),(18,28)], found
+    def testLiteralPrefix( self ):
+        """Test finding productions with a required literal prefix"""
+        for source in (
+            'x call(ab) call( call() call(z',
+            b'call(ab)call(cd)',
+            '',
+            'no calls here',
+        ):
+            self.scan( 'call', source )
+        assert self.parser._generator.literalPrefix( 'call' ) == 'call('
+        assert self.parser._generator.literalPrefix( 'either' ) == ''
+        found = self.scan( 'either', 'call(y) 2020-01-02 call(z)' )
+        assert len( found ) == 2, found
+    def testCaseInsensitive( self ):
+        """Test finding case-insensitive literals"""
+        found = self.scan( 'keyword', 'Select, SELECT and selec' )
+        assert [item[1] for item in found] == [0,8], found
+    def testSpecialCharacters( self ):
+        """Test characters with special meaning to CharSet are escaped"""
+        found = self.scan( 'signed', 'a-1 b^2 c+3 \\4 5' )
+        assert [item[1:3] for item in found] == [(1,3),(5,7),(9,11),(13,14),(15,16)], found
+    def testEveryPosition( self ):
+        """Test productions which need to be tried at every offset"""
+        self.scan( 'spaces', 'a  b ' )
+        self.scan( 'anything', 'ab!c' )
+    def testStartStop( self ):
+        """Test restricting the scan to a slice"""
+        source = '2020-01-02 1999-12-31 1888-01-01'
+        found = list( self.parser.finditer( source, 'date', start=1, stop=22 ))
+        assert [item[1:3] for item in found] == [(11,21)], found
+
+def getSuite():
+    return unittest.makeSuite(FindIterTests,'test')
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
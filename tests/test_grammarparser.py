@@ -362,6 +362,37 @@ class SimpleParseGrammarTests(unittest.TestCase):
             '',
             (0, [], AnyInt)
         )
+    def testRepetitionBounds1( self ):
+        self.doBasicTest(
+            "repetition_bounds",
+            '{2,3}',
+            (1, [
+                ("repetition_min",1,2,NullResult),
+                ("repetition_max",3,4,NullResult),
+            ], 5)
+        )
+    def testRepetitionBounds2( self ):
+        self.doBasicTest(
+            "repetition_bounds",
+            '{12}',
+            (1, [
+                ("repetition_min",1,3,NullResult),
+            ], 4)
+        )
+    def testRepetitionBounds3( self ):
+        self.doBasicTest(
+            "repetition_bounds",
+            '{,3}',
+            (1, [
+                ("repetition_max",2,3,NullResult),
+            ], 4)
+        )
+    def testRepetitionBounds4( self ):
+        self.doBasicTest(
+            "repetition_bounds",
+            '{a}',
+            (0, [], AnyInt)
+        )
 
     def testLookAheadIndicator1( self ):
         self.doBasicTest(
@@ -603,6 +634,17 @@ class SimpleParseGrammarTests(unittest.TestCase):
                 ("name",0,5,NullResult),
             ], 5)
         )
+    def testElementToken1a( self ):
+        self.doBasicTest(
+            "element_token",
+            'hello{2,}',
+            (1, [
+                ("name",0,5,NullResult),
+                ("repetition_bounds",5,9,[
+                    ("repetition_min",6,7,NullResult),
+                ]),
+            ], 9)
+        )
     def testElementToken2( self ):
         self.doBasicTest(
             "element_token",
@@ -0,0 +1,77 @@
+import unittest
+from simpleparse.parser import Parser
+from simpleparse.heatmap import Heatmap, ROOT
+from simpleparse.stt.TextTools import TextTools
+
+declaration = r'''
+root := (item/ts)*
+item := (word, ' ', word, ';') / word
+word := [a-z]+
+<ts> := [ ]+
+retry := (as, 'b') / (as, 'c')
+as := 'a'+
+'''
+
+class HeatmapTests(unittest.TestCase):
+    """Tests for the backtracking heatmap diagnostics"""
+    def setUp( self ):
+        self.parser = Parser( declaration, 'root' )
+    def cells( self, heatmap ):
+        """Get the heatmap's cells as a dictionary"""
+        result = {}
+        for start, stop, name, failed, reentries in heatmap.hottest( len(heatmap) ):
+            result[ (start, name) ] = (failed, reentries)
+        return result
+    def testResults( self ):
+        """Test that the parse results are those of parse"""
+        source = 'ab cd ef; gh ' * 50
+        success, children, next, heatmap = self.parser.parse_heatmap( source )
+        assert (success, children, next) == self.parser.parse( source )
+        assert isinstance( heatmap, Heatmap )
+        assert len( heatmap.bucket ) == len( heatmap ) == len( heatmap.failed )
+    def testFailed( self ):
+        """Test counting the characters of failed attempts per bucket"""
+        source = 'ab cd ' * 20
+        success, children, next, heatmap = self.parser.parse_heatmap(
+            source, bucketsize=60,
+        )
+        assert next == len(source)
+        # at each word, two words are matched before the missing
+        # ';' fails the first alternative of item, the last word
+        # only gets as far as the space
+        assert self.cells( heatmap ) == {
+            (0, 'item'): (100, 0),
+            (60, 'item'): (98, 0),
+        }, self.cells( heatmap )
+    def testReentries( self ):
+        """Test counting productions tried again at the same position"""
+        success, children, next, heatmap = self.parser.parse_heatmap(
+            'aaac', 'retry', bucketsize=2,
+        )
+        assert success and next == 4
+        assert self.cells( heatmap ) == {
+            (0, 'as'): (0, 1),
+            (0, ROOT): (3, 0),
+        }, self.cells( heatmap )
+        assert heatmap.hottest( 1 ) == [(0, 2, ROOT, 3, 0)]
+        rendered = heatmap.render()
+        assert '0-2' in rendered and 'as' in rendered, rendered
+    def testTag( self ):
+        """Test tagheatmap directly with plain tables"""
+        table = (
+            ('x', TextTools.Table, ((None, TextTools.Word, 'ab'), (None, TextTools.Is, 'c'))),
+        )
+        success, taglist, next, raw = TextTools.tagheatmap( 'abd', table )
+        assert (success, taglist, next) == (0, [], 0)
+        heatmap = Heatmap( *raw )
+        assert heatmap.bucketsize == 1024
+        assert heatmap.hottest() == [(0, 1024, ROOT, 2, 0)]
+        raw = TextTools.tagheatmap( 'abd', table, productions={'x': 3} )[3]
+        assert Heatmap( *raw ).hottest() == [(0, 1024, '3', 2, 0)]
+        self.assertRaises( ValueError, TextTools.tagheatmap, 'abd', table, bucketsize=0 )
+
+def getSuite():
+    return unittest.makeSuite(HeatmapTests,'test')
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
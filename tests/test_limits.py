@@ -0,0 +1,140 @@
+import unittest, time, signal
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import TextTools
+
+declaration = r'''
+root := (word/number/ts)*
+word := [a-z]+
+number := [0-9]+
+<ts> := [ ]+
+nested := '(', nested?, ')'
+slow := as, 'b'
+as := a*
+<a> := 'a'/'aa'
+'''
+
+class Interrupted( Exception ):
+    """Raised by the alarm signal handler"""
+
+class LimitTests(unittest.TestCase):
+    """Tests for the limits on the work done by a parse"""
+    def setUp( self ):
+        self.parser = Parser( declaration, 'root' )
+    def testUnlimited( self ):
+        """Test that limits which aren't reached don't change results"""
+        source = 'ab 12 cd ' * 10
+        expected = self.parser.parse( source )
+        assert len( expected[1] ) == 30
+        assert self.parser.parse( source, max_results=30 ) == expected
+        assert self.parser.parse(
+            source, max_depth=2, max_result_bytes=1<<20,
+        ) == expected
+        assert self.parser.parse( b'ab 12', max_results=2 )[0] == 1
+    def testMaxResults( self ):
+        """Test aborting after too many results"""
+        try:
+            self.parser.parse( 'ab 12 cd 34', max_results=3 )
+        except TextTools.LimitError as err:
+            assert err.limit == 'max_results', err.limit
+            assert err.maximum == 3
+            assert err.production == 'number', err.production
+            assert err.position == 11, err.position
+            assert isinstance( err, TextTools.Error )
+            assert 'max_results' in str( err ), str( err )
+        else:
+            raise AssertionError( "no LimitError raised" )
+    def testMaxResultBytes( self ):
+        """Test aborting when the results need too much memory"""
+        source = 'ab ' * 1000
+        self.assertRaises(
+            TextTools.LimitError, self.parser.parse, source,
+            max_result_bytes=10000,
+        )
+        assert self.parser.parse( 'ab ' * 10, max_result_bytes=10000 )[0] == 1
+    def testMaxDepth( self ):
+        """Test aborting when tables nest too deeply"""
+        source = '(' * 50 + ')' * 50
+        assert self.parser.parse( source, 'nested', max_depth=1000 )[2] == 100
+        try:
+            self.parser.parse( source, 'nested', max_depth=10 )
+        except TextTools.LimitError as err:
+            assert err.limit == 'max_depth', err.limit
+            assert err.production == 'nested', err.production
+            assert 0 < err.position < 50, err.position
+        else:
+            raise AssertionError( "no LimitError raised" )
+    def testCompiled( self ):
+        """Test limits on compiled parsers"""
+        compiled = self.parser.compile()
+        self.assertRaises(
+            TextTools.LimitError, compiled.parse, b'ab 12 cd', max_results=2,
+        )
+    def testTag( self ):
+        """Test limits on plain tag tables, including Repeat"""
+        table = (
+            ('x', TextTools.Repeat, ((('a', TextTools.Is, 'a'),), 0, None)),
+        )
+        assert TextTools.tag( 'aaa', table, max_depth=1 )[0] == 1
+        self.assertRaises(
+            TextTools.LimitError, TextTools.tag, 'aaa', table, max_results=2,
+        )
+        try:
+            TextTools.tag( 'aaa', (('y', TextTools.Table, table),), max_depth=1 )
+        except TextTools.LimitError as err:
+            assert err.production == 'x', err.production
+            assert err.position == 0, err.position
+        else:
+            raise AssertionError( "no LimitError raised" )
+    def testMaxSteps( self ):
+        """Test aborting after too many table entries"""
+        source = 'a' * 1000 + 'c'
+        assert self.parser.parse( source, 'slow' )[0] == 0
+        try:
+            self.parser.parse( source, 'slow', max_steps=100 )
+        except TextTools.LimitError as err:
+            assert err.limit == 'max_steps', err.limit
+            assert err.maximum == 100
+            assert err.production == 'as', err.production
+        else:
+            raise AssertionError( "no LimitError raised" )
+        assert self.parser.parse( 'ab', 'slow', max_steps=100 )[0] == 1
+    def testDeadline( self ):
+        """Test aborting a parse which runs past its deadline"""
+        source = 'ab ' * 100000
+        clock = getattr( time, 'monotonic', time.time )
+        try:
+            self.parser.parse( source, deadline=clock() - 1 )
+        except TextTools.LimitError as err:
+            assert err.limit == 'deadline', err.limit
+            assert 0 < err.position < len(source), err.position
+        else:
+            raise AssertionError( "no LimitError raised" )
+        assert self.parser.parse( 'ab 12', deadline=clock() + 60 )[0] == 1
+    def testSignals( self ):
+        """Test that signal handlers run during a long parse"""
+        if not hasattr( signal, 'setitimer' ):
+            return
+        def interrupt( *args ):
+            raise Interrupted()
+        previous = signal.signal( signal.SIGALRM, interrupt )
+        try:
+            signal.setitimer( signal.ITIMER_REAL, 0.01 )
+            started = time.time()
+            try:
+                TextTools.tag(
+                    'ab ' * 2000000, self.parser.buildTagger( 'root', None ),
+                    taglist=None,
+                )
+            except Interrupted:
+                assert time.time() - started < 0.2
+            else:
+                raise AssertionError( "signal handler didn't run" )
+        finally:
+            signal.setitimer( signal.ITIMER_REAL, 0 )
+            signal.signal( signal.SIGALRM, previous )
+
+def getSuite():
+    return unittest.makeSuite(LimitTests,'test')
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -1,3 +1,4 @@
+# -*- coding: utf-8 -*-
 import unittest
 from simpleparse.objectgenerator import *
 from .genericvalues import AnyInt
@@ -318,6 +319,55 @@ class ElementTokenTests(unittest.TestCase):
             'tes',
             (1, [], 0),
         )
+    def testCIString6( self ):
+        self.doBasicTest(
+            CILiteral( value = u'straße', repeating=1),
+            u'STRAßEstraßeStrasse',
+            (1, [], 12),
+        )
+    def testCIStringNegative1( self ):
+        self.doBasicTest(
+            CILiteral( value = 'end', negative=1, repeating=1, optional=1),
+            'abc End',
+            (1, [], 4),
+        )
+        self.doBasicTest(
+            CILiteral( value = 'end', negative=1, repeating=1, optional=1),
+            'END',
+            (1, [], 0),
+        )
+        self.doBasicTest(
+            CILiteral( value = 'end', negative=1, repeating=1, optional=1),
+            'abc',
+            (1, [], 3),
+        )
+    def testCIStringNegative2( self ):
+        self.doBasicTest(
+            CILiteral( value = 'end', negative=1, repeating=1),
+            'abc eNd',
+            (1, [], 4),
+        )
+        self.doBasicTest(
+            CILiteral( value = 'end', negative=1, repeating=1),
+            'End',
+            (0, [], AnyInt),
+        )
+        self.doBasicTest(
+            CILiteral( value = 'end', negative=1, repeating=1),
+            '',
+            (0, [], AnyInt),
+        )
+    def testCIStringNegative3( self ):
+        self.doBasicTest(
+            CILiteral( value = 'ab', negative=1),
+            'Ab',
+            (0, [], AnyInt),
+        )
+        self.doBasicTest(
+            CILiteral( value = 'ab', negative=1),
+            'xb',
+            (1, [], 1),
+        )
 
 ### Simpleparse 2.0.0b4 introduced an explicit check that
 ##  rejects FOGroups with optional children to prevent
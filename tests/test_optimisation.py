@@ -119,7 +119,129 @@ class OptimisationTests(unittest.TestCase):
             pprint.pformat( table),
             pprint.pformat(expected),
         )
-        
+    def testRepetitionEOFGuard( self ):
+        """Test that the EOF check is only generated for repetitions which may not consume"""
+        from simpleparse.stt.TextTools import EOF
+        def eofChecks( table ):
+            count = 0
+            for item in table:
+                if item[1] == EOF:
+                    count += 1
+                elif isinstance( item[2], tuple ) and item[2] and isinstance( item[2][0], tuple ):
+                    count += eofChecks( item[2] )
+            return count
+        for declaration, checks, source, expected in [
+            ("""a := ('x','y')*""", 0, 'xyxyz', (1,[],4)),
+            ("""a := (b/'c')+ b := 'x'""", 0, 'xcxz', (1,[('b',0,1,None),('b',2,3,None)],3)),
+            ("""a := ('x'?,'y'?)*""", 1, 'xyy', (1,[],3)),
+            ("""a := (b,'y'?)* <b> := 'x'?""", 1, 'xy', (1,[],2)),
+            # single-character negatives skip past the end of the buffer
+            ("""a := (-']'/'q')*""", 1, 'ab', (1,[],2)),
+            ("""a := ('x',-']')*""", 0, 'xaxb', (1,[],4)),
+            # and so do negated names of single-character terminals
+            ("""a := c* c := -b b := [x]""", 1, 'ab', (1,[('c',0,1,None),('c',1,2,None)],2)),
+            ("""a := (-b,'q'?)* b := [x]""", 1, 'ab', (1,[],2)),
+            ("""a := (c/'q')* c := -b b := [x]""", 1, 'ab', (1,[('c',0,1,None),('c',1,2,None)],2)),
+            ("""a := (c,'q'?)* <c> := -b b := [x]""", 1, 'ab', (1,[],2)),
+        ]:
+            parser = Parser( declaration, 'a' )
+            table = parser.buildTagger()
+            assert eofChecks( table ) == checks, """%r generated %s EOF checks, expected %s\n%s"""%(
+                declaration, eofChecks( table ), checks, pprint.pformat( table ),
+            )
+            # a missing guard loops forever, stop it with a step budget
+            result = parser.parse( source, max_steps=10000 )
+            assert result == expected, """%r parsing %r gave %s, expected %s"""%(
+                declaration, source, result, expected,
+            )
+    def testNullableFirstOfChild( self ):
+        """Test that a FirstOf child which matches empty through a reference is caught"""
+        parser = Parser( """a := (b/'c')* b := 'x'*""", 'a' )
+        self.assertRaises( AssertionError, parser.buildTagger )
+        for declaration in [
+            """a := (b/'c') b := 'x'*""",
+            """a := ('c'/b)* b := 'x'*""",
+            """a := ('c'/b){1,3} b := 'x'*""",
+        ]:
+            parser = Parser( declaration, 'a' )
+            self.assertRaises( AssertionError, parser.buildTagger )
+    def testNullableLastFirstOfChild( self ):
+        """Test that a FirstOf group may end with a child which matches empty"""
+        for declaration, source, expected in [
+            ("""root := ('a' / ws), 'b'\nws := [ ]*""", 'b', (1,[('ws',0,0,[])],1)),
+            ("""root := ('a' / ws), 'b'\nws := [ ]*""", 'ab', (1,[],2)),
+            ("""root := ('a' / ws){1}, 'b'\nws := [ ]*""", ' b', (1,[('ws',0,1,[])],2)),
+        ]:
+            parser = Parser( declaration, 'root' )
+            result = parser.parse( source )
+            assert result == expected, """%r parsing %r gave %s, expected %s"""%(
+                declaration, source, result, expected,
+            )
+    def testLookaheadFirstOfChild( self ):
+        """Test that FirstOf children which match empty but can fail are allowed"""
+        for declaration, source, expected in [
+            ("""a := ?'x' / 'z'""", 'z', (1,[],1)),
+            ("""a := ?'x' / 'z'""", 'x', (1,[],0)),
+            ("""a := (?'x','y'?) / 'z'""", 'z', (1,[],1)),
+            ("""a := b / 'z' b := ?'q'""", 'z', (1,[],1)),
+        ]:
+            parser = Parser( declaration, 'a' )
+            result = parser.parse( source )
+            assert result == expected, """%r parsing %r gave %s, expected %s"""%(
+                declaration, source, result, expected,
+            )
+    def testLinkedParserList( self ):
+        """Test that building a parser compiles and links the parser list"""
+        from simpleparse.stt.TextTools import TagTableType
+        parser = Parser( """a := b,'c' b := 'x',a?""", 'a' )
+        table = parser.buildTagger()
+        assert isinstance( table, tuple ), table
+        for item in parser._generator.getParserList():
+            assert isinstance( item, TagTableType ), type( item )
+        expected = (1,[
+            ('b',0,3,[('a',1,3,[('b',1,2,[])])]),
+        ],4)
+        for source in ('xxcc', b'xxcc'):
+            result = parser.parse( source )
+            assert result == expected, """parsing %r gave %s"""%( source, result )
+    def testLinkedParserListReused( self ):
+        """Test that parsing again with the same method source doesn't relink"""
+        parser = Parser( """a := b,'c' b := 'x',a?""", 'a' )
+        parser.buildTagger()
+        linked = parser._generator.getParserList()
+        assert parser.parse( 'xxcc' )[0]
+        assert parser._generator.getParserList() is linked
+        class MethodSource( object ):
+            pass
+        parser.buildTagger( processor=MethodSource() )
+        assert parser._generator.getParserList() is not linked
+    def testLinkedUnicodeDefinitions( self ):
+        """Test linking definitions which have no 8-bit form (Python 2)"""
+        from simpleparse.stt.TextTools import TagTable, AllIn
+        parser = Parser( u"""a := b,'c' b := [\u0600-\u06ff]+""", 'a' )
+        result = parser.parse( u'\u0600\u06ffc' )
+        assert result == (1,[('b',0,2,None)],3), result
+        if not isinstance( '', bytes ):
+            return
+        # the 8-bit table compiler can't convert non-ASCII Unicode
+        self.assertRaises( TypeError, TagTable, ((None, AllIn, u'\xe9'),) )
+        self.assertRaises( TypeError, parser.parse, 'abc' )
+    def testLinkedUnicodeFirstOf( self ):
+        """Test linking a FirstOf of non-ASCII literals (Python 2)
+
+        The group's sub-table has no 8-bit form, linking has to
+        leave it for the Unicode text instead of failing.
+        """
+        for declaration in [
+            u"""kw := '\xe9lan'/'end'\n""",
+            u"""kw := ('\xe9lan'/'end'), 'x'?\n""",
+            u"""kw := b b := '\xe9lan'/'end'\n""",
+        ]:
+            parser = Parser( declaration, 'kw' )
+            result = parser.parse( u'end' )
+            assert result[0] and result[2] == 3, (declaration, result)
+            assert parser.parse( u'\xe9lan' )[2] == 4, declaration
+
 def getSuite():
     return unittest.makeSuite(OptimisationTests,'test')
 
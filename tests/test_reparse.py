@@ -0,0 +1,87 @@
+import unittest, random
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import TextTools
+
+declaration = r'''
+root := (word/num/ws)*
+word := [a-z]+
+num := digits, ('.', digits)?
+digits := [0-9]+
+<ws> := [ ]+
+pairs := (key, '=', value, ';')+
+key := [a-z]+
+value := [0-9]+
+fixed := word, ws, word
+'''
+
+class ReparseTests(unittest.TestCase):
+    """Tests incremental reparsing after edits"""
+    def setUp( self ):
+        self.parser = Parser( declaration )
+    def doBasicTest( self, old, edit_range, replacement, production='root' ):
+        start, end = edit_range
+        new = old[:start] + replacement + old[end:]
+        oldResult = self.parser.parse( old, production )
+        result = self.parser.reparse( oldResult, old, new, edit_range, production )
+        expected = self.parser.parse( new, production )
+        assert result == expected, '''\nexpected:%s\n     got:%s\n'''%( expected, result )
+        return result
+    def testInsert( self ):
+        """Test insertion in the middle of the text"""
+        self.doBasicTest( 'abc 12.5 de 7 fg', (5,5), '3' )
+    def testMerge( self ):
+        """Test deleting the separator of two tokens"""
+        self.doBasicTest( 'abc def 12', (3,4), '' )
+    def testStart( self ):
+        """Test edit at the start of the text"""
+        self.doBasicTest( 'abc def 12', (0,0), '9 ' )
+    def testEnd( self ):
+        """Test edit at the end of the text"""
+        self.doBasicTest( 'abc def 12', (10,10), '.5' )
+    def testMultiChildItems( self ):
+        """Test items which report several children"""
+        self.doBasicTest( 'a=1;bb=22;ccc=333;', (5,5), 'x' )
+        self.doBasicTest( 'a=1;bb=22;ccc=333;', (3,4), '' )
+    def testNotRepeating( self ):
+        """Test productions which aren't repetitions are parsed again"""
+        self.doBasicTest( 'abc def', (4,5), 'x', 'fixed' )
+    def testResync( self ):
+        """Test old children after the edit are reused, shifted"""
+        old = 'ab 12 ' * 10
+        oldResult = self.parser.parse( old )
+        new = 'xyz ' + old
+        result = self.parser.reparse( oldResult, old, new, (0,0) )
+        assert result == self.parser.parse( new )
+        assert result[1][-1][1] == oldResult[1][-1][1] + 4
+    def testRandom( self ):
+        """Test random edits against full reparsing"""
+        generator = random.Random( 1 )
+        for production, alphabet in (('root','ab1 .'),('pairs','k1=;')):
+            for i in range(200):
+                old = ''.join([
+                    generator.choice( alphabet )
+                    for i in range(generator.randint(0,20))
+                ])
+                start = generator.randint( 0, len(old) )
+                end = generator.randint( start, min( len(old), start+3 ))
+                replacement = ''.join([
+                    generator.choice( alphabet )
+                    for i in range(generator.randint(0,3))
+                ])
+                new = old[:start] + replacement + old[end:]
+                oldResult = self.parser.parse( old, production )
+                result = self.parser.reparse( oldResult, old, new, (start,end), production )
+                expected = self.parser.parse( new, production )
+                if expected[0] or result[0]:
+                    assert result == expected, (old, (start,end), replacement, result, expected)
+    def testShiftTaglist( self ):
+        """Test shifting of nested result tuples"""
+        assert TextTools.shifttaglist(
+            [('a',1,3,[('b',1,2,None)]), ('c',3,4,[]), 'd'], 2
+        ) == [('a',3,5,[('b',3,4,None)]), ('c',5,6,[]), 'd']
+
+def getSuite():
+    return unittest.makeSuite(ReparseTests,'test')
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,83 @@
+import unittest, json, sys
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import TextTools
+
+declaration = r'''
+root := (item/ts)*
+item := word, (' ', number)?
+word := [a-z]+
+number := [0-9]+
+<ts> := [ ]+
+'''
+
+class SerializeTests(unittest.TestCase):
+    """Tests for the JSON and binary taglist serializers"""
+    def setUp( self ):
+        self.parser = Parser( declaration, 'root' )
+        self.source = 'ab 12 cd ef 345 '
+        self.taglist = self.parser.parse( self.source )[1]
+    def testJSON( self ):
+        """Test writing and reading back JSON"""
+        data = TextTools.taglist2json( self.taglist )
+        assert isinstance( data, bytes )
+        loaded = json.loads( data.decode( 'utf-8' ))
+        assert loaded[0] == ['item', 0, 5, [['word', 0, 2, None], ['number', 3, 5, None]]], loaded
+        assert TextTools.json2taglist( data ) == self.taglist
+        assert TextTools.json2taglist( data.decode( 'utf-8' )) == self.taglist
+        assert TextTools.json2taglist( b' [ ] ' ) == []
+    def testJSONText( self ):
+        """Test including the matched text in JSON"""
+        data = TextTools.taglist2json( self.taglist, self.source )
+        loaded = json.loads( data.decode( 'utf-8' ))
+        assert loaded[1] == ['item', 6, 8, [['word', 6, 8, None, 'cd']], 'cd'], loaded
+        assert TextTools.json2taglist( data ) == self.taglist
+    def testJSONEscapes( self ):
+        """Test tagobjs which need escaping"""
+        taglist = [
+            (None, 0, 1, None),
+            (-3, 1, 0, []),
+            (u'\xe9"\\\n\U0001f600', 2, 4, [(u'x', 2, 3, None)]),
+            # the bounds of the integer tagobjs, -2**63 and 2**63-1 on 64-bit
+            (-sys.maxsize - 1, 0, 0, [(sys.maxsize, 0, 0, None)]),
+        ]
+        data = TextTools.taglist2json( taglist )
+        assert json.loads( data.decode( 'utf-8' ))[2][0] == taglist[2][0]
+        assert TextTools.json2taglist( data ) == taglist
+        escaped = json.dumps( [[taglist[2][0], 0, 0, None]] )
+        assert TextTools.json2taglist( escaped ) == [(taglist[2][0], 0, 0, None)]
+    def testJSONInvalid( self ):
+        """Test rejecting data which isn't taglist JSON"""
+        for data in (b'', b'[', b'[["a",1]]', b'[] x', b'{}', b'[["a",1,2,[],3]]'):
+            self.assertRaises( ValueError, TextTools.json2taglist, data )
+        for tagobj in (-sys.maxsize - 2, sys.maxsize + 1):
+            data = ('[[%d,0,0,null]]'%( tagobj, )).encode( 'ascii' )
+            self.assertRaises( ValueError, TextTools.json2taglist, data )
+        self.assertRaises( TypeError, TextTools.taglist2json, [(1.5, 0, 1, None)] )
+        self.assertRaises( TypeError, TextTools.taglist2json, [('a', 0, 1)] )
+    def testBinary( self ):
+        """Test writing and reading back the binary format"""
+        data = TextTools.taglist2bin( self.taglist )
+        assert len( data ) < len( TextTools.taglist2json( self.taglist ))
+        assert TextTools.bin2taglist( data ) == self.taglist
+        taglist = [
+            (None, 5, 1, None),
+            (-3, 1, 1 << 40, []),
+            (b'x', 0, 0, [(u'\xe9', 0, 0, None)]),
+        ]
+        loaded = TextTools.bin2taglist( TextTools.taglist2bin( taglist ))
+        assert loaded == taglist
+        assert isinstance( loaded[2][0], bytes )
+        assert TextTools.bin2taglist( TextTools.taglist2bin( [] )) == []
+    def testBinaryInvalid( self ):
+        """Test rejecting truncated or foreign binary data"""
+        data = TextTools.taglist2bin( self.taglist )
+        for length in range( len(data) ):
+            self.assertRaises( ValueError, TextTools.bin2taglist, data[:length] )
+        self.assertRaises( ValueError, TextTools.bin2taglist, data + b'\0' )
+        self.assertRaises( ValueError, TextTools.bin2taglist, b'XXXX' + data[4:] )
+
+def getSuite():
+    return unittest.makeSuite(SerializeTests,'test')
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -123,6 +123,22 @@ class ParserGenerationTests(unittest.TestCase):
             (0,[
             ],AnyInt)
         )
+    def testLookaheadNested( self ):
+        """Test a lookahead on a name whose definition is a lookahead
+
+        The LookAhead flag is set once, adding it twice would set
+        an unrelated flag bit (AppendNumber).
+        """
+        self.doBasicTest(
+            '''s := ?t, "x"
+            t := ?[x]
+            ''',
+            's',
+            'x',
+            (1,[
+                ("t",0,1,NullResult),
+            ],1)
+        )
     def testLookahead2( self ):
         """Test lookahead on literals (more complex)"""
         self.doBasicTest(
@@ -285,6 +301,39 @@ class ParserGenerationTests(unittest.TestCase):
             ' thi',
             (1,[],4)
         )
+    def testGenCILiteral7( self ):
+        """Test that a failing negative reports where it failed"""
+        self.doBasicTest(
+            '''s := -c"this"''',
+            's',
+            'THIS',
+            (0,[],4)
+        )
+    def testGenCILiteral8( self ):
+        """Test the children of a reported negative"""
+        self.doBasicTest(
+            '''s := t+
+            t := -c"x"''',
+            's',
+            'yz',
+            (1,[('t',0,1,[]),('t',1,2,[])],2)
+        )
+    def testGenCILiteral9( self ):
+        """Test the children of a reported positive"""
+        self.doBasicTest(
+            '''s := t+
+            t := c"select"''',
+            's',
+            'SeLectselect',
+            (1,[('t',0,6,[]),('t',6,12,[])],12)
+        )
+        self.doBasicTest(
+            '''s := t+
+            t := c"x"''',
+            's',
+            'xX',
+            (1,[('t',0,1,NullResult),('t',1,2,NullResult)],2)
+        )
     def testGenUnicodeRange( self ):
         self.doBasicTest(
             '''s := [\u0600-\u06ff]+''',
@@ -405,6 +454,82 @@ class NameTests(unittest.TestCase):
             'ammmab',
             (0,[],AnyInt)
         )
+    def test_bounded( self ):
+        self.doBasicTest(
+            '''s := [0-9a-fA-F]{4}''',
+            's',
+            '1aF9z',
+            (1,[],4)
+        )
+    def test_bounded_short( self ):
+        self.doBasicTest(
+            '''s := [0-9a-fA-F]{4}''',
+            's',
+            '1aFz',
+            (0,[],AnyInt)
+        )
+    def test_bounded_minimum( self ):
+        self.doBasicTest(
+            '''s := 'ab'{2,}''',
+            's',
+            'abababc',
+            (1,[],6)
+        )
+    def test_bounded_maximum( self ):
+        self.doBasicTest(
+            '''s := something{,2}
+            something := [ab]''',
+            's',
+            'abab',
+            (1,[
+                ('something',0,1,NullResult),
+                ('something',1,2,NullResult),
+            ],2)
+        )
+    def test_bounded_group( self ):
+        self.doBasicTest(
+            '''s := ('x', something){2,3}, 'x'
+            something := [0-9]''',
+            's',
+            'x1x',
+            (0,[],AnyInt)
+        )
+    def test_bounded_negative( self ):
+        self.doBasicTest(
+            '''s := -'x'{3}''',
+            's',
+            'abcx',
+            (1,[],3)
+        )
+    def test_bounded_negative_eof( self ):
+        """Negated items keep skipping past EOF, Repeat has to stop there"""
+        for declaration, expected in [
+            ('''s := -'y'{1,}''', (1,[],1)),
+            # like -'yz',-'yz', which skips past the end as well
+            ('''s := -'yz'{2,}''', (1,[],1)),
+            ('''s := b{1,}
+            b := -'y' ''', (1,[('b',0,1,NullResult)],1)),
+        ]:
+            parser = Parser( declaration, 's' )
+            result = parser.parse( 'x', max_steps=10000 )
+            assert result == expected, """%r parsing 'x' gave %s, expected %s"""%(
+                declaration, result, expected,
+            )
+    def test_bounded_empty_eof( self ):
+        """Iterations matching empty at EOF count towards the minimum"""
+        self.doBasicTest(
+            '''s := b{2}
+            b := 'x'*''',
+            's',
+            'xxx',
+            (1,[
+                ('b',0,3,NullResult),
+                ('b',3,3,NullResult),
+            ],3)
+        )
+    def test_bounded_impossible( self ):
+        self.assertRaises( ValueError, Parser, '''s := 'x'{3,2}''' )
+        self.assertRaises( ValueError, Parser, '''s := 'x'{}''' )
 ##	def test_por_big( self ):
 ##		"""This test creates 1,000,000 result tuples (very inefficiently, I might add)...
 ##		on my machine that takes a long time, so I do not bother with the test
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import unittest, sys
+from simpleparse.parser import Parser
+from simpleparse.error import ParserSyntaxError
+from .genericvalues import NullResult
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+declaration = r'''
+record := field, (',', field)*, '\n'
+field := [a-z0-9]*
+'''
+
+@unittest.skipIf( sys.version_info < (3,6), "parse_stream requires Python 3.6+" )
+class StreamTests(unittest.TestCase):
+    """Tests asynchronous parsing of record streams"""
+    def setUp( self ):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop( self.loop )
+        self.parser = Parser( declaration, 'record' )
+    def tearDown( self ):
+        asyncio.set_event_loop( None )
+        self.loop.close()
+    def reader( self, *chunks ):
+        reader = asyncio.StreamReader( loop=self.loop )
+        for chunk in chunks:
+            reader.feed_data( chunk )
+        reader.feed_eof()
+        return reader
+    def collect( self, iterator ):
+        results = []
+        while True:
+            try:
+                results.append( self.loop.run_until_complete( iterator.__anext__() ))
+            except StopAsyncIteration:
+                return results
+    def testRecords( self ):
+        """Test records split across reads"""
+        results = self.collect( self.parser.parse_stream(
+            self.reader( b'ab,c', b'd\nef\n', b'g,h\n' ), chunkSize=3,
+        ))
+        assert [record for (record, result) in results] == ['ab,cd\n','ef\n','g,h\n'], results
+        assert results[0][1] == (1, [
+            ('field',0,2,NullResult),
+            ('field',3,5,NullResult),
+        ], 6), results[0][1]
+        assert results[2][1] == (1, [
+            ('field',0,1,NullResult),
+            ('field',2,3,NullResult),
+        ], 4), results[2][1]
+    def testEncoding( self ):
+        """Test multi-byte characters split across reads"""
+        parser = Parser( r'''
+        record := word, '\n'
+        word := -'\n'+
+        ''', 'record' )
+        data = u'été\nhiver\n'.encode( 'utf-8' )
+        results = self.collect( parser.parse_stream(
+            self.reader( *[data[i:i+1] for i in range(len(data))] ), chunkSize=1,
+        ))
+        assert [record for (record, result) in results] == [u'été\n', u'hiver\n'], results
+    def testLargeRecord( self ):
+        """Test that a record spanning many reads isn't matched for each read"""
+        import concurrent.futures
+        class Executor( concurrent.futures.ThreadPoolExecutor ):
+            calls = 0
+            def submit( self, *args, **named ):
+                self.calls += 1
+                return super( Executor, self ).submit( *args, **named )
+        executor = Executor( max_workers=1 )
+        try:
+            data = b'a'*20000 + b'\nb\n'
+            results = self.collect( self.parser.parse_stream(
+                self.reader( data ), chunkSize=10, executor=executor,
+            ))
+        finally:
+            executor.shutdown()
+        assert [record for (record, result) in results] == ['a'*20000+'\n', 'b\n'], results
+        assert executor.calls < 30, executor.calls
+    def testTrailingGarbage( self ):
+        """Test unparseable data at the end of the stream"""
+        iterator = self.parser.parse_stream( self.reader( b'ab\n!!' ))
+        assert self.loop.run_until_complete( iterator.__anext__() )[0] == 'ab\n'
+        self.assertRaises(
+            ParserSyntaxError,
+            self.loop.run_until_complete, iterator.__anext__(),
+        )
+    def testErrorPosition( self ):
+        """Test that errors report their offset in the whole stream"""
+        iterator = self.parser.parse_stream( self.reader( b'ab\ncd\n', b'e;f' ), chunkSize=3 )
+        try:
+            self.collect( iterator )
+        except ParserSyntaxError as err:
+            assert err.position == 6, err.position
+            assert err.bufferOffset, err.bufferOffset
+            assert err.buffer[err.position-err.bufferOffset:] == 'e;f', err.buffer
+            assert "'e;f'" in str( err ), str( err )
+            # SyntaxError's own offset is the column, it stays unset
+            assert err.offset is None, err.offset
+        else:
+            raise AssertionError( "Didn't raise a ParserSyntaxError" )
+    def testProcessorThread( self ):
+        """Test that records are processed off the event loop's thread"""
+        import threading
+        threads = []
+        def processor( value, buffer ):
+            threads.append( threading.current_thread() )
+            return buffer.split( ',' )
+        results = self.collect( self.parser.parse_stream(
+            self.reader( b'a,b\nc\n' ), processor=processor,
+        ))
+        assert results == [('a,b\n', ['a','b\n']), ('c\n', ['c\n'])], results
+        assert len( threads ) == 2, threads
+        assert threading.main_thread() not in threads, threads
+    def testLimit( self ):
+        """Test records which never complete"""
+        iterator = self.parser.parse_stream( self.reader( b'!'*100 ), chunkSize=10, limit=50 )
+        self.assertRaises(
+            ValueError,
+            self.loop.run_until_complete, iterator.__anext__(),
+        )
+
+def getSuite():
+    return unittest.makeSuite(StreamTests,'test')
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,88 @@
+import unittest
+from simpleparse.parser import Parser
+from simpleparse import dispatchprocessor
+from simpleparse.stt.TextTools import TextTools
+
+declaration = r'''
+root := (word/number/ts)+
+word := [a-z]+
+number := int, fraction?
+>fraction< := '.', int
+<int> := [0-9]+
+<ts> := [ \t]+
+'''
+
+class CallCounter( dispatchprocessor.DispatchProcessor ):
+    """Method source recording the productions it is asked about"""
+    def __init__( self ):
+        self.calls = []
+    def word( self, tag, buffer ):
+        self.calls.append( tag )
+    def _m_number( self, taglist, text, left, right, children ):
+        self.calls.append( (left, right) )
+
+class ValidateTests(unittest.TestCase):
+    """Tests checking data without building results"""
+    def setUp( self ):
+        self.parser = Parser( declaration, 'root' )
+    def testMatchesParse( self ):
+        """Test that validate agrees with parse on success and end position"""
+        for source in (
+            'this 23 that 4.5',
+            'this 23 that!',
+            '  4.',
+            '!',
+            '',
+            b'this 23 that 4.5',
+            b'this 23!',
+        ):
+            success, children, next = self.parser.parse( source )
+            assert self.parser.validate( source ) == (success, next), source
+    def testProduction( self ):
+        """Test validating with a non-root production, start and stop"""
+        assert self.parser.validate( '4.5', 'number' ) == (1, 3)
+        assert self.parser.validate( 'x4.5', 'number' ) == (0, 0)
+        assert self.parser.validate( 'x4.5 ', 'number', 1 ) == (1, 4)
+        assert self.parser.validate( 'x4.5 ', 'number', 1, 2 ) == (1, 2)
+    def testNoReporting( self ):
+        """Test that the validation tables have no tag objects"""
+        def tags( table, seen ):
+            if id( table ) in seen:
+                return []
+            seen[ id( table ) ] = 1
+            found = []
+            for item in getattr( table, 'definition', table ):
+                if item[0] is not None:
+                    found.append( item[0] )
+                if item[1] in (TextTools.TableInList, TextTools.SubTableInList):
+                    found.extend( tags( item[2][0][item[2][1]], seen ))
+                elif isinstance( item[2], tuple ) and item[2] and isinstance( item[2][0], tuple ):
+                    found.extend( tags( item[2], seen ))
+            return found
+        generator = self.parser._generator
+        for name in ('root', 'number'):
+            assert tags( generator.buildValidator( name ), {} ) == [], name
+    def testCached( self ):
+        """Test that the validation tables are built once"""
+        generator = self.parser._generator
+        first = generator.buildValidator( 'root' )
+        self.parser.parse( 'this 23' )
+        assert generator.buildValidator( 'root' ) is first
+        assert generator.buildValidator( 'number' ) is generator.validatorList[
+            generator.getNameIndex( 'number' )
+        ]
+    def testNoProcessor( self ):
+        """Test that processor methods aren't used while validating"""
+        processor = CallCounter()
+        self.parser.parse( 'this 4.5', processor=processor )
+        assert processor.calls, processor.calls
+        processor.calls = []
+        self.parser.buildProcessor = lambda: processor
+        assert self.parser.validate( 'this 4.5' ) == (1, 8)
+        assert processor.calls == [], processor.calls
+
+def getSuite():
+    return unittest.makeSuite(ValidateTests,'test')
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import unittest, io
+from simpleparse.xmlparser.events import iterevents
+
+document = u'''<?xml version="1.0"?>
+<!DOCTYPE a [ <!ELEMENT a ANY> ]>
+<a x="1>" y='&amp;2'><!-- c <b> --><b/>t&lt;x<![CDATA[<z>]]><?pi <d>?>été</a>
+'''
+
+expected = [
+    ('XMLDecl', u'<?xml version="1.0"?>'),
+    ('Misc', u'\n'),
+    ('doctypedecl', u'<!DOCTYPE a [ <!ELEMENT a ANY> ]>'),
+    ('Misc', u'\n'),
+    ('STag', u'<a x="1>" y=\'&amp;2\'>'),
+    ('XMLComment', u'<!-- c <b> -->'),
+    ('EmptyElemTag', u'<b/>'),
+    ('CharData', u't'),
+    ('Reference', u'&lt;'),
+    ('CharData', u'x'),
+    ('CDSect', u'<![CDATA[<z>]]>'),
+    ('PI', u'<?pi <d>?>'),
+    ('CharData', u'été'),
+    ('ETag', u'</a>'),
+    ('CharData', u'\n'),
+]
+
+def merged( events ):
+    """Join the CharData runs split by the chunking"""
+    result = []
+    for production, text, children in events:
+        if result and production == 'CharData' and result[-1][0] == 'CharData':
+            result[-1] = (production, result[-1][1] + text)
+        else:
+            result.append( (production, text) )
+    return result
+
+class XMLEventTests(unittest.TestCase):
+    """Tests for the incremental XML tokenizer"""
+    def testEvents( self ):
+        """Test the events of a whole document"""
+        events = list( iterevents( io.BytesIO( document.encode( 'utf-8' ))))
+        assert [(production, text) for (production, text, children) in events] == expected, events
+        production, text, children = events[4]
+        assert children[0] == ('Name', 1, 2, []), children
+        assert text[slice(*children[2][1:3])] == u"y='&amp;2'", children
+    def testChunks( self ):
+        """Test that the events don't depend on where chunks end"""
+        data = document.encode( 'utf-8' )
+        for chunkSize in range( 1, len(data) + 1 ):
+            events = merged( iterevents( io.BytesIO( data ), chunkSize=chunkSize ))
+            assert events == expected, (chunkSize, events)
+    def testText( self ):
+        """Test reading text rather than bytes"""
+        events = merged( iterevents( io.StringIO( document ), chunkSize=7 ))
+        assert events == expected, events
+        events = merged( iterevents( io.BytesIO( document.encode( 'latin-1' )), 'latin-1', chunkSize=5 ))
+        assert events == expected, events
+    def testMalformed( self ):
+        """Test that stray markup characters are reported as CharData"""
+        events = merged( iterevents( io.StringIO( u'<a>1 < 2 & 3</a>' ), chunkSize=3 ))
+        assert events == [
+            ('STag', u'<a>'), ('CharData', u'1 < 2 & 3'), ('ETag', u'</a>'),
+        ], events
+    def testLongEvent( self ):
+        """Test that an event spanning many reads isn't tagged for each read"""
+        from simpleparse.xmlparser import events
+        calls = []
+        def tag( *args ):
+            calls.append( args[2] )
+            return original( *args )
+        original, events.tag = events.tag, tag
+        try:
+            source = io.StringIO( u'<a>' + u'x'*20000 + u'</a>' )
+            result = merged( iterevents( source, chunkSize=10 ))
+        finally:
+            events.tag = original
+        assert result == [
+            ('STag', u'<a>'), ('CharData', u'x'*20000), ('ETag', u'</a>'),
+        ], result
+        assert len(calls) < 50, len(calls)
+    def testLimit( self ):
+        """Test events which never complete"""
+        source = io.StringIO( u'<a><!-- ' + u'x'*100 )
+        self.assertRaises( ValueError, list, iterevents( source, chunkSize=10, limit=50 ))
+
+def getSuite():
+    return unittest.makeSuite(XMLEventTests, 'test')
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")